@@ -4,10 +4,12 @@ import aws_cdk as cdk
 from cdk_stack import ItemAPIStack
 from flask import Flask
 from shared.mongo_utils import get_mongo_collection
+from shared.json_provider import SerializerJSONProvider
 
 # Create Flask app
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET")
+app.json = SerializerJSONProvider(app)
 
 # Initialize MongoDB connection
 get_mongo_collection()
@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+"""ASGI entry point serving the items API as async views, e.g. `hypercorn asgi:app`"""
+import os
+from quart import Quart
+from shared.async_geocoding import close_client
+from shared.json_provider import SerializerJSONProvider
+
+# Create Quart app
+app = Quart(__name__)
+app.secret_key = os.environ.get("SESSION_SECRET")
+app.json = SerializerJSONProvider(app)
+
+@app.after_serving
+async def close_clients():
+    await close_client()
+
+# Import routes after app is created to avoid circular imports
+from async_routes import *
+
+if __name__ == "__main__":
+    app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,240 @@
+from quart import request, jsonify, Response
+from asgi import app
+from shared.validation import validate_item, validate_updates, verify_auth, parse_near_params, parse_list_params, parse_fields, encode_page_token
+from shared.validation import item_etag, item_version, list_etag, stats_etag, etag_matches, parse_stats_params
+from shared.validation import parse_search_params, multi_get_body
+from shared.async_mongo_utils import create_item, get_items_page, check_page_key, iter_items, update_item, delete_item, find_items_near
+from shared.async_mongo_utils import get_items_by_ids, get_item_and_version, get_item_version, get_collection_version, get_item_stats, search_items
+from shared.async_geocoding import get_coordinates
+from shared.geocoding import location_fields
+from shared.batch import parse_batch
+from shared.async_batch import create_items_batch, update_items_batch, delete_items_batch
+from shared.item_cache import get_body_cache
+from shared.serializer import dumps, dumps_cached
+import uuid
+
+@app.route('/items', methods=['POST'])
+async def create_item_route():
+    try:
+        # Verify authentication
+        is_auth_valid, auth_error = verify_auth(request)
+        if not is_auth_valid:
+            return jsonify({'error': f'Authentication failed: {auth_error}'}), 401
+
+        data = await request.get_json()
+
+        # Validate input
+        is_valid, error_message = validate_item(data)
+        if not is_valid:
+            return jsonify({'error': error_message}), 400
+
+        # Get coordinates from postcode; other requests are served while this waits
+        coordinates = await get_coordinates(data['postcode'])
+        if not coordinates:
+            return jsonify({'error': 'Invalid postcode'}), 400
+
+        # Create item with additional data
+        item = {'id': str(uuid.uuid4()), **data, **location_fields(*coordinates)}
+
+        await create_item(item)
+        return jsonify(item), 201, {'ETag': item_etag(item['id'], item_version(item))}
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+async def _batch_route(operation, key='items'):
+    """Run a batch operation, which geocodes and writes with the asyncio clients"""
+    try:
+        # Verify authentication
+        is_auth_valid, auth_error = verify_auth(request)
+        if not is_auth_valid:
+            return jsonify({'error': f'Authentication failed: {auth_error}'}), 401
+
+        try:
+            elements = parse_batch(await request.get_json(), key=key)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        status_code, body = await operation(elements)
+        return jsonify(body), status_code
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/items:batch', methods=['POST'])
+async def create_items_batch_route():
+    return await _batch_route(create_items_batch)
+
+@app.route('/items:batch', methods=['PATCH'])
+async def update_items_batch_route():
+    return await _batch_route(update_items_batch)
+
+@app.route('/items:batch', methods=['DELETE'])
+async def delete_items_batch_route():
+    return await _batch_route(delete_items_batch, key='ids')
+
+async def stream_items(fields=None, filters=None):
+    """Yield the whole collection as a JSON document, one item at a time"""
+    yield '{"items": ['
+    index = 0
+    async for item in iter_items(fields=fields, filters=filters):
+        yield (',' if index else '') + dumps(item)
+        index += 1
+    yield ']}'
+
+@app.route('/items', methods=['GET'])
+async def get_items_route():
+    try:
+        try:
+            multi_get, page_params = parse_list_params(request.args.to_dict())
+            if page_params and page_params['after']:
+                check_page_key(page_params['after'], page_params['filters'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        # ?ids=a,b,c reads every listed item in one query instead of one request per item
+        if multi_get is not None:
+            items = await get_items_by_ids(**multi_get)
+            return jsonify(multi_get_body(multi_get['ids'], items)), 200
+
+        if request.args.get('stream', '').lower() == 'true':
+            return Response(stream_items(page_params['fields'], page_params['filters']), mimetype='application/json')
+
+        # Polling clients whose copy is current get a 304 without the page being read
+        etag = list_etag(await get_collection_version(), page_params)
+        if etag_matches(request.headers.get('If-None-Match'), etag):
+            return '', 304, {'ETag': etag}
+
+        # Clients that do not page get every item, streamed from the cursor as before pagination existed
+        if page_params['limit'] is None:
+            return Response(stream_items(page_params['fields'], page_params['filters']), mimetype='application/json'), 200, {'ETag': etag}
+
+        items, next_key = await get_items_page(**page_params)
+        return jsonify({'items': items, 'next': encode_page_token(next_key)}), 200, {'ETag': etag}
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/items/near', methods=['GET'])
+async def get_items_near_route():
+    try:
+        try:
+            params = parse_near_params(request.args.to_dict())
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        items = await find_items_near(**params)
+        return jsonify({'items': items}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/items/stats', methods=['GET'])
+async def get_items_stats_route():
+    try:
+        # Verify authentication
+        is_auth_valid, auth_error = verify_auth(request)
+        if not is_auth_valid:
+            return jsonify({'error': f'Authentication failed: {auth_error}'}), 401
+
+        try:
+            params = parse_stats_params(request.args.to_dict())
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        # The aggregation reads every item, so skip it when the collection has not changed
+        etag = stats_etag(await get_collection_version(), params)
+        if etag_matches(request.headers.get('If-None-Match'), etag):
+            return '', 304, {'ETag': etag}
+
+        return jsonify(await get_item_stats(**params)), 200, {'ETag': etag}
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/items/search', methods=['GET'])
+async def search_items_route():
+    try:
+        # Verify authentication
+        is_auth_valid, auth_error = verify_auth(request)
+        if not is_auth_valid:
+            return jsonify({'error': f'Authentication failed: {auth_error}'}), 401
+
+        try:
+            params = parse_search_params(request.args.to_dict())
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        items, next_key = await search_items(**params)
+        return jsonify({'items': items, 'next': encode_page_token(next_key)}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/items/<item_id>', methods=['GET'])
+async def get_item_route(item_id):
+    try:
+        try:
+            fields = parse_fields(request.args.get('fields'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        # A revalidation only needs the version, so an unchanged item is never fetched
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match:
+            version = await get_item_version(item_id)
+            if version is not None and etag_matches(if_none_match, item_etag(item_id, version, fields)):
+                return '', 304, {'ETag': item_etag(item_id, version, fields)}
+
+        item, version = await get_item_and_version(item_id, fields)
+        if not item:
+            return jsonify({'error': 'Item not found'}), 404
+        # Repeated reads of an unchanged item reuse its encoded body
+        etag = item_etag(item_id, version, fields)
+        return Response(dumps_cached(get_body_cache(), etag, item), mimetype='application/json'), 200, {'ETag': etag}
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/items/<item_id>', methods=['PATCH'])
+async def update_item_route(item_id):
+    try:
+        # Verify authentication
+        is_auth_valid, auth_error = verify_auth(request)
+        if not is_auth_valid:
+            return jsonify({'error': f'Authentication failed: {auth_error}'}), 401
+
+        updates = await request.get_json()
+        is_valid, error_message = validate_updates(updates)
+        if not is_valid:
+            return jsonify({'error': error_message}), 400
+
+        # If postcode is being updated, recalculate coordinates
+        if 'postcode' in updates:
+            # Geocoding is only worth doing, and a bad postcode only worth reporting, for an item that exists
+            if await get_item_version(item_id) is None:
+                return jsonify({'error': 'Item not found'}), 404
+
+            coordinates = await get_coordinates(updates['postcode'])
+            if not coordinates:
+                return jsonify({'error': 'Invalid postcode'}), 400
+
+            updates.update(location_fields(*coordinates))
+
+        updated_item = await update_item(item_id, updates)
+        if not updated_item:
+            return jsonify({'error': 'Item not found'}), 404
+        return jsonify(updated_item), 200, {'ETag': item_etag(item_id, item_version(updated_item))}
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/items/<item_id>', methods=['DELETE'])
+async def delete_item_route(item_id):
+    try:
+        # Verify authentication
+        is_auth_valid, auth_error = verify_auth(request)
+        if not is_auth_valid:
+            return jsonify({'error': f'Authentication failed: {auth_error}'}), 401
+
+        if not await delete_item(item_id):
+            return jsonify({'error': 'Item not found'}), 404
+        return '', 204
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -1,3 +1,4 @@
+import os
 from aws_cdk import (
     Stack,
     aws_dynamodb as dynamodb,
@@ -5,13 +6,33 @@ from aws_cdk import (
     aws_apigateway as apigateway,
     aws_cognito as cognito,
     aws_cloudwatch as cloudwatch,
+    aws_grafana as grafana,
     aws_kinesis as kinesis,
+    aws_logs as logs,
     aws_iam as iam,
+    triggers,
     RemovalPolicy,
     Duration,
 )
 from constructs import Construct
 
+# Lambda code, resolved from this file so the stack synthesizes from any directory
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lambda")
+
+# Global secondary indexes of ItemsTable as (name, partition key, sort key), in the
+# order they were added. A new table is created with all of them. CloudFormation
+# creates at most one GSI per update of an existing table, so an existing table
+# gains them over consecutive deployments, `cdk deploy -c itemsTableIndexes=N` with
+# N going up by one each time. Functions are told which ones exist.
+ITEMS_TABLE_INDEXES = [
+    ("postcode-index", ("postcode", dynamodb.AttributeType.STRING), ("id", dynamodb.AttributeType.STRING)),
+    ("direction-startDate-index", ("directionFromNY", dynamodb.AttributeType.STRING),
+     ("startDate", dynamodb.AttributeType.STRING)),
+    # distanceBucket is floor(distanceFromNY / 500), written by dynamo_utils alongside the distance
+    ("distance-index", ("distanceBucket", dynamodb.AttributeType.NUMBER),
+     ("distanceFromNY", dynamodb.AttributeType.NUMBER))
+]
+
 class ItemAPIStack(Stack):
     def __init__(self, scope: Construct, construct_id: str, **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
@@ -32,6 +53,20 @@ class ItemAPIStack(Stack):
             removal_policy=RemovalPolicy.DESTROY  # For development, use RETAIN for production
         )
 
+        # Counters shared by all functions, such as the items' collection version
+        # behind list ETags and the in-process index refresh
+        counters_table = dynamodb.Table(
+            self, "CountersTable",
+            partition_key=dynamodb.Attribute(
+                name="id",
+                type=dynamodb.AttributeType.STRING
+            ),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            # Change records of item writes expire (dynamo_utils.CHANGE_LOG_TTL_SECONDS)
+            time_to_live_attribute="expiresAt",
+            removal_policy=RemovalPolicy.DESTROY
+        )
+
         # Create app client
         client = user_pool.add_client("ItemsWebClient",
             o_auth=cognito.OAuthSettings(
@@ -64,10 +99,10 @@ class ItemAPIStack(Stack):
         )
 
         # Create CloudWatch Log Group with Kinesis subscription
-        log_group = cloudwatch.LogGroup(
+        log_group = logs.LogGroup(
             self, "ItemsAPILogs",
             log_group_name="/aws/lambda/items-api",
-            retention=cloudwatch.RetentionDays.ONE_WEEK,
+            retention=logs.RetentionDays.ONE_WEEK,
             removal_policy=RemovalPolicy.DESTROY
         )
 
@@ -114,10 +149,21 @@ class ItemAPIStack(Stack):
             removal_policy=RemovalPolicy.DESTROY  # For development, use RETAIN for production
         )
 
+        # Serve the GET /items filters with queries instead of scans (see dynamo_utils._query_plan),
+        # deploying the first itemsTableIndexes of ITEMS_TABLE_INDEXES
+        index_count = self.node.try_get_context("itemsTableIndexes")
+        deployed_indexes = ITEMS_TABLE_INDEXES if index_count is None else ITEMS_TABLE_INDEXES[:int(index_count)]
+        for index_name, partition_key, sort_key in deployed_indexes:
+            items_table.add_global_secondary_index(
+                index_name=index_name,
+                partition_key=dynamodb.Attribute(name=partition_key[0], type=partition_key[1]),
+                sort_key=dynamodb.Attribute(name=sort_key[0], type=sort_key[1])
+            )
+
         # Create Lambda layers
         shared_layer = _lambda.LayerVersion(
             self, "SharedLayer",
-            code=_lambda.Code.from_asset("lambda/shared"),
+            code=_lambda.Code.from_asset(os.path.join(LAMBDA_DIR, "shared")),
             compatible_runtimes=[_lambda.Runtime.PYTHON_3_11],
             description="Layer containing shared utilities and external dependencies"
         )
@@ -129,14 +175,27 @@ class ItemAPIStack(Stack):
             "LOG_LEVEL": "INFO",
             "POWERTOOLS_SERVICE_NAME": "items-api",
             "POWERTOOLS_METRICS_NAMESPACE": "ItemsAPI",
-            "KINESIS_STREAM_NAME": log_stream.stream_name
+            "KINESIS_STREAM_NAME": log_stream.stream_name,
+            # Items live in ItemsTable (see shared/storage.py). The shared geocoding
+            # cache tier is a MongoDB collection, which this stack does not provision
+            "STORAGE_BACKEND": "dynamodb",
+            "ITEMS_TABLE": items_table.table_name,
+            "ITEMS_TABLE_INDEXES": ",".join(index_name for index_name, _, _ in deployed_indexes),
+            "COUNTERS_TABLE": counters_table.table_name,
+            # Writes are counted on 8 counter items, each taking about 1000 writes a second
+            "COUNTER_SHARDS": "8",
+            # Full-table reads (statistics, index builds, streamed lists) scan 4 segments in parallel
+            "SCAN_SEGMENTS": "4",
+            # Bulk endpoints send up to 4 BatchGetItem/BatchWriteItem requests at once
+            "BATCH_CONCURRENCY": "4",
+            "GEOCACHE_SHARED_TIER": "false"
         }
 
         # Create mock Kinesis consumer Lambda
         mock_consumer = _lambda.Function(
             self, "MockKinesisConsumer",
             runtime=_lambda.Runtime.PYTHON_3_11,
-            code=_lambda.Code.from_asset("lambda"),
+            code=_lambda.Code.from_asset(LAMBDA_DIR),
             handler="mock_consumer.handler",
             environment=lambda_environment
         )
@@ -148,27 +207,70 @@ class ItemAPIStack(Stack):
         create_function = _lambda.Function(
             self, "CreateItemFunction",
             runtime=_lambda.Runtime.PYTHON_3_11,
-            code=_lambda.Code.from_asset("lambda"),
+            code=_lambda.Code.from_asset(LAMBDA_DIR),
             handler="create_item.handler",
             environment=lambda_environment,
             layers=[shared_layer]
         )
         log_stream.grant_write(create_function)
 
+        create_batch_function = _lambda.Function(
+            self, "CreateItemsBatchFunction",
+            runtime=_lambda.Runtime.PYTHON_3_11,
+            code=_lambda.Code.from_asset(LAMBDA_DIR),
+            handler="create_items_batch.handler",
+            environment=lambda_environment,
+            layers=[shared_layer],
+            timeout=Duration.seconds(30)
+        )
+        log_stream.grant_write(create_batch_function)
+
         get_items_function = _lambda.Function(
             self, "GetItemsFunction",
             runtime=_lambda.Runtime.PYTHON_3_11,
-            code=_lambda.Code.from_asset("lambda"),
+            code=_lambda.Code.from_asset(LAMBDA_DIR),
             handler="get_items.handler",
             environment=lambda_environment,
             layers=[shared_layer]
         )
         log_stream.grant_write(get_items_function)
 
+        get_items_near_function = _lambda.Function(
+            self, "GetItemsNearFunction",
+            runtime=_lambda.Runtime.PYTHON_3_11,
+            code=_lambda.Code.from_asset(LAMBDA_DIR),
+            handler="get_items_near.handler",
+            environment=lambda_environment,
+            layers=[shared_layer]
+        )
+        log_stream.grant_write(get_items_near_function)
+
+        # The aggregation reads the whole collection, so it gets more time than single-item reads
+        get_items_stats_function = _lambda.Function(
+            self, "GetItemsStatsFunction",
+            runtime=_lambda.Runtime.PYTHON_3_11,
+            code=_lambda.Code.from_asset(LAMBDA_DIR),
+            handler="get_items_stats.handler",
+            environment=lambda_environment,
+            layers=[shared_layer],
+            timeout=Duration.seconds(30)
+        )
+        log_stream.grant_write(get_items_stats_function)
+
+        search_items_function = _lambda.Function(
+            self, "SearchItemsFunction",
+            runtime=_lambda.Runtime.PYTHON_3_11,
+            code=_lambda.Code.from_asset(LAMBDA_DIR),
+            handler="search_items.handler",
+            environment=lambda_environment,
+            layers=[shared_layer]
+        )
+        log_stream.grant_write(search_items_function)
+
         get_item_function = _lambda.Function(
             self, "GetItemFunction",
             runtime=_lambda.Runtime.PYTHON_3_11,
-            code=_lambda.Code.from_asset("lambda"),
+            code=_lambda.Code.from_asset(LAMBDA_DIR),
             handler="get_item.handler",
             environment=lambda_environment,
             layers=[shared_layer]
@@ -178,7 +280,7 @@ class ItemAPIStack(Stack):
         update_function = _lambda.Function(
             self, "UpdateItemFunction",
             runtime=_lambda.Runtime.PYTHON_3_11,
-            code=_lambda.Code.from_asset("lambda"),
+            code=_lambda.Code.from_asset(LAMBDA_DIR),
             handler="update_item.handler",
             environment=lambda_environment,
             layers=[shared_layer]
@@ -188,13 +290,62 @@ class ItemAPIStack(Stack):
         delete_function = _lambda.Function(
             self, "DeleteItemFunction",
             runtime=_lambda.Runtime.PYTHON_3_11,
-            code=_lambda.Code.from_asset("lambda"),
+            code=_lambda.Code.from_asset(LAMBDA_DIR),
             handler="delete_item.handler",
             environment=lambda_environment,
             layers=[shared_layer]
         )
         log_stream.grant_write(delete_function)
 
+        update_batch_function = _lambda.Function(
+            self, "UpdateItemsBatchFunction",
+            runtime=_lambda.Runtime.PYTHON_3_11,
+            code=_lambda.Code.from_asset(LAMBDA_DIR),
+            handler="update_items_batch.handler",
+            environment=lambda_environment,
+            layers=[shared_layer],
+            timeout=Duration.seconds(30)
+        )
+        log_stream.grant_write(update_batch_function)
+
+        delete_batch_function = _lambda.Function(
+            self, "DeleteItemsBatchFunction",
+            runtime=_lambda.Runtime.PYTHON_3_11,
+            code=_lambda.Code.from_asset(LAMBDA_DIR),
+            handler="delete_items_batch.handler",
+            environment=lambda_environment,
+            layers=[shared_layer],
+            timeout=Duration.seconds(30)
+        )
+        log_stream.grant_write(delete_batch_function)
+
+        # Item table access, least privilege per function
+        for function in (get_items_function, get_items_near_function, get_items_stats_function,
+                         search_items_function, get_item_function):
+            items_table.grant_read_data(function)
+            counters_table.grant_read_data(function)
+        for function in (create_function, create_batch_function, update_function, delete_function,
+                         update_batch_function, delete_batch_function):
+            items_table.grant_read_write_data(function)
+            counters_table.grant_read_write_data(function)
+
+        # Data backfills (dynamo_utils.backfill_distance_buckets) run during each
+        # deployment that changes the Lambda code, once the functions writing the new
+        # attributes are live, so existing items appear in the distance-filtered lists
+        backfill_function = triggers.TriggerFunction(
+            self, "BackfillItemsFunction",
+            runtime=_lambda.Runtime.PYTHON_3_11,
+            code=_lambda.Code.from_asset(LAMBDA_DIR),
+            handler="backfill_items.handler",
+            environment=lambda_environment,
+            layers=[shared_layer],
+            timeout=Duration.minutes(15),
+            execute_after=[items_table, create_function, create_batch_function, update_function,
+                           update_batch_function]
+        )
+        items_table.grant_read_write_data(backfill_function)
+        counters_table.grant_read_write_data(backfill_function)
+
 
         # Create Authorizer
         auth = apigateway.CognitoUserPoolsAuthorizer(
@@ -210,19 +361,33 @@ class ItemAPIStack(Stack):
         )
 
         # Add authorization to all methods
-        auth_settings = apigateway.MethodOptions(
+        auth_settings = dict(
             authorizer=auth,
             authorization_type=apigateway.AuthorizationType.COGNITO
         )
 
         items = api.root.add_resource("items")
-        items.add_method("GET", apigateway.LambdaIntegration(get_items_function), auth_settings)
-        items.add_method("POST", apigateway.LambdaIntegration(create_function), auth_settings)
+        items.add_method("GET", apigateway.LambdaIntegration(get_items_function), **auth_settings)
+        items.add_method("POST", apigateway.LambdaIntegration(create_function), **auth_settings)
+
+        items_batch = api.root.add_resource("items:batch")
+        items_batch.add_method("POST", apigateway.LambdaIntegration(create_batch_function), **auth_settings)
+        items_batch.add_method("PATCH", apigateway.LambdaIntegration(update_batch_function), **auth_settings)
+        items_batch.add_method("DELETE", apigateway.LambdaIntegration(delete_batch_function), **auth_settings)
+
+        items_near = items.add_resource("near")
+        items_near.add_method("GET", apigateway.LambdaIntegration(get_items_near_function), **auth_settings)
+
+        items_stats = items.add_resource("stats")
+        items_stats.add_method("GET", apigateway.LambdaIntegration(get_items_stats_function), **auth_settings)
+
+        items_search = items.add_resource("search")
+        items_search.add_method("GET", apigateway.LambdaIntegration(search_items_function), **auth_settings)
 
         item = items.add_resource("{id}")
-        item.add_method("GET", apigateway.LambdaIntegration(get_item_function), auth_settings)
-        item.add_method("PATCH", apigateway.LambdaIntegration(update_function), auth_settings)
-        item.add_method("DELETE", apigateway.LambdaIntegration(delete_function), auth_settings)
+        item.add_method("GET", apigateway.LambdaIntegration(get_item_function), **auth_settings)
+        item.add_method("PATCH", apigateway.LambdaIntegration(update_function), **auth_settings)
+        item.add_method("DELETE", apigateway.LambdaIntegration(delete_function), **auth_settings)
 
     def create_grafana_role(self):
         """Create IAM role for Grafana workspace"""
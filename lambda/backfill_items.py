@@ -0,0 +1,18 @@
+import time
+from shared.dynamo_utils import backfill_distance_buckets
+from shared.cloudwatch_logger import setup_logging, logger
+
+# Set up logging with Lambda Powertools
+setup_logging("backfill_items")
+
+def handler(event, context):
+    """Bring items written by earlier versions up to date; run by a CDK trigger at deploy time.
+
+    Safe to run again: only items still missing an attribute are updated. An
+    exception fails the deployment.
+    """
+    start_time = time.time()
+    logger.info("Backfilling items")
+    updated = backfill_distance_buckets()
+    logger.info(f"Gave {updated} items their distance bucket in {time.time() - start_time:.1f}s")
+    return {'distanceBuckets': updated}
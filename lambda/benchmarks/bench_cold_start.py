@@ -0,0 +1,40 @@
+"""Time to the first item read in a fresh process, with and without index bootstrap.
+
+'bootstrap' repeats what every new container used to do before its first query
+(create_index for each declared index), 'schema check' reads the schema version
+once, and 'no check' goes straight to the query. Needs a real server:
+
+    MONGODB_URI=mongodb://... python -m benchmarks.bench_cold_start [runs]
+"""
+import os
+import sys
+import time
+import statistics
+from pymongo import MongoClient
+from shared.mongo_utils import INDEXES
+from shared.migrations import current_version, migrate
+
+def _first_read(uri: str, mode: str) -> float:
+    start = time.perf_counter()
+    client = MongoClient(uri)
+    db = client.items_db
+    if mode == 'bootstrap':
+        for keys, options in INDEXES['items']:
+            db.items.create_index(keys, **options)
+    elif mode == 'schema check':
+        current_version(db)
+    db.items.find_one({'id': 'cold-start-probe'}, {'_id': 0})
+    elapsed = time.perf_counter() - start
+    client.close()
+    return elapsed
+
+def main(runs: int = 20) -> None:
+    uri = os.environ.get('MONGODB_URI', 'mongodb://localhost:27017')
+    migrate(MongoClient(uri).items_db)
+
+    for mode in ('bootstrap', 'schema check', 'no check'):
+        timings = [_first_read(uri, mode) * 1000 for _ in range(runs)]
+        print(f"{mode:<13} median {statistics.median(timings):7.2f} ms   max {max(timings):7.2f} ms")
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -0,0 +1,43 @@
+"""Throughput of the batch distance/direction API against per-point geopy calls.
+
+Run from the lambda directory:
+    python -m benchmarks.bench_distance [points]
+"""
+import sys
+import time
+import numpy as np
+from geopy.distance import geodesic
+from shared.geocoding import (
+    NY_LAT, NY_LON, calculate_distances_from_ny, get_directions_from_ny, geodesic_miles
+)
+
+def main(points: int = 1_000_000) -> None:
+    rng = np.random.default_rng(42)
+    # Roughly the bounding box of the contiguous US
+    lats = rng.uniform(24.5, 49.5, points)
+    lons = rng.uniform(-125.0, -66.9, points)
+
+    start = time.perf_counter()
+    distances = calculate_distances_from_ny(lats, lons)
+    directions = get_directions_from_ny(lats, lons)
+    batch_seconds = time.perf_counter() - start
+
+    sample = min(points, 10_000)
+    start = time.perf_counter()
+    expected = np.array([
+        geodesic((NY_LAT, NY_LON), (lat, lon)).miles for lat, lon in zip(lats[:sample], lons[:sample])
+    ])
+    scalar_seconds = (time.perf_counter() - start) * points / sample
+
+    max_error = np.abs(geodesic_miles(NY_LAT, NY_LON, lats[:sample], lons[:sample]) - expected).max()
+
+    print(f"points:            {points:,}")
+    print(f"batch:             {batch_seconds:.3f}s ({points / batch_seconds:,.0f} points/s)")
+    print(f"geopy (estimated): {scalar_seconds:.3f}s ({points / scalar_seconds:,.0f} points/s)")
+    print(f"speedup:           {scalar_seconds / batch_seconds:.1f}x")
+    print(f"max error vs geopy: {max_error * 1609.344 * 1000:.6f} mm")
+    assert distances.shape == directions.shape == (points,)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,44 @@
+"""Query latency of the in-process indexes the DynamoDB backend answers from.
+
+Run from the lambda directory:
+    python -m benchmarks.bench_indexes [items]
+"""
+import sys
+import time
+import numpy as np
+from typing import Callable, Dict
+from shared.spatial_index import SpatialIndex
+
+QUERIES = 200
+
+
+def _per_query_ms(query: Callable[[int], object], queries: int = QUERIES) -> float:
+    start = time.perf_counter()
+    for i in range(queries):
+        query(i)
+    return (time.perf_counter() - start) / queries * 1000
+
+
+def spatial(items: int) -> Dict[str, float]:
+    rng = np.random.default_rng(1)
+    index = SpatialIndex()
+    index.build(
+        {'id': str(i), 'latitude': float(lat), 'longitude': float(lon)}
+        for i, (lat, lon) in enumerate(zip(rng.uniform(-89, 89, items), rng.uniform(-180, 180, items)))
+    )
+    points = list(zip(rng.uniform(25, 49, QUERIES), rng.uniform(-124, -67, QUERIES)))
+    return {
+        'nearest k=10': _per_query_ms(lambda i: index.nearest(*points[i], k=10)),
+        'radius 25mi': _per_query_ms(lambda i: index.within_radius(*points[i], 25)),
+        'radius 300mi': _per_query_ms(lambda i: index.within_radius(*points[i], 300))
+    }
+
+
+def main(items: int = 50_000) -> None:
+    print(f"items: {items:,}")
+    for name, ms in spatial(items).items():
+        print(f"spatial {name:<14} {ms:8.3f} ms/query")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50_000)
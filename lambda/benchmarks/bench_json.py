@@ -0,0 +1,80 @@
+"""Encoding time of list response bodies by JSON serializer.
+
+Encodes {"items": [...]} payloads the way each store returns items: MongoDB with
+floats, DynamoDB with every number a Decimal. 'DecimalEncoder' is the
+json.JSONEncoder subclass that create_response used before shared.serializer.
+'pre-serialized' is a cached body, which only has to be decoded to text. Run from
+the lambda directory:
+
+    python -m benchmarks.bench_json [items]
+"""
+import sys
+import json
+import time
+import statistics
+from decimal import Decimal
+from typing import Any, Callable, Dict
+from shared import serializer
+from shared.validation import DecimalEncoder
+
+PAYLOADS = ('mongo', 'dynamodb')
+
+
+def _item(i: int, number: Callable[[Any], Any]) -> Dict[str, Any]:
+    return {
+        'id': f'item-{i:06d}', 'name': f'Item {i}', 'postcode': f'{10001 + i % 500}', 'users': ['John Doe', 'Jane Doe'],
+        'startDate': '2025-03-26T00:00:00Z', 'latitude': number(40.7128 + i / 10000), 'longitude': number(-74.006 - i / 10000),
+        'distanceFromNY': number(round(i % 2500 * 1.37, 2)), 'directionFromNY': 'NE', 'version': number(1 + i % 5),
+        'updatedAt': '2025-03-26T00:00:00.000000Z'
+    }
+
+
+def payload(kind: str, items: int) -> Dict[str, Any]:
+    number = (lambda value: Decimal(str(value))) if kind == 'dynamodb' else (lambda value: value)
+    return {'items': [_item(i, number) for i in range(items)], 'next': None}
+
+
+def _encoders() -> Dict[str, Callable[[Any], Any]]:
+    encoders = {'DecimalEncoder': lambda body: json.dumps(body, cls=DecimalEncoder)}
+    for name in serializer.SERIALIZERS:
+        try:
+            encode = serializer.load_serializer(name)
+        except ValueError:
+            continue
+        encoders[name] = lambda body, encode=encode: encode(body).decode()
+    return encoders
+
+
+def _timed(encode: Callable[[], str], repeats: int) -> Dict[str, float]:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        text = encode()
+        timings.append(time.perf_counter() - start)
+    median = statistics.median(timings)
+    return {'median_ms': median * 1000, 'mb_per_s': len(text.encode()) / 1e6 / median if median else float('inf')}
+
+
+def run(items: int = 10_000, repeats: int = 20) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """Results per payload, then per encoder"""
+    results = {}
+    for kind in PAYLOADS:
+        body = payload(kind, items)
+        results[kind] = {name: _timed(lambda: encode(body), repeats) for name, encode in _encoders().items()}
+        cached = serializer.load_serializer('json')(body)
+        results[kind]['pre-serialized'] = _timed(lambda: serializer.as_text(cached), repeats)
+    return results
+
+
+def main(items: int = 10_000) -> None:
+    results = run(items)
+    print(f"items per payload: {items:,}")
+    print(f"{'payload':<9} {'encoder':<15} {'median ms':>10} {'MB/s':>9} {'speedup':>8}")
+    for kind, encoders in results.items():
+        baseline = encoders['DecimalEncoder']['median_ms']
+        for name, r in encoders.items():
+            print(f"{kind:<9} {name:<15} {r['median_ms']:10.2f} {r['mb_per_s']:9.1f} {baseline / r['median_ms']:7.1f}x")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000)
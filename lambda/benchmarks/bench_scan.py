@@ -0,0 +1,60 @@
+"""Full-table scan time in dynamo_utils by number of parallel segments, on a moto table.
+
+Also reports what a single scan() call returns, which is one 1 MB page rather
+than the table, and how soon the generator yields its first item. moto serves
+requests in-process under the GIL, spending a few milliseconds per returned item,
+so segments overlap little here and 100,000 items take minutes. Against DynamoDB
+each segment waits on its own network round trips. Run from the lambda directory:
+
+    python -m benchmarks.bench_scan [items] [segments ...]
+"""
+import sys
+import time
+import logging
+from typing import Any, Dict, List, Sequence
+from benchmarks.bench_storage import SETUPS
+import shared.dynamo_utils as dynamo_utils
+
+DEFAULT_SEGMENTS = (1, 4, 16)
+
+
+def _item(i: int) -> Dict[str, Any]:
+    # Few attributes: moto's response serializer costs time per attribute
+    return {'id': f'item-{i:07d}', 'name': f'Item {i}', 'postcode': f'{10001 + i % 500}', 'distanceFromNY': float(i % 2500)}
+
+
+def _scan(segments: int) -> Dict[str, float]:
+    start = time.perf_counter()
+    items = dynamo_utils.iter_items(segments=segments)
+    next(items)
+    first = time.perf_counter() - start
+    count = 1 + sum(1 for _ in items)
+    seconds = time.perf_counter() - start
+    return {'count': count, 'seconds': seconds, 'first_ms': first * 1000}
+
+
+def run(items: int = 100_000, segment_counts: Sequence[int] = DEFAULT_SEGMENTS) -> Dict[str, Any]:
+    """Single-call scan size and, per segment count, items read, total seconds and ms to the first item"""
+    with SETUPS['dynamodb']():
+        for start in range(0, items, 1000):
+            dynamo_utils.put_items([_item(i) for i in range(start, min(start + 1000, items))])
+        results: Dict[str, Any] = {'single_call': len(dynamo_utils.get_table().scan().get('Items', []))}
+        results['segments'] = {segments: _scan(segments) for segments in segment_counts}
+    return results
+
+
+def main(items: int = 100_000, segment_counts: List[int] = None) -> None:
+    # mongo_utils logs at DEBUG, which would have botocore log every request
+    logging.getLogger().setLevel(logging.WARNING)
+    results = run(items, segment_counts or DEFAULT_SEGMENTS)
+    print(f"items: {items:,}   one scan() call returns: {results['single_call']:,}")
+    print(f"{'segments':>8} {'items':>9} {'seconds':>8} {'items/s':>10} {'first item ms':>14} {'speedup':>8}")
+    baseline = results['segments'][min(results['segments'])]['seconds']
+    for segments, r in results['segments'].items():
+        print(f"{segments:>8} {r['count']:>9,} {r['seconds']:>8.2f} {r['count'] / r['seconds']:>10,.0f} "
+              f"{r['first_ms']:>14.1f} {baseline / r['seconds']:>7.2f}x")
+        assert r['count'] == items
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000, [int(arg) for arg in sys.argv[2:]])
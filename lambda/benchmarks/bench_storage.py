@@ -0,0 +1,140 @@
+"""Latency and throughput of each storage backend for the basic item workloads.
+
+Every backend in shared.storage.BACKENDS runs against its in-memory double
+(mongomock for MongoDB, moto for DynamoDB), so the numbers compare client-side
+work and request patterns, not network or server time. Use them to rank the
+backends per workload, not as production latencies. Run from the lambda directory:
+
+    python -m benchmarks.bench_storage [items]
+"""
+import os
+import sys
+import logging
+import time
+import random
+import statistics
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List
+
+# boto3 needs a region and credentials before dynamo_utils creates its resource; moto accepts any
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+
+import boto3
+import mongomock
+from moto import mock_aws
+import shared.dynamo_utils as dynamo_utils
+import shared.mongo_utils as mongo_utils
+from shared.storage import BACKENDS, StorageBackend
+
+WORKLOADS = ('put', 'batch put', 'get', 'update', 'page', 'scan')
+PAGE_SIZE = 100
+
+
+@contextmanager
+def _mongo():
+    mongo_utils.set_mongo_collection(mongomock.MongoClient().items_db.items)
+    try:
+        yield mongo_utils
+    finally:
+        mongo_utils.set_mongo_collection(None)
+
+
+@contextmanager
+def _dynamodb():
+    saved = dynamo_utils.dynamodb, dynamo_utils._table
+    with mock_aws():
+        dynamo_utils.dynamodb = boto3.resource('dynamodb')
+        dynamo_utils._table = dynamo_utils.dynamodb.create_table(
+            TableName='bench-items',
+            KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'id', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        dynamo_utils._indexes = {}
+        try:
+            yield dynamo_utils
+        finally:
+            dynamo_utils.dynamodb, dynamo_utils._table = saved
+            dynamo_utils._indexes = {}
+
+
+SETUPS = {'mongo': _mongo, 'dynamodb': _dynamodb}
+
+
+def _item(i: int, prefix: str = 'item') -> Dict[str, Any]:
+    return {
+        'id': f'{prefix}-{i:06d}', 'name': f'Item {i}', 'postcode': '10001', 'users': ['John Doe'],
+        'startDate': '2025-03-26T00:00:00Z', 'latitude': 40.7128, 'longitude': -74.0060,
+        'distanceFromNY': float(i % 2500), 'directionFromNY': 'NE'
+    }
+
+
+def _timed(operations: List[Callable[[], Any]], units_per_operation: int = 1) -> Dict[str, float]:
+    """Median and p95 latency of each operation and the units processed per second overall"""
+    timings = []
+    for operation in operations:
+        start = time.perf_counter()
+        operation()
+        timings.append(time.perf_counter() - start)
+    total = sum(timings)
+    timings.sort()
+    return {
+        'median_ms': statistics.median(timings) * 1000,
+        'p95_ms': timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000,
+        'per_s': len(timings) * units_per_operation / total if total else float('inf')
+    }
+
+
+def _walk_pages(backend: StorageBackend) -> None:
+    after = None
+    while True:
+        _, after = backend.get_items_page(PAGE_SIZE, after)
+        if after is None:
+            return
+
+
+def bench_backend(backend: StorageBackend, items: int) -> Dict[str, Dict[str, float]]:
+    rng = random.Random(42)
+    ids = [f'item-{i:06d}' for i in range(items)]
+    results = {
+        'put': _timed([lambda i=i: backend.create_item(_item(i)) for i in range(items)]),
+        'batch put': _timed([lambda: backend.create_items([_item(i, 'batch') for i in range(items)])], items)
+    }
+    results['get'] = _timed([lambda item_id=item_id: backend.get_item(item_id) for item_id in rng.choices(ids, k=items)])
+    results['update'] = _timed([
+        lambda item_id=item_id, n=n: backend.update_item(item_id, {'name': f'Renamed {n}'})
+        for n, item_id in enumerate(rng.choices(ids, k=items))
+    ])
+    # Both collections are read: the items and the batch-written copies
+    results['page'] = _timed([lambda: _walk_pages(backend)], 2 * items)
+    results['scan'] = _timed([lambda: sum(1 for _ in backend.iter_items())], 2 * items)
+    return results
+
+
+def run(items: int = 1000) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """Results per backend, then per workload"""
+    results = {}
+    for name in BACKENDS:
+        with SETUPS[name]() as backend:
+            results[name] = bench_backend(backend, items)
+    return results
+
+
+def main(items: int = 1000) -> None:
+    # mongo_utils logs at DEBUG, which would have botocore log every request
+    logging.getLogger().setLevel(logging.WARNING)
+    results = run(items)
+    print(f"items: {items:,} (page and scan read {2 * items:,}; throughput is items/s)")
+    print(f"{'workload':<10} {'backend':<9} {'median ms':>10} {'p95 ms':>9} {'per s':>11}")
+    for workload in WORKLOADS:
+        for name in results:
+            r = results[name][workload]
+            print(f"{workload:<10} {name:<9} {r['median_ms']:10.3f} {r['p95_ms']:9.3f} {r['per_s']:11,.0f}")
+        fastest = max(results, key=lambda name: results[name][workload]['per_s'])
+        print(f"{'':<10} fastest: {fastest}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
@@ -1,9 +1,9 @@
 import json
 import uuid
 import time
-from shared.validation import validate_item, create_response, verify_auth
-from shared.geocoding import get_coordinates, calculate_distance_from_ny, get_direction_from_ny
-from shared.mongo_utils import create_item
+from shared.validation import validate_item, create_response, verify_auth, item_etag, item_version
+from shared.geocoding import get_coordinates, location_fields
+from shared.storage import create_item
 from shared.cloudwatch_logger import setup_logging, logger, log_event, log_api_metrics, metrics
 
 # Set up logging with Lambda Powertools
@@ -45,25 +45,14 @@ def handler(event, context):
             log_api_metrics("CreateItem", status_code, (time.time() - start_time) * 1000)
             return response
 
-        lat, lon = coordinates
-        distance_from_ny = calculate_distance_from_ny(lat, lon)
-        direction_from_ny = get_direction_from_ny(lat, lon)
-
         # Create item with additional data
-        item = {
-            'id': str(uuid.uuid4()),
-            **body,
-            'latitude': float(lat),
-            'longitude': float(lon),
-            'distanceFromNY': float(distance_from_ny),
-            'directionFromNY': direction_from_ny
-        }
+        item = {'id': str(uuid.uuid4()), **body, **location_fields(*coordinates)}
 
         logger.info("Creating item in MongoDB", extra={"item": item})
         create_item(item)
 
         status_code = 201
-        response = create_response(status_code, item)
+        response = create_response(status_code, item, {'ETag': item_etag(item['id'], item_version(item))})
         log_api_metrics("CreateItem", status_code, (time.time() - start_time) * 1000)
         return response
 
@@ -0,0 +1,46 @@
+import json
+import time
+from shared.validation import create_response, verify_auth
+from shared.batch import parse_batch, create_items_batch
+from shared.cloudwatch_logger import setup_logging, logger, log_event, log_api_metrics, metrics
+
+# Set up logging with Lambda Powertools
+setup_logging("create_items_batch")
+
+@metrics.log_metrics  # Add metrics
+def handler(event, context):
+    start_time = time.time()
+    try:
+        log_event(event, context)
+        logger.info("Processing batch create items request")
+
+        # Verify authentication
+        is_auth_valid, auth_error = verify_auth(event)
+        if not is_auth_valid:
+            logger.error(f"Authentication error: {auth_error}")
+            status_code = 401
+            response = create_response(status_code, {'error': f'Authentication failed: {auth_error}'})
+            log_api_metrics("CreateItemsBatch", status_code, (time.time() - start_time) * 1000)
+            return response
+
+        try:
+            bodies = parse_batch(json.loads(event['body']))
+        except ValueError as e:
+            logger.error(f"Validation error: {str(e)}")
+            status_code = 400
+            response = create_response(status_code, {'error': str(e)})
+            log_api_metrics("CreateItemsBatch", status_code, (time.time() - start_time) * 1000)
+            return response
+
+        status_code, body = create_items_batch(bodies)
+        logger.info(f"Created {body['created']} of {len(bodies)} items")
+        response = create_response(status_code, body)
+        log_api_metrics("CreateItemsBatch", status_code, (time.time() - start_time) * 1000)
+        return response
+
+    except Exception as e:
+        logger.exception("Error creating items")
+        status_code = 500
+        response = create_response(status_code, {'error': str(e)})
+        log_api_metrics("CreateItemsBatch", status_code, (time.time() - start_time) * 1000)
+        return response
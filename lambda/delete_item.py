@@ -1,5 +1,5 @@
 from shared.validation import create_response, verify_auth
-from shared.mongo_utils import get_item, delete_item
+from shared.storage import delete_item
 from shared.cloudwatch_logger import setup_logging, logger, log_event, log_api_metrics, metrics
 import time
 
@@ -24,18 +24,14 @@ def handler(event, context):
 
         item_id = event['pathParameters']['id']
 
-        # Check if item exists
-        existing_item = get_item(item_id)
-        if not existing_item:
+        logger.info(f"Deleting item {item_id}")
+        if not delete_item(item_id):
             logger.info(f"Item not found: {item_id}")
             status_code = 404
             response = create_response(status_code, {'error': 'Item not found'})
             log_api_metrics("DeleteItem", status_code, (time.time() - start_time) * 1000)
             return response
 
-        logger.info(f"Deleting item {item_id}")
-        delete_item(item_id)
-
         status_code = 204
         response = create_response(status_code, {})
         log_api_metrics("DeleteItem", status_code, (time.time() - start_time) * 1000)
@@ -1,5 +1,7 @@
-from shared.validation import create_response, verify_auth
-from shared.mongo_utils import get_item
+from shared.validation import create_response, verify_auth, parse_fields, get_header, item_etag, etag_matches
+from shared.storage import get_item_and_version, get_item_version, item_cache_stats
+from shared.item_cache import get_body_cache
+from shared.serializer import dumps_cached
 from shared.cloudwatch_logger import setup_logging, logger, log_event, log_api_metrics, metrics
 import time
 
@@ -23,18 +25,40 @@ def handler(event, context):
             return response
 
         item_id = event['pathParameters']['id']
-        item = get_item(item_id)
+
+        try:
+            fields = parse_fields((event.get('queryStringParameters') or {}).get('fields'))
+        except ValueError as e:
+            logger.error(f"Validation error: {str(e)}")
+            status_code = 400
+            response = create_response(status_code, {'error': str(e)})
+            log_api_metrics("GetItem", status_code, (time.time() - start_time) * 1000)
+            return response
+
+        # A revalidation only needs the version, so an unchanged item is never fetched
+        if_none_match = get_header(event, 'If-None-Match')
+        if if_none_match:
+            version = get_item_version(item_id)
+            if version is not None and etag_matches(if_none_match, item_etag(item_id, version, fields)):
+                status_code = 304
+                response = create_response(status_code, None, {'ETag': item_etag(item_id, version, fields)})
+                log_api_metrics("GetItem", status_code, (time.time() - start_time) * 1000, item_cache_stats())
+                return response
+
+        item, version = get_item_and_version(item_id, fields)
 
         if not item:
             logger.info(f"Item not found: {item_id}")
             status_code = 404
             response = create_response(status_code, {'error': 'Item not found'})
-            log_api_metrics("GetItem", status_code, (time.time() - start_time) * 1000)
+            log_api_metrics("GetItem", status_code, (time.time() - start_time) * 1000, item_cache_stats())
             return response
 
+        # Repeated reads of an unchanged item reuse its encoded body
+        etag = item_etag(item_id, version, fields)
         status_code = 200
-        response = create_response(status_code, item)
-        log_api_metrics("GetItem", status_code, (time.time() - start_time) * 1000)
+        response = create_response(status_code, dumps_cached(get_body_cache(), etag, item), {'ETag': etag})
+        log_api_metrics("GetItem", status_code, (time.time() - start_time) * 1000, item_cache_stats())
         return response
 
     except Exception as e:
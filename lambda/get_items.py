@@ -1,5 +1,6 @@
-from shared.validation import create_response
-from shared.mongo_utils import get_all_items
+from shared.validation import (create_response, parse_list_params, multi_get_body, encode_page_token, get_header,
+                               list_etag, etag_matches, DEFAULT_PAGE_SIZE)
+from shared.storage import get_items_page, check_page_key, get_items_by_ids, get_collection_version
 from shared.cloudwatch_logger import setup_logging, logger, log_event, log_api_metrics, metrics
 import time
 
@@ -13,9 +14,42 @@ def handler(event, context):
         log_event(event, context)
         logger.info("Processing get items request")
 
-        items = get_all_items()
+        params = event.get('queryStringParameters')
+        try:
+            multi_get, page_params = parse_list_params(params)
+            if page_params:
+                if page_params['after']:
+                    check_page_key(page_params['after'], page_params['filters'])
+                # Responses are built in memory and capped at 6 MB by API Gateway, so
+                # clients that do not page get the first page and a next token
+                if page_params['limit'] is None:
+                    page_params['limit'] = DEFAULT_PAGE_SIZE
+        except ValueError as e:
+            logger.error(f"Validation error: {str(e)}")
+            status_code = 400
+            response = create_response(status_code, {'error': str(e)})
+            log_api_metrics("GetItems", status_code, (time.time() - start_time) * 1000)
+            return response
+
+        # ?ids=a,b,c reads every listed item in one query instead of one request per item
+        if multi_get is not None:
+            items = get_items_by_ids(**multi_get)
+            status_code = 200
+            response = create_response(status_code, multi_get_body(multi_get['ids'], items))
+            log_api_metrics("GetItems", status_code, (time.time() - start_time) * 1000)
+            return response
+
+        # Polling clients whose copy is current get a 304 without the page being read
+        etag = list_etag(get_collection_version(), page_params)
+        if etag_matches(get_header(event, 'If-None-Match'), etag):
+            status_code = 304
+            response = create_response(status_code, None, {'ETag': etag})
+            log_api_metrics("GetItems", status_code, (time.time() - start_time) * 1000)
+            return response
+
+        items, next_key = get_items_page(**page_params)
         status_code = 200
-        response = create_response(status_code, {'items': items})
+        response = create_response(status_code, {'items': items, 'next': encode_page_token(next_key)}, {'ETag': etag} if etag else None)
         log_api_metrics("GetItems", status_code, (time.time() - start_time) * 1000)
         return response
 
@@ -24,4 +58,4 @@ def handler(event, context):
         status_code = 500
         response = create_response(status_code, {'error': str(e)})
         log_api_metrics("GetItems", status_code, (time.time() - start_time) * 1000)
-        return response
\ No newline at end of file
+        return response
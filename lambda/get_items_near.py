@@ -0,0 +1,45 @@
+from shared.validation import create_response, verify_auth, parse_near_params
+from shared.storage import find_items_near
+from shared.cloudwatch_logger import setup_logging, logger, log_event, log_api_metrics, metrics
+import time
+
+# Set up logging with Lambda Powertools
+setup_logging("get_items_near")
+
+@metrics.log_metrics  # Add metrics
+def handler(event, context):
+    start_time = time.time()
+    try:
+        log_event(event, context)
+        logger.info("Processing get items near request")
+
+        # Verify authentication
+        is_auth_valid, auth_error = verify_auth(event)
+        if not is_auth_valid:
+            logger.error(f"Authentication error: {auth_error}")
+            status_code = 401
+            response = create_response(status_code, {'error': f'Authentication failed: {auth_error}'})
+            log_api_metrics("GetItemsNear", status_code, (time.time() - start_time) * 1000)
+            return response
+
+        try:
+            params = parse_near_params(event.get('queryStringParameters'))
+        except ValueError as e:
+            logger.error(f"Validation error: {str(e)}")
+            status_code = 400
+            response = create_response(status_code, {'error': str(e)})
+            log_api_metrics("GetItemsNear", status_code, (time.time() - start_time) * 1000)
+            return response
+
+        items = find_items_near(**params)
+        status_code = 200
+        response = create_response(status_code, {'items': items})
+        log_api_metrics("GetItemsNear", status_code, (time.time() - start_time) * 1000)
+        return response
+
+    except Exception as e:
+        logger.exception("Error getting items near")
+        status_code = 500
+        response = create_response(status_code, {'error': str(e)})
+        log_api_metrics("GetItemsNear", status_code, (time.time() - start_time) * 1000)
+        return response
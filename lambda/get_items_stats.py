@@ -0,0 +1,53 @@
+from shared.validation import create_response, verify_auth, parse_stats_params, get_header, stats_etag, etag_matches
+from shared.storage import get_item_stats, get_collection_version
+from shared.cloudwatch_logger import setup_logging, logger, log_event, log_api_metrics, metrics
+import time
+
+# Set up logging with Lambda Powertools
+setup_logging("get_items_stats")
+
+@metrics.log_metrics  # Add metrics
+def handler(event, context):
+    start_time = time.time()
+    try:
+        log_event(event, context)
+        logger.info("Processing get items stats request")
+
+        # Verify authentication
+        is_auth_valid, auth_error = verify_auth(event)
+        if not is_auth_valid:
+            logger.error(f"Authentication error: {auth_error}")
+            status_code = 401
+            response = create_response(status_code, {'error': f'Authentication failed: {auth_error}'})
+            log_api_metrics("GetItemsStats", status_code, (time.time() - start_time) * 1000)
+            return response
+
+        try:
+            params = parse_stats_params(event.get('queryStringParameters'))
+        except ValueError as e:
+            logger.error(f"Validation error: {str(e)}")
+            status_code = 400
+            response = create_response(status_code, {'error': str(e)})
+            log_api_metrics("GetItemsStats", status_code, (time.time() - start_time) * 1000)
+            return response
+
+        # The aggregation reads every item, so skip it when the collection has not changed
+        etag = stats_etag(get_collection_version(), params)
+        if etag_matches(get_header(event, 'If-None-Match'), etag):
+            status_code = 304
+            response = create_response(status_code, None, {'ETag': etag})
+            log_api_metrics("GetItemsStats", status_code, (time.time() - start_time) * 1000)
+            return response
+
+        stats = get_item_stats(**params)
+        status_code = 200
+        response = create_response(status_code, stats, {'ETag': etag} if etag else None)
+        log_api_metrics("GetItemsStats", status_code, (time.time() - start_time) * 1000)
+        return response
+
+    except Exception as e:
+        logger.exception("Error getting items stats")
+        status_code = 500
+        response = create_response(status_code, {'error': str(e)})
+        log_api_metrics("GetItemsStats", status_code, (time.time() - start_time) * 1000)
+        return response
@@ -0,0 +1,45 @@
+from shared.validation import create_response, verify_auth, parse_search_params, encode_page_token
+from shared.storage import search_items
+from shared.cloudwatch_logger import setup_logging, logger, log_event, log_api_metrics, metrics
+import time
+
+# Set up logging with Lambda Powertools
+setup_logging("search_items")
+
+@metrics.log_metrics  # Add metrics
+def handler(event, context):
+    start_time = time.time()
+    try:
+        log_event(event, context)
+        logger.info("Processing search items request")
+
+        # Verify authentication
+        is_auth_valid, auth_error = verify_auth(event)
+        if not is_auth_valid:
+            logger.error(f"Authentication error: {auth_error}")
+            status_code = 401
+            response = create_response(status_code, {'error': f'Authentication failed: {auth_error}'})
+            log_api_metrics("SearchItems", status_code, (time.time() - start_time) * 1000)
+            return response
+
+        try:
+            params = parse_search_params(event.get('queryStringParameters'))
+        except ValueError as e:
+            logger.error(f"Validation error: {str(e)}")
+            status_code = 400
+            response = create_response(status_code, {'error': str(e)})
+            log_api_metrics("SearchItems", status_code, (time.time() - start_time) * 1000)
+            return response
+
+        items, next_key = search_items(**params)
+        status_code = 200
+        response = create_response(status_code, {'items': items, 'next': encode_page_token(next_key)})
+        log_api_metrics("SearchItems", status_code, (time.time() - start_time) * 1000)
+        return response
+
+    except Exception as e:
+        logger.exception("Error searching items")
+        status_code = 500
+        response = create_response(status_code, {'error': str(e)})
+        log_api_metrics("SearchItems", status_code, (time.time() - start_time) * 1000)
+        return response
@@ -0,0 +1,30 @@
+"""Asyncio version of shared.batch, with the same function surface.
+
+Used by the ASGI server. The steps are shared.batch's; postcodes are geocoded with
+shared.async_geocoding and items written with the Motor client in
+shared.async_mongo_utils, so a batch never blocks the event loop or a worker thread.
+"""
+from typing import Any, Dict, List, Tuple
+from .batch import (
+    _check_creates, _new_items, _create_response, _check_updates, _item_updates, _update_response,
+    _check_deletes, _delete_response
+)
+from .async_geocoding import get_coordinates_many
+from .async_mongo_utils import create_items, update_items, delete_items
+
+async def create_items_batch(bodies: List[Any]) -> Tuple[int, Dict[str, Any]]:
+    """Validate, geocode and insert a batch of new items; see shared.batch.create_items_batch"""
+    results, valid, postcodes = _check_creates(bodies)
+    located, items = _new_items(bodies, results, valid, await get_coordinates_many(postcodes))
+    return _create_response(bodies, results, located, items, await create_items(items))
+
+async def update_items_batch(elements: List[Any]) -> Tuple[int, Dict[str, Any]]:
+    """Apply a batch of partial updates; see shared.batch.update_items_batch"""
+    results, valid, postcodes = _check_updates(elements)
+    located, updates = _item_updates(elements, results, valid, await get_coordinates_many(postcodes))
+    return _update_response(elements, results, located, await update_items(updates))
+
+async def delete_items_batch(ids: List[Any]) -> Tuple[int, Dict[str, Any]]:
+    """Delete a batch of items by id; see shared.batch.delete_items_batch"""
+    results, valid, unique = _check_deletes(ids)
+    return _delete_response(ids, results, valid, await delete_items(unique))
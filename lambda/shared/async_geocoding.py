@@ -0,0 +1,145 @@
+"""asyncio counterpart of shared.geocoding for the ASGI server.
+
+Lookups go through the same gazetteer and in-process cache as the sync module.
+Misses are fetched with httpx, so a request waiting on the upstream API does
+not hold a worker thread.
+"""
+import random
+import asyncio
+import logging
+import httpx
+from typing import Tuple, Optional, Dict, Iterable
+from pymongo.errors import PyMongoError
+from .cache import AsyncSingleFlight
+from .gazetteer import get_gazetteer
+from .geocoding import (
+    GEOCACHE_TTL_SECONDS, GEOCACHE_NEGATIVE_TTL_SECONDS, GEOCODING_BASE_URL,
+    GEOCODING_CONNECT_TIMEOUT, GEOCODING_READ_TIMEOUT, GEOCODING_MAX_RETRIES,
+    GEOCODING_BACKOFF_SECONDS, GEOCODING_MAX_WORKERS,
+    _geocache, _MISS, _shared_tier_enabled, _from_shared_doc, _shared_doc
+)
+from .async_mongo_utils import get_geocache_collection
+
+logger = logging.getLogger(__name__)
+
+_inflight = AsyncSingleFlight()
+_client = None
+
+class AsyncGeocodingClient:
+    """Pooled, timeout-bounded async HTTP client for the Zippopotam.us API"""
+
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(self, base_url: str = GEOCODING_BASE_URL,
+                 connect_timeout: float = GEOCODING_CONNECT_TIMEOUT,
+                 read_timeout: float = GEOCODING_READ_TIMEOUT,
+                 max_retries: int = GEOCODING_MAX_RETRIES,
+                 backoff: float = GEOCODING_BACKOFF_SECONDS,
+                 pool_size: int = GEOCODING_MAX_WORKERS):
+        self.base_url = base_url.rstrip('/')
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.session = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        )
+
+    async def fetch(self, postcode: str) -> Optional[Tuple[float, float]]:
+        """Fetch coordinates for a postcode, with the same retry policy as GeocodingClient.fetch"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await self.session.get(f'{self.base_url}/{postcode}')
+            except (httpx.NetworkError, httpx.TimeoutException) as e:
+                error = e
+            else:
+                if response.status_code == 404:
+                    return None
+                if response.status_code == 200:
+                    data = response.json()
+                    return (
+                        float(data['places'][0]['latitude']),
+                        float(data['places'][0]['longitude'])
+                    )
+                error = Exception(f"Geocoding request failed with status {response.status_code}")
+                if response.status_code not in self.RETRY_STATUSES:
+                    raise error
+
+            if attempt < self.max_retries:
+                await asyncio.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+        raise error
+
+    async def close(self) -> None:
+        await self.session.aclose()
+
+def get_client() -> AsyncGeocodingClient:
+    global _client
+    if _client is None:
+        _client = AsyncGeocodingClient()
+    return _client
+
+# For testing purposes
+def set_client(client: Optional[AsyncGeocodingClient]):
+    global _client
+    _client = client
+
+async def close_client() -> None:
+    """Close the pooled client; call before the event loop it was used on shuts down"""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+async def _resolve(postcode: str) -> Optional[Tuple[float, float]]:
+    """Resolve a postcode missing from the in-process tier and cache the answer"""
+    use_shared_tier = _shared_tier_enabled()
+    if use_shared_tier:
+        try:
+            coordinates = _from_shared_doc(await get_geocache_collection().find_one({'_id': postcode}))
+        except PyMongoError as e:
+            logger.warning(f"Error reading geocache: {str(e)}")
+            coordinates = _MISS
+        if coordinates is not _MISS:
+            ttl = GEOCACHE_TTL_SECONDS if coordinates else GEOCACHE_NEGATIVE_TTL_SECONDS
+            _geocache.set(postcode, coordinates, ttl=ttl)
+            return coordinates
+
+    coordinates = await get_client().fetch(postcode)
+    ttl = GEOCACHE_TTL_SECONDS if coordinates else GEOCACHE_NEGATIVE_TTL_SECONDS
+    _geocache.set(postcode, coordinates, ttl=ttl)
+    if use_shared_tier:
+        try:
+            await get_geocache_collection().replace_one(
+                {'_id': postcode}, _shared_doc(postcode, coordinates, ttl), upsert=True
+            )
+        except PyMongoError as e:
+            logger.warning(f"Error writing geocache: {str(e)}")
+    return coordinates
+
+async def get_coordinates(postcode: str) -> Optional[Tuple[float, float]]:
+    """Get coordinates from the offline gazetteer, the geocoding cache or the Zippopotam.us API"""
+    gazetteer = get_gazetteer()
+    if gazetteer is not None:
+        coordinates = gazetteer.lookup(postcode)
+        if coordinates is not None:
+            return coordinates
+
+    key = str(postcode)
+    coordinates = _geocache.get(key, _MISS)
+    if coordinates is not _MISS:
+        return coordinates
+
+    # Concurrent misses for the same postcode share a single upstream lookup
+    try:
+        return await _inflight.do(key, lambda: _resolve(key))
+    except Exception as e:
+        logger.warning(f"Error geocoding postcode {postcode}: {str(e)}")
+        return None
+
+async def get_coordinates_many(postcodes: Iterable[str]) -> Dict[str, Optional[Tuple[float, float]]]:
+    """Resolve many postcodes concurrently, looking each distinct postcode up once"""
+    unique = list(dict.fromkeys(str(postcode) for postcode in postcodes))
+    return dict(zip(unique, await asyncio.gather(*(get_coordinates(postcode) for postcode in unique))))
+
+def get_inflight_stats() -> Dict[str, int]:
+    """Upstream lookups made and saved by coalescing on this event loop"""
+    return _inflight.stats()
@@ -0,0 +1,318 @@
+"""Motor-backed asyncio version of shared.mongo_utils, with the same function surface.
+
+Used by the ASGI server. The client is created on first use and belongs to the
+event loop that is running at that point, so one process shares one pool.
+Queries, update documents and result shaping come from shared.mongo_utils, so
+only the awaited I/O lives here.
+"""
+import os
+import logging
+from typing import Dict, Any, List, AsyncIterator, Optional, Tuple
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, ReturnDocument, DeleteOne
+from pymongo.errors import PyMongoError, BulkWriteError
+from .mongo_utils import (
+    _PROJECTION, _UPDATE_PROJECTION, _COLLECTION_VERSION, _COUNT_WRITE, _VERSION_PROJECTION, _projection, _filter_query,
+    _page_query, _page, _select_fields, _document, _insert_errors, _set_fields, _update_document, _changed_filter,
+    _update_requests, _update_outcome, _delete_outcome, _item_version, _near_pipeline, _round_distances,
+    _stats_pipeline, _stats_from_facets, _search_pipeline, _search_page, check_page_key
+)
+from .stats import DEFAULT_BUCKET_MILES, DEFAULT_TOP
+from .item_cache import get_item_cache, get_body_cache
+
+logger = logging.getLogger(__name__)
+
+_client = None
+_db = None
+_items_collection = None
+_geocache_collection = None
+
+def get_mongo_db():
+    global _client, _db
+    if _db is None:
+        _client = AsyncIOMotorClient(os.environ.get('MONGODB_URI', 'mongodb://localhost:27017'))
+        _db = _client.items_db
+    return _db
+
+def get_mongo_collection():
+    global _items_collection
+    if _items_collection is None:
+        _items_collection = get_mongo_db().items
+    return _items_collection
+
+def get_counters_collection():
+    """Counters stored next to the items collection, such as the collection version"""
+    return get_mongo_collection().database.counters
+
+def get_geocache_collection():
+    """Get the shared geocoding cache collection, whose entries expire at 'expiresAt'"""
+    global _geocache_collection
+    if _geocache_collection is None:
+        _geocache_collection = get_mongo_db().geocache
+    return _geocache_collection
+
+async def get_all_items(fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    try:
+        return await get_mongo_collection().find({}, _projection(fields)).to_list(None)
+    except PyMongoError as e:
+        logger.error(f"Error getting all items: {str(e)}")
+        raise
+
+async def get_items_page(limit: int, after: Optional[Dict[str, Any]] = None, fields: Optional[List[str]] = None,
+                         filters: Optional[Dict[str, Any]] = None) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """Get up to limit items matching filters, ordered by id, starting after the given key.
+
+    Returns the items and the key to pass as 'after' for the next page, or None on the last page.
+    """
+    try:
+        # Fetch one extra item to learn whether there is another page
+        cursor = get_mongo_collection().find(_page_query(after, filters), _projection(fields))
+        return _page(await cursor.sort('id', ASCENDING).limit(limit + 1).to_list(limit + 1), limit)
+    except PyMongoError as e:
+        logger.error(f"Error getting items page: {str(e)}")
+        raise
+
+async def iter_items(batch_size: int = 500, fields: Optional[List[str]] = None,
+                     filters: Optional[Dict[str, Any]] = None) -> AsyncIterator[Dict[str, Any]]:
+    """Yield every item matching filters straight from the cursor without building a list"""
+    try:
+        async for item in get_mongo_collection().find(_filter_query(filters), _projection(fields)).batch_size(batch_size):
+            yield item
+    except PyMongoError as e:
+        logger.error(f"Error iterating items: {str(e)}")
+        raise
+
+async def get_item(item_id: str, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Get an item through the read-through item cache, which holds whole items"""
+    try:
+        if not item_id:
+            raise Exception("Invalid ID: item_id cannot be None or empty")
+        item = await get_item_cache().aget(item_id, lambda: get_mongo_collection().find_one({'id': item_id}, _PROJECTION))
+        return _select_fields(item, fields) if item else None
+    except PyMongoError as e:
+        logger.error(f"Error getting item {item_id}: {str(e)}")
+        raise
+
+async def get_items_by_ids(ids: List[str], fields: Optional[List[str]] = None) -> List[Optional[Dict[str, Any]]]:
+    """Get many items with one $in query, in the order of ids, with None for ids that do not exist"""
+    try:
+        unique = list(dict.fromkeys(ids))
+        items = await get_mongo_collection().find({'id': {'$in': unique}}, _projection(fields)).to_list(None)
+        found = {item['id']: item for item in items}
+        return [found.get(item_id) for item_id in ids]
+    except PyMongoError as e:
+        logger.error(f"Error getting items by ids: {str(e)}")
+        raise
+
+async def create_item(item: Dict[str, Any]) -> None:
+    """Insert an item, stamping it with 'version' and 'updatedAt'"""
+    try:
+        await get_mongo_collection().insert_one(_document(item))
+        await _bump_collection_version()
+        get_item_cache().put(item['id'], item)
+    except PyMongoError as e:
+        logger.error(f"Error creating item: {str(e)}")
+        raise Exception("Duplicate Key Error" if "duplicate key error" in str(e).lower() else str(e))
+
+async def create_items(items: List[Dict[str, Any]]) -> List[Optional[str]]:
+    """Insert many items in one unordered batch.
+
+    Returns one entry per item: None if it was written, otherwise the error message.
+    """
+    if not items:
+        return []
+    docs = [_document(item) for item in items]
+
+    errors = [None] * len(items)
+    try:
+        await get_mongo_collection().insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        errors = _insert_errors(len(items), e.details)
+        logger.warning(f"Bulk insert wrote {len(items) - len(e.details.get('writeErrors', []))} of {len(items)} items")
+    except PyMongoError as e:
+        logger.error(f"Error creating items: {str(e)}")
+        raise
+
+    if any(error is None for error in errors):
+        await _bump_collection_version()
+    for item, error in zip(items, errors):
+        if error is None:
+            get_item_cache().put(item['id'], item)
+    return errors
+
+async def _existing_ids(ids: List[str]) -> set:
+    cursor = get_mongo_collection().find({'id': {'$in': ids}}, {'_id': 0, 'id': 1})
+    return {doc['id'] async for doc in cursor}
+
+async def update_item(item_id: str, updates: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Apply updates in one round trip and return the updated item, or None if it does not exist"""
+    try:
+        if not item_id:
+            raise Exception("Invalid ID: item_id cannot be None or empty")
+        fields = _set_fields(updates)
+        if not fields:
+            return await get_item(item_id)
+        # The projection keeps _id, which is dropped below, because some drivers and
+        # doubles read the result back by _id, not by a filter the update falsified
+        item = await get_mongo_collection().find_one_and_update(
+            _changed_filter(item_id, fields),
+            _update_document(fields),
+            projection=_UPDATE_PROJECTION,
+            return_document=ReturnDocument.AFTER
+        )
+        if item is None:
+            # Either missing or already up to date; read it back from the database
+            get_item_cache().invalidate(item_id)
+            return await get_item(item_id)
+        item.pop('_id', None)
+        await _bump_collection_version()
+        get_item_cache().put(item_id, item)
+        return item
+    except PyMongoError as e:
+        logger.error(f"Error updating item {item_id}: {str(e)}")
+        raise
+
+async def delete_item(item_id: str) -> bool:
+    """Delete an item in one round trip, returning False if it did not exist"""
+    try:
+        if not item_id:
+            raise Exception("Invalid ID: item_id cannot be None or empty")
+        result = await get_mongo_collection().delete_one({'id': item_id})
+        if result.deleted_count:
+            await _bump_collection_version()
+        get_item_cache().invalidate(item_id)
+        return result.deleted_count > 0
+    except PyMongoError as e:
+        logger.error(f"Error deleting item {item_id}: {str(e)}")
+        raise
+
+async def update_items(updates: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Apply per-item updates in one unordered bulk write.
+
+    Returns the matched and modified counts, the ids that do not exist and the
+    error message of each update that failed.
+    """
+    try:
+        if not updates:
+            return {'matched': 0, 'modified': 0, 'missing': [], 'failed': {}}
+        existing = await _existing_ids(list(updates))
+        ids, requests = _update_requests(updates, existing)
+        details = {}
+        try:
+            if requests:
+                details = (await get_mongo_collection().bulk_write(requests, ordered=False)).bulk_api_result
+        except BulkWriteError as e:
+            details = e.details
+            logger.warning(f"Bulk update failed for {len(details.get('writeErrors', []))} of {len(requests)} items")
+        outcome = _update_outcome(updates, existing, ids, details)
+        if outcome['modified']:
+            await _bump_collection_version()
+        for item_id in existing:
+            get_item_cache().invalidate(item_id)
+        return outcome
+    except PyMongoError as e:
+        logger.error(f"Error updating {len(updates)} items: {str(e)}")
+        raise
+
+async def delete_items(ids: List[str]) -> Dict[str, Any]:
+    """Delete many items in one unordered bulk write.
+
+    Returns the deleted count, the ids that do not exist and the error message
+    of each id that could not be deleted.
+    """
+    try:
+        if not ids:
+            return {'deleted': 0, 'missing': [], 'failed': {}}
+        existing = await _existing_ids(ids)
+        targets = [item_id for item_id in dict.fromkeys(ids) if item_id in existing]
+        details = {}
+        try:
+            if targets:
+                requests = [DeleteOne({'id': item_id}) for item_id in targets]
+                details = (await get_mongo_collection().bulk_write(requests, ordered=False)).bulk_api_result
+        except BulkWriteError as e:
+            details = e.details
+            logger.warning(f"Bulk delete failed for {len(details.get('writeErrors', []))} of {len(targets)} items")
+        outcome = _delete_outcome(ids, existing, targets, details)
+        if outcome['deleted']:
+            await _bump_collection_version()
+        for item_id in existing:
+            get_item_cache().invalidate(item_id)
+        return outcome
+    except PyMongoError as e:
+        logger.error(f"Error deleting {len(ids)} items: {str(e)}")
+        raise
+
+async def get_item_and_version(item_id: str,
+                               fields: Optional[List[str]] = None) -> Tuple[Optional[Dict[str, Any]], Optional[Tuple[int, Optional[str]]]]:
+    """Get an item and its (version, updatedAt), which are returned even when the fieldset leaves them out"""
+    item = await get_item(item_id)
+    if not item:
+        return None, None
+    return _select_fields(item, fields), _item_version(item)
+
+async def get_item_version(item_id: str) -> Optional[Tuple[int, Optional[str]]]:
+    """Current (version, updatedAt) of an item from the item cache or a query for only those fields, or None"""
+    try:
+        item = get_item_cache().peek(item_id)
+        if item is None:
+            item = await get_mongo_collection().find_one({'id': item_id}, _VERSION_PROJECTION)
+        return _item_version(item)
+    except PyMongoError as e:
+        logger.error(f"Error getting version of item {item_id}: {str(e)}")
+        raise
+
+async def _bump_collection_version() -> None:
+    """Count a write to the items collection, after the write; a failure is logged instead of failing the write"""
+    try:
+        await get_counters_collection().update_one(_COLLECTION_VERSION, _COUNT_WRITE, upsert=True)
+    except PyMongoError as e:
+        logger.error(f"Error counting a write to items: {str(e)}")
+
+async def get_collection_version() -> int:
+    """Counter that every item write increases; read it before the items it versions"""
+    try:
+        counter = await get_counters_collection().find_one(_COLLECTION_VERSION)
+        return counter['seq'] if counter else 0
+    except PyMongoError as e:
+        logger.error(f"Error getting collection version: {str(e)}")
+        raise
+
+async def find_items_near(latitude: float, longitude: float, radius: float = None, limit: int = 20) -> List[Dict[str, Any]]:
+    """Find items nearest to a point, closest first, with their 'distance' in miles"""
+    try:
+        cursor = get_mongo_collection().aggregate(_near_pipeline(latitude, longitude, radius, limit))
+        return _round_distances(await cursor.to_list(limit))
+    except PyMongoError as e:
+        logger.error(f"Error finding items near ({latitude}, {longitude}): {str(e)}")
+        raise
+
+async def search_items(query: str, limit: int = 20, after: Optional[Dict[str, Any]] = None,
+                       fields: Optional[List[str]] = None) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """Items whose name or users match query, best first, each with its relevance 'score'"""
+    try:
+        items = await get_mongo_collection().aggregate(_search_pipeline(query, limit, after, fields)).to_list(limit + 1)
+        return _search_page(items, limit)
+    except PyMongoError as e:
+        logger.error(f"Error searching items for '{query}': {str(e)}")
+        raise
+
+async def get_item_stats(bucket_size: float = DEFAULT_BUCKET_MILES, top: int = DEFAULT_TOP) -> Dict[str, Any]:
+    """Aggregate statistics over all items, computed by the database"""
+    try:
+        facets = await get_mongo_collection().aggregate(_stats_pipeline(bucket_size, top)).to_list(1)
+        return _stats_from_facets(facets[0], bucket_size)
+    except PyMongoError as e:
+        logger.error(f"Error getting item stats: {str(e)}")
+        raise
+
+# For testing purposes
+def set_mongo_collection(collection):
+    global _items_collection
+    _items_collection = collection
+    get_item_cache().clear()
+    get_body_cache().clear()
+
+def set_geocache_collection(collection):
+    global _geocache_collection
+    _geocache_collection = collection
@@ -0,0 +1,207 @@
+"""Batch create, update and delete of items, with one result per element.
+
+Each operation is split into pure steps (validation, building the writes from the
+geocoded postcodes, shaping the response) around two I/O calls: geocoding the
+distinct postcodes and the bulk write. The functions here run those calls
+synchronously; shared.async_batch runs the same steps with the asyncio clients.
+"""
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+from .validation import validate_item, validate_updates
+from .geocoding import get_coordinates_many, calculate_distances_from_ny, get_directions_from_ny
+from .storage import create_items, update_items, delete_items
+
+MAX_BATCH_SIZE = 500
+
+def parse_batch(body: Any, key: str = 'items') -> List[Any]:
+    """Get the list of batch elements from a request body, raising ValueError if invalid"""
+    if not isinstance(body, dict) or not isinstance(body.get(key), list):
+        raise ValueError(f"Request body must be an object with an '{key}' list")
+    elements = body[key]
+    if not elements:
+        raise ValueError(f"'{key}' cannot be empty")
+    if len(elements) > MAX_BATCH_SIZE:
+        raise ValueError(f"'{key}' cannot contain more than {MAX_BATCH_SIZE} elements")
+    return elements
+
+def geo_fields(coordinates: List[Tuple[float, float]]) -> List[Dict[str, Any]]:
+    """Latitude, longitude, distance and direction from New York for many points in one pass"""
+    if not coordinates:
+        return []
+    lats = [lat for lat, _ in coordinates]
+    lons = [lon for _, lon in coordinates]
+    distances = calculate_distances_from_ny(lats, lons)
+    directions = get_directions_from_ny(lats, lons)
+    return [
+        {
+            'latitude': float(lat),
+            'longitude': float(lon),
+            'distanceFromNY': float(distance),
+            'directionFromNY': str(direction)
+        }
+        for lat, lon, distance, direction in zip(lats, lons, distances, directions)
+    ]
+
+Results = List[Optional[Dict[str, Any]]]
+Coordinates = Dict[str, Optional[Tuple[float, float]]]
+
+def _status(results: Results, success: int) -> int:
+    """200/201 when every element succeeded, otherwise 207 Multi-Status"""
+    return success if all(result['status'] == success for result in results) else 207
+
+def _check_creates(bodies: List[Any]) -> Tuple[Results, List[int], List[str]]:
+    """Results for the invalid bodies, the indexes of the valid ones and the postcodes to geocode"""
+    results: Results = [None] * len(bodies)
+    valid = []
+    for index, body in enumerate(bodies):
+        if not isinstance(body, dict):
+            results[index] = {'index': index, 'status': 400, 'error': 'Item must be an object'}
+            continue
+        is_valid, error_message = validate_item(body)
+        if not is_valid:
+            results[index] = {'index': index, 'status': 400, 'error': error_message}
+            continue
+        valid.append(index)
+    return results, valid, [bodies[index]['postcode'] for index in valid]
+
+def _new_items(bodies: List[Any], results: Results, valid: List[int],
+               coordinates: Coordinates) -> Tuple[List[int], List[Dict[str, Any]]]:
+    """The indexes of the bodies whose postcode was found, and the new item for each"""
+    located = []
+    for index in valid:
+        if coordinates[str(bodies[index]['postcode'])] is None:
+            results[index] = {'index': index, 'status': 400, 'error': 'Invalid postcode'}
+        else:
+            located.append(index)
+
+    points = [coordinates[str(bodies[index]['postcode'])] for index in located]
+    items = [
+        {'id': str(uuid.uuid4()), **bodies[index], **fields}
+        for index, fields in zip(located, geo_fields(points))
+    ]
+    return located, items
+
+def _create_response(bodies: List[Any], results: Results, located: List[int], items: List[Dict[str, Any]],
+                     errors: List[Optional[str]]) -> Tuple[int, Dict[str, Any]]:
+    for index, item, error in zip(located, items, errors):
+        if error is None:
+            results[index] = {'index': index, 'status': 201, 'item': item}
+        else:
+            status = 409 if error == "Duplicate Key Error" else 500
+            results[index] = {'index': index, 'status': status, 'error': error}
+
+    created = sum(1 for result in results if result['status'] == 201)
+    return _status(results, 201), {'results': results, 'created': created, 'failed': len(bodies) - created}
+
+def create_items_batch(bodies: List[Any]) -> Tuple[int, Dict[str, Any]]:
+    """Validate, geocode and insert a batch of new items.
+
+    Returns the status code and a body with one result per element, in request order.
+    """
+    results, valid, postcodes = _check_creates(bodies)
+    # Each distinct postcode is geocoded once, concurrently
+    located, items = _new_items(bodies, results, valid, get_coordinates_many(postcodes))
+    return _create_response(bodies, results, located, items, create_items(items))
+
+def _check_updates(elements: List[Any]) -> Tuple[Results, List[int], List[str]]:
+    """Results for the invalid elements, the indexes of the valid ones and the new postcodes to geocode"""
+    results: Results = [None] * len(elements)
+    seen = set()
+    valid = []
+    for index, element in enumerate(elements):
+        item_id = element.get('id') if isinstance(element, dict) else None
+        if not isinstance(item_id, str) or not item_id:
+            results[index] = {'index': index, 'status': 400, 'error': 'Each update must be an object with an id'}
+        elif item_id in seen:
+            results[index] = {'index': index, 'id': item_id, 'status': 400, 'error': 'Duplicate id in batch'}
+        else:
+            seen.add(item_id)
+            is_valid, error_message = validate_updates(element)
+            if is_valid:
+                valid.append(index)
+            else:
+                results[index] = {'index': index, 'id': item_id, 'status': 400, 'error': error_message}
+    return results, valid, [elements[index]['postcode'] for index in valid if 'postcode' in elements[index]]
+
+def _item_updates(elements: List[Any], results: Results, valid: List[int],
+                  coordinates: Coordinates) -> Tuple[List[int], Dict[str, Dict[str, Any]]]:
+    """The indexes of the elements whose new postcode, if any, was found, and the updates by id"""
+    located = []
+    for index in valid:
+        if 'postcode' in elements[index] and coordinates[str(elements[index]['postcode'])] is None:
+            results[index] = {'index': index, 'id': elements[index]['id'], 'status': 400, 'error': 'Invalid postcode'}
+        else:
+            located.append(index)
+
+    relocated = [index for index in located if 'postcode' in elements[index]]
+    geo = dict(zip(relocated, geo_fields([coordinates[str(elements[index]['postcode'])] for index in relocated])))
+    updates = {}
+    for index in located:
+        fields = {key: value for key, value in elements[index].items() if key != 'id'}
+        fields.update(geo.get(index, {}))
+        updates[elements[index]['id']] = fields
+    return located, updates
+
+def _update_response(elements: List[Any], results: Results, located: List[int],
+                     outcome: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+    missing = set(outcome['missing'])
+    failed = outcome.get('failed', {})
+    for index in located:
+        item_id = elements[index]['id']
+        if item_id in missing:
+            results[index] = {'index': index, 'id': item_id, 'status': 404, 'error': 'Item not found'}
+        elif item_id in failed:
+            results[index] = {'index': index, 'id': item_id, 'status': 500, 'error': failed[item_id]}
+        else:
+            results[index] = {'index': index, 'id': item_id, 'status': 200}
+
+    return _status(results, 200), {
+        'results': results,
+        'matched': outcome['matched'],
+        'modified': outcome['modified'],
+        'missing': len(missing)
+    }
+
+def update_items_batch(elements: List[Any]) -> Tuple[int, Dict[str, Any]]:
+    """Apply a batch of partial updates, each element being an object with the item's 'id'.
+
+    Returns the status code and a body with one result per element, in request order.
+    """
+    results, valid, postcodes = _check_updates(elements)
+    # Only the distinct new postcodes are geocoded
+    located, updates = _item_updates(elements, results, valid, get_coordinates_many(postcodes))
+    return _update_response(elements, results, located, update_items(updates))
+
+def _check_deletes(ids: List[Any]) -> Tuple[Results, List[int], List[str]]:
+    """Results for the invalid ids, the indexes of the valid ones and the distinct ids to delete"""
+    results: Results = [None] * len(ids)
+    valid = []
+    for index, item_id in enumerate(ids):
+        if not isinstance(item_id, str) or not item_id:
+            results[index] = {'index': index, 'status': 400, 'error': 'Each id must be a non-empty string'}
+        else:
+            valid.append(index)
+    return results, valid, list(dict.fromkeys(ids[index] for index in valid))
+
+def _delete_response(ids: List[Any], results: Results, valid: List[int],
+                     outcome: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+    missing = set(outcome['missing'])
+    failed = outcome.get('failed', {})
+    for index in valid:
+        item_id = ids[index]
+        if item_id in missing:
+            results[index] = {'index': index, 'id': item_id, 'status': 404, 'error': 'Item not found'}
+        elif item_id in failed:
+            results[index] = {'index': index, 'id': item_id, 'status': 500, 'error': failed[item_id]}
+        else:
+            results[index] = {'index': index, 'id': item_id, 'status': 200}
+
+    return _status(results, 200), {'results': results, 'deleted': outcome['deleted'], 'missing': len(missing)}
+
+def delete_items_batch(ids: List[Any]) -> Tuple[int, Dict[str, Any]]:
+    """Delete a batch of items by id.
+
+    Returns the status code and a body with one result per id, in request order.
+    """
+    results, valid, unique = _check_deletes(ids)
+    return _delete_response(ids, results, valid, delete_items(unique))
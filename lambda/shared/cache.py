@@ -0,0 +1,155 @@
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+class TTLCache:
+    """Thread-safe, bounded LRU cache whose entries expire after a time to live"""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 300.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value for key, or default if it is missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > self._clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Store value under key, evicting the least recently used entry when full"""
+        if self.max_entries <= 0:
+            return
+        expires_at = self._clock() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Drop every entry and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries)
+            }
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Collapses concurrent calls for the same key into one call whose outcome is shared"""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.saved = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """Run fn for key, or wait for the call already in flight for key and share its result"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+                leader = True
+            else:
+                self.saved += 1
+                leader = False
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.calls = self.saved = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'calls': self.calls, 'saved': self.saved, 'in_flight': len(self._calls)}
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines: concurrent awaits for the same key share one call"""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, "asyncio.Future"] = {}
+        self.calls = 0
+        self.saved = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Await fn() for key, or the call already in flight for key"""
+        call = self._calls.get(key)
+        if call is not None:
+            self.saved += 1
+            # Shielded so one cancelled waiter does not cancel the call for everyone
+            return await asyncio.shield(call)
+
+        self.calls += 1
+        call = self._calls[key] = asyncio.ensure_future(fn())
+        try:
+            return await asyncio.shield(call)
+        finally:
+            if call.done():
+                self._calls.pop(key, None)
+            else:
+                call.add_done_callback(lambda _: self._calls.pop(key, None))
+
+    def reset(self) -> None:
+        self.calls = self.saved = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {'calls': self.calls, 'saved': self.saved, 'in_flight': len(self._calls)}
@@ -1,6 +1,7 @@
 import os
 import json
 import logging
+from typing import Any, Dict, Optional
 from aws_lambda_powertools import Logger
 from aws_lambda_powertools.logging import correlation_paths
 from aws_lambda_powertools.metrics import MetricUnit
@@ -16,6 +17,10 @@ metrics = Metrics(namespace="ItemsAPI")
 kinesis_client = boto3.client('kinesis')
 STREAM_NAME = os.environ.get('KINESIS_STREAM_NAME')
 
+# Item cache counters as of the last log_api_metrics call; the cache counts for the
+# life of the container, while each invocation reports only its own lookups
+_reported_cache_stats = {'hits': 0, 'misses': 0}
+
 def setup_logging(handler_name: str):
     """Configure logging for Lambda function"""
     logger.append_keys(handler=handler_name)
@@ -54,9 +59,27 @@ def log_event(event: dict, context: LambdaContext = None):
         except Exception as e:
             logger.warning(f"Failed to stream log to Kinesis: {str(e)}")
 
-def log_api_metrics(operation: str, status_code: int, duration_ms: float):
-    """Record API metrics"""
+def _cache_deltas(cache_stats: Dict[str, Any]) -> Dict[str, int]:
+    """Item cache hits and misses since the previous report, from the cumulative counters.
+
+    A counter lower than last time means they were reset, so all of them are new.
+    """
+    current = {key: cache_stats[key] for key in ('hits', 'misses')}
+    reset = any(current[key] < _reported_cache_stats[key] for key in current)
+    deltas = {key: current[key] if reset else current[key] - _reported_cache_stats[key] for key in current}
+    _reported_cache_stats.update(current)
+    return deltas
+
+def log_api_metrics(operation: str, status_code: int, duration_ms: float, cache_stats: Optional[Dict[str, Any]] = None):
+    """Record API metrics, plus this request's item cache lookups when cache stats are given"""
     metrics.add_metric(name="APILatency", unit=MetricUnit.Milliseconds, value=duration_ms)
     metrics.add_metric(name="APIStatus", unit=MetricUnit.Count, value=1)
+    if cache_stats is not None:
+        deltas = _cache_deltas(cache_stats)
+        lookups = deltas['hits'] + deltas['misses']
+        if lookups:
+            metrics.add_metric(name="ItemCacheHitRatio", unit=MetricUnit.Percent, value=deltas['hits'] / lookups * 100)
+        metrics.add_metric(name="ItemCacheHits", unit=MetricUnit.Count, value=deltas['hits'])
+        metrics.add_metric(name="ItemCacheMisses", unit=MetricUnit.Count, value=deltas['misses'])
     metrics.add_dimension(name="Operation", value=operation)
     metrics.add_dimension(name="StatusCode", value=str(status_code))
\ No newline at end of file
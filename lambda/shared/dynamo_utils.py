@@ -1,9 +1,103 @@
 import os
+import logging
+import queue
+import random
+import threading
+import time
 import boto3
-from typing import Dict, Any, List
+from collections import Counter
+from boto3.dynamodb.conditions import Attr, Key
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Dict, Any, List, Iterator, Optional, Sequence, Tuple
+from .spatial_index import SpatialIndex
+from .stats import DEFAULT_BUCKET_MILES, DEFAULT_TOP, MAX_DISTANCE_MILES, summarize
+from .text_index import TextIndex
+
+logger = logging.getLogger(__name__)
 
 dynamodb = boto3.resource('dynamodb')
 _table = None
+_counters_table = None
+# In-process indexes by name ('spatial', 'text'), the counter shard counts each
+# reflects, when they were last compared, and the (shard, count) pairs whose
+# change record a refresh could not find yet, with when it first looked
+_indexes: Dict[str, Any] = {}
+_index_versions: Dict[str, Optional[List[int]]] = {}
+_index_checked: Dict[str, float] = {}
+_index_missing: Dict[str, Dict[Tuple[int, int], float]] = {}
+_index_locks = {name: threading.Lock() for name in ('spatial', 'text')}
+_scan_pool = None
+_batch_pool = None
+_thread_resources = threading.local()
+
+# Global secondary indexes declared on ItemsTable in cdk_stack, projecting all attributes
+POSTCODE_INDEX = 'postcode-index'  # postcode / id
+# directionFromNY / startDate; sparse, but the API requires startDate on every item
+DIRECTION_INDEX = 'direction-startDate-index'
+# distanceBucket / distanceFromNY. A GSI key condition needs an equality on the
+# partition key, so items are grouped into DISTANCE_BUCKET_MILES wide buckets and
+# a distance range is one query per bucket it overlaps.
+DISTANCE_INDEX = 'distance-index'
+DISTANCE_BUCKET = 'distanceBucket'
+DISTANCE_BUCKET_MILES = 500
+# A page key that resumes a distance-filtered list at the start of this bucket,
+# for a page that ended exactly at the end of the one before
+NEXT_BUCKET = 'nextBucket'
+# Names of the GSIs deployed so far, comma separated. cdk_stack adds them to an
+# existing table one per deployment and sets this meanwhile; filters on an index
+# that is not there yet are served by the scan's FilterExpression. Unset means all.
+DEPLOYED_INDEXES = (frozenset(filter(None, os.environ['ITEMS_TABLE_INDEXES'].split(',')))
+                    if 'ITEMS_TABLE_INDEXES' in os.environ else None)
+
+# Every items write increments one of COUNTER_SHARDS counters in the counters
+# table (COUNTERS_TABLE), picked at random, and the collection version is their
+# sum. One item takes about 1000 writes a second, so more shards allow more
+# writes, but every version read gets them all (at most BATCH_GET_SIZE). Only
+# raise it, since dropping a shard would take the version back.
+COUNTER_SHARDS = int(os.environ.get('COUNTER_SHARDS', '1'))
+# Each write also puts a change record there, naming the ids it changed under
+# its shard and count, which expires after CHANGE_LOG_TTL_SECONDS through the
+# table's 'expiresAt' TTL attribute.
+_COLLECTION_VERSION = 'items'
+CHANGE_LOG_TTL_SECONDS = 24 * 3600
+# The in-process indexes compare their version with the counter at most this
+# often, and re-read the items named by the change records of the writes since
+INDEX_REFRESH_SECONDS = float(os.environ.get('INDEX_REFRESH_SECONDS', '5'))
+# An index further behind than this many writes is rebuilt from a scan instead
+INDEX_MAX_CHANGES = 1000
+# A record is put just after its write is counted. One still missing this long
+# after a refresh first looked for it, because its writer failed, forces a rebuild.
+CHANGE_LOG_GRACE_SECONDS = 30
+
+# Fields maintained by the write paths; client-supplied values are ignored
+_MANAGED_FIELDS = ('version', 'updatedAt', DISTANCE_BUCKET)
+
+# Parallel scans read the table as this many Segment/TotalSegments slices, each on
+# its own thread. 1 scans sequentially. More segments finish sooner but consume
+# read capacity faster, so this is set per deployment.
+SCAN_SEGMENTS = int(os.environ.get('SCAN_SEGMENTS', '1'))
+MAX_SCAN_SEGMENTS = 16
+# Pages each segment may read ahead of the consumer
+_PAGES_AHEAD = 2
+_DONE = object()
+# Outcomes of a conditional write that did not happen
+_MISSING = object()
+_UNCHANGED = object()
+_EXISTS = object()
+
+# Request size limits of BatchGetItem and BatchWriteItem
+BATCH_GET_SIZE = 100
+BATCH_WRITE_SIZE = 25
+# Batch requests sent at once by one call, each on its own thread. Higher values
+# move bulk reads and writes faster but consume table capacity faster.
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', '4'))
+# Unprocessed keys and items are resent after an exponential backoff with full
+# jitter, starting at BATCH_BASE_DELAY seconds and capped at BATCH_MAX_DELAY
+BATCH_MAX_RETRIES = 8
+BATCH_BASE_DELAY = 0.05
+BATCH_MAX_DELAY = 2.0
 
 def get_table():
     global _table
@@ -11,35 +105,814 @@ def get_table():
         _table = dynamodb.Table(os.environ['ITEMS_TABLE'])
     return _table
 
-def get_all_items() -> List[Dict[str, Any]]:
-    response = get_table().scan()
-    return response.get('Items', [])
+def get_counters_table():
+    """Table of counters, such as the collection version, or None when COUNTERS_TABLE is not set"""
+    global _counters_table
+    if _counters_table is None and os.environ.get('COUNTERS_TABLE'):
+        _counters_table = dynamodb.Table(os.environ['COUNTERS_TABLE'])
+    return _counters_table
+
+def _current_index(name: str, factory):
+    """The in-process index called name, built with factory on first use and kept current with every function's writes.
+
+    Each function keeps its own indexes, so the collection version is checked at
+    most every INDEX_REFRESH_SECONDS. One thread checks at a time; the others
+    keep answering from the index they have, and only wait for a first build.
+    """
+    index = _indexes.get(name)
+    if index is not None and time.monotonic() - _index_checked.get(name, 0) < INDEX_REFRESH_SECONDS:
+        return index
+    lock = _index_locks[name]
+    if not lock.acquire(blocking=index is None):
+        return index
+    try:
+        if name not in _indexes or time.monotonic() - _index_checked.get(name, 0) >= INDEX_REFRESH_SECONDS:
+            _refresh_index(name, factory)
+            _index_checked[name] = time.monotonic()
+        return _indexes[name]
+    finally:
+        lock.release()
+
+def _rebuild_index(name: str, factory, counts: Optional[List[int]]) -> None:
+    index = factory()
+    index.build(get_all_items())
+    _indexes[name] = index
+    _index_versions[name] = counts
+    _index_missing[name] = {}
+
+def _refresh_index(name: str, factory) -> None:
+    """Apply the writes counted since the index was built or last refreshed.
+
+    Only the items named by their change records are read again. The index is
+    rebuilt from a scan instead on first use, when it is more than
+    INDEX_MAX_CHANGES writes behind, and when a record is still missing
+    CHANGE_LOG_GRACE_SECONDS after a refresh first looked for it.
+    """
+    # Read before the items, so a write made meanwhile is applied by the next refresh
+    counts = _read_counters()
+    index = _indexes.get(name)
+    indexed = _index_versions.get(name)
+    if index is not None and counts is None:
+        # Without a counters table an index only sees this function's writes
+        return
+    if (index is None or indexed is None or len(indexed) > len(counts)
+            or any(count < done for count, done in zip(counts, indexed))):
+        _rebuild_index(name, factory, counts)
+        return
+
+    indexed = indexed + [0] * (len(counts) - len(indexed))
+    missing = _index_missing.get(name, {})
+    if sum(counts) - sum(indexed) + len(missing) > INDEX_MAX_CHANGES:
+        _rebuild_index(name, factory, counts)
+        return
+    wanted = sorted({*missing, *((shard, seq) for shard, (done, count) in enumerate(zip(indexed, counts))
+                                 for seq in range(done + 1, count + 1))})
+    changes = _read_changes(wanted)
+    now = time.monotonic()
+    missing = {key: missing.get(key, now) for key in wanted if key not in changes}
+    if any(now - since >= CHANGE_LOG_GRACE_SECONDS for since in missing.values()):
+        _rebuild_index(name, factory, counts)
+        return
+
+    # Items are read as they are now, so records can be applied in any order
+    ids = sorted({item_id for changed in changes.values() for item_id in changed})
+    found = _batch_get(ids)
+    for item_id in ids:
+        if item_id in found:
+            index.upsert(found[item_id])
+        else:
+            index.remove(item_id)
+    _index_versions[name] = counts
+    _index_missing[name] = missing
+
+def get_spatial_index() -> SpatialIndex:
+    """In-process spatial index over all items, built on first use and kept current by writes.
+
+    DynamoDB has no geo index, so proximity queries are answered from this index
+    instead of scanning the table per request.
+    """
+    return _current_index('spatial', SpatialIndex)
+
+def get_text_index() -> TextIndex:
+    """In-process inverted index over item names and users, built on first use and kept current by writes.
+
+    DynamoDB has no full-text search, so searches are answered from this index
+    instead of scanning the table per request.
+    """
+    return _current_index('text', TextIndex)
+
+def _written(upserted: Sequence[Dict[str, Any]] = (), removed: Sequence[str] = ()) -> None:
+    """Apply a write to this function's in-process indexes, then count it for the other functions'"""
+    for index in list(_indexes.values()):
+        for item in upserted:
+            index.upsert(item)
+        for item_id in removed:
+            index.remove(item_id)
+    _count_write([item['id'] for item in upserted] + list(removed))
+
+def _projection(fields: Optional[List[str]] = None) -> Dict[str, Any]:
+    """ProjectionExpression arguments returning only the requested fields, plus 'id'"""
+    if not fields:
+        return {}
+    names = {f"#f{i}": field for i, field in enumerate(dict.fromkeys(['id', *fields]))}
+    return {
+        'ProjectionExpression': ", ".join(names),
+        'ExpressionAttributeNames': names
+    }
+
+def _range(condition, lower, upper):
+    """Key or Attr condition for an optional inclusive range, or None"""
+    if lower is not None and upper is not None:
+        return condition.between(lower, upper)
+    if lower is not None:
+        return condition.gte(lower)
+    if upper is not None:
+        return condition.lte(upper)
+    return None
+
+def _number(value: Optional[float]) -> Optional[Decimal]:
+    return None if value is None else Decimal(str(value))
+
+def _to_dynamo(value: Any) -> Any:
+    """Copy of value with floats, which boto3 rejects, converted to Decimal"""
+    if isinstance(value, float):
+        return Decimal(str(value))
+    if isinstance(value, dict):
+        return {key: _to_dynamo(v) for key, v in value.items()}
+    if isinstance(value, list):
+        return [_to_dynamo(v) for v in value]
+    return value
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float, Decimal)) and not isinstance(value, bool)
+
+def _distance_bucket(distance: Any) -> int:
+    return int(distance // DISTANCE_BUCKET_MILES)
+
+def _to_item(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Item as written to the table, with the distanceBucket that DISTANCE_INDEX is keyed on"""
+    stored = {key: _to_dynamo(value) for key, value in item.items() if key != DISTANCE_BUCKET}
+    if _is_number(stored.get('distanceFromNY')):
+        stored[DISTANCE_BUCKET] = _distance_bucket(stored['distanceFromNY'])
+    return stored
+
+def _from_table(item: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Item as returned to callers, without the attributes only the indexes use"""
+    if item is not None:
+        item.pop(DISTANCE_BUCKET, None)
+    return item
+
+def _distance_buckets(filters: Dict[str, Any], after: Optional[Dict[str, Any]] = None) -> range:
+    """Buckets the minDistance/maxDistance range overlaps, from the one the page key after is in or names"""
+    first = _distance_bucket(filters.get('minDistance') or 0)
+    if after and NEXT_BUCKET in after:
+        first = max(first, int(after[NEXT_BUCKET]))
+    elif after and DISTANCE_BUCKET in after:
+        first = max(first, int(after[DISTANCE_BUCKET]))
+    high = filters.get('maxDistance')
+    return range(first, _distance_bucket(MAX_DISTANCE_MILES if high is None else high) + 1)
+
+def _deployed(index_name: str) -> bool:
+    return DEPLOYED_INDEXES is None or index_name in DEPLOYED_INDEXES
+
+def _plan_index(filters: Dict[str, Any]) -> Optional[str]:
+    """GSI whose key matches a filter, which _query_plan queries instead of scanning, or None"""
+    if 'postcode' in filters and _deployed(POSTCODE_INDEX):
+        return POSTCODE_INDEX
+    if 'directionFromNY' in filters and _deployed(DIRECTION_INDEX):
+        return DIRECTION_INDEX
+    if ('minDistance' in filters or 'maxDistance' in filters) and _deployed(DISTANCE_INDEX):
+        return DISTANCE_INDEX
+    return None
+
+def _query_plan(filters: Optional[Dict[str, Any]] = None,
+                after: Optional[Dict[str, Any]] = None) -> Tuple[str, List[Dict[str, Any]]]:
+    """Pick GSI queries over a scan whenever a filter matches the key of a deployed GSI.
+
+    Returns the table method to call and the arguments of each request, to read
+    in turn: one scan or query, or one query per distance bucket in the range.
+    Buckets before the one the page key after ended in are skipped. Filters the
+    keys do not cover become a FilterExpression.
+    """
+    remaining = dict(filters or {})
+    queries = [{}]
+    index_name = _plan_index(remaining)
+    if index_name == POSTCODE_INDEX:
+        queries = [{'IndexName': POSTCODE_INDEX, 'KeyConditionExpression': Key('postcode').eq(remaining.pop('postcode'))}]
+    elif index_name == DIRECTION_INDEX:
+        key = Key('directionFromNY').eq(remaining.pop('directionFromNY'))
+        dates = _range(Key('startDate'), remaining.pop('startDateFrom', None), remaining.pop('startDateTo', None))
+        queries = [{'IndexName': DIRECTION_INDEX, 'KeyConditionExpression': key if dates is None else key & dates}]
+    elif index_name == DISTANCE_INDEX:
+        distances = _range(Key('distanceFromNY'), _number(remaining.pop('minDistance', None)),
+                           _number(remaining.pop('maxDistance', None)))
+        queries = [
+            {'IndexName': DISTANCE_INDEX, 'KeyConditionExpression': Key(DISTANCE_BUCKET).eq(bucket) & distances}
+            for bucket in _distance_buckets(filters, after)
+        ]
+    operation = 'scan' if index_name is None else 'query'
+
+    conditions = [
+        Attr('postcode').eq(remaining['postcode']) if 'postcode' in remaining else None,
+        Attr('directionFromNY').eq(remaining.get('directionFromNY')) if 'directionFromNY' in remaining else None,
+        Attr('users').contains(remaining['user']) if 'user' in remaining else None,
+        _range(Attr('startDate'), remaining.get('startDateFrom'), remaining.get('startDateTo')),
+        _range(Attr('distanceFromNY'), _number(remaining.get('minDistance')), _number(remaining.get('maxDistance')))
+    ]
+    conditions = [condition for condition in conditions if condition is not None]
+    if conditions:
+        expression = conditions[0]
+        for condition in conditions[1:]:
+            expression &= condition
+        queries = [{**query, 'FilterExpression': expression} for query in queries]
+    return operation, queries
+
+def _pages(read, kwargs: Dict[str, Any]) -> Iterator[List[Dict[str, Any]]]:
+    """Pages of a scan or query, following LastEvaluatedKey past each 1 MB page"""
+    kwargs = dict(kwargs)
+    while True:
+        response = read(**kwargs)
+        yield [_from_table(item) for item in response.get('Items', [])]
+        if 'LastEvaluatedKey' not in response:
+            return
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def _thread_resource():
+    """The calling thread's own DynamoDB resource, since boto3 resources are not thread-safe"""
+    resource = getattr(_thread_resources, 'resource', None)
+    if resource is None:
+        resource = _thread_resources.resource = boto3.session.Session().resource('dynamodb')
+        _thread_resources.tables = {}
+    return resource
+
+def _thread_table(name: str):
+    """The calling thread's own Table resource"""
+    resource = _thread_resource()
+    if name not in _thread_resources.tables:
+        _thread_resources.tables[name] = resource.Table(name)
+    return _thread_resources.tables[name]
+
+def _get_scan_pool() -> ThreadPoolExecutor:
+    """Worker threads shared by all parallel scans, so each builds its Table resource once"""
+    global _scan_pool
+    if _scan_pool is None:
+        _scan_pool = ThreadPoolExecutor(max_workers=MAX_SCAN_SEGMENTS, thread_name_prefix='dynamo-scan')
+    return _scan_pool
+
+def _parallel_scan(kwargs: Dict[str, Any], segments: int) -> Iterator[Dict[str, Any]]:
+    """Yield the items of segments parallel scan segments as their pages arrive.
+
+    Workers hand pages over through a bounded queue, so a slow consumer holds at
+    most a few pages per segment in memory. Closing the generator stops the workers,
+    and the first worker error is raised to the consumer.
+    """
+    table_name = get_table().name
+    pages = queue.Queue(maxsize=_PAGES_AHEAD * segments)
+    stop = threading.Event()
+
+    def offer(value) -> bool:
+        while not stop.is_set():
+            try:
+                pages.put(value, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def read(segment: int) -> None:
+        try:
+            table = _thread_table(table_name)
+            for page in _pages(table.scan, {**kwargs, 'Segment': segment, 'TotalSegments': segments}):
+                if not offer(page):
+                    return
+        except Exception as e:
+            offer(e)
+        finally:
+            offer(_DONE)
+
+    for segment in range(segments):
+        _get_scan_pool().submit(read, segment)
+    remaining = segments
+    try:
+        while remaining:
+            page = pages.get()
+            if page is _DONE:
+                remaining -= 1
+            elif isinstance(page, Exception):
+                raise page
+            else:
+                yield from page
+    finally:
+        stop.set()
+
+def iter_items(fields: Optional[List[str]] = None, filters: Optional[Dict[str, Any]] = None,
+               segments: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """Yield every item matching filters without building a list.
+
+    Scans are split into segments (default SCAN_SEGMENTS) read in parallel, in
+    which case items arrive in no particular order. GSI queries are read sequentially.
+    """
+    segments = SCAN_SEGMENTS if segments is None else segments
+    if not 1 <= segments <= MAX_SCAN_SEGMENTS:
+        raise ValueError(f"segments must be between 1 and {MAX_SCAN_SEGMENTS}")
+    operation, queries = _query_plan(filters)
+    projection = _projection(fields)
+    if operation == 'scan' and segments > 1:
+        yield from _parallel_scan({**projection, **queries[0]}, segments)
+        return
+    read = getattr(get_table(), operation)
+    for query in queries:
+        for page in _pages(read, {**projection, **query}):
+            yield from page
+
+def get_all_items(fields: Optional[List[str]] = None, segments: Optional[int] = None) -> List[Dict[str, Any]]:
+    return list(iter_items(fields, segments=segments))
+
+def _within(value: Any, lower: Any, upper: Any) -> bool:
+    return (lower is None or value >= lower) and (upper is None or value <= upper)
+
+def check_page_key(after: Dict[str, Any], filters: Optional[Dict[str, Any]] = None) -> None:
+    """Raise ValueError unless after is a key get_items_page can return for these filters.
+
+    That is the LastEvaluatedKey of the table or GSI the filters are read from,
+    which DynamoDB only resumes from if it satisfies the key condition, or a
+    bucket cursor of a distance-filtered list.
+    """
+    filters = filters or {}
+    index_name = _plan_index(filters)
+    # Tokens carry numbers as JSON, so a bucket may come back as a float
+    def is_bucket(value: Any) -> bool:
+        return _is_number(value) and value % 1 == 0 and int(value) in _distance_buckets(filters)
+
+    if index_name == DISTANCE_INDEX and list(after) == [NEXT_BUCKET]:
+        if is_bucket(after[NEXT_BUCKET]):
+            return
+        raise ValueError("Invalid next token")
+
+    checks = {'id': lambda value: isinstance(value, str)}
+    if index_name == POSTCODE_INDEX:
+        checks['postcode'] = lambda value: value == filters['postcode']
+    elif index_name == DIRECTION_INDEX:
+        checks['directionFromNY'] = lambda value: value == filters['directionFromNY']
+        checks['startDate'] = lambda value: (isinstance(value, str) and
+                                             _within(value, filters.get('startDateFrom'), filters.get('startDateTo')))
+    elif index_name == DISTANCE_INDEX:
+        checks[DISTANCE_BUCKET] = is_bucket
+        checks['distanceFromNY'] = lambda value: (_is_number(value) and _distance_bucket(value) == after.get(DISTANCE_BUCKET) and
+                                                  _within(value, filters.get('minDistance'), filters.get('maxDistance')))
+    if set(after) != set(checks) or not all(check(after[name]) for name, check in checks.items()):
+        raise ValueError("Invalid next token")
+
+def get_items_page(limit: int, after: Optional[Dict[str, Any]] = None, fields: Optional[List[str]] = None,
+                   filters: Optional[Dict[str, Any]] = None) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """Get up to limit items matching filters, starting after the given key.
+
+    limit bounds the items read, so a filtered page can hold fewer items while
+    more pages follow. A distance range reads its buckets in turn, so its pages
+    are ordered by distance. Returns the items and the key to pass as 'after' for
+    the next page, or None on the last page.
+    """
+    # Page tokens carry numeric keys as JSON numbers, which boto3 only takes as Decimal
+    after = _to_dynamo(after) if after else None
+    operation, queries = _query_plan(filters, after)
+    read = getattr(get_table(), operation)
+    # A bucket cursor starts the page at the beginning of its bucket
+    start = None if after and NEXT_BUCKET in after else after
+    items, read_count = [], 0
+    for index, query in enumerate(queries):
+        if read_count >= limit:
+            # The limit ran out exactly at the end of a bucket, without a LastEvaluatedKey
+            return items, {NEXT_BUCKET: _distance_buckets(filters, after)[index]}
+        kwargs = {'Limit': limit - read_count, **_projection(fields), **query}
+        if start:
+            kwargs['ExclusiveStartKey'] = start
+            start = None
+        response = read(**kwargs)
+        items += [_from_table(item) for item in response.get('Items', [])]
+        read_count += response.get('ScannedCount', 0)
+        if 'LastEvaluatedKey' in response:
+            return items, response['LastEvaluatedKey']
+    return items, None
+
+def get_item(item_id: str, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+    response = get_table().get_item(Key={'id': item_id}, **_projection(fields))
+    return _from_table(response.get('Item'))
 
-def get_item(item_id: str) -> Dict[str, Any]:
-    response = get_table().get_item(Key={'id': item_id})
-    return response.get('Item')
+def _timestamp() -> str:
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+def _stamp(item: Dict[str, Any]) -> None:
+    """Give a new item its first version and write time, in place"""
+    item['version'] = 1
+    item['updatedAt'] = _timestamp()
+
+def _put_new(table, item: Dict[str, Any]):
+    """Put an item unless its id exists, returning _EXISTS if it does"""
+    try:
+        table.put_item(Item=_to_item(item), ConditionExpression='attribute_not_exists(#id)',
+                       ExpressionAttributeNames={'#id': 'id'})
+    except table.meta.client.exceptions.ConditionalCheckFailedException:
+        return _EXISTS
+    return None
 
 def create_item(item: Dict[str, Any]) -> None:
-    get_table().put_item(Item=item)
+    """Put a new item, stamping it with 'version' and 'updatedAt'; an existing id raises "Duplicate Key Error" """
+    _stamp(item)
+    if _put_new(get_table(), item) is _EXISTS:
+        raise Exception("Duplicate Key Error")
+    _written([item])
+
+def create_items(items: List[Dict[str, Any]]) -> List[Optional[str]]:
+    """Insert many items with one conditional PutItem each, up to BATCH_CONCURRENCY at once.
+
+    BatchWriteItem cannot make a put conditional, so it would overwrite existing
+    ids. Returns one entry per item: None if it was written, "Duplicate Key Error"
+    if its id exists or an earlier item in the batch has it, otherwise the error message.
+    """
+    errors: List[Optional[str]] = [None] * len(items)
+    seen = set()
+    pending = []
+    for index, item in enumerate(items):
+        _stamp(item)
+        if item['id'] in seen:
+            errors[index] = "Duplicate Key Error"
+        else:
+            seen.add(item['id'])
+            pending.append(index)
+
+    for index, outcome in zip(pending, _run_each(_put_new, [items[index] for index in pending])):
+        if outcome is _EXISTS:
+            errors[index] = "Duplicate Key Error"
+        elif isinstance(outcome, Exception):
+            errors[index] = str(outcome)
+    written = [item for item, error in zip(items, errors) if error is None]
+    if written:
+        _written(written)
+    return errors
+
+def _update_arguments(updates: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """UpdateItem arguments applying updates atomically, or None if they set no client field.
+
+    The condition fails the write when the item does not exist or no field
+    changes, so a no-op keeps its version.
+    """
+    updates = {key: value for key, value in updates.items() if key not in _MANAGED_FIELDS}
+    if not updates:
+        return None
+    if _is_number(updates.get('distanceFromNY')):
+        updates[DISTANCE_BUCKET] = _distance_bucket(updates['distanceFromNY'])
 
-def update_item(item_id: str, updates: Dict[str, Any]) -> None:
     update_expression = "SET "
     expression_values = {}
 
     for key, value in updates.items():
         update_expression += f"#{key} = :{key}, "
-        expression_values[f":{key}"] = value
+        expression_values[f":{key}"] = _to_dynamo(value)
 
-    update_expression = update_expression.rstrip(", ")
+    update_expression += "#updatedAt = :updatedAt ADD #version :one"
+    changed = " OR ".join(f"#{key} <> :{key}" for key in updates)
+    expression_values[':updatedAt'] = _timestamp()
+    expression_values[':one'] = 1
 
     expression_names = {f"#{k}": k for k in updates.keys()}
+    expression_names.update({'#id': 'id', '#updatedAt': 'updatedAt', '#version': 'version'})
+    return {
+        'UpdateExpression': update_expression,
+        'ConditionExpression': f'attribute_exists(#id) AND ({changed})',
+        'ExpressionAttributeNames': expression_names,
+        'ExpressionAttributeValues': expression_values
+    }
+
+def update_item(item_id: str, updates: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Apply updates in one round trip and return the updated item, or None if it does not exist"""
+    arguments = _update_arguments(updates)
+    if arguments is None:
+        return get_item(item_id)
+
+    table = get_table()
+    try:
+        response = table.update_item(Key={'id': item_id}, ReturnValues='ALL_NEW', **arguments)
+    except table.meta.client.exceptions.ConditionalCheckFailedException:
+        # Either missing or already up to date
+        return get_item(item_id)
+
+    item = _from_table(response['Attributes'])
+    _written([item])
+    return item
+
+def get_item_and_version(item_id: str,
+                         fields: Optional[List[str]] = None) -> Tuple[Optional[Dict[str, Any]], Optional[Tuple[int, Optional[str]]]]:
+    """Get an item and its (version, updatedAt), which are returned even when the fieldset leaves them out"""
+    item = get_item(item_id, [*fields, 'version', 'updatedAt'] if fields else None)
+    if not item:
+        return None, None
+    version = (int(item.get('version', 0)), item.get('updatedAt'))
+    if fields:
+        for key in ('version', 'updatedAt'):
+            if key not in fields:
+                item.pop(key, None)
+    return item, version
+
+def _counter_key(shard: int) -> Dict[str, str]:
+    return {'id': f'{_COLLECTION_VERSION}#{shard}'}
+
+def _change_key(shard: int, seq: int) -> Dict[str, str]:
+    return {'id': f'{_COLLECTION_VERSION}#{shard}#{seq}'}
 
-    get_table().update_item(
+def _count_write(ids: List[str]) -> None:
+    """Count a write to the items on a random counter shard, and record the ids it changed.
+
+    Called after the write has landed, so a failure is logged instead of failing
+    it. Other functions' indexes then pick the write up at their next rebuild,
+    and list ETags change with the next write that is counted.
+    """
+    counters = get_counters_table()
+    if counters is None:
+        return
+    shard = random.randrange(COUNTER_SHARDS)
+    try:
+        response = counters.update_item(Key=_counter_key(shard), UpdateExpression='ADD #seq :one',
+                                        ExpressionAttributeNames={'#seq': 'seq'},
+                                        ExpressionAttributeValues={':one': 1}, ReturnValues='UPDATED_NEW')
+        seq = int(response['Attributes']['seq'])
+        counters.put_item(Item={**_change_key(shard, seq), 'shard': shard, 'seq': seq, 'ids': ids,
+                                'expiresAt': int(time.time()) + CHANGE_LOG_TTL_SECONDS})
+    except Exception as e:
+        logger.error(f"Error counting a write to {len(ids)} items: {str(e)}")
+
+def _read_counters() -> Optional[List[int]]:
+    """Count of each counter shard, read consistently in one request, or None without a counters table"""
+    counters = get_counters_table()
+    if counters is None:
+        return None
+    request_items = {counters.name: {'Keys': [_counter_key(shard) for shard in range(COUNTER_SHARDS)],
+                                     'ConsistentRead': True}}
+    found = {}
+    for response in _send_batch(dynamodb.batch_get_item, request_items, 'UnprocessedKeys'):
+        for counter in response['Responses'].get(counters.name, []):
+            found[counter['id']] = int(counter['seq'])
+    return [found.get(_counter_key(shard)['id'], 0) for shard in range(COUNTER_SHARDS)]
+
+def _read_changes(keys: List[Tuple[int, int]]) -> Dict[Tuple[int, int], List[str]]:
+    """Ids changed by the write counted as each (shard, count), for those whose change record exists"""
+    counters = get_counters_table()
+    changes = {}
+    for chunk in _chunks(keys, BATCH_GET_SIZE):
+        request_items = {counters.name: {'Keys': [_change_key(*key) for key in chunk], 'ConsistentRead': True}}
+        for response in _send_batch(dynamodb.batch_get_item, request_items, 'UnprocessedKeys'):
+            for record in response['Responses'].get(counters.name, []):
+                changes[(int(record['shard']), int(record['seq']))] = record['ids']
+    return changes
+
+def item_cache_stats() -> None:
+    """None: get_item reads DynamoDB directly, so there are no cache lookups to report"""
+    return None
+
+def get_collection_version() -> Optional[int]:
+    """Counter that every item write increases: the sum of the counter shards, read consistently.
+
+    The table's item count lags by hours and the latest write time would take a
+    scan, so writers count themselves. Returns None without a counters table,
+    in which case list responses carry no ETag.
+    """
+    counts = _read_counters()
+    return None if counts is None else sum(counts)
+
+def get_item_version(item_id: str) -> Optional[Tuple[int, Optional[str]]]:
+    """Current (version, updatedAt) of an item, read with a projection of only those fields, or None"""
+    response = get_table().get_item(
         Key={'id': item_id},
-        UpdateExpression=update_expression,
-        ExpressionAttributeNames=expression_names,
-        ExpressionAttributeValues=expression_values
+        ProjectionExpression='#id, #version, #updatedAt',
+        ExpressionAttributeNames={'#id': 'id', '#version': 'version', '#updatedAt': 'updatedAt'}
     )
+    item = response.get('Item')
+    return None if item is None else (int(item.get('version', 0)), item.get('updatedAt'))
+
+def delete_item(item_id: str) -> bool:
+    """Delete an item in one round trip, returning False if it did not exist"""
+    response = get_table().delete_item(Key={'id': item_id}, ReturnValues='ALL_OLD')
+    if 'Attributes' not in response:
+        return False
+    _written(removed=[item_id])
+    return True
+
+def _get_batch_pool() -> ThreadPoolExecutor:
+    global _batch_pool
+    if _batch_pool is None:
+        _batch_pool = ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY, thread_name_prefix='dynamo-batch')
+    return _batch_pool
+
+def _chunks(values: List[Any], size: int) -> List[List[Any]]:
+    return [values[start:start + size] for start in range(0, len(values), size)]
+
+def _run_chunks(send_chunk, chunks: List[List[Any]]) -> List[Any]:
+    """send_chunk(resource, chunk) for every chunk, up to BATCH_CONCURRENCY at once, in chunk order"""
+    if len(chunks) <= 1 or BATCH_CONCURRENCY <= 1:
+        return [send_chunk(dynamodb, chunk) for chunk in chunks]
+    return list(_get_batch_pool().map(lambda chunk: send_chunk(_thread_resource(), chunk), chunks))
+
+def _run_each(send, values: List[Any]) -> List[Any]:
+    """send(table, value) for every value, up to BATCH_CONCURRENCY at once, in value order.
+
+    The exception a value raises is returned in its place, so one failure does not
+    hide the outcome of the others.
+    """
+    def attempt(table, value):
+        try:
+            return send(table, value)
+        except Exception as e:
+            logger.warning(f"DynamoDB request failed: {str(e)}")
+            return e
+
+    if len(values) <= 1 or BATCH_CONCURRENCY <= 1:
+        table = get_table()
+        return [attempt(table, value) for value in values]
+    table_name = get_table().name
+    return list(_get_batch_pool().map(lambda value: attempt(_thread_table(table_name), value), values))
+
+def _send_batch(send, request_items: Dict[str, Any], unprocessed_key: str) -> Iterator[Dict[str, Any]]:
+    """Responses to a batch request, resending its unprocessed part with exponential backoff.
+
+    Raises RuntimeError if part of the request is still unprocessed after BATCH_MAX_RETRIES retries.
+    """
+    for attempt in range(BATCH_MAX_RETRIES + 1):
+        if attempt:
+            time.sleep(random.uniform(0, min(BATCH_MAX_DELAY, BATCH_BASE_DELAY * 2 ** (attempt - 1))))
+        response = send(RequestItems=request_items)
+        yield response
+        request_items = response.get(unprocessed_key)
+        if not request_items:
+            return
+    raise RuntimeError(f"DynamoDB returned {unprocessed_key} after {BATCH_MAX_RETRIES} retries")
+
+def _batch_get(ids: List[str], fields: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+    """Fetch items by id with concurrent BatchGetItem requests, keyed by id; missing ids are absent"""
+    table_name = get_table().name
+    projection = _projection(fields)
+
+    def get_chunk(resource, chunk: List[str]) -> List[Dict[str, Any]]:
+        request_items = {table_name: {'Keys': [{'id': item_id} for item_id in chunk], **projection}}
+        return [
+            item
+            for response in _send_batch(resource.batch_get_item, request_items, 'UnprocessedKeys')
+            for item in response['Responses'].get(table_name, [])
+        ]
+
+    # BatchGetItem rejects requests that repeat a key
+    chunks = _chunks(list(dict.fromkeys(ids)), BATCH_GET_SIZE)
+    return {item['id']: _from_table(item) for items in _run_chunks(get_chunk, chunks) for item in items}
+
+def _request_id(request: Dict[str, Any]) -> str:
+    return (request['PutRequest']['Item'] if 'PutRequest' in request else request['DeleteRequest']['Key'])['id']
+
+def _batch_write(requests: List[Dict[str, Any]]) -> Dict[str, str]:
+    """Send PutRequest and DeleteRequest entries with concurrent BatchWriteItem requests.
+
+    Returns the error message for the id of each entry that was not written,
+    because its request failed or it was still unprocessed after the retries.
+    The other requests go ahead regardless.
+    """
+    table_name = get_table().name
+
+    def write_chunk(resource, chunk: List[Dict[str, Any]]) -> Dict[str, str]:
+        pending = chunk
+        try:
+            for response in _send_batch(resource.batch_write_item, {table_name: chunk}, 'UnprocessedItems'):
+                pending = response.get('UnprocessedItems', {}).get(table_name, [])
+        except Exception as e:
+            logger.warning(f"BatchWriteItem failed for {len(pending)} of {len(chunk)} items: {str(e)}")
+            return {_request_id(request): str(e) for request in pending}
+        return {}
+
+    failed = {}
+    for errors in _run_chunks(write_chunk, _chunks(requests, BATCH_WRITE_SIZE)):
+        failed.update(errors)
+    return failed
+
+def get_items_by_ids(ids: List[str], fields: Optional[List[str]] = None) -> List[Optional[Dict[str, Any]]]:
+    """Get many items with BatchGetItem, in the order of ids, with None for ids that do not exist"""
+    found = _batch_get(ids, fields)
+    return [found.get(item_id) for item_id in ids]
+
+def put_items(items: List[Dict[str, Any]]) -> None:
+    """Write whole items as given with BatchWriteItem, replacing any item with the same id.
+
+    Raises ValueError if two items share an id, which BatchWriteItem rejects,
+    and RuntimeError if some items could not be written.
+    """
+    repeated = sorted(item_id for item_id, count in Counter(item['id'] for item in items).items() if count > 1)
+    if repeated:
+        raise ValueError(f"Items repeat ids: {', '.join(repeated)}")
+    failed = _batch_write([{'PutRequest': {'Item': _to_item(item)}} for item in items])
+    if failed:
+        raise RuntimeError(f"{len(failed)} of {len(items)} items were not written: {next(iter(failed.values()))}")
+
+def update_items(updates: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Apply per-item updates with one atomic UpdateItem per item, up to BATCH_CONCURRENCY at once.
+
+    BatchWriteItem can only put whole items, which would undo writes made between
+    reading and putting them, so DynamoDB merges each update itself. Returns the
+    matched and modified counts, the ids that do not exist and the error message
+    of each update that failed.
+    """
+    def update(table, item_id: str):
+        arguments = _update_arguments(updates[item_id])
+        if arguments is None:
+            exists = 'Item' in table.get_item(Key={'id': item_id}, ProjectionExpression='#id',
+                                              ExpressionAttributeNames={'#id': 'id'})
+            return _UNCHANGED if exists else _MISSING
+        try:
+            response = table.update_item(Key={'id': item_id}, ReturnValues='ALL_NEW',
+                                         ReturnValuesOnConditionCheckFailure='ALL_OLD', **arguments)
+        except table.meta.client.exceptions.ConditionalCheckFailedException as e:
+            return _UNCHANGED if 'Item' in e.response else _MISSING
+        return _from_table(response['Attributes'])
+
+    outcomes = dict(zip(updates, _run_each(update, list(updates))))
+    modified = [outcome for outcome in outcomes.values() if isinstance(outcome, dict)]
+    if modified:
+        _written(modified)
+    missing = [item_id for item_id, outcome in outcomes.items() if outcome is _MISSING]
+    failed = {item_id: str(outcome) for item_id, outcome in outcomes.items() if isinstance(outcome, Exception)}
+    return {
+        'matched': len(updates) - len(missing) - len(failed),
+        'modified': len(modified),
+        'missing': missing,
+        'failed': failed
+    }
+
+def delete_items(ids: List[str]) -> Dict[str, Any]:
+    """Delete many items with BatchWriteItem.
+
+    Returns the deleted count, the ids that do not exist and the error message
+    of each id that could not be deleted.
+    """
+    existing = list(_batch_get(ids, fields=['id']))
+    failed = _batch_write([{'DeleteRequest': {'Key': {'id': item_id}}} for item_id in existing])
+    deleted = [item_id for item_id in existing if item_id not in failed]
+    if deleted:
+        _written(removed=deleted)
+    return {
+        'deleted': len(deleted),
+        'missing': [item_id for item_id in ids if item_id not in existing],
+        'failed': failed
+    }
+
+def backfill_distance_buckets() -> int:
+    """Give items written before DISTANCE_INDEX existed their distanceBucket, returning how many were updated.
+
+    The index is sparse, so until this has run once such items are missing from
+    distance-filtered lists. An item whose distance changes meanwhile is skipped,
+    since that write sets the bucket itself.
+    """
+    table = get_table()
+    kwargs = {
+        'FilterExpression': Attr('distanceFromNY').exists() & Attr(DISTANCE_BUCKET).not_exists(),
+        **_projection(['distanceFromNY'])
+    }
+    updated = 0
+    for page in _pages(table.scan, kwargs):
+        for item in page:
+            if not _is_number(item.get('distanceFromNY')):
+                continue
+            try:
+                table.update_item(
+                    Key={'id': item['id']},
+                    UpdateExpression='SET #bucket = :bucket',
+                    ConditionExpression='#distance = :distance',
+                    ExpressionAttributeNames={'#bucket': DISTANCE_BUCKET, '#distance': 'distanceFromNY'},
+                    ExpressionAttributeValues={':bucket': _distance_bucket(item['distanceFromNY']),
+                                               ':distance': item['distanceFromNY']}
+                )
+                updated += 1
+            except table.meta.client.exceptions.ConditionalCheckFailedException:
+                pass
+    if updated:
+        # Distance-filtered lists now hold these items; the in-process indexes do
+        # not use the bucket, so the write names no ids for them to read again
+        _count_write([])
+    return updated
+
+def find_items_near(latitude: float, longitude: float, radius: float = None, limit: int = 20) -> List[Dict[str, Any]]:
+    """Find items nearest to a point, closest first, with their 'distance' in miles"""
+    return get_spatial_index().nearest(latitude, longitude, k=limit, radius=radius)
+
+def search_items(query: str, limit: int = 20, after: Optional[Dict[str, Any]] = None,
+                 fields: Optional[List[str]] = None) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """Items matching any term of query, best first, each with its 'score'.
+
+    Returns the items and the key to pass as 'after' for the next page, or None on the last page.
+    """
+    items, next_key = get_text_index().search(query, limit, after)
+    if fields:
+        keep = {'id', 'score', *fields}
+        items = [{key: value for key, value in item.items() if key in keep} for item in items]
+    return items, next_key
+
+def get_item_stats(bucket_size: float = DEFAULT_BUCKET_MILES, top: int = DEFAULT_TOP) -> Dict[str, Any]:
+    """Aggregate statistics over all items.
 
-def delete_item(item_id: str) -> None:
-    get_table().delete_item(Key={'id': item_id})
\ No newline at end of file
+    DynamoDB cannot aggregate, so one scan reads only the fields the statistics
+    use and folds them in memory; only the aggregates leave the function.
+    """
+    return summarize(iter_items(fields=['directionFromNY', 'distanceFromNY', 'postcode', 'users']), bucket_size, top)
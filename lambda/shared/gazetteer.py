@@ -0,0 +1,169 @@
+"""Offline US postcode gazetteer backed by a memory-mapped binary file.
+
+File layout (little endian):
+    header:  8-byte magic, uint32 record count, uint32 reserved
+    records: uint32 zip, int32 latitude * 1e6, int32 longitude * 1e6
+
+Records are fixed width and sorted by zip, so lookups are a binary search over
+the mapped file and only the pages touched by the search become resident.
+"""
+import os
+import csv
+import mmap
+import struct
+import logging
+import argparse
+from typing import Dict, Optional, Tuple, List
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'ZIPGAZ01'
+_HEADER = struct.Struct('<8sII')
+_RECORD = struct.Struct('<Iii')
+_KEY = struct.Struct('<I')
+_SCALE = 1_000_000
+
+# Loaded gazetteer, False once we know none is configured
+_gazetteer = None
+
+
+def _parse_postcode(postcode: str) -> Optional[int]:
+    """Return the numeric key for a 5-digit US postcode, or None"""
+    if not isinstance(postcode, str):
+        return None
+    postcode = postcode.strip()
+    if len(postcode) != 5 or not postcode.isdigit():
+        return None
+    return int(postcode)
+
+
+class Gazetteer:
+    """Read-only view over a gazetteer file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, _ = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self._mm.close()
+            raise ValueError(f"Not a gazetteer file: {path}")
+        if len(self._mm) != _HEADER.size + count * _RECORD.size:
+            self._mm.close()
+            raise ValueError(f"Truncated gazetteer file: {path}")
+        self._count = count
+
+    def __len__(self) -> int:
+        return self._count
+
+    def lookup(self, postcode: str) -> Optional[Tuple[float, float]]:
+        """Return (latitude, longitude) for a postcode, or None if it is not in the file"""
+        key = _parse_postcode(postcode)
+        if key is None:
+            return None
+
+        mm = self._mm
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            (mid_key,) = _KEY.unpack_from(mm, _HEADER.size + mid * _RECORD.size)
+            if mid_key < key:
+                lo = mid + 1
+            elif mid_key > key:
+                hi = mid
+            else:
+                _, lat, lon = _RECORD.unpack_from(mm, _HEADER.size + mid * _RECORD.size)
+                return lat / _SCALE, lon / _SCALE
+        return None
+
+    def close(self) -> None:
+        self._mm.close()
+
+
+def build_gazetteer(csv_path: str, output_path: str,
+                    postcode_column: str = 'postcode',
+                    latitude_column: str = 'latitude',
+                    longitude_column: str = 'longitude',
+                    delimiter: str = ',') -> int:
+    """Build a gazetteer file from a CSV dump and return the number of records written.
+
+    The first row seen for a postcode wins, matching the first place the
+    Zippopotam.us API returns. Rows with a malformed postcode or coordinate are skipped.
+    """
+    records: Dict[int, Tuple[int, int]] = {}
+    skipped = 0
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f, delimiter=delimiter):
+            key = _parse_postcode(row.get(postcode_column, ''))
+            try:
+                lat = round(float(row[latitude_column]) * _SCALE)
+                lon = round(float(row[longitude_column]) * _SCALE)
+            except (KeyError, TypeError, ValueError):
+                key = None
+            if key is None or not (-90 * _SCALE <= lat <= 90 * _SCALE) or not (-180 * _SCALE <= lon <= 180 * _SCALE):
+                skipped += 1
+                continue
+            records.setdefault(key, (lat, lon))
+
+    buffer = bytearray(_HEADER.size + len(records) * _RECORD.size)
+    _HEADER.pack_into(buffer, 0, MAGIC, len(records), 0)
+    offset = _HEADER.size
+    for key in sorted(records):
+        _RECORD.pack_into(buffer, offset, key, *records[key])
+        offset += _RECORD.size
+
+    # Write to a temporary file first so running processes never map a half-written file
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(buffer)
+    os.replace(tmp_path, output_path)
+
+    if skipped:
+        logger.warning(f"Skipped {skipped} malformed rows while building {output_path}")
+    return len(records)
+
+
+def get_gazetteer() -> Optional[Gazetteer]:
+    """Get the gazetteer configured by GAZETTEER_PATH, or None if there is none"""
+    global _gazetteer
+    if _gazetteer is None:
+        path = os.environ.get('GAZETTEER_PATH')
+        _gazetteer = False
+        if path:
+            try:
+                _gazetteer = Gazetteer(path)
+                logger.debug(f"Loaded gazetteer with {len(_gazetteer)} postcodes from {path}")
+            except (OSError, ValueError) as e:
+                logger.warning(f"Error loading gazetteer: {str(e)}")
+    return _gazetteer or None
+
+# For testing purposes
+def set_gazetteer(gazetteer: Optional[Gazetteer]):
+    global _gazetteer
+    _gazetteer = gazetteer
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    arg_parser = argparse.ArgumentParser(description="Build an offline postcode gazetteer from a CSV dump")
+    arg_parser.add_argument('csv_path', help="CSV file with one row per postcode")
+    arg_parser.add_argument('output_path', help="Gazetteer file to write")
+    arg_parser.add_argument('--postcode-column', default='postcode')
+    arg_parser.add_argument('--latitude-column', default='latitude')
+    arg_parser.add_argument('--longitude-column', default='longitude')
+    arg_parser.add_argument('--delimiter', default=',', help="Use '\\t' for tab-separated dumps")
+    args = arg_parser.parse_args(argv)
+
+    delimiter = '\t' if args.delimiter == '\\t' else args.delimiter
+    count = build_gazetteer(
+        args.csv_path,
+        args.output_path,
+        postcode_column=args.postcode_column,
+        latitude_column=args.latitude_column,
+        longitude_column=args.longitude_column,
+        delimiter=delimiter
+    )
+    print(f"Wrote {count} postcodes to {args.output_path}")
+
+
+if __name__ == '__main__':
+    main()
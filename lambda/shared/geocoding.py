@@ -1,39 +1,318 @@
+import os
+import time
+import random
+import logging
+import threading
 import requests
-from typing import Tuple, Optional
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Tuple, Optional, Dict, Iterable
+from requests.adapters import HTTPAdapter
+from pymongo.errors import PyMongoError
+from .cache import TTLCache, SingleFlight
+from .gazetteer import get_gazetteer
+from .mongo_utils import get_geocache_collection
+
+logger = logging.getLogger(__name__)
+
+GEOCACHE_MAX_ENTRIES = int(os.environ.get('GEOCACHE_MAX_ENTRIES', '4096'))
+GEOCACHE_TTL_SECONDS = int(os.environ.get('GEOCACHE_TTL_SECONDS', str(30 * 24 * 3600)))
+GEOCACHE_NEGATIVE_TTL_SECONDS = int(os.environ.get('GEOCACHE_NEGATIVE_TTL_SECONDS', '3600'))
+
+# In-process tier; a cached None marks a postcode the upstream does not know
+_geocache = TTLCache(max_entries=GEOCACHE_MAX_ENTRIES, ttl=GEOCACHE_TTL_SECONDS)
+_shared_stats = {'hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+_MISS = object()
+_inflight = SingleFlight()
+
+GEOCODING_BASE_URL = os.environ.get('GEOCODING_BASE_URL', 'https://api.zippopotam.us/us')
+GEOCODING_CONNECT_TIMEOUT = float(os.environ.get('GEOCODING_CONNECT_TIMEOUT', '3.05'))
+GEOCODING_READ_TIMEOUT = float(os.environ.get('GEOCODING_READ_TIMEOUT', '5'))
+GEOCODING_MAX_RETRIES = int(os.environ.get('GEOCODING_MAX_RETRIES', '2'))
+GEOCODING_BACKOFF_SECONDS = float(os.environ.get('GEOCODING_BACKOFF_SECONDS', '0.2'))
+GEOCODING_MAX_WORKERS = int(os.environ.get('GEOCODING_MAX_WORKERS', '16'))
+
+_client = None
+
+def _shared_tier_enabled() -> bool:
+    return os.environ.get('GEOCACHE_SHARED_TIER', '').lower() == 'true'
+
+def _count_shared(counter: str) -> None:
+    with _stats_lock:
+        _shared_stats[counter] += 1
+
+def _from_shared_doc(doc: Optional[Dict]):
+    """Coordinates held by a shared tier document, or _MISS if it is absent or expired"""
+    if not doc:
+        _count_shared('misses')
+        return _MISS
+
+    # The TTL monitor only runs once a minute, so expired documents can still be returned
+    expires_at = doc['expiresAt']
+    if expires_at.tzinfo is None:
+        expires_at = expires_at.replace(tzinfo=timezone.utc)
+    if expires_at <= datetime.now(timezone.utc):
+        _count_shared('misses')
+        return _MISS
+
+    _count_shared('hits')
+    if not doc.get('found'):
+        return None
+    return doc['latitude'], doc['longitude']
+
+def _shared_doc(postcode: str, coordinates: Optional[Tuple[float, float]], ttl: int) -> Dict:
+    doc = {
+        '_id': postcode,
+        'found': coordinates is not None,
+        'expiresAt': datetime.now(timezone.utc) + timedelta(seconds=ttl)
+    }
+    if coordinates is not None:
+        doc['latitude'], doc['longitude'] = coordinates
+    return doc
+
+def _get_shared(postcode: str):
+    """Look a postcode up in the shared Mongo tier, returning _MISS when absent"""
+    try:
+        doc = get_geocache_collection().find_one({'_id': postcode})
+    except PyMongoError as e:
+        logger.warning(f"Error reading geocache: {str(e)}")
+        return _MISS
+    return _from_shared_doc(doc)
+
+def _set_shared(postcode: str, coordinates: Optional[Tuple[float, float]], ttl: int) -> None:
+    try:
+        get_geocache_collection().replace_one({'_id': postcode}, _shared_doc(postcode, coordinates, ttl), upsert=True)
+    except PyMongoError as e:
+        logger.warning(f"Error writing geocache: {str(e)}")
+
+class GeocodingClient:
+    """Pooled, timeout-bounded HTTP client for the Zippopotam.us API"""
+
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(self, base_url: str = GEOCODING_BASE_URL,
+                 connect_timeout: float = GEOCODING_CONNECT_TIMEOUT,
+                 read_timeout: float = GEOCODING_READ_TIMEOUT,
+                 max_retries: int = GEOCODING_MAX_RETRIES,
+                 backoff: float = GEOCODING_BACKOFF_SECONDS,
+                 pool_size: int = GEOCODING_MAX_WORKERS):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+        # Keep-alive connections are reused across calls; retries are handled in fetch()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def fetch(self, postcode: str) -> Optional[Tuple[float, float]]:
+        """Fetch coordinates for a postcode.
+
+        Returns None for postcodes the API does not know and raises on any other failure,
+        so that only definitive answers are cached. Connection errors, timeouts and
+        retryable statuses are retried with exponential backoff and full jitter.
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.get(f'{self.base_url}/{postcode}', timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            else:
+                if response.status_code == 404:
+                    return None
+                if response.status_code == 200:
+                    data = response.json()
+                    return (
+                        float(data['places'][0]['latitude']),
+                        float(data['places'][0]['longitude'])
+                    )
+                error = Exception(f"Geocoding request failed with status {response.status_code}")
+                if response.status_code not in self.RETRY_STATUSES:
+                    raise error
+
+            if attempt < self.max_retries:
+                time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+        raise error
+
+    def close(self) -> None:
+        self.session.close()
+
+def get_client() -> GeocodingClient:
+    global _client
+    if _client is None:
+        _client = GeocodingClient()
+    return _client
+
+# For testing purposes
+def set_client(client: Optional[GeocodingClient]):
+    global _client
+    _client = client
+
+def _resolve(postcode: str) -> Optional[Tuple[float, float]]:
+    """Resolve a postcode missing from the in-process tier and cache the answer"""
+    use_shared_tier = _shared_tier_enabled()
+    if use_shared_tier:
+        coordinates = _get_shared(postcode)
+        if coordinates is not _MISS:
+            ttl = GEOCACHE_TTL_SECONDS if coordinates else GEOCACHE_NEGATIVE_TTL_SECONDS
+            _geocache.set(postcode, coordinates, ttl=ttl)
+            return coordinates
+
+    coordinates = get_client().fetch(postcode)
+    ttl = GEOCACHE_TTL_SECONDS if coordinates else GEOCACHE_NEGATIVE_TTL_SECONDS
+    _geocache.set(postcode, coordinates, ttl=ttl)
+    if use_shared_tier:
+        _set_shared(postcode, coordinates, ttl)
+    return coordinates
 
 def get_coordinates(postcode: str) -> Optional[Tuple[float, float]]:
-    """Get coordinates from Zippopotam.us API"""
+    """Get coordinates from the offline gazetteer, the geocoding cache or the Zippopotam.us API"""
+    gazetteer = get_gazetteer()
+    if gazetteer is not None:
+        coordinates = gazetteer.lookup(postcode)
+        if coordinates is not None:
+            return coordinates
+
+    key = str(postcode)
+    coordinates = _geocache.get(key, _MISS)
+    if coordinates is not _MISS:
+        return coordinates
+
+    # Concurrent misses for the same postcode share a single upstream lookup
     try:
-        response = requests.get(f'https://api.zippopotam.us/us/{postcode}')
-        if response.status_code == 200:
-            data = response.json()
-            return (
-                float(data['places'][0]['latitude']),
-                float(data['places'][0]['longitude'])
-            )
-        return None
-    except Exception:
+        return _inflight.do(key, lambda: _resolve(key))
+    except Exception as e:
+        logger.warning(f"Error geocoding postcode {postcode}: {str(e)}")
         return None
 
+def get_coordinates_many(postcodes: Iterable[str]) -> Dict[str, Optional[Tuple[float, float]]]:
+    """Resolve many postcodes concurrently, looking each distinct postcode up once"""
+    unique = list(dict.fromkeys(str(postcode) for postcode in postcodes))
+    if len(unique) <= 1:
+        return {postcode: get_coordinates(postcode) for postcode in unique}
+
+    with ThreadPoolExecutor(max_workers=min(GEOCODING_MAX_WORKERS, len(unique))) as executor:
+        return dict(zip(unique, executor.map(get_coordinates, unique)))
+
+def get_cache_stats() -> Dict[str, Dict[str, int]]:
+    """Hit/miss counters for both geocoding cache tiers, and upstream lookups saved by coalescing"""
+    with _stats_lock:
+        shared = dict(_shared_stats)
+    return {'memory': _geocache.stats(), 'shared': shared, 'inflight': _inflight.stats()}
+
+def clear_cache() -> None:
+    """Empty the in-process tier and reset the counters"""
+    _geocache.clear()
+    _inflight.reset()
+    with _stats_lock:
+        _shared_stats.update(hits=0, misses=0)
+
+# WGS-84 ellipsoid, as used by geopy's geodesic
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_B = (1 - WGS84_F) * WGS84_A
+METERS_PER_MILE = 1609.344
+
+NY_LAT, NY_LON = 40.7128, -74.0060  # New York coordinates
+
+def _vincenty_terms(lam, sin_u1, cos_u1, sin_u2, cos_u2):
+    sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+    sin_sigma = np.hypot(cos_u2 * sin_lam, cos_u1 * sin_u2 - sin_u1 * cos_u2 * cos_lam)
+    cos_sigma = sin_u1 * sin_u2 + cos_u1 * cos_u2 * cos_lam
+    sigma = np.arctan2(sin_sigma, cos_sigma)
+    sin_alpha = np.divide(cos_u1 * cos_u2 * sin_lam, sin_sigma,
+                          out=np.zeros_like(sin_sigma), where=sin_sigma != 0)
+    cos2_alpha = 1 - sin_alpha ** 2
+    # Points on the equator have cos2_alpha == 0
+    cos_2sigma_m = cos_sigma - np.divide(2 * sin_u1 * sin_u2, cos2_alpha,
+                                         out=np.zeros_like(cos2_alpha), where=cos2_alpha != 0)
+    cos_2sigma_m[cos2_alpha == 0] = 0.0
+    return sin_sigma, cos_sigma, sigma, sin_alpha, cos2_alpha, cos_2sigma_m
+
+def geodesic_miles(origin_lat: float, origin_lon: float, lats, lons) -> np.ndarray:
+    """Geodesic distances (in miles) from one origin to arrays of points.
+
+    Solves Vincenty's inverse problem for every point at once, which agrees with
+    geopy's Karney solution to well under a millimetre. The few nearly antipodal
+    points where the iteration does not converge are handed to geopy.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    shape = lats.shape
+    lats = lats.ravel()
+    lons = np.asarray(lons, dtype=np.float64).ravel()
+
+    L = np.radians(lons - origin_lon)
+    U1 = np.arctan((1 - WGS84_F) * np.tan(np.radians(origin_lat)))
+    U2 = np.arctan((1 - WGS84_F) * np.tan(np.radians(lats)))
+    sin_u1, cos_u1 = np.sin(U1), np.cos(U1)
+    sin_u2, cos_u2 = np.sin(U2), np.cos(U2)
+
+    # Iterate lambda only for the points that have not converged yet
+    lam = L.copy()
+    active = np.flatnonzero(~(np.isnan(lats) | np.isnan(lons)))
+    for _ in range(200):
+        if not active.size:
+            break
+        sin_sigma, cos_sigma, sigma, sin_alpha, cos2_alpha, cos_2sigma_m = _vincenty_terms(
+            lam[active], sin_u1, cos_u1, sin_u2[active], cos_u2[active]
+        )
+        C = WGS84_F / 16 * cos2_alpha * (4 + WGS84_F * (4 - 3 * cos2_alpha))
+        new_lam = L[active] + (1 - C) * WGS84_F * sin_alpha * (
+            sigma + C * sin_sigma * (cos_2sigma_m + C * cos_sigma * (-1 + 2 * cos_2sigma_m ** 2))
+        )
+        done = np.abs(new_lam - lam[active]) < 1e-12
+        lam[active] = new_lam
+        active = active[~done]
+
+    sin_sigma, cos_sigma, sigma, _, cos2_alpha, cos_2sigma_m = _vincenty_terms(
+        lam, sin_u1, cos_u1, sin_u2, cos_u2
+    )
+    u_sq = cos2_alpha * (WGS84_A ** 2 - WGS84_B ** 2) / WGS84_B ** 2
+    A = 1 + u_sq / 16384 * (4096 + u_sq * (-768 + u_sq * (320 - 175 * u_sq)))
+    B = u_sq / 1024 * (256 + u_sq * (-128 + u_sq * (74 - 47 * u_sq)))
+    delta_sigma = B * sin_sigma * (cos_2sigma_m + B / 4 * (
+        cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)
+        - B / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sigma_m ** 2)
+    ))
+    miles = WGS84_B * A * (sigma - delta_sigma) / METERS_PER_MILE
+
+    if active.size:
+        from geopy.distance import geodesic
+        for index in active:
+            miles[index] = geodesic((origin_lat, origin_lon), (lats[index], lons[index])).miles
+    return miles.reshape(shape)
+
+def calculate_distances_from_ny(lats, lons) -> np.ndarray:
+    """Calculate distances (in miles) from New York for arrays of coordinates"""
+    return np.round(geodesic_miles(NY_LAT, NY_LON, lats, lons), 2)
+
+def get_directions_from_ny(lats, lons) -> np.ndarray:
+    """Calculate directions (NE, NW, SE, SW) from New York for arrays of coordinates"""
+    is_north = np.asarray(lats, dtype=np.float64) > NY_LAT
+    is_east = np.asarray(lons, dtype=np.float64) > NY_LON
+    return np.where(
+        is_north,
+        np.where(is_east, "NE", "NW"),
+        np.where(is_east, "SE", "SW")
+    )
+
 def calculate_distance_from_ny(lat: float, lon: float) -> float:
     """Calculate distance (in miles) from New York"""
-    ny_coordinates = (40.7128, -74.0060)  # New York coordinates
-    # Use existing distance calculation
-    from geopy.distance import geodesic
-    return round(geodesic(ny_coordinates, (lat, lon)).miles, 2)
+    return float(calculate_distances_from_ny([lat], [lon])[0])
 
 def get_direction_from_ny(lat: float, lon: float) -> str:
     """Calculate direction (NE, NW, SE, SW) from New York"""
-    ny_lat, ny_lon = 40.7128, -74.0060  # New York coordinates
-
-    is_north = lat > ny_lat
-    is_east = lon > ny_lon
-
-    if is_north and is_east:
-        return "NE"
-    elif is_north:
-        return "NW"
-    elif is_east:
-        return "SE"
-    else:
-        return "SW"
\ No newline at end of file
+    return str(get_directions_from_ny([lat], [lon])[0])
+
+def location_fields(lat: float, lon: float) -> Dict[str, Any]:
+    """The latitude, longitude, distance and direction from New York stored with an item"""
+    return {
+        'latitude': float(lat),
+        'longitude': float(lon),
+        'distanceFromNY': calculate_distance_from_ny(lat, lon),
+        'directionFromNY': get_direction_from_ny(lat, lon)
+    }
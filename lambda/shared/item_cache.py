@@ -0,0 +1,237 @@
+"""Read-through cache for single items, kept current by the write paths.
+
+The default backend is a bounded in-process TTLCache. Set ITEM_CACHE_REDIS_URL to
+share entries between processes instead, so that a write in one Lambda container
+invalidates the entry for all of them. Any object with TTLCache's get/set/delete/
+clear/stats methods can be plugged in with set_item_cache(). A backend shared
+between processes also provides generation/bump/set_if_generation, so that a
+read racing a write in another process is not cached either.
+"""
+import os
+import json
+import threading
+import logging
+from typing import Any, Callable, Dict, Hashable, Optional
+from .cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+ITEM_CACHE_MAX_ENTRIES = int(os.environ.get('ITEM_CACHE_MAX_ENTRIES', '1024'))
+ITEM_CACHE_TTL_SECONDS = float(os.environ.get('ITEM_CACHE_TTL_SECONDS', '30'))
+# How long a key's write count outlives its last write; a load taking longer than
+# this may cache what it read
+GENERATION_TTL_SECONDS = 3600
+
+_MISS = object()
+_item_cache = None
+_body_cache = None
+
+
+class RedisCache:
+    """Shared cache backend storing JSON values in Redis under a key prefix"""
+
+    def __init__(self, client, prefix: str = 'item:', ttl: float = ITEM_CACHE_TTL_SECONDS):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _count(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        value = self.client.get(f"{self.prefix}{key}")
+        self._count(value is not None)
+        return default if value is None else json.loads(value)
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        self.client.set(f"{self.prefix}{key}", json.dumps(value), px=int((self.ttl if ttl is None else ttl) * 1000))
+
+    def delete(self, key: Hashable) -> None:
+        self.client.delete(f"{self.prefix}{key}")
+
+    def _generation_key(self, key: Hashable) -> str:
+        return f"{self.prefix}gen:{key}"
+
+    def generation(self, key: Hashable) -> int:
+        """Number of writes to key, counted in Redis so every process sees the same value"""
+        return int(self.client.get(self._generation_key(key)) or 0)
+
+    def bump(self, key: Hashable) -> None:
+        """Count a write to key, before its entry is replaced or deleted"""
+        with self.client.pipeline() as pipe:
+            pipe.incr(self._generation_key(key))
+            pipe.pexpire(self._generation_key(key), GENERATION_TTL_SECONDS * 1000)
+            pipe.execute()
+
+    def set_if_generation(self, key: Hashable, value: Any, generation: int) -> bool:
+        """Set key only if no write was counted since generation was read, atomically"""
+        from redis.exceptions import WatchError
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(self._generation_key(key))
+                if int(pipe.get(self._generation_key(key)) or 0) != generation:
+                    return False
+                pipe.multi()
+                pipe.set(f"{self.prefix}{key}", json.dumps(value), px=int(self.ttl * 1000))
+                pipe.execute()
+                return True
+            except WatchError:
+                return False
+
+    def clear(self) -> None:
+        """Reset the counters; entries are left to expire so other processes keep their hits"""
+        with self._lock:
+            self.hits = self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': 0, 'size': -1}
+
+
+class ReadThroughCache:
+    """Loads missing entries on demand and never caches a read that raced a write"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.Lock()
+        # Bumped by every write; a load that saw it change may have read old data.
+        # Backends shared between processes count writes per key themselves.
+        self._generation = 0
+        self._shared = hasattr(backend, 'set_if_generation')
+
+    def get(self, key: Hashable, loader: Callable[[], Optional[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+        """Return a copy of the cached value for key, loading and caching it on a miss"""
+        value = self._cached(key)
+        if value is not _MISS:
+            return value
+        generation = self._current_generation(key)
+        value = loader()
+        self._fill(key, value, generation)
+        return value
+
+    async def aget(self, key: Hashable, loader: Callable[[], Any]) -> Optional[Dict[str, Any]]:
+        """get() for an async loader"""
+        value = self._cached(key)
+        if value is not _MISS:
+            return value
+        generation = self._current_generation(key)
+        value = await loader()
+        self._fill(key, value, generation)
+        return value
+
+    def peek(self, key: Hashable) -> Optional[Dict[str, Any]]:
+        """Return a copy of the cached value for key without loading it on a miss"""
+        value = self._cached(key)
+        return None if value is _MISS else value
+
+    def _cached(self, key: Hashable):
+        try:
+            value = self.backend.get(key, _MISS)
+        except Exception as e:
+            logger.warning(f"Error reading item cache: {str(e)}")
+            return _MISS
+        # Callers get their own copy, so mutating a result cannot change the cache
+        return value if value is _MISS else dict(value)
+
+    def _current_generation(self, key: Hashable) -> Optional[int]:
+        """Generation to pass to _fill, or None when the load must not be cached"""
+        if not self._shared:
+            return self._generation
+        try:
+            return self.backend.generation(key)
+        except Exception as e:
+            logger.warning(f"Error reading item cache: {str(e)}")
+            return None
+
+    def _fill(self, key: Hashable, value: Optional[Dict[str, Any]], generation: Optional[int]) -> None:
+        if value is None or generation is None:
+            return
+        if self._shared:
+            try:
+                self.backend.set_if_generation(key, dict(value), generation)
+            except Exception as e:
+                logger.warning(f"Error writing item cache: {str(e)}")
+            return
+        # Checked and written under the lock so a write cannot land in between
+        with self._lock:
+            if generation != self._generation:
+                return
+            try:
+                self.backend.set(key, dict(value))
+            except Exception as e:
+                logger.warning(f"Error writing item cache: {str(e)}")
+
+    def _bump(self, key: Hashable) -> None:
+        self._generation += 1
+        if self._shared:
+            self.backend.bump(key)
+
+    def put(self, key: Hashable, value: Dict[str, Any]) -> None:
+        """Refresh an entry with a value that was just written"""
+        with self._lock:
+            try:
+                self._bump(key)
+                self.backend.set(key, dict(value))
+                return
+            except Exception as e:
+                logger.warning(f"Error writing item cache: {str(e)}")
+        self.invalidate(key)
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            for step in (self._bump, self.backend.delete):
+                try:
+                    step(key)
+                except Exception as e:
+                    logger.warning(f"Error invalidating item cache: {str(e)}")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self.backend.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Backend counters plus the hit ratio (0-1) since the last clear"""
+        stats = dict(self.backend.stats())
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+
+def get_item_cache() -> ReadThroughCache:
+    """Get the item cache configured by ITEM_CACHE_REDIS_URL, or the in-process one"""
+    global _item_cache
+    if _item_cache is None:
+        redis_url = os.environ.get('ITEM_CACHE_REDIS_URL')
+        if redis_url:
+            import redis
+            backend = RedisCache(redis.Redis.from_url(redis_url))
+        else:
+            backend = TTLCache(max_entries=ITEM_CACHE_MAX_ENTRIES, ttl=ITEM_CACHE_TTL_SECONDS)
+        _item_cache = ReadThroughCache(backend)
+    return _item_cache
+
+def get_body_cache() -> TTLCache:
+    """In-process cache of encoded single-item response bodies, keyed by ETag.
+
+    An ETag names one (version, updatedAt) of one fieldset of an item. Versions
+    start over when an id is deleted and created again, but the write time does
+    not repeat, so the new item gets new entries; the old ones are never read
+    again and age out, and writes do not need to invalidate them.
+    """
+    global _body_cache
+    if _body_cache is None:
+        _body_cache = TTLCache(max_entries=ITEM_CACHE_MAX_ENTRIES, ttl=ITEM_CACHE_TTL_SECONDS)
+    return _body_cache
+
+# For testing purposes
+def set_item_cache(cache: Optional[ReadThroughCache]):
+    global _item_cache
+    _item_cache = cache
@@ -0,0 +1,18 @@
+"""Flask and Quart JSON provider encoding with shared.serializer.
+
+Installed on the apps in app.py and asgi.py, so jsonify gives the same output as the
+Lambda handlers: DynamoDB Decimals as numbers and ObjectIds as strings. Quart uses
+Flask's provider interface, so one class serves both.
+"""
+import json
+from typing import Any
+from flask.json.provider import JSONProvider
+from .serializer import dumps
+
+
+class SerializerJSONProvider(JSONProvider):
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return dumps(obj)
+
+    def loads(self, s: Any, **kwargs: Any) -> Any:
+        return json.loads(s, **kwargs)
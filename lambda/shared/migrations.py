@@ -0,0 +1,219 @@
+"""Versioned schema migrations for the MongoDB database.
+
+Index creation and data backfills run here, from a deploy step, instead of on
+the first request in every new Lambda container:
+
+    python -m shared.migrations status
+    python -m shared.migrations migrate
+
+Applied versions are recorded in the 'schema_migrations' collection. Declared
+indexes (mongo_utils.INDEXES) are reconciled after every migrate run, so adding
+an index only needs a change to the declaration.
+"""
+import logging
+import argparse
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from pymongo import UpdateOne
+from .mongo_utils import INDEXES, get_mongo_db, _location, _timestamp
+from .validation import normalize_start_date
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_COLLECTION = 'schema_migrations'
+BACKFILL_BATCH_SIZE = 1000
+
+# Version the runtime has seen in this process, so it is only read once
+_verified_version = None
+
+
+def _index_name(keys: List[Tuple[str, Any]]) -> str:
+    """The name MongoDB gives an index by default"""
+    return '_'.join(f"{field}_{direction}" for field, direction in keys)
+
+
+def _same_options(existing: Dict[str, Any], options: Dict[str, Any]) -> bool:
+    return all(existing.get(option) == options.get(option) for option in ('unique', 'expireAfterSeconds'))
+
+
+def reconcile_indexes(db, drop_undeclared: bool = False, dry_run: bool = False) -> Dict[str, Dict[str, List[str]]]:
+    """Create missing declared indexes and rebuild ones whose options changed.
+
+    Undeclared indexes are reported and only dropped when drop_undeclared is set.
+    """
+    changes = {}
+    for collection_name, declared in INDEXES.items():
+        collection = db[collection_name]
+        existing = collection.index_information()
+        names = set()
+        created, rebuilt = [], []
+        for keys, options in declared:
+            name = _index_name(keys)
+            names.add(name)
+            if name in existing and _same_options(existing[name], options):
+                continue
+            if name in existing:
+                rebuilt.append(name)
+                if not dry_run:
+                    collection.drop_index(name)
+            else:
+                created.append(name)
+            if not dry_run:
+                collection.create_index(keys, name=name, **options)
+
+        undeclared = sorted(name for name in existing if name != '_id_' and name not in names)
+        if drop_undeclared and not dry_run:
+            for name in undeclared:
+                collection.drop_index(name)
+        changes[collection_name] = {
+            'created': created,
+            'rebuilt': rebuilt,
+            ('dropped' if drop_undeclared else 'undeclared'): undeclared
+        }
+        for action, indexes in changes[collection_name].items():
+            if indexes:
+                logger.info(f"{collection_name}: {action} {', '.join(indexes)}")
+    return changes
+
+
+def _create_indexes(db) -> None:
+    reconcile_indexes(db)
+
+
+def _backfill_location(db) -> None:
+    """Add the GeoJSON location used by the 2dsphere index to items written before it existed"""
+    items = db.items
+    cursor = items.find(
+        {'location': {'$exists': False}, 'latitude': {'$type': 'number'}, 'longitude': {'$type': 'number'}},
+        {'latitude': 1, 'longitude': 1}
+    )
+    requests = []
+    for doc in cursor:
+        requests.append(UpdateOne(
+            {'_id': doc['_id']},
+            {'$set': {'location': _location(doc['latitude'], doc['longitude'])}}
+        ))
+        if len(requests) == BACKFILL_BATCH_SIZE:
+            items.bulk_write(requests, ordered=False)
+            requests = []
+    if requests:
+        items.bulk_write(requests, ordered=False)
+
+
+def _backfill_version(db) -> None:
+    """Give items written before versioning the 'version' and 'updatedAt' used for ETags"""
+    db.items.update_many({'version': {'$exists': False}}, {'$set': {'version': 1}})
+    db.items.update_many({'updatedAt': {'$exists': False}}, {'$set': {'updatedAt': _timestamp()}})
+
+
+def _normalize_start_dates(db) -> None:
+    """Rewrite startDate values in the UTC ISO 8601 form the date filters compare, leaving unparseable ones"""
+    items = db.items
+    requests = []
+    for doc in items.find({'startDate': {'$type': 'string'}}, {'startDate': 1}):
+        try:
+            start_date = normalize_start_date(doc['startDate'])
+        except ValueError:
+            logger.warning(f"Item {doc['_id']} has an invalid startDate: {doc['startDate']}")
+            continue
+        if start_date != doc['startDate']:
+            requests.append(UpdateOne({'_id': doc['_id']}, {'$set': {'startDate': start_date}}))
+        if len(requests) == BACKFILL_BATCH_SIZE:
+            items.bulk_write(requests, ordered=False)
+            requests = []
+    if requests:
+        items.bulk_write(requests, ordered=False)
+
+
+# (version, description, migration) in the order they are applied
+MIGRATIONS: List[Tuple[int, str, Callable[[Any], None]]] = [
+    (1, "Create collection indexes", _create_indexes),
+    (2, "Backfill GeoJSON location on items", _backfill_location),
+    (3, "Backfill version and updatedAt on items", _backfill_version),
+    (4, "Normalize startDate on items to UTC ISO 8601", _normalize_start_dates)
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def applied_versions(db) -> List[int]:
+    return sorted(doc['_id'] for doc in db[MIGRATIONS_COLLECTION].find({}, {'_id': 1}))
+
+
+def current_version(db) -> int:
+    """The highest applied migration version, or 0 for a fresh database"""
+    doc = db[MIGRATIONS_COLLECTION].find_one({}, {'_id': 1}, sort=[('_id', -1)])
+    return doc['_id'] if doc else 0
+
+
+def migrate(db=None, target: Optional[int] = None, drop_undeclared: bool = False) -> List[int]:
+    """Apply pending migrations up to target (default: all), then reconcile indexes.
+
+    Returns the versions that were applied.
+    """
+    db = get_mongo_db() if db is None else db
+    done = set(applied_versions(db))
+    applied = []
+    for version, description, migration in MIGRATIONS:
+        if version in done or (target is not None and version > target):
+            continue
+        logger.info(f"Applying migration {version}: {description}")
+        migration(db)
+        db[MIGRATIONS_COLLECTION].insert_one({
+            '_id': version,
+            'description': description,
+            'appliedAt': datetime.now(timezone.utc)
+        })
+        applied.append(version)
+
+    if target is None or target >= SCHEMA_VERSION:
+        reconcile_indexes(db, drop_undeclared=drop_undeclared)
+    return applied
+
+
+def verify_schema(db) -> int:
+    """Check once per process that the database has every migration this code expects.
+
+    A database that is behind is logged rather than failing requests.
+    """
+    global _verified_version
+    if _verified_version is None:
+        _verified_version = current_version(db)
+        if _verified_version < SCHEMA_VERSION:
+            logger.warning(
+                f"Database schema version {_verified_version} is behind {SCHEMA_VERSION}; "
+                f"run 'python -m shared.migrations migrate'"
+            )
+    return _verified_version
+
+# For testing purposes
+def reset_schema_check():
+    global _verified_version
+    _verified_version = None
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    arg_parser = argparse.ArgumentParser(description="Apply schema migrations to the items database")
+    arg_parser.add_argument('command', choices=['status', 'migrate'])
+    arg_parser.add_argument('--target', type=int, help="Migrate up to this version only")
+    arg_parser.add_argument('--drop-undeclared-indexes', action='store_true',
+                            help="Drop indexes that are not declared in mongo_utils.INDEXES")
+    args = arg_parser.parse_args(argv)
+
+    db = get_mongo_db()
+    if args.command == 'migrate':
+        applied = migrate(db, target=args.target, drop_undeclared=args.drop_undeclared_indexes)
+        print(f"Applied migrations: {', '.join(map(str, applied)) or 'none'}")
+
+    done = set(applied_versions(db))
+    print(f"Schema version: {current_version(db)} (latest {SCHEMA_VERSION})")
+    for version, description, _ in MIGRATIONS:
+        print(f"  [{'x' if version in done else ' '}] {version}: {description}")
+    labels = {'created': 'missing', 'rebuilt': 'changed', 'undeclared': 'undeclared'}
+    for collection_name, changes in reconcile_indexes(db, dry_run=True).items():
+        for action, indexes in changes.items():
+            if indexes:
+                print(f"  {collection_name} {labels[action]} indexes: {', '.join(indexes)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,14 @@
 import os
 import logging
-from typing import Dict, Any, List
-from pymongo import MongoClient, ASCENDING
-from pymongo.errors import PyMongoError
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Iterator, Optional, Tuple
+from pymongo import MongoClient, ASCENDING, DESCENDING, GEOSPHERE, TEXT, ReturnDocument, UpdateOne, DeleteOne
+from pymongo.errors import PyMongoError, BulkWriteError
+from bson.errors import InvalidDocument
+from .spatial_index import SpatialIndex
+from .item_cache import get_item_cache, get_body_cache
+from .text_index import TEXT_WEIGHTS
+from .stats import DEFAULT_BUCKET_MILES, DEFAULT_TOP, bucket_boundaries, ranked, distance_summary
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
@@ -12,73 +18,610 @@ logger = logging.getLogger(__name__)
 _client = None
 _db = None
 _items_collection = None
+_geocache_collection = None
+_spatial_index = None
 
-def get_mongo_collection():
-    global _client, _db, _items_collection
-    if _items_collection is None:
+# Indexes each collection should have. They are created by shared.migrations at
+# deploy time, never on the request path.
+INDEXES = {
+    'items': [
+        ([('id', ASCENDING)], {'unique': True}),
+        ([('location', GEOSPHERE)], {}),
+        ([('updatedAt', DESCENDING)], {}),
+        # GET /items filters; equality filters end in 'id' so pages come off the index in order
+        ([('postcode', ASCENDING), ('id', ASCENDING)], {}),
+        ([('directionFromNY', ASCENDING), ('id', ASCENDING)], {}),
+        ([('users', ASCENDING), ('id', ASCENDING)], {}),  # Multikey: one entry per user
+        ([('startDate', ASCENDING)], {}),
+        ([('distanceFromNY', ASCENDING)], {}),
+        ([('name', TEXT), ('users', TEXT)], {'weights': TEXT_WEIGHTS})
+    ],
+    'geocache': [
+        ([('expiresAt', ASCENDING)], {'expireAfterSeconds': 0})
+    ]
+}
+
+# Internal fields that are never returned to clients
+_PROJECTION = {'_id': 0, 'location': 0}
+_UPDATE_PROJECTION = {'location': 0}
+# Document in the counters collection whose 'seq' every item write increments
+_COLLECTION_VERSION = {'_id': 'items'}
+_COUNT_WRITE = {'$inc': {'seq': 1}}
+_VERSION_PROJECTION = {'_id': 0, 'version': 1, 'updatedAt': 1}
+# Fields maintained by the write paths; client-supplied values are ignored
+_MANAGED_FIELDS = ('version', 'updatedAt')
+METERS_PER_MILE = 1609.344
+
+def get_mongo_db():
+    global _client, _db
+    if _db is None:
         _client = MongoClient(os.environ.get('MONGODB_URI', 'mongodb://localhost:27017'))
         _db = _client.items_db
-        _items_collection = _db.items
+    return _db
 
-        # Ensure indexes
-        try:
-            _items_collection.create_index([('id', ASCENDING)], unique=True)
-            logger.debug("Created unique index on 'id' field")
+def get_mongo_collection():
+    global _items_collection
+    if _items_collection is None:
+        db = get_mongo_db()
+        if os.environ.get('SCHEMA_CHECK', 'false').lower() == 'true':
+            # Imported here because the migrations module builds on this one
+            from .migrations import verify_schema
+            verify_schema(db)
+        _items_collection = db.items
+    return _items_collection
 
-            # Optional: Add index for geospatial queries if needed
-            _items_collection.create_index([('latitude', ASCENDING), ('longitude', ASCENDING)])
-            logger.debug("Created index on latitude and longitude fields")
-        except PyMongoError as e:
-            logger.warning(f"Error creating indexes: {str(e)}")
+def get_counters_collection():
+    """Counters stored next to the items collection, such as the collection version"""
+    return get_mongo_collection().database.counters
 
-    return _items_collection
+def get_geocache_collection():
+    """Get the shared geocoding cache collection, whose entries expire at 'expiresAt'"""
+    global _geocache_collection
+    if _geocache_collection is None:
+        _geocache_collection = get_mongo_db().geocache
+    return _geocache_collection
+
+def get_spatial_index() -> SpatialIndex:
+    """In-process spatial index over all items, built on first use and kept current by writes"""
+    global _spatial_index
+    if _spatial_index is None:
+        index = SpatialIndex()
+        index.build(get_all_items())
+        _spatial_index = index
+    return _spatial_index
+
+def _projection(fields: Optional[List[str]] = None) -> Dict[str, int]:
+    """Server-side projection returning only the requested fields, plus 'id'"""
+    if not fields:
+        return _PROJECTION
+    projection = {'_id': 0, 'id': 1}
+    projection.update((field, 1) for field in fields if field not in _PROJECTION)
+    return projection
+
+def _filter_query(filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """MongoDB query for parsed GET /items filters (see validation.parse_item_filters)"""
+    filters = filters or {}
+    query = {}
+    for field in ('postcode', 'directionFromNY'):
+        if field in filters:
+            query[field] = filters[field]
+    if 'user' in filters:
+        query['users'] = filters['user']
+    for field, (lower, upper) in (('startDate', ('startDateFrom', 'startDateTo')),
+                                  ('distanceFromNY', ('minDistance', 'maxDistance'))):
+        bounds = {}
+        if lower in filters:
+            bounds['$gte'] = filters[lower]
+        if upper in filters:
+            bounds['$lte'] = filters[upper]
+        if bounds:
+            query[field] = bounds
+    return query
 
-def get_all_items() -> List[Dict[str, Any]]:
+def get_all_items(fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
     try:
-        return list(get_mongo_collection().find({}, {'_id': 0}))
+        return list(get_mongo_collection().find({}, _projection(fields)))
     except PyMongoError as e:
         logger.error(f"Error getting all items: {str(e)}")
         raise
 
-def get_item(item_id: str) -> Dict[str, Any]:
+def check_page_key(after: Dict[str, Any], filters: Optional[Dict[str, Any]] = None) -> None:
+    """Raise ValueError unless after is a key get_items_page returns: the id a page ended on"""
+    if list(after) != ['id'] or not isinstance(after['id'], str):
+        raise ValueError("Invalid next token")
+
+def _page_query(after: Optional[Dict[str, Any]] = None, filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Query for the items matching filters that come after the key a page ended on"""
+    query = _filter_query(filters)
+    if after:
+        query['id'] = {'$gt': after['id']}
+    return query
+
+def _page(items: List[Dict[str, Any]], limit: int) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """Split the limit + 1 items read for a page into the page and the key of the next one"""
+    if len(items) > limit:
+        return items[:limit], {'id': items[limit - 1]['id']}
+    return items, None
+
+def get_items_page(limit: int, after: Optional[Dict[str, Any]] = None, fields: Optional[List[str]] = None,
+                   filters: Optional[Dict[str, Any]] = None) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """Get up to limit items matching filters, ordered by id, starting after the given key.
+
+    Returns the items and the key to pass as 'after' for the next page, or None on the last page.
+    """
+    try:
+        # Fetch one extra item to learn whether there is another page
+        cursor = get_mongo_collection().find(_page_query(after, filters), _projection(fields))
+        return _page(list(cursor.sort('id', ASCENDING).limit(limit + 1)), limit)
+    except PyMongoError as e:
+        logger.error(f"Error getting items page: {str(e)}")
+        raise
+
+def iter_items(batch_size: int = 500, fields: Optional[List[str]] = None,
+               filters: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+    """Yield every item matching filters straight from the cursor without building a list"""
+    try:
+        yield from get_mongo_collection().find(_filter_query(filters), _projection(fields)).batch_size(batch_size)
+    except PyMongoError as e:
+        logger.error(f"Error iterating items: {str(e)}")
+        raise
+
+def _select_fields(item: Dict[str, Any], fields: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Apply a sparse fieldset to a full item the way _projection does on the server"""
+    if not fields:
+        return item
+    return {'id': item['id'], **{field: item[field] for field in fields if field in item}}
+
+def get_item(item_id: str, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Get an item through the read-through item cache, which holds whole items"""
     try:
         if not item_id:
             raise Exception("Invalid ID: item_id cannot be None or empty")
-        item = get_mongo_collection().find_one({'id': item_id}, {'_id': 0})
-        return item if item else None
+        item = get_item_cache().get(item_id, lambda: get_mongo_collection().find_one({'id': item_id}, _PROJECTION))
+        return _select_fields(item, fields) if item else None
     except PyMongoError as e:
         logger.error(f"Error getting item {item_id}: {str(e)}")
         raise
 
+def get_items_by_ids(ids: List[str], fields: Optional[List[str]] = None) -> List[Optional[Dict[str, Any]]]:
+    """Get many items with one $in query, in the order of ids, with None for ids that do not exist"""
+    try:
+        cursor = get_mongo_collection().find({'id': {'$in': list(dict.fromkeys(ids))}}, _projection(fields))
+        found = {item['id']: item for item in cursor}
+        return [found.get(item_id) for item_id in ids]
+    except PyMongoError as e:
+        logger.error(f"Error getting items by ids: {str(e)}")
+        raise
+
+def _location(latitude: float, longitude: float) -> Dict[str, Any]:
+    """GeoJSON point for the 2dsphere index"""
+    return {'type': 'Point', 'coordinates': [float(longitude), float(latitude)]}
+
+def _timestamp() -> str:
+    """Write time in the ISO format used for 'updatedAt', which sorts chronologically"""
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+def _stamp(item: Dict[str, Any]) -> None:
+    """Give a new item its first version and write time, in place"""
+    item['version'] = 1
+    item['updatedAt'] = _timestamp()
+
+def _document(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Stamp a new item and return the document to insert for it, with its GeoJSON location"""
+    _stamp(item)
+    doc = dict(item)
+    if 'latitude' in item and 'longitude' in item:
+        doc['location'] = _location(item['latitude'], item['longitude'])
+    return doc
+
+def _insert_errors(count: int, details: Dict[str, Any]) -> List[Optional[str]]:
+    """Error message of each of count inserted items from a bulk write's details, None if it was written"""
+    errors = [None] * count
+    for write_error in details.get('writeErrors', []):
+        message = write_error.get('errmsg', '')
+        errors[write_error['index']] = "Duplicate Key Error" if write_error.get('code') == 11000 else message
+    return errors
+
+def _write_errors(ids: List[str], details: Dict[str, Any]) -> Dict[str, str]:
+    """Error message by id of the failed requests in a bulk write with one request per id"""
+    return {ids[write_error['index']]: write_error.get('errmsg', '') for write_error in details.get('writeErrors', [])}
+
 def create_item(item: Dict[str, Any]) -> None:
+    """Insert an item, stamping it with 'version' and 'updatedAt'"""
     try:
-        get_mongo_collection().insert_one(item)
+        get_mongo_collection().insert_one(_document(item))
+        _bump_collection_version()
+        get_item_cache().put(item['id'], item)
+        if _spatial_index is not None:
+            _spatial_index.upsert(item)
     except PyMongoError as e:
         logger.error(f"Error creating item: {str(e)}")
         raise Exception("Duplicate Key Error" if "duplicate key error" in str(e).lower() else str(e))
 
-def update_item(item_id: str, updates: Dict[str, Any]) -> None:
+def create_items(items: List[Dict[str, Any]]) -> List[Optional[str]]:
+    """Insert many items in one unordered batch.
+
+    Returns one entry per item: None if it was written, otherwise the error message.
+    """
+    if not items:
+        return []
+    docs = [_document(item) for item in items]
+
+    errors = [None] * len(items)
+    try:
+        get_mongo_collection().insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        errors = _insert_errors(len(items), e.details)
+        logger.warning(f"Bulk insert wrote {len(items) - len(e.details.get('writeErrors', []))} of {len(items)} items")
+    except PyMongoError as e:
+        logger.error(f"Error creating items: {str(e)}")
+        raise
+
+    if any(error is None for error in errors):
+        _bump_collection_version()
+    for item, error in zip(items, errors):
+        if error is None:
+            get_item_cache().put(item['id'], item)
+            if _spatial_index is not None:
+                _spatial_index.upsert(item)
+    return errors
+
+def _set_fields(updates: Dict[str, Any]) -> Dict[str, Any]:
+    """The $set document for an update, keeping the GeoJSON location in step"""
+    for key in updates:
+        # Update keys also go into the _changed_filter query, where they must not be operators
+        if key.startswith('$'):
+            raise InvalidDocument(f"key '{key}' must not start with '$'")
+    fields = {key: value for key, value in updates.items() if key not in _MANAGED_FIELDS}
+    if 'latitude' in updates and 'longitude' in updates:
+        fields['location'] = _location(updates['latitude'], updates['longitude'])
+    return fields
+
+def _update_document(fields: Dict[str, Any]) -> Dict[str, Any]:
+    """Update operators for a $set document that also bump the version"""
+    return {'$set': {**fields, 'updatedAt': _timestamp()}, '$inc': {'version': 1}}
+
+def _changed_filter(item_id: str, fields: Dict[str, Any]) -> Dict[str, Any]:
+    """Match the item only if the update would change it, so a no-op keeps its version"""
+    return {'id': item_id, '$or': [{field: {'$ne': value}} for field, value in fields.items()]}
+
+def _update_pipeline(fields: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Update pipeline setting fields, which bumps the version only if a value changes.
+
+    Unlike _changed_filter it matches no-op updates too, so a bulk write's
+    matched_count counts every item it found and modified_count the changed ones.
+    Values are $literal, so a string such as '$5 off' is not read as a field path.
+    """
+    changed = {'$or': [{'$ne': [f'${field}', {'$literal': value}]} for field, value in fields.items()]} if fields else False
+    return [{'$set': {
+        **{field: {'$literal': value} for field, value in fields.items()},
+        'updatedAt': {'$cond': [changed, _timestamp(), '$updatedAt']},
+        'version': {'$cond': [changed, {'$add': [{'$ifNull': ['$version', 0]}, 1]}, '$version']}
+    }}]
+
+def _update_requests(updates: Dict[str, Dict[str, Any]], existing: set) -> Tuple[List[str], List[UpdateOne]]:
+    """The ids of the existing items among updates, and a bulk update request for each"""
+    ids = [item_id for item_id in updates if item_id in existing]
+    return ids, [UpdateOne({'id': item_id}, _update_pipeline(_set_fields(updates[item_id]))) for item_id in ids]
+
+def _update_outcome(updates: Dict[str, Dict[str, Any]], existing: set, ids: List[str],
+                    details: Dict[str, Any]) -> Dict[str, Any]:
+    """update_items' result from the details of the bulk write of _update_requests"""
+    return {
+        'matched': details.get('nMatched', 0),
+        'modified': details.get('nModified', 0),
+        'missing': [item_id for item_id in updates if item_id not in existing],
+        'failed': _write_errors(ids, details)
+    }
+
+def _delete_outcome(ids: List[str], existing: set, targets: List[str], details: Dict[str, Any]) -> Dict[str, Any]:
+    """delete_items' result from the details of the bulk write deleting targets"""
+    return {
+        'deleted': details.get('nRemoved', 0),
+        'missing': [item_id for item_id in ids if item_id not in existing],
+        'failed': _write_errors(targets, details)
+    }
+
+def _existing_ids(ids: List[str]) -> set:
+    return {doc['id'] for doc in get_mongo_collection().find({'id': {'$in': ids}}, {'_id': 0, 'id': 1})}
+
+def update_item(item_id: str, updates: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Apply updates in one round trip and return the updated item, or None if it does not exist"""
     try:
         if not item_id:
             raise Exception("Invalid ID: item_id cannot be None or empty")
-        get_mongo_collection().update_one(
-            {'id': item_id},
-            {'$set': updates}
+        fields = _set_fields(updates)
+        if not fields:
+            return get_item(item_id)
+        # The projection keeps _id, which is dropped below, because some drivers and
+        # doubles read the result back by _id, not by a filter the update falsified
+        item = get_mongo_collection().find_one_and_update(
+            _changed_filter(item_id, fields),
+            _update_document(fields),
+            projection=_UPDATE_PROJECTION,
+            return_document=ReturnDocument.AFTER
         )
+        if item is None:
+            # Either missing or already up to date; read it back from the database
+            get_item_cache().invalidate(item_id)
+            return get_item(item_id)
+        item.pop('_id', None)
+        _bump_collection_version()
+        get_item_cache().put(item_id, item)
+        if _spatial_index is not None:
+            _spatial_index.upsert(item)
+        return item
     except PyMongoError as e:
         logger.error(f"Error updating item {item_id}: {str(e)}")
         raise
 
-def delete_item(item_id: str) -> None:
+def delete_item(item_id: str) -> bool:
+    """Delete an item in one round trip, returning False if it did not exist"""
     try:
         if not item_id:
             raise Exception("Invalid ID: item_id cannot be None or empty")
-        get_mongo_collection().delete_one({'id': item_id})
+        result = get_mongo_collection().delete_one({'id': item_id})
+        if result.deleted_count:
+            _bump_collection_version()
+        get_item_cache().invalidate(item_id)
+        if _spatial_index is not None:
+            _spatial_index.remove(item_id)
+        return result.deleted_count > 0
     except PyMongoError as e:
         logger.error(f"Error deleting item {item_id}: {str(e)}")
         raise
 
+def update_items(updates: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Apply per-item updates in one unordered bulk write.
+
+    Returns the matched and modified counts, the ids that do not exist and the
+    error message of each update that failed.
+    """
+    try:
+        if not updates:
+            return {'matched': 0, 'modified': 0, 'missing': [], 'failed': {}}
+        existing = _existing_ids(list(updates))
+        ids, requests = _update_requests(updates, existing)
+        details = {}
+        try:
+            if requests:
+                details = get_mongo_collection().bulk_write(requests, ordered=False).bulk_api_result
+        except BulkWriteError as e:
+            details = e.details
+            logger.warning(f"Bulk update failed for {len(details.get('writeErrors', []))} of {len(requests)} items")
+        outcome = _update_outcome(updates, existing, ids, details)
+        if outcome['modified']:
+            _bump_collection_version()
+        for item_id in existing:
+            get_item_cache().invalidate(item_id)
+        # Only the writes that went through reach the spatial index
+        if _spatial_index is not None:
+            for item_id in ids:
+                if item_id not in outcome['failed']:
+                    _spatial_index.update(item_id, {key: value for key, value in updates[item_id].items()
+                                                    if key not in _MANAGED_FIELDS})
+        return outcome
+    except PyMongoError as e:
+        logger.error(f"Error updating {len(updates)} items: {str(e)}")
+        raise
+
+def delete_items(ids: List[str]) -> Dict[str, Any]:
+    """Delete many items in one unordered bulk write.
+
+    Returns the deleted count, the ids that do not exist and the error message
+    of each id that could not be deleted.
+    """
+    try:
+        if not ids:
+            return {'deleted': 0, 'missing': [], 'failed': {}}
+        existing = _existing_ids(ids)
+        targets = [item_id for item_id in dict.fromkeys(ids) if item_id in existing]
+        details = {}
+        try:
+            if targets:
+                requests = [DeleteOne({'id': item_id}) for item_id in targets]
+                details = get_mongo_collection().bulk_write(requests, ordered=False).bulk_api_result
+        except BulkWriteError as e:
+            details = e.details
+            logger.warning(f"Bulk delete failed for {len(details.get('writeErrors', []))} of {len(targets)} items")
+        outcome = _delete_outcome(ids, existing, targets, details)
+        if outcome['deleted']:
+            _bump_collection_version()
+        for item_id in existing:
+            get_item_cache().invalidate(item_id)
+            if item_id not in outcome['failed'] and _spatial_index is not None:
+                _spatial_index.remove(item_id)
+        return outcome
+    except PyMongoError as e:
+        logger.error(f"Error deleting {len(ids)} items: {str(e)}")
+        raise
+
+def get_item_and_version(item_id: str,
+                         fields: Optional[List[str]] = None) -> Tuple[Optional[Dict[str, Any]], Optional[Tuple[int, Optional[str]]]]:
+    """Get an item and its (version, updatedAt), which are returned even when the fieldset leaves them out"""
+    item = get_item(item_id)
+    if not item:
+        return None, None
+    return _select_fields(item, fields), _item_version(item)
+
+def _item_version(item: Optional[Dict[str, Any]]) -> Optional[Tuple[int, Optional[str]]]:
+    """(version, updatedAt) of an item or of its version projection, or None for no item"""
+    return None if item is None else (item.get('version', 0), item.get('updatedAt'))
+
+def get_item_version(item_id: str) -> Optional[Tuple[int, Optional[str]]]:
+    """Current (version, updatedAt) of an item, or None if it does not exist.
+
+    Served from the item cache when possible, otherwise by a query that projects
+    only those fields. Items written before versioning report version 0.
+    """
+    try:
+        item = get_item_cache().peek(item_id)
+        if item is None:
+            item = get_mongo_collection().find_one({'id': item_id}, _VERSION_PROJECTION)
+        return _item_version(item)
+    except PyMongoError as e:
+        logger.error(f"Error getting version of item {item_id}: {str(e)}")
+        raise
+
+def _bump_collection_version() -> None:
+    """Count a write to the items collection; called after the write, so a reader
+    that read the counter before the write sees it change.
+
+    The write has landed by then, so a failure is logged instead of failing it,
+    and list ETags change with the next write that is counted.
+    """
+    try:
+        get_counters_collection().update_one(_COLLECTION_VERSION, _COUNT_WRITE, upsert=True)
+    except PyMongoError as e:
+        logger.error(f"Error counting a write to items: {str(e)}")
+
+def item_cache_stats() -> Dict[str, Any]:
+    """Stats of the item cache that get_item reads through"""
+    return get_item_cache().stats()
+
+def get_collection_version() -> int:
+    """Counter that every item write increases, with one lookup by _id.
+
+    Unlike the item count or the latest write time it never repeats a value,
+    whatever the clocks of the writers. Read it before the items it versions.
+    """
+    try:
+        counter = get_counters_collection().find_one(_COLLECTION_VERSION)
+        return counter['seq'] if counter else 0
+    except PyMongoError as e:
+        logger.error(f"Error getting collection version: {str(e)}")
+        raise
+
+def _near_pipeline(latitude: float, longitude: float, radius: float = None, limit: int = 20) -> List[Dict[str, Any]]:
+    """$geoNear aggregation for the items nearest to a point, with their 'distance' in miles"""
+    geo_near = {
+        'near': _location(latitude, longitude),
+        'distanceField': 'distance',
+        'distanceMultiplier': 1 / METERS_PER_MILE,
+        'key': 'location',
+        'spherical': True
+    }
+    if radius is not None:
+        geo_near['maxDistance'] = radius * METERS_PER_MILE
+    return [{'$geoNear': geo_near}, {'$limit': limit}, {'$project': _PROJECTION}]
+
+def _round_distances(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    for item in items:
+        item['distance'] = round(item['distance'], 2)
+    return items
+
+def find_items_near(latitude: float, longitude: float, radius: float = None, limit: int = 20) -> List[Dict[str, Any]]:
+    """Find items nearest to a point, closest first, with their 'distance' in miles"""
+    try:
+        return _round_distances(list(get_mongo_collection().aggregate(_near_pipeline(latitude, longitude, radius, limit))))
+    except PyMongoError as e:
+        logger.error(f"Error finding items near ({latitude}, {longitude}): {str(e)}")
+        raise
+
+def _search_pipeline(query: str, limit: int, after: Optional[Dict[str, Any]] = None,
+                     fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """Text search ranked by relevance, paging on (score, id) so pages never overlap"""
+    pipeline = [
+        {'$match': {'$text': {'$search': query}}},
+        {'$addFields': {'score': {'$meta': 'textScore'}}}
+    ]
+    if after:
+        pipeline.append({'$match': {'$or': [
+            {'score': {'$lt': after['score']}},
+            {'score': after['score'], 'id': {'$gt': after['id']}}
+        ]}})
+    projection = dict(_projection(fields))
+    if fields:
+        projection['score'] = 1
+    # Fetch one extra item to learn whether there is another page
+    pipeline += [{'$sort': {'score': -1, 'id': 1}}, {'$limit': limit + 1}, {'$project': projection}]
+    return pipeline
+
+def _search_page(items: List[Dict[str, Any]], limit: int) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    if len(items) > limit:
+        return items[:limit], {'id': items[limit - 1]['id'], 'score': items[limit - 1]['score']}
+    return items, None
+
+def search_items(query: str, limit: int = 20, after: Optional[Dict[str, Any]] = None,
+                 fields: Optional[List[str]] = None) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """Items whose name or users match query, best first, each with its relevance 'score'.
+
+    Returns the items and the key to pass as 'after' for the next page, or None on the last page.
+    """
+    try:
+        items = list(get_mongo_collection().aggregate(_search_pipeline(query, limit, after, fields)))
+        return _search_page(items, limit)
+    except PyMongoError as e:
+        logger.error(f"Error searching items for '{query}': {str(e)}")
+        raise
+
+def _stats_pipeline(bucket_size: float, top: int) -> List[Dict[str, Any]]:
+    """One $facet stage computing every statistic in a single pass over the collection"""
+    has_distance = {'$match': {'distanceFromNY': {'$type': 'number'}}}
+    by_count = {'$sort': {'count': -1, '_id': 1}}
+    return [{'$facet': {
+        'count': [{'$count': 'count'}],
+        'byDirection': [{'$group': {'_id': '$directionFromNY', 'count': {'$sum': 1}}}, by_count],
+        'distance': [has_distance, {'$group': {
+            '_id': None,
+            'min': {'$min': '$distanceFromNY'},
+            'max': {'$max': '$distanceFromNY'},
+            'average': {'$avg': '$distanceFromNY'}
+        }}],
+        'buckets': [has_distance, {'$bucket': {
+            'groupBy': '$distanceFromNY',
+            'boundaries': bucket_boundaries(bucket_size),
+            'default': 'other',
+            'output': {'count': {'$sum': 1}}
+        }}],
+        'topPostcodes': [
+            {'$match': {'postcode': {'$ne': None}}},
+            {'$group': {'_id': '$postcode', 'count': {'$sum': 1}}},
+            by_count,
+            {'$limit': top}
+        ],
+        'topUsers': [
+            {'$unwind': '$users'},
+            {'$group': {'_id': '$users', 'count': {'$sum': 1}}},
+            by_count,
+            {'$limit': top}
+        ]
+    }}]
+
+def _stats_from_facets(facets: Dict[str, Any], bucket_size: float) -> Dict[str, Any]:
+    """Reshape the $facet output into the document shared.stats.summarize returns"""
+    distance = facets['distance'][0] if facets['distance'] else {}
+    return {
+        'count': facets['count'][0]['count'] if facets['count'] else 0,
+        'byDirection': ranked(((group['_id'], group['count']) for group in facets['byDirection']), 'direction'),
+        'distanceFromNY': distance_summary(
+            distance.get('min'),
+            distance.get('max'),
+            distance.get('average'),
+            {group['_id']: group['count'] for group in facets['buckets'] if group['_id'] != 'other'},
+            bucket_size
+        ),
+        'topPostcodes': ranked(((group['_id'], group['count']) for group in facets['topPostcodes']), 'postcode'),
+        'topUsers': ranked(((group['_id'], group['count']) for group in facets['topUsers']), 'user')
+    }
+
+def get_item_stats(bucket_size: float = DEFAULT_BUCKET_MILES, top: int = DEFAULT_TOP) -> Dict[str, Any]:
+    """Aggregate statistics over all items, computed by the database"""
+    try:
+        facets = next(get_mongo_collection().aggregate(_stats_pipeline(bucket_size, top)))
+        return _stats_from_facets(facets, bucket_size)
+    except PyMongoError as e:
+        logger.error(f"Error getting item stats: {str(e)}")
+        raise
+
 # For testing purposes
 def set_mongo_collection(collection):
-    global _items_collection
-    _items_collection = collection
\ No newline at end of file
+    global _items_collection, _spatial_index
+    _items_collection = collection
+    _spatial_index = None
+    get_item_cache().clear()
+    get_body_cache().clear()
+
+def set_geocache_collection(collection):
+    global _geocache_collection
+    _geocache_collection = collection
\ No newline at end of file
@@ -0,0 +1,96 @@
+"""JSON encoding for API responses, with the encoder chosen by JSON_SERIALIZER.
+
+'orjson' encodes in C and 'json' uses the stdlib. By default orjson is used when
+it is installed. Both produce the same compact output: Decimals (DynamoDB numbers)
+become ints when integral and floats otherwise, ObjectIds their hex string and
+datetimes ISO 8601. Bodies that are already encoded, such as cached responses,
+are passed around as bytes and sent without encoding them again.
+"""
+import os
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Callable, Hashable
+from bson import ObjectId
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_serializer = None
+
+
+def _default(value: Any) -> Any:
+    """JSON-native stand-in for the types the encoders do not handle"""
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _json_dumps(value: Any) -> bytes:
+    return json.dumps(value, default=_default, separators=(',', ':'), ensure_ascii=False).encode()
+
+
+def _orjson_dumps(value: Any) -> bytes:
+    # orjson has no Decimal or ObjectId support of its own, so those go through the
+    # default hook. OPT_NON_STR_KEYS writes non-string keys as strings, like the stdlib.
+    return orjson.dumps(value, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+# JSON_SERIALIZER value -> function encoding a value to bytes
+SERIALIZERS = {
+    'orjson': _orjson_dumps,
+    'json': _json_dumps
+}
+
+
+def load_serializer(name: str) -> Callable[[Any], bytes]:
+    """Get the serializer registered under name, raising ValueError if unknown or not installed"""
+    if name not in SERIALIZERS:
+        raise ValueError(f"Unknown JSON_SERIALIZER '{name}', expected one of: {', '.join(SERIALIZERS)}")
+    if name == 'orjson' and orjson is None:
+        raise ValueError("JSON_SERIALIZER is 'orjson' but orjson is not installed")
+    return SERIALIZERS[name]
+
+
+def get_serializer() -> Callable[[Any], bytes]:
+    global _serializer
+    if _serializer is None:
+        _serializer = load_serializer(os.environ.get('JSON_SERIALIZER') or ('orjson' if orjson else 'json'))
+    return _serializer
+
+
+def dumps_bytes(value: Any) -> bytes:
+    return get_serializer()(value)
+
+
+def dumps(value: Any) -> str:
+    return dumps_bytes(value).decode()
+
+
+def dumps_cached(cache, key: Hashable, value: Any) -> bytes:
+    """Encoded value, reused from cache under key so a repeated response is encoded once.
+
+    key must change whenever the value does, like an ETag.
+    """
+    body = cache.get(key)
+    if body is None:
+        body = dumps_bytes(value)
+        cache.set(key, body)
+    return body
+
+
+def as_text(body: Any) -> str:
+    """Response body text of a value, or of bytes that were encoded before"""
+    return body.decode() if isinstance(body, bytes) else dumps(body)
+
+
+# For testing purposes
+def set_serializer(name: str = None):
+    global _serializer
+    _serializer = None if name is None else load_serializer(name)
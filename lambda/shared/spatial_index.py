@@ -0,0 +1,178 @@
+"""In-process spatial index over item coordinates.
+
+Items are bucketed into a uniform latitude/longitude grid so that queries only
+look at the cells around the query point instead of scanning every item.
+Distances are great-circle (spherical) miles, the same model Mongo's $geoNear uses.
+"""
+import math
+import threading
+import numpy as np
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+EARTH_RADIUS_MILES = 3958.8
+
+
+def haversine_miles(lat: float, lon: float, lats, lons) -> np.ndarray:
+    """Great-circle distances (in miles) from one point to arrays of points"""
+    lat1, lon1 = math.radians(lat), math.radians(lon)
+    lat2, lon2 = np.radians(lats), np.radians(lons)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+class SpatialIndex:
+    """Thread-safe grid index answering k-nearest, radius and bounding-box queries"""
+
+    def __init__(self, cell_size: float = 0.5):
+        columns = 360 / cell_size
+        if cell_size <= 0 or abs(columns - round(columns)) > 1e-9:
+            raise ValueError("cell_size must divide 360 degrees evenly")
+        self.cell_size = cell_size
+        self._columns = round(columns)
+        self._items: Dict[str, Dict[str, Any]] = {}
+        self._points: Dict[str, Tuple[float, float]] = {}
+        self._cells: Dict[Tuple[int, int], Set[str]] = {}
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def _cell(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        half = self._columns // 2
+        column = (math.floor(longitude / self.cell_size) + half) % self._columns - half
+        return math.floor(latitude / self.cell_size), column
+
+    def build(self, items: Iterable[Dict[str, Any]]) -> None:
+        """Replace the contents of the index"""
+        with self._lock:
+            self._items.clear()
+            self._points.clear()
+            self._cells.clear()
+            for item in items:
+                self.upsert(item)
+
+    def upsert(self, item: Dict[str, Any]) -> None:
+        """Add an item, or replace the indexed copy of it"""
+        with self._lock:
+            self.remove(item['id'])
+            self._items[item['id']] = dict(item)
+            if item.get('latitude') is None or item.get('longitude') is None:
+                return
+            point = (float(item['latitude']), float(item['longitude']))
+            self._points[item['id']] = point
+            self._cells.setdefault(self._cell(*point), set()).add(item['id'])
+
+    def update(self, item_id: str, updates: Dict[str, Any]) -> None:
+        """Apply a partial update to an indexed item"""
+        with self._lock:
+            if item_id in self._items:
+                self.upsert({**self._items[item_id], **updates})
+
+    def remove(self, item_id: str) -> None:
+        with self._lock:
+            self._items.pop(item_id, None)
+            point = self._points.pop(item_id, None)
+            if point is None:
+                return
+            cell = self._cell(*point)
+            ids = self._cells[cell]
+            ids.discard(item_id)
+            if not ids:
+                del self._cells[cell]
+
+    def _ids_in_cells(self, min_row: int, max_row: int, min_col: int, max_col: int) -> List[str]:
+        """Ids in a block of cells; columns wrap around the antimeridian"""
+        columns = self._columns
+        col_span = min(max_col - min_col + 1, columns)
+        if (max_row - min_row + 1) * col_span > len(self._cells):
+            # Cheaper to walk the occupied cells than every cell in a large block
+            return [
+                item_id
+                for (row, col), ids in self._cells.items()
+                if min_row <= row <= max_row and (col - min_col) % columns < col_span
+                for item_id in ids
+            ]
+
+        half = columns // 2
+        ids = []
+        for row in range(min_row, max_row + 1):
+            for offset in range(col_span):
+                ids.extend(self._cells.get((row, (min_col + offset + half) % columns - half), ()))
+        return ids
+
+    def _ids_in_box(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> List[str]:
+        """Ids in every cell overlapping a box; min_lon > max_lon crosses the antimeridian"""
+        min_row, min_col = self._cell(min_lat, min_lon)
+        max_row, max_col = self._cell(max_lat, max_lon)
+        if max_col < min_col:
+            max_col += self._columns
+        return self._ids_in_cells(min_row, max_row, min_col, max_col)
+
+    def _with_distances(self, latitude: float, longitude: float, ids: List[str]) -> Tuple[List[str], np.ndarray]:
+        if not ids:
+            return [], np.empty(0)
+        points = np.array([self._points[item_id] for item_id in ids])
+        return ids, haversine_miles(latitude, longitude, points[:, 0], points[:, 1])
+
+    def _radius_box(self, latitude: float, longitude: float, radius: float) -> Tuple[float, float, float, float]:
+        """Bounding box of a spherical cap, widening to all longitudes near the poles"""
+        angle = radius / EARTH_RADIUS_MILES
+        min_lat = latitude - math.degrees(angle)
+        max_lat = latitude + math.degrees(angle)
+        if min_lat <= -90 or max_lat >= 90 or angle >= math.pi / 2:
+            return max(min_lat, -90), -180, min(max_lat, 90), 180 - 1e-9
+        ratio = math.sin(angle) / math.cos(math.radians(latitude))
+        if ratio >= 1:
+            return min_lat, -180, max_lat, 180 - 1e-9
+        delta_lon = math.degrees(math.asin(ratio))
+        min_lon = (longitude - delta_lon + 180) % 360 - 180
+        max_lon = (longitude + delta_lon + 180) % 360 - 180
+        return min_lat, min_lon, max_lat, max_lon
+
+    def _results(self, ids: List[str], distances: np.ndarray, order: np.ndarray) -> List[Dict[str, Any]]:
+        return [{**self._items[ids[i]], 'distance': round(float(distances[i]), 2)} for i in order]
+
+    def within_radius(self, latitude: float, longitude: float, radius: float,
+                      limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Items within radius miles of a point, closest first, with their 'distance' in miles"""
+        with self._lock:
+            ids, distances = self._with_distances(
+                latitude, longitude, self._ids_in_box(*self._radius_box(latitude, longitude, radius))
+            )
+            inside = np.flatnonzero(distances <= radius)
+            order = inside[np.argsort(distances[inside], kind='stable')][:limit]
+            return self._results(ids, distances, order)
+
+    def nearest(self, latitude: float, longitude: float, k: int = 20,
+                radius: Optional[float] = None) -> List[Dict[str, Any]]:
+        """The k items closest to a point, with their 'distance' in miles"""
+        with self._lock:
+            if not self._points or k <= 0:
+                return []
+
+            # Grow a square of cells until it holds k candidates; the k-th closest of
+            # those bounds the search radius, which a radius query then makes exact
+            row, col = self._cell(latitude, longitude)
+            ring = 0
+            candidates = self._ids_in_cells(row, row, col, col)
+            while len(candidates) < min(k, len(self._points)):
+                ring += 1
+                candidates = self._ids_in_cells(row - ring, row + ring, col - ring, col + ring)
+
+            ids, distances = self._with_distances(latitude, longitude, candidates)
+            kth = min(k, len(ids)) - 1
+            bound = float(np.partition(distances, kth)[kth])
+            if radius is not None:
+                bound = min(bound, radius)
+            return self.within_radius(latitude, longitude, bound, limit=k)
+
+    def within_bbox(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> List[Dict[str, Any]]:
+        """Items inside a latitude/longitude box; min_lon > max_lon crosses the antimeridian"""
+        with self._lock:
+            results = []
+            for item_id in self._ids_in_box(min_lat, min_lon, max_lat, max_lon):
+                lat, lon = self._points[item_id]
+                in_lon = min_lon <= lon <= max_lon if min_lon <= max_lon else (lon >= min_lon or lon <= max_lon)
+                if min_lat <= lat <= max_lat and in_lon:
+                    results.append(dict(self._items[item_id]))
+            return results
@@ -0,0 +1,86 @@
+"""Item statistics: counts by direction, a distance histogram and the most common postcodes and users.
+
+mongo_utils computes them in the database with one aggregation pipeline. Stores
+without one (DynamoDB) fold the items through summarize(), which returns the
+same document.
+"""
+import math
+from collections import Counter
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional
+
+DEFAULT_BUCKET_MILES = 500
+DEFAULT_TOP = 10
+MAX_TOP = 100
+# Half the Earth's circumference, so no distance from New York is larger
+MAX_DISTANCE_MILES = 12500
+
+
+def bucket_boundaries(bucket_size: float) -> List[float]:
+    """Lower bounds of the distance histogram buckets, plus the upper bound of the last one"""
+    return [i * bucket_size for i in range(math.ceil(MAX_DISTANCE_MILES / bucket_size) + 1)]
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float, Decimal)) and not isinstance(value, bool)
+
+
+def ranked(counts: Iterable, key: str, top: Optional[int] = None) -> List[Dict[str, Any]]:
+    """(value, count) pairs as documents, most common first and then by value as MongoDB sorts them"""
+    ordered = sorted(counts, key=lambda pair: (-pair[1], pair[0] is not None, '' if pair[0] is None else str(pair[0])))
+    return [{key: value, 'count': count} for value, count in ordered[:top]]
+
+
+def distance_summary(minimum, maximum, average, buckets: Dict[float, int], bucket_size: float) -> Dict[str, Any]:
+    """The 'distanceFromNY' section of the statistics"""
+    return {
+        'min': None if minimum is None else float(minimum),
+        'max': None if maximum is None else float(maximum),
+        'average': None if average is None else round(float(average), 2),
+        'bucketSize': bucket_size,
+        'buckets': [
+            {'min': lower, 'max': lower + bucket_size, 'count': buckets[lower]}
+            for lower in sorted(buckets)
+        ]
+    }
+
+
+def summarize(items: Iterable[Dict[str, Any]], bucket_size: float = DEFAULT_BUCKET_MILES,
+              top: int = DEFAULT_TOP) -> Dict[str, Any]:
+    """Compute the statistics in one pass over items"""
+    count = 0
+    directions = Counter()
+    postcodes = Counter()
+    users = Counter()
+    buckets = Counter()
+    distances = []
+    for item in items:
+        count += 1
+        directions[item.get('directionFromNY')] += 1
+        if item.get('postcode') is not None:
+            postcodes[item['postcode']] += 1
+        item_users = item.get('users')
+        if isinstance(item_users, list):
+            users.update(item_users)
+        elif item_users is not None:
+            users[item_users] += 1
+        distance = item.get('distanceFromNY')
+        if _is_number(distance):
+            distance = float(distance)
+            distances.append(distance)
+            if 0 <= distance < MAX_DISTANCE_MILES:
+                buckets[math.floor(distance / bucket_size) * bucket_size] += 1
+
+    return {
+        'count': count,
+        'byDirection': ranked(directions.items(), 'direction'),
+        'distanceFromNY': distance_summary(
+            min(distances) if distances else None,
+            max(distances) if distances else None,
+            sum(distances) / len(distances) if distances else None,
+            buckets,
+            bucket_size
+        ),
+        'topPostcodes': ranked(postcodes.items(), 'postcode', top),
+        'topUsers': ranked(users.items(), 'user', top)
+    }
@@ -0,0 +1,167 @@
+"""Item storage behind one interface, with the backend chosen by STORAGE_BACKEND.
+
+'mongo' (the default) stores items with shared.mongo_utils and 'dynamodb' with
+shared.dynamo_utils. Handlers import item operations from this module, so they
+run unchanged on either backend. Every backend implements StorageBackend with
+the same semantics, which tests/test_storage.py checks against both:
+
+- Writes stamp items with 'version' and 'updatedAt' and ignore client values for them.
+- get_item, update_item and get_item_version return None for missing items.
+- Pages, searches and cursors return the key to pass back as 'after', or None on the last page.
+- Numbers may come back as Decimal (DynamoDB); shared.serializer encodes them.
+- Store errors propagate as the driver's exceptions and become 500 responses, except
+  that batch writes report the error of each element that failed and go on with the rest.
+"""
+import importlib
+import os
+from typing import Any, Dict, Iterator, List, Optional, Protocol, Tuple, runtime_checkable
+from .stats import DEFAULT_BUCKET_MILES, DEFAULT_TOP
+
+# STORAGE_BACKEND value -> module implementing StorageBackend
+BACKENDS = {
+    'mongo': '.mongo_utils',
+    'dynamodb': '.dynamo_utils'
+}
+
+_backend = None
+
+# An item's (version, updatedAt): the version number starts over when an id is
+# deleted and created again, the write time does not
+ItemVersion = Tuple[int, Optional[str]]
+
+
+@runtime_checkable
+class StorageBackend(Protocol):
+    """Item operations every storage backend provides"""
+
+    def get_item(self, item_id: str, fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]: ...
+
+    def get_item_and_version(self, item_id: str,
+                             fields: Optional[List[str]] = None) -> Tuple[Optional[Dict[str, Any]], Optional[ItemVersion]]:
+        """An item and its (version, updatedAt), which is returned even when the fieldset leaves them out"""
+        ...
+
+    def get_item_version(self, item_id: str) -> Optional[ItemVersion]:
+        """An item's (version, updatedAt), or None if it does not exist"""
+        ...
+
+    def get_items_by_ids(self, ids: List[str], fields: Optional[List[str]] = None) -> List[Optional[Dict[str, Any]]]:
+        """Items in the order of ids, with None for ids that do not exist"""
+        ...
+
+    def get_items_page(self, limit: int, after: Optional[Dict[str, Any]] = None, fields: Optional[List[str]] = None,
+                       filters: Optional[Dict[str, Any]] = None) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]: ...
+
+    def check_page_key(self, after: Dict[str, Any], filters: Optional[Dict[str, Any]] = None) -> None:
+        """Raise ValueError unless get_items_page can return after as the key of a page with these filters"""
+        ...
+
+    def iter_items(self, fields: Optional[List[str]] = None,
+                   filters: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]: ...
+
+    def get_collection_version(self) -> Optional[int]:
+        """Counter that every write to an item increases, or None if the backend has none"""
+        ...
+
+    def item_cache_stats(self) -> Optional[Dict[str, Any]]:
+        """Stats of the item cache get_item reads through, or None if the backend has none"""
+        ...
+
+    def create_item(self, item: Dict[str, Any]) -> None: ...
+
+    def create_items(self, items: List[Dict[str, Any]]) -> List[Optional[str]]: ...
+
+    def update_item(self, item_id: str, updates: Dict[str, Any]) -> Optional[Dict[str, Any]]: ...
+
+    def update_items(self, updates: Dict[str, Dict[str, Any]]) -> Dict[str, Any]: ...
+
+    def delete_item(self, item_id: str) -> bool: ...
+
+    def delete_items(self, ids: List[str]) -> Dict[str, Any]: ...
+
+    def find_items_near(self, latitude: float, longitude: float, radius: float = None,
+                        limit: int = 20) -> List[Dict[str, Any]]: ...
+
+    def search_items(self, query: str, limit: int = 20, after: Optional[Dict[str, Any]] = None,
+                     fields: Optional[List[str]] = None) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]: ...
+
+    def get_item_stats(self, bucket_size: float = DEFAULT_BUCKET_MILES, top: int = DEFAULT_TOP) -> Dict[str, Any]: ...
+
+
+def load_backend(name: str) -> StorageBackend:
+    """Import the backend registered under name, raising ValueError for unknown names"""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown STORAGE_BACKEND '{name}', expected one of: {', '.join(BACKENDS)}")
+    return importlib.import_module(BACKENDS[name], __package__)
+
+
+def get_backend() -> StorageBackend:
+    global _backend
+    if _backend is None:
+        _backend = load_backend(os.environ.get('STORAGE_BACKEND', 'mongo').lower())
+    return _backend
+
+
+# The functions below look the backend up on every call, so set_backend and
+# patches on the backend modules take effect in modules that imported them.
+
+def get_item(item_id: str, fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+    return get_backend().get_item(item_id, fields)
+
+def get_item_and_version(item_id: str, fields: Optional[List[str]] = None) -> Tuple[Optional[Dict[str, Any]], Optional[ItemVersion]]:
+    return get_backend().get_item_and_version(item_id, fields)
+
+def get_item_version(item_id: str) -> Optional[ItemVersion]:
+    return get_backend().get_item_version(item_id)
+
+def get_items_by_ids(ids: List[str], fields: Optional[List[str]] = None) -> List[Optional[Dict[str, Any]]]:
+    return get_backend().get_items_by_ids(ids, fields)
+
+def get_items_page(limit: int, after: Optional[Dict[str, Any]] = None, fields: Optional[List[str]] = None,
+                   filters: Optional[Dict[str, Any]] = None) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    return get_backend().get_items_page(limit, after, fields, filters)
+
+def check_page_key(after: Dict[str, Any], filters: Optional[Dict[str, Any]] = None) -> None:
+    return get_backend().check_page_key(after, filters)
+
+def iter_items(fields: Optional[List[str]] = None, filters: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+    return get_backend().iter_items(fields=fields, filters=filters)
+
+def get_collection_version() -> Optional[int]:
+    return get_backend().get_collection_version()
+
+def item_cache_stats() -> Optional[Dict[str, Any]]:
+    return get_backend().item_cache_stats()
+
+def create_item(item: Dict[str, Any]) -> None:
+    return get_backend().create_item(item)
+
+def create_items(items: List[Dict[str, Any]]) -> List[Optional[str]]:
+    return get_backend().create_items(items)
+
+def update_item(item_id: str, updates: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    return get_backend().update_item(item_id, updates)
+
+def update_items(updates: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    return get_backend().update_items(updates)
+
+def delete_item(item_id: str) -> bool:
+    return get_backend().delete_item(item_id)
+
+def delete_items(ids: List[str]) -> Dict[str, Any]:
+    return get_backend().delete_items(ids)
+
+def find_items_near(latitude: float, longitude: float, radius: float = None, limit: int = 20) -> List[Dict[str, Any]]:
+    return get_backend().find_items_near(latitude, longitude, radius, limit)
+
+def search_items(query: str, limit: int = 20, after: Optional[Dict[str, Any]] = None,
+                 fields: Optional[List[str]] = None) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    return get_backend().search_items(query, limit, after, fields)
+
+def get_item_stats(bucket_size: float = DEFAULT_BUCKET_MILES, top: int = DEFAULT_TOP) -> Dict[str, Any]:
+    return get_backend().get_item_stats(bucket_size, top)
+
+# For testing purposes
+def set_backend(backend: Optional[StorageBackend]):
+    global _backend
+    _backend = backend
@@ -0,0 +1,101 @@
+"""In-process inverted index for full-text search over item names and users.
+
+Each term maps to the items containing it, so a search only touches the posting
+lists of its own terms instead of every item. Like MongoDB's $text, a search
+matches items containing any of its terms. Scores are the field-weighted term
+counts, with the same field weights as the MongoDB text index.
+"""
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+# Relative weight of a match in each field, shared with the MongoDB text index
+TEXT_WEIGHTS = {'name': 2, 'users': 1}
+
+_TOKEN = re.compile(r'\w+')
+
+
+def tokenize(text: Any) -> List[str]:
+    """Lowercase word tokens of a string, or of each string in a list"""
+    if isinstance(text, list):
+        return [token for value in text for token in tokenize(value)]
+    if not isinstance(text, str):
+        return []
+    return _TOKEN.findall(text.lower())
+
+
+class TextIndex:
+    """Thread-safe inverted index answering ranked, keyset-paginated term searches"""
+
+    def __init__(self, weights: Dict[str, int] = TEXT_WEIGHTS):
+        self.weights = weights
+        self._items: Dict[str, Dict[str, Any]] = {}
+        # term -> {item id: weighted count}
+        self._postings: Dict[str, Dict[str, float]] = {}
+        # item id -> terms it is posted under, so removal only visits those
+        self._terms: Dict[str, List[str]] = {}
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def build(self, items) -> None:
+        """Replace the contents of the index"""
+        with self._lock:
+            self._items.clear()
+            self._postings.clear()
+            self._terms.clear()
+            for item in items:
+                self.upsert(item)
+
+    def upsert(self, item: Dict[str, Any]) -> None:
+        """Add an item, or replace the indexed copy of it"""
+        with self._lock:
+            self.remove(item['id'])
+            self._items[item['id']] = dict(item)
+            counts: Dict[str, float] = {}
+            for field, weight in self.weights.items():
+                for term in tokenize(item.get(field)):
+                    counts[term] = counts.get(term, 0) + weight
+            for term, count in counts.items():
+                self._postings.setdefault(term, {})[item['id']] = count
+            self._terms[item['id']] = list(counts)
+
+    def update(self, item_id: str, updates: Dict[str, Any]) -> None:
+        """Apply a partial update to an indexed item"""
+        with self._lock:
+            if item_id in self._items:
+                self.upsert({**self._items[item_id], **updates})
+
+    def remove(self, item_id: str) -> None:
+        with self._lock:
+            self._items.pop(item_id, None)
+            for term in self._terms.pop(item_id, ()):
+                postings = self._postings[term]
+                postings.pop(item_id, None)
+                if not postings:
+                    del self._postings[term]
+
+    def search(self, query: str, limit: int = 20,
+               after: Optional[Dict[str, Any]] = None) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """Items matching any term of query, best first, each with its 'score'.
+
+        Ties are broken by id. Returns the items and the key to pass as 'after'
+        for the next page, or None on the last page.
+        """
+        with self._lock:
+            scores: Dict[str, float] = {}
+            for term in set(tokenize(query)):
+                for item_id, count in self._postings.get(term, {}).items():
+                    scores[item_id] = scores.get(item_id, 0) + count
+
+            ranked = sorted(scores.items(), key=lambda pair: (-pair[1], pair[0]))
+            if after:
+                ranked = [
+                    (item_id, score) for item_id, score in ranked
+                    if score < after['score'] or (score == after['score'] and item_id > after['id'])
+                ]
+            page = [{**self._items[item_id], 'score': score} for item_id, score in ranked[:limit]]
+            if len(ranked) > limit:
+                return page, {'id': page[-1]['id'], 'score': page[-1]['score']}
+            return page, None
@@ -1,10 +1,27 @@
-from datetime import datetime, timedelta
-from typing import List, Dict, Any, Tuple
+from datetime import datetime, timedelta, timezone
+from typing import List, Dict, Any, Tuple, Optional, Union
+import re
 import json
+import base64
+import binascii
+import hashlib
 from dateutil import parser
 from decimal import Decimal
 from bson import ObjectId
 from .auth import verify_token
+from .stats import DEFAULT_BUCKET_MILES, DEFAULT_TOP, MAX_TOP, MAX_DISTANCE_MILES
+from .serializer import as_text
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+MAX_FIELDS = 50
+FIELD_NAME_PATTERN = re.compile(r'^[A-Za-z][A-Za-z0-9_]*$')
+DIRECTIONS = ('NE', 'NW', 'SE', 'SW')
+MAX_QUERY_LENGTH = 200
+MAX_MULTI_GET_IDS = 200
+# GET /items parameters that page or filter the list, which a multi-get has no use for
+LIST_ONLY_PARAMS = ('limit', 'next', 'stream', 'postcode', 'user', 'directionFromNY',
+                    'startDateFrom', 'startDateTo', 'minDistance', 'maxDistance')
 
 class DecimalEncoder(json.JSONEncoder):
     def default(self, o):
@@ -31,6 +48,19 @@ def validate_users(users: List[str]) -> tuple[bool, str]:
 
     return True, ""
 
+def normalize_start_date(value: Any) -> str:
+    """startDate as it is stored: ISO 8601 in UTC, so that date filters can compare the strings.
+
+    Dates without a time zone are taken to be UTC. Raises ValueError if the value is not a date.
+    """
+    try:
+        start_date = parser.parse(value)
+        if start_date.tzinfo is None:
+            start_date = start_date.replace(tzinfo=timezone.utc)
+        return start_date.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError("Invalid date format")
+
 def validate_item(item: Dict[str, Any]) -> tuple[bool, str]:
     required_fields = ['name', 'postcode', 'startDate', 'users']
 
@@ -54,21 +84,303 @@ def validate_item(item: Dict[str, Any]) -> tuple[bool, str]:
         min_start_date = datetime.now(start_date.tzinfo) + timedelta(weeks=1)
         if start_date < min_start_date:
             return False, "Start date must be at least 1 week from now"
-    except ValueError:
+    except (TypeError, ValueError, OverflowError):
         return False, "Invalid date format"
 
+    item['startDate'] = normalize_start_date(item['startDate'])
+    return True, ""
+
+def validate_updates(updates: Dict[str, Any]) -> tuple[bool, str]:
+    """Check a partial update's startDate, if it has one, and normalize it like validate_item does"""
+    if 'startDate' in updates:
+        try:
+            updates['startDate'] = normalize_start_date(updates['startDate'])
+        except ValueError as e:
+            return False, str(e)
     return True, ""
 
-def create_response(status_code: int, body: Dict[str, Any]) -> Dict[str, Any]:
+def parse_near_params(params: Dict[str, str]) -> Dict[str, Any]:
+    """Parse lat/lon/radius/limit query parameters for proximity search, raising ValueError if invalid"""
+    params = params or {}
+    try:
+        latitude = float(params['lat'])
+        longitude = float(params['lon'])
+    except KeyError as e:
+        raise ValueError(f"Missing required parameter: {e.args[0]}")
+    except ValueError:
+        raise ValueError("lat and lon must be numbers")
+    if not -90 <= latitude <= 90:
+        raise ValueError("lat must be between -90 and 90")
+    if not -180 <= longitude <= 180:
+        raise ValueError("lon must be between -180 and 180")
+
+    radius = None
+    if params.get('radius') is not None:
+        try:
+            radius = float(params['radius'])
+        except ValueError:
+            raise ValueError("radius must be a number")
+        if radius <= 0:
+            raise ValueError("radius must be greater than 0")
+
+    try:
+        limit = int(params.get('limit', 20))
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    if not 1 <= limit <= 100:
+        raise ValueError("limit must be between 1 and 100")
+
+    return {'latitude': latitude, 'longitude': longitude, 'radius': radius, 'limit': limit}
+
+def parse_stats_params(params: Dict[str, str]) -> Dict[str, Any]:
+    """Parse bucketMiles/top query parameters for item statistics, raising ValueError if invalid"""
+    params = params or {}
+    try:
+        bucket_size = float(params.get('bucketMiles', DEFAULT_BUCKET_MILES))
+    except ValueError:
+        raise ValueError("bucketMiles must be a number")
+    # At least one mile keeps the histogram to a bounded number of buckets
+    if not 1 <= bucket_size <= MAX_DISTANCE_MILES:
+        raise ValueError(f"bucketMiles must be between 1 and {MAX_DISTANCE_MILES}")
+    if bucket_size.is_integer():
+        bucket_size = int(bucket_size)
+
+    try:
+        top = int(params.get('top', DEFAULT_TOP))
+    except ValueError:
+        raise ValueError("top must be an integer")
+    if not 1 <= top <= MAX_TOP:
+        raise ValueError(f"top must be between 1 and {MAX_TOP}")
+
+    return {'bucket_size': bucket_size, 'top': top}
+
+def parse_fields(value: Optional[str]) -> Optional[List[str]]:
+    """Parse a comma-separated sparse fieldset, raising ValueError if invalid"""
+    if value is None:
+        return None
+    fields = list(dict.fromkeys(field.strip() for field in value.split(',') if field.strip()))
+    if not fields:
+        raise ValueError("fields cannot be empty")
+    if len(fields) > MAX_FIELDS:
+        raise ValueError(f"fields cannot list more than {MAX_FIELDS} fields")
+    for field in fields:
+        if not FIELD_NAME_PATTERN.match(field):
+            raise ValueError(f"Invalid field name: {field}")
+    return fields
+
+def parse_item_filters(params: Dict[str, str]) -> Dict[str, Any]:
+    """Parse the GET /items filter parameters, raising ValueError if invalid.
+
+    Returns only the filters that were given: postcode, directionFromNY, user
+    (membership in 'users'), startDateFrom/startDateTo and minDistance/maxDistance.
+    """
+    params = params or {}
+    filters = {}
+    for name in ('postcode', 'user'):
+        if params.get(name) is not None:
+            value = params[name].strip()
+            if not value:
+                raise ValueError(f"{name} cannot be empty")
+            filters[name] = value
+
+    if params.get('directionFromNY') is not None:
+        direction = params['directionFromNY'].strip().upper()
+        if direction not in DIRECTIONS:
+            raise ValueError(f"directionFromNY must be one of {', '.join(DIRECTIONS)}")
+        filters['directionFromNY'] = direction
+
+    # Dates are compared as stored, so bounds are normalized like startDate itself
+    for name in ('startDateFrom', 'startDateTo'):
+        if params.get(name) is not None:
+            try:
+                parser.isoparse(params[name])
+            except ValueError:
+                raise ValueError(f"{name} must be an ISO 8601 date")
+            filters[name] = normalize_start_date(params[name])
+
+    for name in ('minDistance', 'maxDistance'):
+        if params.get(name) is not None:
+            try:
+                filters[name] = float(params[name])
+            except ValueError:
+                raise ValueError(f"{name} must be a number")
+            if filters[name] < 0:
+                raise ValueError(f"{name} cannot be negative")
+
+    if 'minDistance' in filters and 'maxDistance' in filters and filters['minDistance'] > filters['maxDistance']:
+        raise ValueError("minDistance cannot be greater than maxDistance")
+    if 'startDateFrom' in filters and 'startDateTo' in filters and filters['startDateFrom'] > filters['startDateTo']:
+        raise ValueError("startDateFrom cannot be after startDateTo")
+    return filters
+
+def encode_page_token(key: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Opaque token for the key a page ended on"""
+    if not key:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(key, cls=DecimalEncoder).encode()).decode()
+
+def decode_page_token(token: str) -> Dict[str, Any]:
+    """Key encoded by a token, raising ValueError unless it is an object whose 'id', if any, is a string.
+
+    Which keys a list accepts depends on the storage backend and the filters, so
+    list handlers also pass the key to storage.check_page_key.
+    """
+    try:
+        key = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except (binascii.Error, ValueError):
+        raise ValueError("Invalid next token")
+    if not isinstance(key, dict) or not isinstance(key.get('id', ''), str):
+        raise ValueError("Invalid next token")
+    return key
+
+def parse_page_params(params: Dict[str, str]) -> Dict[str, Any]:
+    """Parse limit/next query parameters for keyset pagination, raising ValueError if invalid.
+
+    A request with neither limit nor next is not paginated, and gets a limit of None.
+    """
+    params = params or {}
+    limit = None
+    if params.get('limit') is not None or params.get('next'):
+        try:
+            limit = int(params.get('limit', DEFAULT_PAGE_SIZE))
+        except ValueError:
+            raise ValueError("limit must be an integer")
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+
+    after = decode_page_token(params['next']) if params.get('next') else None
+    return {'limit': limit, 'after': after, 'fields': parse_fields(params.get('fields'))}
+
+def parse_ids_params(params: Dict[str, str]) -> Optional[Dict[str, Any]]:
+    """Parse ids/fields query parameters for a multi-get, raising ValueError if invalid.
+
+    Returns None when there is no 'ids' parameter, so the request is a list request.
+    """
+    params = params or {}
+    if params.get('ids') is None:
+        return None
+    ids = [item_id.strip() for item_id in params['ids'].split(',')]
+    if not all(ids):
+        raise ValueError("ids must be a comma-separated list of item ids")
+    if len(ids) > MAX_MULTI_GET_IDS:
+        raise ValueError(f"ids cannot list more than {MAX_MULTI_GET_IDS} ids")
+    for name in LIST_ONLY_PARAMS:
+        if params.get(name) is not None:
+            raise ValueError(f"ids cannot be combined with {name}")
+    return {'ids': ids, 'fields': parse_fields(params.get('fields'))}
+
+def parse_list_params(params: Dict[str, str]) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """Parse GET /items query parameters, raising ValueError if invalid.
+
+    Returns the multi-get parameters and None for an ids request, otherwise None
+    and the page parameters with their 'filters'. Callers check the page key
+    against their storage backend, which issued it.
+    """
+    multi_get = parse_ids_params(params)
+    if multi_get is not None:
+        return multi_get, None
+    page_params = parse_page_params(params)
+    page_params['filters'] = parse_item_filters(params)
+    return None, page_params
+
+def multi_get_body(ids: List[str], items: List[Optional[Dict[str, Any]]]) -> Dict[str, Any]:
+    """Multi-get response body: the items in request order, null for missing ids, which are also listed"""
+    return {'items': items, 'missing': list(dict.fromkeys(item_id for item_id, item in zip(ids, items) if item is None))}
+
+def parse_search_params(params: Dict[str, str]) -> Dict[str, Any]:
+    """Parse q/limit/next/fields query parameters for text search, raising ValueError if invalid"""
+    params = params or {}
+    query = (params.get('q') or '').strip()
+    if not query:
+        raise ValueError("Missing required parameter: q")
+    if len(query) > MAX_QUERY_LENGTH:
+        raise ValueError(f"q must be at most {MAX_QUERY_LENGTH} characters")
+
+    try:
+        limit = int(params.get('limit', 20))
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    if not 1 <= limit <= 100:
+        raise ValueError("limit must be between 1 and 100")
+
+    after = None
+    if params.get('next'):
+        after = decode_page_token(params['next'])
+        # Search pages resume after a (score, id) key
+        if ('id' not in after or not isinstance(after.get('score'), (int, float))
+                or isinstance(after['score'], bool)):
+            raise ValueError("Invalid next token")
+    return {'query': query, 'limit': limit, 'after': after, 'fields': parse_fields(params.get('fields'))}
+
+def create_response(status_code: int, body: Optional[Union[Dict[str, Any], bytes]],
+                    headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """API Gateway response; a None body (e.g. for 304 Not Modified) is sent empty.
+
+    body is encoded with shared.serializer, unless it is bytes that were encoded before.
+    """
     return {
         'statusCode': status_code,
         'headers': {
             'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*'
+            'Access-Control-Allow-Origin': '*',
+            # Let browser clients read the ETag for conditional requests
+            'Access-Control-Expose-Headers': 'ETag',
+            **(headers or {})
         },
-        'body': json.dumps(body, cls=DecimalEncoder)
+        'body': '' if body is None else as_text(body)
     }
 
+def make_etag(*parts: Any) -> str:
+    """Strong ETag derived from the values that determine a representation"""
+    digest = hashlib.sha1(json.dumps(parts, cls=DecimalEncoder, sort_keys=True).encode()).hexdigest()
+    return f'"{digest[:20]}"'
+
+def item_version(item: Dict[str, Any]) -> Tuple[int, Optional[str]]:
+    """An item's (version, updatedAt), as the storage backends' get_item_version returns it"""
+    return int(item.get('version', 0)), item.get('updatedAt')
+
+def item_etag(item_id: str, version: Tuple[int, Optional[str]], fields: Optional[List[str]] = None) -> str:
+    """ETag of one item, which changes with its (version, updatedAt) and the requested fieldset.
+
+    Versions start over at 1 when an id is deleted and created again, so the
+    write time tells the two items apart.
+    """
+    number, updated_at = version
+    # int() so a DynamoDB Decimal version gives the same tag
+    return make_etag('item', item_id, int(number), updated_at, fields or [])
+
+def list_etag(collection_version: Optional[int], params: Dict[str, Any]) -> Optional[str]:
+    """ETag of a list response, which changes with the collection and the query parameters.
+
+    None when the storage backend cannot version the collection.
+    """
+    if collection_version is None:
+        return None
+    return make_etag('items', collection_version, params)
+
+def stats_etag(collection_version: Optional[int], params: Dict[str, Any]) -> Optional[str]:
+    """ETag of an item statistics response, which changes with the collection and the parameters, or None"""
+    if collection_version is None:
+        return None
+    return make_etag('stats', collection_version, params)
+
+def etag_matches(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    """Whether an If-None-Match header value matches an ETag, using weak comparison"""
+    if not if_none_match or etag is None:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(','))
+    return etag in (tag[2:] if tag.startswith('W/') else tag for tag in candidates)
+
+def get_header(event: Dict[str, Any], name: str) -> Optional[str]:
+    """Case-insensitive header lookup on an API Gateway event"""
+    name = name.lower()
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
 def get_token_from_event(event: Dict[str, Any]) -> str:
     """Extract the JWT token from the API Gateway event"""
     if 'Authorization' not in event.get('headers', {}):
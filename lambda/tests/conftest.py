@@ -3,7 +3,10 @@ import pytest
 from mongomock import MongoClient
 from moto import mock_aws
 import boto3
+import mongomock.collection
 from shared.mongo_utils import set_mongo_collection
+from shared.geocoding import clear_cache
+from shared.item_cache import get_body_cache
 
 # Set AWS test credentials and region
 os.environ['AWS_DEFAULT_REGION'] = 'us-east-1'
@@ -16,6 +19,8 @@ os.environ['USER_POOL_ID'] = 'test-pool'
 os.environ['CLIENT_ID'] = 'test-client-id'
 os.environ['TESTING'] = 'true'  # Enable test mode
 
+import shared.dynamo_utils as dynamo_utils  # Creates its boto3 resource on import, so after the region is set
+
 
 @pytest.fixture(scope='function')
 def aws_credentials():
@@ -31,8 +36,21 @@ def mongodb_client():
     return MongoClient()
 
 
+@pytest.fixture
+def mongomock_bulk_updates(monkeypatch):
+    """Let mongomock run UpdateOne in bulk_write: pymongo >= 4.11 passes sort= when
+    adding it to the bulk, which mongomock 4.3 does not accept yet. An unset sort
+    means the same thing to both"""
+    add_update = mongomock.collection.BulkOperationBuilder.add_update
+
+    def add_update_without_sort(self, *args, sort=None, **kwargs):
+        return add_update(self, *args, **kwargs)
+
+    monkeypatch.setattr(mongomock.collection.BulkOperationBuilder, 'add_update', add_update_without_sort)
+
+
 @pytest.fixture(scope='function')
-def mongodb_collection(mongodb_client):
+def mongodb_collection(mongodb_client, mongomock_bulk_updates):
     """Create a mock MongoDB collection for testing."""
     db = mongodb_client.items_db
     collection = db.items
@@ -40,4 +58,66 @@ def mongodb_collection(mongodb_client):
     set_mongo_collection(collection)
     yield collection
     collection.drop()  # Clean up after test
-    set_mongo_collection(None)  # Reset the collection after test
\ No newline at end of file
+    set_mongo_collection(None)  # Reset the collection after test
+
+
+@pytest.fixture
+def moto_table(monkeypatch):
+    """A moto DynamoDB items table with the GSIs cdk_stack declares, and a counters table, injected into dynamo_utils"""
+    with mock_aws():
+        dynamodb = boto3.resource('dynamodb')
+        table = dynamodb.create_table(
+            TableName='test-items-table',
+            KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[
+                {'AttributeName': name, 'AttributeType': 'S'}
+                for name in ('id', 'postcode', 'directionFromNY', 'startDate')
+            ] + [
+                {'AttributeName': name, 'AttributeType': 'N'}
+                for name in (dynamo_utils.DISTANCE_BUCKET, 'distanceFromNY')
+            ],
+            GlobalSecondaryIndexes=[
+                {
+                    'IndexName': dynamo_utils.POSTCODE_INDEX,
+                    'KeySchema': [{'AttributeName': 'postcode', 'KeyType': 'HASH'},
+                                  {'AttributeName': 'id', 'KeyType': 'RANGE'}],
+                    'Projection': {'ProjectionType': 'ALL'}
+                },
+                {
+                    'IndexName': dynamo_utils.DIRECTION_INDEX,
+                    'KeySchema': [{'AttributeName': 'directionFromNY', 'KeyType': 'HASH'},
+                                  {'AttributeName': 'startDate', 'KeyType': 'RANGE'}],
+                    'Projection': {'ProjectionType': 'ALL'}
+                },
+                {
+                    'IndexName': dynamo_utils.DISTANCE_INDEX,
+                    'KeySchema': [{'AttributeName': dynamo_utils.DISTANCE_BUCKET, 'KeyType': 'HASH'},
+                                  {'AttributeName': 'distanceFromNY', 'KeyType': 'RANGE'}],
+                    'Projection': {'ProjectionType': 'ALL'}
+                }
+            ],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        counters = dynamodb.create_table(
+            TableName='test-counters-table',
+            KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'id', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        monkeypatch.setattr(dynamo_utils, 'dynamodb', dynamodb)
+        monkeypatch.setattr(dynamo_utils, '_table', table)
+        monkeypatch.setattr(dynamo_utils, '_counters_table', counters)
+        monkeypatch.setattr(dynamo_utils, '_indexes', {})
+        monkeypatch.setattr(dynamo_utils, '_index_versions', {})
+        monkeypatch.setattr(dynamo_utils, '_index_checked', {})
+        monkeypatch.setattr(dynamo_utils, '_index_missing', {})
+        get_body_cache().clear()
+        yield table
+
+
+@pytest.fixture(autouse=True)
+def clear_geocode_cache():
+    """Keep cached postcode lookups from leaking between tests."""
+    clear_cache()
+    yield
+    clear_cache()
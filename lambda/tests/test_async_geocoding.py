@@ -0,0 +1,98 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import httpx
+import pytest
+from shared import async_geocoding
+from shared.async_geocoding import AsyncGeocodingClient, get_coordinates, get_coordinates_many, get_inflight_stats
+
+PLACES = {
+    '10001': {'places': [{'latitude': '40.7484', 'longitude': '-73.9967'}]},
+    '90210': {'places': [{'latitude': '34.0901', 'longitude': '-118.4065'}]}
+}
+
+def stub_client(handler, **kwargs):
+    client = AsyncGeocodingClient(base_url='http://geocoder.test', backoff=0, **kwargs)
+    client.session = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client
+
+@pytest.fixture
+def requests_seen():
+    seen = []
+
+    async def handler(request):
+        postcode = request.url.path.rsplit('/', 1)[-1]
+        seen.append(postcode)
+        # Slow enough that concurrent lookups overlap
+        await asyncio.sleep(0.05)
+        if postcode in PLACES:
+            return httpx.Response(200, json=PLACES[postcode])
+        return httpx.Response(404)
+
+    async_geocoding.set_client(stub_client(handler))
+    async_geocoding._inflight.reset()
+    yield seen
+    async_geocoding.set_client(None)
+
+def test_get_coordinates(requests_seen):
+    async def scenario():
+        assert await get_coordinates('10001') == (40.7484, -73.9967)
+        assert await get_coordinates('99999') is None
+        # Both answers are cached, including the miss
+        assert await get_coordinates('10001') == (40.7484, -73.9967)
+        assert await get_coordinates('99999') is None
+
+    asyncio.run(scenario())
+    assert requests_seen == ['10001', '99999']
+
+def test_concurrent_lookups_are_coalesced(requests_seen):
+    async def scenario():
+        return await asyncio.gather(*(get_coordinates('90210') for _ in range(20)))
+
+    assert asyncio.run(scenario()) == [(34.0901, -118.4065)] * 20
+    assert requests_seen == ['90210']
+    assert get_inflight_stats() == {'calls': 1, 'saved': 19, 'in_flight': 0}
+
+def test_get_coordinates_many(requests_seen):
+    async def scenario():
+        start = asyncio.get_running_loop().time()
+        results = await get_coordinates_many(['10001', '90210', 10001, '00000'])
+        return results, asyncio.get_running_loop().time() - start
+
+    results, elapsed = asyncio.run(scenario())
+    assert results == {'10001': (40.7484, -73.9967), '90210': (34.0901, -118.4065), '00000': None}
+    assert sorted(requests_seen) == ['00000', '10001', '90210']
+    # The three lookups ran concurrently rather than one after another
+    assert elapsed < 0.14
+
+def test_retries():
+    statuses = [503, 503, 200]
+
+    def handler(request):
+        status = statuses.pop(0)
+        return httpx.Response(status, json=PLACES['10001'] if status == 200 else None)
+
+    async def scenario():
+        assert await stub_client(handler).fetch('10001') == (40.7484, -73.9967)
+
+        # Non-retryable statuses fail straight away, and failures are not cached
+        client = stub_client(lambda request: httpx.Response(400), max_retries=2)
+        with pytest.raises(Exception, match="status 400"):
+            await client.fetch('10001')
+
+    asyncio.run(scenario())
+    assert statuses == []
+
+def test_network_errors_are_not_cached():
+    def handler(request):
+        raise httpx.ConnectError("connection refused")
+
+    async_geocoding.set_client(stub_client(handler, max_retries=1))
+    try:
+        assert asyncio.run(get_coordinates('10001')) is None
+        async_geocoding.set_client(stub_client(lambda request: httpx.Response(200, json=PLACES['10001'])))
+        assert asyncio.run(get_coordinates('10001')) == (40.7484, -73.9967)
+    finally:
+        async_geocoding.set_client(None)
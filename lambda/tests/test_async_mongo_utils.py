@@ -0,0 +1,92 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import pytest
+from unittest.mock import AsyncMock
+from pymongo.errors import PyMongoError
+from mongomock_motor import AsyncMongoMockClient
+from shared import async_mongo_utils as storage
+
+TEST_ITEM = {
+    'id': 'test-id',
+    'name': 'Test Item',
+    'latitude': 40.7484,
+    'longitude': -73.9967
+}
+
+@pytest.fixture
+def collection(mongomock_bulk_updates):
+    collection = AsyncMongoMockClient().items_db.items
+    asyncio.run(collection.create_index('id', unique=True))
+    storage.set_mongo_collection(collection)
+    yield collection
+    storage.set_mongo_collection(None)
+
+def test_crud(collection):
+    async def scenario():
+        await storage.create_item(TEST_ITEM)
+        assert await storage.get_item('test-id') == TEST_ITEM
+        assert await storage.get_item('test-id', ['name']) == {'id': 'test-id', 'name': 'Test Item'}
+        assert (await collection.find_one({'id': 'test-id'}))['location']['coordinates'] == [-73.9967, 40.7484]
+
+        with pytest.raises(Exception, match="Duplicate Key Error"):
+            await storage.create_item(TEST_ITEM)
+
+        updated = await storage.update_item('test-id', {'name': 'Updated'})
+        assert updated == {**TEST_ITEM, 'name': 'Updated', 'version': 2, 'updatedAt': updated['updatedAt']}
+        assert await storage.get_item_version('test-id') == (2, updated['updatedAt'])
+        assert await storage.get_item_and_version('test-id', ['name']) == ({'id': 'test-id', 'name': 'Updated'}, (2, updated['updatedAt']))
+        assert await storage.get_collection_version() == 2
+        assert await storage.update_item('missing', {'name': 'Updated'}) is None
+
+        assert await storage.delete_item('test-id') is True
+        assert await storage.delete_item('test-id') is False
+        assert await storage.get_item('test-id') is None
+
+    asyncio.run(scenario())
+
+def test_writes_succeed_when_counting_fails(collection, monkeypatch):
+    counters = AsyncMock()
+    counters.update_one.side_effect = PyMongoError("Write concern timeout")
+    monkeypatch.setattr(storage, 'get_counters_collection', lambda: counters)
+
+    async def scenario():
+        await storage.create_item(dict(TEST_ITEM))
+        assert (await storage.update_item('test-id', {'name': 'Renamed'}))['version'] == 2
+        assert await storage.delete_item('test-id') is True
+    asyncio.run(scenario())
+    assert counters.update_one.await_count == 3
+
+def test_reads(collection):
+    async def scenario():
+        errors = await storage.create_items([{'id': f'item-{i}', 'n': i} for i in range(5)] + [{'id': 'item-0'}])
+        assert errors == [None] * 5 + ["Duplicate Key Error"]
+
+        items, next_key = await storage.get_items_page(3)
+        assert [item['id'] for item in items] == ['item-0', 'item-1', 'item-2']
+        items, next_key = await storage.get_items_page(3, after=next_key, fields=['n'])
+        assert items == [{'id': 'item-3', 'n': 3}, {'id': 'item-4', 'n': 4}]
+        assert next_key is None
+
+        assert len(await storage.get_all_items()) == 5
+        assert await storage.get_items_by_ids(['item-4', 'missing', 'item-1'], ['n']) == [
+            {'id': 'item-4', 'n': 4}, None, {'id': 'item-1', 'n': 1}
+        ]
+        assert [item['id'] async for item in storage.iter_items(batch_size=2)] == [f'item-{i}' for i in range(5)]
+
+    asyncio.run(scenario())
+
+def test_bulk_mutations(collection):
+    async def scenario():
+        await storage.create_items([{'id': 'a', 'name': 'A'}, {'id': 'b', 'name': 'B'}])
+
+        result = await storage.update_items({'a': {'name': 'Renamed'}, 'b': {'name': 'B'}, 'missing': {'name': 'Ghost'}})
+        assert result == {'matched': 2, 'modified': 1, 'missing': ['missing'], 'failed': {}}
+        assert (await storage.get_item('a'))['name'] == 'Renamed'
+
+        assert await storage.delete_items(['a', 'missing']) == {'deleted': 1, 'missing': ['missing'], 'failed': {}}
+        assert [item['id'] for item in await storage.get_all_items()] == ['b']
+
+    asyncio.run(scenario())
@@ -0,0 +1,213 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from shared import storage
+from shared.batch import parse_batch, geo_fields, create_items_batch, update_items_batch, delete_items_batch
+from shared import async_batch, async_mongo_utils
+from mongomock_motor import AsyncMongoMockClient
+from shared.geocoding import calculate_distance_from_ny, get_direction_from_ny
+
+START_DATE = (datetime.utcnow() + timedelta(weeks=2)).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+def new_item(name, postcode):
+    return {'name': name, 'postcode': postcode, 'startDate': START_DATE, 'users': ['John Doe']}
+
+COORDINATES = {
+    '10001': (40.7484, -73.9967),
+    '90210': (34.0901, -118.4065),
+    '00000': None
+}
+
+def test_parse_batch():
+    assert parse_batch({'items': [1, 2]}) == [1, 2]
+    for body in (None, [], {'items': 'x'}, {'items': []}, {'items': [{}] * 501}):
+        with pytest.raises(ValueError):
+            parse_batch(body)
+    assert parse_batch({'ids': ['a']}, key='ids') == ['a']
+
+def test_geo_fields():
+    fields = geo_fields([(34.0901, -118.4065), (42.7128, -73.0060)])
+    assert fields[0] == {
+        'latitude': 34.0901,
+        'longitude': -118.4065,
+        'distanceFromNY': calculate_distance_from_ny(34.0901, -118.4065),
+        'directionFromNY': get_direction_from_ny(34.0901, -118.4065)
+    }
+    assert fields[1]['directionFromNY'] == 'NE'
+    assert type(fields[1]['distanceFromNY']) is float
+    assert geo_fields([]) == []
+
+@patch('shared.batch.get_coordinates_many')
+def test_create_items_batch(mock_get_coordinates_many, mongodb_collection):
+    mock_get_coordinates_many.side_effect = lambda postcodes: {p: COORDINATES[p] for p in postcodes}
+    bodies = [
+        new_item('First', '10001'),
+        {'name': 'Missing fields'},
+        new_item('Second', '90210'),
+        new_item('Unknown postcode', '00000'),
+        'not an object',
+        new_item('Third', '10001')
+    ]
+
+    status_code, body = create_items_batch(bodies)
+    assert status_code == 207
+    assert body['created'] == 3
+    assert body['failed'] == 3
+    assert [r['status'] for r in body['results']] == [201, 400, 201, 400, 400, 201]
+    assert [r['index'] for r in body['results']] == list(range(6))
+    assert body['results'][1]['error'] == 'Missing required field: postcode'
+    assert body['results'][3]['error'] == 'Invalid postcode'
+
+    # Only valid items are geocoded, in one call
+    assert mock_get_coordinates_many.call_args[0][0] == ['10001', '90210', '00000', '10001']
+
+    second = body['results'][2]['item']
+    assert second['latitude'] == 34.0901
+    assert second['directionFromNY'] == 'SW'
+    assert mongodb_collection.count_documents({}) == 3
+    assert mongodb_collection.find_one({'id': second['id']})['location']['coordinates'] == [-118.4065, 34.0901]
+
+    # Everything created
+    status_code, body = create_items_batch([new_item('Fourth', '90210')])
+    assert status_code == 201
+    assert body['failed'] == 0
+
+@patch('shared.batch.get_coordinates_many')
+def test_create_items_batch_duplicate_ids(mock_get_coordinates_many, mongodb_collection):
+    mock_get_coordinates_many.side_effect = lambda postcodes: {p: COORDINATES[p] for p in postcodes}
+    mongodb_collection.create_index('id', unique=True)
+    mongodb_collection.insert_one({'id': 'taken'})
+
+    status_code, body = create_items_batch([
+        {**new_item('Duplicate', '10001'), 'id': 'taken'},
+        new_item('Fresh', '10001')
+    ])
+    assert status_code == 207
+    assert body['results'][0]['status'] == 409
+    assert body['results'][1]['status'] == 201
+
+@patch('shared.batch.get_coordinates_many')
+def test_create_items_batch_duplicate_ids_on_dynamodb(mock_get_coordinates_many, moto_table):
+    mock_get_coordinates_many.side_effect = lambda postcodes: {p: COORDINATES[p] for p in postcodes}
+    storage.set_backend(storage.load_backend('dynamodb'))
+    moto_table.put_item(Item={'id': 'taken', 'name': 'Original'})
+    try:
+        status_code, body = create_items_batch([
+            {**new_item('Duplicate', '10001'), 'id': 'taken'},
+            {**new_item('First', '10001'), 'id': 'twice'},
+            {**new_item('Second', '10001'), 'id': 'twice'}
+        ])
+    finally:
+        storage.set_backend(None)
+    assert status_code == 207
+    assert [result['status'] for result in body['results']] == [409, 201, 409]
+    assert moto_table.get_item(Key={'id': 'taken'})['Item']['name'] == 'Original'
+    assert moto_table.get_item(Key={'id': 'twice'})['Item']['name'] == 'First'
+
+@patch('shared.batch.get_coordinates_many')
+def test_update_items_batch(mock_get_coordinates_many, mongodb_collection):
+    mock_get_coordinates_many.side_effect = lambda postcodes: {p: COORDINATES[p] for p in postcodes}
+    mongodb_collection.insert_many([{'id': 'a', 'name': 'A'}, {'id': 'b', 'name': 'B'}, {'id': 'c', 'name': 'C'}])
+
+    status_code, body = update_items_batch([
+        {'id': 'a', 'name': 'Renamed'},
+        {'id': 'b', 'postcode': '90210'},
+        {'id': 'c', 'postcode': '00000'},
+        {'id': 'missing', 'name': 'Ghost'},
+        {'id': 'a', 'name': 'Again'},
+        {'name': 'No id'},
+        {'id': 'c', 'name': 'C'}
+    ])
+    assert status_code == 207
+    assert [r['status'] for r in body['results']] == [200, 200, 400, 404, 400, 400, 400]
+    assert body['results'][4]['error'] == 'Duplicate id in batch'
+    assert body['results'][6]['error'] == 'Duplicate id in batch'
+    assert body['matched'] == 2
+    assert body['modified'] == 2
+    assert body['missing'] == 1
+
+    # Only the new postcodes are geocoded
+    mock_get_coordinates_many.assert_called_once_with(['90210', '00000'])
+
+    assert mongodb_collection.find_one({'id': 'a'})['name'] == 'Renamed'
+    b = mongodb_collection.find_one({'id': 'b'})
+    assert b['postcode'] == '90210'
+    assert b['directionFromNY'] == 'SW'
+    assert b['location']['coordinates'] == [-118.4065, 34.0901]
+    assert 'postcode' not in mongodb_collection.find_one({'id': 'c'})
+    assert mongodb_collection.count_documents({'id': 'missing'}) == 0
+
+    status_code, body = update_items_batch([{'id': 'a', 'name': 'Final'}])
+    assert status_code == 200
+
+@patch('shared.batch.update_items')
+def test_update_items_batch_reports_failed_items(mock_update_items):
+    mock_update_items.return_value = {'matched': 1, 'modified': 1, 'missing': [], 'failed': {'b': 'Throttled'}}
+    status_code, body = update_items_batch([{'id': 'a', 'name': 'A'}, {'id': 'b', 'name': 'B'}])
+    assert status_code == 207
+    assert body['results'][1] == {'index': 1, 'id': 'b', 'status': 500, 'error': 'Throttled'}
+    assert [r['status'] for r in body['results']] == [200, 500]
+
+@patch('shared.batch.update_items')
+def test_update_items_batch_normalizes_start_dates(mock_update_items):
+    mock_update_items.return_value = {'matched': 1, 'modified': 1, 'missing': [], 'failed': {}}
+    status_code, body = update_items_batch([{'id': 'a', 'startDate': '2099-03-26'}, {'id': 'b', 'startDate': 'soon'}])
+    assert status_code == 207
+    assert body['results'][1] == {'index': 1, 'id': 'b', 'status': 400, 'error': 'Invalid date format'}
+    mock_update_items.assert_called_once_with({'a': {'startDate': '2099-03-26T00:00:00Z'}})
+
+@patch('shared.batch.delete_items')
+def test_delete_items_batch_reports_failed_items(mock_delete_items):
+    mock_delete_items.return_value = {'deleted': 1, 'missing': [], 'failed': {'b': 'Throttled'}}
+    status_code, body = delete_items_batch(['a', 'b'])
+    assert status_code == 207
+    assert body['results'] == [{'index': 0, 'id': 'a', 'status': 200},
+                               {'index': 1, 'id': 'b', 'status': 500, 'error': 'Throttled'}]
+
+def test_delete_items_batch(mongodb_collection):
+    mongodb_collection.insert_many([{'id': 'a'}, {'id': 'b'}, {'id': 'c'}])
+
+    status_code, body = delete_items_batch(['a', 'missing', 'b', 42, 'a'])
+    assert status_code == 207
+    assert [r['status'] for r in body['results']] == [200, 404, 200, 400, 200]
+    assert body['deleted'] == 2
+    assert body['missing'] == 1
+    assert [doc['id'] for doc in mongodb_collection.find()] == ['c']
+
+    status_code, body = delete_items_batch(['c'])
+    assert status_code == 200
+    assert mongodb_collection.count_documents({}) == 0
+
+def test_async_batches(mongomock_bulk_updates, monkeypatch):
+    async def get_coordinates_many(postcodes):
+        return {str(postcode): COORDINATES[str(postcode)] for postcode in postcodes}
+    monkeypatch.setattr(async_batch, 'get_coordinates_many', get_coordinates_many)
+    # The Motor implementations do the writes; the sync backend is never used
+    monkeypatch.setattr(storage, 'get_backend', lambda: pytest.fail("sync storage used"))
+    collection = AsyncMongoMockClient().items_db.items
+    async_mongo_utils.set_mongo_collection(collection)
+
+    async def scenario():
+        status_code, body = await async_batch.create_items_batch([new_item('First', '10001'), new_item('Unknown', '00000')])
+        assert (status_code, body['created']) == (207, 1)
+        item_id = body['results'][0]['item']['id']
+
+        status_code, body = await async_batch.update_items_batch([{'id': item_id, 'postcode': '90210'}, {'id': 'missing'}])
+        assert status_code == 207
+        assert [r['status'] for r in body['results']] == [200, 404]
+        assert (await collection.find_one({'id': item_id}))['directionFromNY'] == 'SW'
+
+        status_code, body = await async_batch.delete_items_batch([item_id, 42])
+        assert [r['status'] for r in body['results']] == [200, 400]
+        assert await collection.count_documents({}) == 0
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        async_mongo_utils.set_mongo_collection(None)
+
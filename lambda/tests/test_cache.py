@@ -0,0 +1,144 @@
+import asyncio
+import threading
+import time
+import pytest
+from shared.cache import TTLCache, SingleFlight, AsyncSingleFlight
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+def test_get_and_set(clock):
+    cache = TTLCache(max_entries=10, ttl=60, clock=clock)
+    assert cache.get('a') is None
+    assert cache.get('a', 'default') == 'default'
+
+    cache.set('a', 1)
+    cache.set('b', None)
+    assert cache.get('a') == 1
+    assert cache.get('b', 'default') is None  # Cached None is distinct from a miss
+
+    cache.delete('a')
+    assert cache.get('a') is None
+    assert cache.stats() == {'hits': 2, 'misses': 3, 'evictions': 0, 'size': 1}
+
+def test_expiry(clock):
+    cache = TTLCache(max_entries=10, ttl=60, clock=clock)
+    cache.set('a', 1)
+    cache.set('b', 2, ttl=5)
+
+    clock.now = 10
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+
+    clock.now = 61
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+def test_lru_eviction(clock):
+    cache = TTLCache(max_entries=2, ttl=60, clock=clock)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')  # 'b' is now least recently used
+    cache.set('c', 3)
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert cache.stats()['evictions'] == 1
+
+def test_disabled_and_clear(clock):
+    cache = TTLCache(max_entries=0, clock=clock)
+    cache.set('a', 1)
+    assert cache.get('a') is None
+
+    cache = TTLCache(max_entries=2, clock=clock)
+    cache.set('a', 1)
+    cache.get('a')
+    cache.clear()
+    assert cache.stats() == {'hits': 0, 'misses': 0, 'evictions': 0, 'size': 0}
+
+def test_single_flight():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    results = []
+
+    def slow():
+        started.set()
+        release.wait(timeout=5)
+        return 'value'
+
+    leader = threading.Thread(target=lambda: results.append(flight.do('key', slow)))
+    leader.start()
+    started.wait(timeout=5)
+    followers = [
+        threading.Thread(target=lambda: results.append(flight.do('key', lambda: 'other')))
+        for _ in range(3)
+    ]
+    for thread in followers:
+        thread.start()
+    # Let every follower join the call in flight before it returns, giving up after 5s
+    deadline = time.monotonic() + 5
+    while flight.stats()['saved'] < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(timeout=5)
+
+    assert results == ['value'] * 4
+    assert flight.stats() == {'calls': 1, 'saved': 3, 'in_flight': 0}
+
+    # Once the call finishes the next one runs again
+    assert flight.do('key', lambda: 'fresh') == 'fresh'
+
+    # Errors are raised to the caller and not remembered
+    def fail():
+        raise ValueError('boom')
+
+    with pytest.raises(ValueError):
+        flight.do('key', fail)
+    assert flight.do('key', lambda: 'ok') == 'ok'
+
+    flight.reset()
+    assert flight.stats() == {'calls': 0, 'saved': 0, 'in_flight': 0}
+
+def test_async_single_flight():
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def slow(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        return value
+
+    async def fail():
+        raise ValueError('boom')
+
+    async def scenario():
+        results = await asyncio.gather(*(flight.do('key', lambda i=i: slow(i)) for i in range(5)))
+        assert results == [0] * 5
+        assert flight.stats() == {'calls': 1, 'saved': 4, 'in_flight': 0}
+
+        # Errors reach every waiter and are not remembered
+        outcomes = await asyncio.gather(flight.do('key', fail), flight.do('key', fail), return_exceptions=True)
+        assert all(isinstance(outcome, ValueError) for outcome in outcomes)
+        assert await flight.do('key', lambda: slow('next')) == 'next'
+
+        # Cancelling one waiter leaves the shared call running for the others
+        leader = asyncio.ensure_future(flight.do('other', lambda: slow('shared')))
+        follower = asyncio.ensure_future(flight.do('other', lambda: slow('unused')))
+        await asyncio.sleep(0)
+        leader.cancel()
+        assert await follower == 'shared'
+        assert flight.stats()['in_flight'] == 0
+
+    asyncio.run(scenario())
+    assert calls == [0, 'next', 'shared']
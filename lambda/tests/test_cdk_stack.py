@@ -0,0 +1,95 @@
+import json
+import os
+import sys
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(ROOT)
+
+import pytest
+import shared.dynamo_utils as dynamo_utils
+
+cdk = pytest.importorskip('aws_cdk')
+from aws_cdk.assertions import Template
+
+# Index name -> (attribute, key type) pairs that dynamo_utils._query_plan relies on
+INDEX_KEYS = {
+    dynamo_utils.POSTCODE_INDEX: [('postcode', 'HASH'), ('id', 'RANGE')],
+    dynamo_utils.DIRECTION_INDEX: [('directionFromNY', 'HASH'), ('startDate', 'RANGE')],
+    dynamo_utils.DISTANCE_INDEX: [(dynamo_utils.DISTANCE_BUCKET, 'HASH'), ('distanceFromNY', 'RANGE')]
+}
+
+@pytest.fixture(scope='module')
+def template():
+    from cdk_stack import ItemAPIStack
+    return Template.from_stack(ItemAPIStack(cdk.App(), 'TestStack'))
+
+def items_table(template):
+    tables = [table for logical_id, table in template.find_resources('AWS::DynamoDB::Table').items()
+              if logical_id.startswith('ItemsTable')]
+    assert len(tables) == 1
+    return tables[0]['Properties']
+
+def test_items_table_indexes(template):
+    table = items_table(template)
+    assert table['KeySchema'] == [{'AttributeName': 'id', 'KeyType': 'HASH'}]
+    indexes = {index['IndexName']: index for index in table['GlobalSecondaryIndexes']}
+    assert set(indexes) == set(INDEX_KEYS)
+    for name, keys in INDEX_KEYS.items():
+        assert [(key['AttributeName'], key['KeyType']) for key in indexes[name]['KeySchema']] == keys
+        assert indexes[name]['Projection'] == {'ProjectionType': 'ALL'}
+
+    types = {attribute['AttributeName']: attribute['AttributeType'] for attribute in table['AttributeDefinitions']}
+    assert types == {'id': 'S', 'postcode': 'S', 'directionFromNY': 'S', 'startDate': 'S',
+                     dynamo_utils.DISTANCE_BUCKET: 'N', 'distanceFromNY': 'N'}
+
+def test_items_table_indexes_are_added_one_per_deployment():
+    # CloudFormation creates one GSI per table update, so they are rolled out in stages
+    from cdk_stack import ItemAPIStack
+    staged = Template.from_stack(ItemAPIStack(cdk.App(context={'itemsTableIndexes': 1}), 'StagedStack'))
+    indexes = items_table(staged)['GlobalSecondaryIndexes']
+    assert [index['IndexName'] for index in indexes] == [dynamo_utils.POSTCODE_INDEX]
+    for function in staged.find_resources('AWS::Lambda::Function').values():
+        variables = function['Properties'].get('Environment', {}).get('Variables', {})
+        if 'ITEMS_TABLE' in variables:
+            assert variables['ITEMS_TABLE_INDEXES'] == dynamo_utils.POSTCODE_INDEX
+
+def test_moto_table_matches_stack(template, moto_table):
+    # The tests' table must have the indexes the stack deploys
+    indexes = {index['IndexName']: index for index in items_table(template)['GlobalSecondaryIndexes']}
+    for index in moto_table.global_secondary_indexes:
+        assert index['KeySchema'] == indexes[index['IndexName']]['KeySchema']
+    assert len(moto_table.global_secondary_indexes) == len(indexes)
+
+def item_functions(template):
+    """Properties of the functions running this repo's handlers, not of CDK's own providers"""
+    functions = template.find_resources('AWS::Lambda::Function').values()
+    return [function['Properties'] for function in functions
+            if os.path.exists(os.path.join(ROOT, 'lambda', function['Properties'].get('Handler', '').split('.')[0] + '.py'))]
+
+def test_functions_use_the_items_table(template):
+    functions = item_functions(template)
+    assert len(functions) >= 12
+    for function in functions:
+        variables = function['Environment']['Variables']
+        assert variables['STORAGE_BACKEND'] == 'dynamodb'
+        assert 'ITEMS_TABLE' in variables
+        assert 'COUNTERS_TABLE' in variables
+        assert int(variables['COUNTER_SHARDS']) <= dynamo_utils.BATCH_GET_SIZE
+
+def test_backfill_runs_at_deploy_time(template):
+    handlers = [function['Handler'] for function in item_functions(template)]
+    assert 'backfill_items.handler' in handlers
+    assert template.find_resources('Custom::Trigger')
+
+def test_backfill_can_write_both_tables(template):
+    # The backfill bumps the collection version in the counters table after updating items
+    policies = [policy['Properties']['PolicyDocument'] for logical_id, policy in template.find_resources('AWS::IAM::Policy').items()
+                if logical_id.startswith('BackfillItemsFunction')]
+    resources = json.dumps([statement['Resource'] for policy in policies for statement in policy['Statement']])
+    for table in ('ItemsTable', 'CountersTable'):
+        logical_id = next(name for name in template.find_resources('AWS::DynamoDB::Table') if name.startswith(table))
+        assert logical_id in resources
+
+def test_change_records_expire(template):
+    tables = [table['Properties'] for logical_id, table in template.find_resources('AWS::DynamoDB::Table').items()
+              if logical_id.startswith('CountersTable')]
+    assert tables[0]['TimeToLiveSpecification'] == {'AttributeName': 'expiresAt', 'Enabled': True}
@@ -1,7 +1,8 @@
 import os
+import threading
 import pytest
 from unittest.mock import patch, MagicMock
-from moto import mock_aws
+from decimal import Decimal
 
 # Set required environment variables for testing
 os.environ['AWS_DEFAULT_REGION'] = 'us-east-1'
@@ -11,11 +12,20 @@ os.environ['ITEMS_TABLE'] = 'test-items-table'
 
 from shared.dynamo_utils import (
     get_all_items,
+    get_items_page,
     get_item,
     create_item,
+    create_items,
     update_item,
-    delete_item
+    update_items,
+    get_item_version,
+    delete_item,
+    delete_items,
+    get_items_by_ids,
+    put_items
 )
+import shared.dynamo_utils as dynamo_utils
+from shared.validation import encode_page_token, decode_page_token
 
 @pytest.fixture
 def mock_table():
@@ -48,6 +58,33 @@ def test_get_all_items(mock_table):
     items = get_all_items()
     assert items == []
 
+def test_get_all_items_follows_last_evaluated_key(mock_table):
+    mock_table.return_value.scan.side_effect = [
+        {'Items': [{'id': '1'}], 'LastEvaluatedKey': {'id': '1'}},
+        {'Items': [{'id': '2'}], 'LastEvaluatedKey': {'id': '2'}},
+        {'Items': [{'id': '3'}]}
+    ]
+
+    items = get_all_items()
+    assert [item['id'] for item in items] == ['1', '2', '3']
+    assert mock_table.return_value.scan.call_count == 3
+    assert mock_table.return_value.scan.call_args_list[1][1] == {'ExclusiveStartKey': {'id': '1'}}
+
+def test_get_items_page(mock_table):
+    mock_table.return_value.scan.return_value = {
+        'Items': [{'id': '1'}, {'id': '2'}],
+        'LastEvaluatedKey': {'id': '2'}
+    }
+    items, next_key = get_items_page(2)
+    assert len(items) == 2
+    assert next_key == {'id': '2'}
+    mock_table.return_value.scan.assert_called_with(Limit=2)
+
+    mock_table.return_value.scan.return_value = {'Items': [{'id': '3'}]}
+    items, next_key = get_items_page(2, after={'id': '2'})
+    assert next_key is None
+    mock_table.return_value.scan.assert_called_with(Limit=2, ExclusiveStartKey={'id': '2'})
+
 def test_get_item(mock_table, sample_item):
     # Test successful get
     mock_table.return_value.get_item.return_value = {'Item': sample_item}
@@ -60,17 +97,44 @@ def test_get_item(mock_table, sample_item):
     item = get_item('non-existent')
     assert item is None
 
+def test_sparse_fields(mock_table):
+    mock_table.return_value.get_item.return_value = {'Item': {'id': 'test-id', 'name': 'Test Item'}}
+    get_item('test-id', ['name', 'id', 'description'])
+    mock_table.return_value.get_item.assert_called_with(
+        Key={'id': 'test-id'},
+        ProjectionExpression='#f0, #f1, #f2',
+        ExpressionAttributeNames={'#f0': 'id', '#f1': 'name', '#f2': 'description'}
+    )
+
+    mock_table.return_value.scan.return_value = {'Items': []}
+    get_items_page(10, fields=['name'])
+    mock_table.return_value.scan.assert_called_with(
+        Limit=10,
+        ProjectionExpression='#f0, #f1',
+        ExpressionAttributeNames={'#f0': 'id', '#f1': 'name'}
+    )
+
 def test_create_item(mock_table, sample_item):
     create_item(sample_item)
-    mock_table.return_value.put_item.assert_called_with(Item=sample_item)
+    mock_table.return_value.put_item.assert_called_with(
+        Item=sample_item, ConditionExpression='attribute_not_exists(#id)', ExpressionAttributeNames={'#id': 'id'})
+    assert sample_item['version'] == 1
+    assert sample_item['updatedAt'].endswith('Z')
+
+def test_create_items(moto_table, sample_item):
+    other = {**sample_item, 'id': 'other-id'}
+    assert create_items([sample_item, other]) == [None, None]
+    assert get_item('other-id')['version'] == 1
+    assert get_item(sample_item['id'])['name'] == sample_item['name']
 
 def test_update_item(mock_table):
     updates = {
         'name': 'Updated Name',
         'description': 'Updated Description'
     }
+    mock_table.return_value.update_item.return_value = {'Attributes': {'id': 'test-id', **updates}}
 
-    update_item('test-id', updates)
+    assert update_item('test-id', updates) == {'id': 'test-id', **updates}
 
     mock_table.return_value.update_item.assert_called_once()
     call_args = mock_table.return_value.update_item.call_args[1]
@@ -80,7 +144,481 @@ def test_update_item(mock_table):
     assert '#description' in call_args['ExpressionAttributeNames']
     assert ':name' in call_args['ExpressionAttributeValues']
     assert ':description' in call_args['ExpressionAttributeValues']
+    assert call_args['ConditionExpression'] == 'attribute_exists(#id) AND (#name <> :name OR #description <> :description)'
+    assert call_args['UpdateExpression'].endswith('#updatedAt = :updatedAt ADD #version :one')
+    assert call_args['ReturnValues'] == 'ALL_NEW'
+
+def test_update_missing_item(mock_table):
+    class ConditionalCheckFailedException(Exception):
+        pass
+
+    mock_table.return_value.meta.client.exceptions.ConditionalCheckFailedException = ConditionalCheckFailedException
+    mock_table.return_value.update_item.side_effect = ConditionalCheckFailedException()
+    mock_table.return_value.get_item.return_value = {}
+    assert update_item('missing-id', {'name': 'Updated Name'}) is None
+
+def test_versions(moto_table):
+    item = {'id': 'item-1', 'name': 'Item'}
+    create_item(item)
+    assert get_item_version('item-1')[0] == 1
+
+    updated = update_item('item-1', {'name': 'Renamed', 'version': 99})
+    assert updated['version'] == 2
+    assert updated['updatedAt'] > item['updatedAt']
+
+    # A no-op update keeps the version
+    assert update_item('item-1', {'name': 'Renamed'})['version'] == 2
+    assert get_item_version('item-1')[0] == 2
+    assert get_item_version('missing') is None
+
+def test_collection_version_counts_writes(moto_table):
+    assert dynamo_utils.get_collection_version() == 0
+    create_item({'id': 'item-1', 'name': 'Item'})
+    update_item('item-1', {'name': 'Renamed'})
+    # Neither a no-op nor a missing item is a write
+    update_item('item-1', {'name': 'Renamed'})
+    assert dynamo_utils.delete_item('missing') is False
+    assert dynamo_utils.get_collection_version() == 2
+    dynamo_utils.delete_item('item-1')
+    assert dynamo_utils.get_collection_version() == 3
+
+def test_collection_version_is_spread_over_counter_shards(moto_table, monkeypatch):
+    monkeypatch.setattr(dynamo_utils, 'COUNTER_SHARDS', 4)
+    monkeypatch.setattr(dynamo_utils, 'INDEX_REFRESH_SECONDS', 0)
+    assert dynamo_utils.search_items('red')[0] == []
+    for i in range(20):
+        create_item({'id': f'item-{i:02d}', 'name': 'Red bike'})
+    assert dynamo_utils.get_collection_version() == 20
+    counts = dynamo_utils._read_counters()
+    assert sum(counts) == 20 and sum(1 for count in counts if count) > 1
+
+    # Another function's writes are found on whichever shard counted them
+    moto_table.delete_item(Key={'id': 'item-00'})
+    dynamo_utils._count_write(['item-00'])
+    assert len(dynamo_utils.search_items('red', limit=100)[0]) == 19
+
+def test_writes_succeed_when_counting_fails(moto_table):
+    counters = dynamo_utils.get_counters_table()
+    with patch.object(counters, 'update_item', side_effect=Exception("Throttled")):
+        create_item({'id': 'item-1', 'name': 'Item'})
+        assert update_item('item-1', {'name': 'Renamed'})['version'] == 2
+        assert delete_item('item-1') is True
+    assert dynamo_utils.get_collection_version() == 0
+    # A record that cannot be put leaves the write counted
+    with patch.object(counters, 'put_item', side_effect=Exception("Throttled")):
+        create_item({'id': 'item-2', 'name': 'Item'})
+    assert dynamo_utils.get_collection_version() == 1
+
+def test_in_process_indexes_see_other_functions_writes(moto_table, monkeypatch):
+    monkeypatch.setattr(dynamo_utils, 'INDEX_REFRESH_SECONDS', 0)
+    builds = []
+    get_all_items = dynamo_utils.get_all_items
+    monkeypatch.setattr(dynamo_utils, 'get_all_items', lambda: builds.append(1) or get_all_items())
+    reads = []
+    batch_get = dynamo_utils._batch_get
+    monkeypatch.setattr(dynamo_utils, '_batch_get', lambda ids, fields=None: reads.append(ids) or batch_get(ids, fields))
+
+    create_item({'id': 'a', 'name': 'Red bike', 'latitude': 40.7, 'longitude': -74.0})
+    create_item({'id': 'x', 'name': 'Blue chair'})
+    assert [item['id'] for item in dynamo_utils.search_items('red')[0]] == ['a']
+    # This function's own writes keep its index current without a rebuild
+    create_item({'id': 'b', 'name': 'Red lamp', 'latitude': 34.1, 'longitude': -118.4})
+    assert [item['id'] for item in dynamo_utils.search_items('red')[0]] == ['a', 'b']
+    assert len(builds) == 1
+
+    # Other functions write the table and record what they changed; only those items are read again
+    moto_table.put_item(Item={'id': 'c', 'name': 'Red kettle', 'version': 1})
+    dynamo_utils._count_write(['c'])
+    moto_table.delete_item(Key={'id': 'a'})
+    dynamo_utils._count_write(['a'])
+    reads.clear()
+    assert [item['id'] for item in dynamo_utils.search_items('red')[0]] == ['b', 'c']
+    assert reads == [['a', 'c']]
+    assert len(builds) == 1
+
+    # A write whose record never appears is applied by a rebuild once the grace period is over
+    moto_table.put_item(Item={'id': 'd', 'name': 'Red mug', 'version': 1})
+    with patch.object(dynamo_utils.get_counters_table(), 'put_item', side_effect=Exception("Throttled")):
+        dynamo_utils._count_write(['d'])
+    assert [item['id'] for item in dynamo_utils.search_items('red')[0]] == ['b', 'c']
+    monkeypatch.setattr(dynamo_utils, 'CHANGE_LOG_GRACE_SECONDS', 0)
+    assert [item['id'] for item in dynamo_utils.search_items('red')[0]] == ['b', 'c', 'd']
+    assert len(builds) == 2
+
+    # So is a backlog of more than INDEX_MAX_CHANGES writes
+    monkeypatch.setattr(dynamo_utils, 'INDEX_MAX_CHANGES', 1)
+    dynamo_utils._count_write(['b'])
+    dynamo_utils._count_write(['c'])
+    dynamo_utils.search_items('red')
+    assert len(builds) == 3
+
+    # Until INDEX_REFRESH_SECONDS have passed the index is not checked
+    monkeypatch.setattr(dynamo_utils, 'INDEX_REFRESH_SECONDS', 3600)
+    dynamo_utils.find_items_near(34.1, -118.4)
+    moto_table.delete_item(Key={'id': 'b'})
+    dynamo_utils._count_write(['b'])
+    assert [item['id'] for item in dynamo_utils.find_items_near(34.1, -118.4, limit=1)] == ['b']
+
+def test_in_process_index_is_refreshed_by_one_thread(moto_table, monkeypatch):
+    monkeypatch.setattr(dynamo_utils, 'INDEX_REFRESH_SECONDS', 0)
+    create_item({'id': 'a', 'name': 'Red bike'})
+    building = threading.Event()
+    release = threading.Event()
+    builds = []
+    get_all_items = dynamo_utils.get_all_items
+
+    def slow_get_all_items():
+        builds.append(1)
+        building.set()
+        assert release.wait(5)
+        return get_all_items()
+
+    monkeypatch.setattr(dynamo_utils, 'get_all_items', slow_get_all_items)
+    # Threads needing a first build wait for the one that is building
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(dynamo_utils.search_items('red')[0])) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    assert building.wait(5)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert [[item['id'] for item in items] for items in results] == [['a']] * 4
+    assert len(builds) == 1
+
+    # While one thread refreshes, the others answer from the index they have
+    building.clear()
+    release.clear()
+    monkeypatch.setattr(dynamo_utils, 'CHANGE_LOG_GRACE_SECONDS', 0)
+    with patch.object(dynamo_utils.get_counters_table(), 'put_item', side_effect=Exception("Throttled")):
+        dynamo_utils._count_write(['a'])
+    refresher = threading.Thread(target=lambda: dynamo_utils.search_items('red'))
+    refresher.start()
+    assert building.wait(5)
+    assert [item['id'] for item in dynamo_utils.search_items('red')[0]] == ['a']
+    release.set()
+    refresher.join(5)
+    assert len(builds) == 2
 
 def test_delete_item(mock_table):
-    delete_item('test-id')
-    mock_table.return_value.delete_item.assert_called_with(Key={'id': 'test-id'})
\ No newline at end of file
+    mock_table.return_value.delete_item.return_value = {'Attributes': {'id': 'test-id'}}
+    assert delete_item('test-id') is True
+    mock_table.return_value.delete_item.assert_called_with(Key={'id': 'test-id'}, ReturnValues='ALL_OLD')
+
+    # Nothing was deleted
+    mock_table.return_value.delete_item.return_value = {}
+    assert delete_item('test-id') is False
+
+def test_update_and_delete_items(moto_table):
+    for i in range(150):
+        moto_table.put_item(Item={'id': f'item-{i}', 'name': f'Item {i}'})
+
+    updates = {f'item-{i}': {'name': 'Renamed'} for i in range(120)}
+    updates['item-140'] = {'name': 'Item 140'}
+    updates['missing'] = {'name': 'Ghost'}
+    assert update_items(updates) == {'matched': 121, 'modified': 120, 'missing': ['missing'], 'failed': {}}
+    assert moto_table.get_item(Key={'id': 'item-119'})['Item']['name'] == 'Renamed'
+    assert moto_table.get_item(Key={'id': 'item-119'})['Item']['version'] == 1
+    assert moto_table.get_item(Key={'id': 'item-120'})['Item']['name'] == 'Item 120'
+    assert 'version' not in moto_table.get_item(Key={'id': 'item-140'})['Item']
+    assert 'Item' not in moto_table.get_item(Key={'id': 'missing'})
+
+    ids = [f'item-{i}' for i in range(0, 150, 2)] + ['missing']
+    assert delete_items(ids) == {'deleted': 75, 'missing': ['missing'], 'failed': {}}
+    assert moto_table.scan(Select='COUNT')['Count'] == 75
+
+def test_update_items_merges_in_place_and_reports_failures(moto_table, monkeypatch):
+    moto_table.put_item(Item={'id': 'a', 'name': 'A', 'users': ['Ann'], 'version': 4})
+    moto_table.put_item(Item={'id': 'b', 'name': 'B', 'version': 1})
+    monkeypatch.setattr(dynamo_utils, 'BATCH_CONCURRENCY', 1)
+    update = moto_table.update_item
+
+    def concurrent(**kwargs):
+        if kwargs['Key']['id'] == 'b':
+            raise moto_table.meta.client.exceptions.ProvisionedThroughputExceededException(
+                {'Error': {'Code': 'ProvisionedThroughputExceededException', 'Message': 'Throttled'}}, 'UpdateItem')
+        if kwargs['Key']['id'] == 'a':
+            # Another writer changes the item just before this update lands
+                update(Key={'id': 'a'}, UpdateExpression='SET #users = :users, #version = :version',
+                   ExpressionAttributeNames={'#users': 'users', '#version': 'version'},
+                   ExpressionAttributeValues={':users': ['Bob'], ':version': 5})
+        return update(**kwargs)
+    monkeypatch.setattr(moto_table, 'update_item', concurrent)
+
+    outcome = update_items({'a': {'name': 'Renamed'}, 'b': {'name': 'Bee'}, 'missing': {'name': 'Ghost'}})
+    assert outcome['matched'] == 1 and outcome['modified'] == 1 and outcome['missing'] == ['missing']
+    assert list(outcome['failed']) == ['b'] and 'Throttled' in outcome['failed']['b']
+    a = moto_table.get_item(Key={'id': 'a'})['Item']
+    assert (a['name'], a['users'], a['version']) == ('Renamed', ['Bob'], 6)
+    assert moto_table.get_item(Key={'id': 'b'})['Item']['name'] == 'B'
+
+FILTER_ITEMS = [
+    {'id': f'item-{i}', 'postcode': ['10001', '90210'][i % 2], 'directionFromNY': ['NE', 'SW', 'NW'][i % 3],
+     'startDate': f'2025-0{1 + i % 9}-01T00:00:00Z', 'users': [f'user-{i % 4}', 'everyone'],
+     'distanceFromNY': Decimal(str(i * 100.5))}
+    for i in range(30)
+]
+
+@pytest.mark.parametrize('filters, operation', [
+    ({'postcode': '10001'}, 'query'),
+    ({'postcode': '90210', 'directionFromNY': 'SW', 'user': 'user-1'}, 'query'),
+    ({'directionFromNY': 'NE'}, 'query'),
+    ({'directionFromNY': 'NW', 'startDateFrom': '2025-03-01', 'startDateTo': '2025-07-01'}, 'query'),
+    ({'user': 'user-2'}, 'scan'),
+    ({'startDateFrom': '2025-05-01'}, 'scan'),
+    ({'minDistance': 500.0, 'maxDistance': 1500.25}, 'query'),
+    ({'maxDistance': 700.0, 'user': 'user-1'}, 'query'),
+    ({'minDistance': 1000.0, 'startDateFrom': '2025-06-01'}, 'query')
+])
+def test_filters(moto_table, filters, operation):
+    put_items([dict(item) for item in FILTER_ITEMS])
+
+    def matches(item):
+        return (
+            filters.get('postcode', item['postcode']) == item['postcode']
+            and filters.get('directionFromNY', item['directionFromNY']) == item['directionFromNY']
+            and filters.get('user', 'everyone') in item['users']
+            and filters.get('startDateFrom', '') <= item['startDate'] <= filters.get('startDateTo', '9999')
+            and filters.get('minDistance', 0) <= item['distanceFromNY'] <= filters.get('maxDistance', 10 ** 6)
+        )
+    expected = sorted(item['id'] for item in FILTER_ITEMS if matches(item))
+    assert expected
+
+    assert dynamo_utils._query_plan(filters)[0] == operation
+    assert sorted(item['id'] for item in dynamo_utils.iter_items(filters=filters)) == expected
+    # Queries ignore segments; scans split into them
+    assert sorted(item['id'] for item in dynamo_utils.iter_items(filters=filters, segments=4)) == expected
+
+    ids, next_key = [], None
+    while True:
+        items, next_key = get_items_page(4, after=next_key, fields=['postcode'], filters=filters)
+        ids.extend(item['id'] for item in items)
+        if next_key is None:
+            break
+    assert sorted(ids) == expected
+
+def test_filters_on_undeployed_indexes_scan(moto_table, monkeypatch):
+    # While the GSIs are rolled out, a filter on one that is not there yet is a scan filter
+    put_items([dict(item) for item in FILTER_ITEMS])
+    monkeypatch.setattr(dynamo_utils, 'DEPLOYED_INDEXES', frozenset([dynamo_utils.POSTCODE_INDEX]))
+    filters = {'directionFromNY': 'NE', 'minDistance': 500.0}
+    assert dynamo_utils._query_plan(filters)[0] == 'scan'
+    expected = sorted(item['id'] for item in FILTER_ITEMS
+                      if item['directionFromNY'] == 'NE' and item['distanceFromNY'] >= 500)
+    assert sorted(item['id'] for item in dynamo_utils.iter_items(filters=filters)) == expected
+    assert dynamo_utils._query_plan({'postcode': '10001'})[0] == 'query'
+
+    monkeypatch.setattr(dynamo_utils, 'DEPLOYED_INDEXES', frozenset())
+    filters = {'postcode': '10001', 'user': 'user-2'}
+    assert dynamo_utils._query_plan(filters)[0] == 'scan'
+    assert sorted(item['id'] for item in dynamo_utils.iter_items(filters=filters)) == sorted(
+        item['id'] for item in FILTER_ITEMS if item['postcode'] == '10001' and 'user-2' in item['users'])
+
+@pytest.mark.parametrize('segments', [1, 3, 16])
+def test_parallel_scan_reads_every_item_once(moto_table, segments):
+    # ~3 MB, so every segment has to follow LastEvaluatedKey
+    padding = 'x' * 5000
+    with moto_table.batch_writer() as batch:
+        for i in range(600):
+            batch.put_item(Item={'id': f'item-{i:03d}', 'name': f'Item {i}', 'padding': padding})
+
+    ids = [item['id'] for item in dynamo_utils.iter_items(segments=segments)]
+    assert len(ids) == 600
+    assert sorted(ids) == [f'item-{i:03d}' for i in range(600)]
+    assert get_all_items(['name'], segments=segments)[0].keys() == {'id', 'name'}
+
+def test_parallel_scan_errors_and_early_exit(moto_table):
+    with moto_table.batch_writer() as batch:
+        for i in range(200):
+            batch.put_item(Item={'id': f'item-{i:03d}'})
+
+    with pytest.raises(ValueError):
+        list(dynamo_utils.iter_items(segments=0))
+
+    # A worker error reaches the consumer
+    table = MagicMock()
+    table.scan.side_effect = [{'Items': [{'id': 'a'}]}, RuntimeError('throttled')] * 4
+    with patch.object(dynamo_utils, '_thread_table', return_value=table):
+        with pytest.raises(RuntimeError):
+            list(dynamo_utils.iter_items(segments=2))
+
+    # Abandoning a scan releases its workers, so a scan using every worker still completes
+    items = dynamo_utils.iter_items(segments=dynamo_utils.MAX_SCAN_SEGMENTS)
+    next(items)
+    items.close()
+    result = []
+    reader = threading.Thread(target=lambda: result.extend(dynamo_utils.iter_items(segments=dynamo_utils.MAX_SCAN_SEGMENTS)))
+    reader.start()
+    reader.join(timeout=30)
+    assert not reader.is_alive()
+    assert len(result) == 200
+
+def test_scan_benchmark_runs():
+    from benchmarks.bench_scan import run
+    results = run(items=50, segment_counts=(1, 4))
+    assert results['single_call'] == 50
+    assert [r['count'] for r in results['segments'].values()] == [50, 50]
+
+def test_batch_chunks_run_concurrently(moto_table, monkeypatch):
+    monkeypatch.setattr(dynamo_utils, 'BATCH_CONCURRENCY', 3)
+    monkeypatch.setattr(dynamo_utils, '_batch_pool', None)
+    threads = set()
+    send = dynamo_utils._send_batch
+    def record(*args):
+        threads.add(threading.current_thread().name)
+        return send(*args)
+    monkeypatch.setattr(dynamo_utils, '_send_batch', record)
+
+    # 11 BatchWriteItem chunks, replacing an existing item
+    moto_table.put_item(Item={'id': 'item-000', 'name': 'First'})
+    put_items([{'id': 'item-000', 'name': 'Last'}]
+              + [{'id': f'item-{i:03d}', 'name': f'Item {i}', 'distanceFromNY': i / 2} for i in range(1, 260)])
+    assert len(threads) > 1 and all(name.startswith('dynamo-batch') for name in threads)
+    assert moto_table.scan(Select='COUNT')['Count'] == 260
+
+    # 3 BatchGetItem chunks, in request order with repeats and missing ids
+    ids = [f'item-{i:03d}' for i in range(259, -1, -1)] + ['missing', 'item-007']
+    items = get_items_by_ids(ids, fields=['name'])
+    assert [item and item['id'] for item in items] == ids[:-2] + [None, 'item-007']
+    assert items[259] == {'id': 'item-000', 'name': 'Last'}
+
+    assert delete_items([f'item-{i:03d}' for i in range(100)] + ['missing']) == {'deleted': 100, 'missing': ['missing'], 'failed': {}}
+    assert moto_table.scan(Select='COUNT')['Count'] == 160
+    assert get_items_by_ids([]) == []
+
+def test_batch_write_failures_are_reported_per_item(moto_table, monkeypatch):
+    put_items([{'id': f'item-{i:02d}', 'name': f'Item {i}'} for i in range(60)])
+    with pytest.raises(ValueError, match='item-01'):
+        put_items([{'id': 'item-01'}, {'id': 'item-02'}, {'id': 'item-01'}])
+    dynamo_utils.search_items('item')
+
+    # The BatchWriteItem request holding item-30 fails; the other two go ahead
+    send = dynamo_utils._send_batch
+    def fail_one_chunk(submit, request_items, unprocessed_key):
+        if unprocessed_key == 'UnprocessedItems' and {'DeleteRequest': {'Key': {'id': 'item-30'}}} in request_items[moto_table.name]:
+            raise RuntimeError('Throttled')
+        return send(submit, request_items, unprocessed_key)
+    monkeypatch.setattr(dynamo_utils, '_send_batch', fail_one_chunk)
+
+    result = delete_items([f'item-{i:02d}' for i in range(60)] + ['missing'])
+    failed = {f'item-{i:02d}' for i in range(25, 50)}
+    assert result == {'deleted': 35, 'missing': ['missing'], 'failed': dict.fromkeys(failed, 'Throttled')}
+    assert sorted(item['id'] for item in moto_table.scan()['Items']) == sorted(failed)
+    # Only the deleted items leave the in-process index
+    assert sorted(item['id'] for item in dynamo_utils.search_items('item', limit=100)[0]) == sorted(failed)
+
+@patch('shared.dynamo_utils.time.sleep')
+def test_batch_retries_unprocessed_with_backoff(mock_sleep, monkeypatch):
+    table_name = 'test-items-table'
+    table = MagicMock()
+    table.name = table_name
+    monkeypatch.setattr(dynamo_utils, 'get_table', lambda: table)
+    resource = MagicMock()
+    monkeypatch.setattr(dynamo_utils, 'dynamodb', resource)
+
+    unprocessed = lambda *ids: {table_name: {'Keys': [{'id': item_id} for item_id in ids]}}
+    resource.batch_get_item.side_effect = [
+        {'Responses': {table_name: [{'id': 'a'}]}, 'UnprocessedKeys': unprocessed('b', 'c')},
+        {'Responses': {table_name: []}, 'UnprocessedKeys': unprocessed('b', 'c')},
+        {'Responses': {table_name: [{'id': 'b'}, {'id': 'c'}]}, 'UnprocessedKeys': {}}
+    ]
+    assert get_items_by_ids(['c', 'a', 'b']) == [{'id': 'c'}, {'id': 'a'}, {'id': 'b'}]
+    assert resource.batch_get_item.call_args[1]['RequestItems'] == unprocessed('b', 'c')
+    # Full jitter under a cap that doubles per retry
+    delays = [call[0][0] for call in mock_sleep.call_args_list]
+    assert len(delays) == 2
+    assert delays[0] <= dynamo_utils.BATCH_BASE_DELAY and delays[1] <= 2 * dynamo_utils.BATCH_BASE_DELAY
+
+    # Items still unprocessed after every retry are an error
+    mock_sleep.reset_mock()
+    request = {'PutRequest': {'Item': {'id': 'a'}}}
+    resource.batch_write_item.return_value = {'UnprocessedItems': {table_name: [request]}}
+    with pytest.raises(RuntimeError):
+        put_items([{'id': 'a'}])
+    assert resource.batch_write_item.call_count == dynamo_utils.BATCH_MAX_RETRIES + 1
+    assert max(call[0][0] for call in mock_sleep.call_args_list) <= dynamo_utils.BATCH_MAX_DELAY
+
+def scanned_counts(table, monkeypatch):
+    """Items DynamoDB reads for each query and scan call on table, summed per operation"""
+    counts = {'query': 0, 'scan': 0}
+    def counting(operation):
+        read = getattr(table, operation)
+        def wrapper(**kwargs):
+            response = read(**kwargs)
+            counts[operation] += response['ScannedCount']
+            return response
+        return wrapper
+    for operation in counts:
+        monkeypatch.setattr(table, operation, counting(operation))
+    return counts
+
+@pytest.mark.parametrize('filters', [
+    {'postcode': '10001'},
+    {'directionFromNY': 'NW', 'startDateFrom': '2025-03-01', 'startDateTo': '2025-05-01'},
+    {'minDistance': 1200.0, 'maxDistance': 2600.0},
+    {'maxDistance': 300.0, 'user': 'user-2'}
+])
+def test_queries_read_fewer_items_than_scans(moto_table, monkeypatch, filters):
+    put_items([{**item, 'id': f'{item["id"]}-{copy}'} for copy in range(10) for item in FILTER_ITEMS])
+    counts = scanned_counts(moto_table, monkeypatch)
+
+    # Only items matching the index key are read, where a scan reads all 300
+    matching = list(dynamo_utils.iter_items(filters=filters))
+    assert matching and counts['scan'] == 0
+    assert len(matching) <= counts['query'] <= len(FILTER_ITEMS) * 10 / 2
+    if 'user' not in filters:
+        assert counts['query'] == len(matching)
+    read = counts['query']
+
+    counts['query'] = 0
+    seen, next_key = [], None
+    while True:
+        items, next_key = get_items_page(7, after=next_key, filters=filters)
+        seen += items
+        if next_key is None:
+            break
+    assert sorted(item['id'] for item in seen) == sorted(item['id'] for item in matching)
+    assert counts['scan'] == 0 and counts['query'] == read
+
+def test_distance_buckets(moto_table):
+    put_items([dict(item) for item in FILTER_ITEMS])
+
+    # Pages of a distance range come in distance order, across bucket boundaries
+    distances, next_key = [], None
+    while True:
+        items, next_key = get_items_page(4, after=next_key, filters={'minDistance': 300.0, 'maxDistance': 2100.0})
+        distances += [item['distanceFromNY'] for item in items]
+        if next_key is None:
+            break
+    assert distances == sorted(item['distanceFromNY'] for item in FILTER_ITEMS if 300 <= item['distanceFromNY'] <= 2100)
+
+    # A page that ends with its bucket resumes at the next bucket through a bucket cursor
+    filters = {'maxDistance': 1200.0}
+    first_bucket = [item for item in FILTER_ITEMS if item['distanceFromNY'] < dynamo_utils.DISTANCE_BUCKET_MILES]
+    items, next_key = get_items_page(len(first_bucket), filters=filters)
+    assert sorted(item['id'] for item in items) == sorted(item['id'] for item in first_bucket)
+    assert next_key == {'nextBucket': 1}
+    after = decode_page_token(encode_page_token(next_key))
+    dynamo_utils.check_page_key(after, filters)
+    items, _ = get_items_page(3, after=after, filters=filters)
+    assert [item['distanceFromNY'] for item in items] == [Decimal('502.5'), Decimal('603'), Decimal('703.5')]
+
+    # The bucket follows distance changes, is ignored when sent, and is never returned
+    update_item('item-1', {'distanceFromNY': 2400.5, dynamo_utils.DISTANCE_BUCKET: 0})
+    update_items({'item-2': {'distanceFromNY': 2450.0}})
+    assert moto_table.get_item(Key={'id': 'item-1'})['Item'][dynamo_utils.DISTANCE_BUCKET] == 4
+    near = [item['id'] for item in dynamo_utils.iter_items(filters={'minDistance': 2400.0})]
+    assert sorted(near) == ['item-1', 'item-2', 'item-24', 'item-25', 'item-26', 'item-27', 'item-28', 'item-29']
+    assert dynamo_utils.DISTANCE_BUCKET not in get_item('item-1')
+    assert all(dynamo_utils.DISTANCE_BUCKET not in item for item in get_all_items())
+
+def test_backfill_distance_buckets(moto_table):
+    # Items written before the index have no bucket, so distance queries miss them
+    for item in FILTER_ITEMS[:10]:
+        moto_table.put_item(Item=item)
+    moto_table.put_item(Item={'id': 'no-distance'})
+    assert list(dynamo_utils.iter_items(filters={'maxDistance': 300.0})) == []
+
+    assert dynamo_utils.backfill_distance_buckets() == 10
+    assert [item['id'] for item in dynamo_utils.iter_items(filters={'maxDistance': 300.0})] == ['item-0', 'item-1', 'item-2']
+    assert dynamo_utils.backfill_distance_buckets() == 0
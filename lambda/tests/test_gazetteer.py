@@ -0,0 +1,87 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from unittest.mock import patch
+from shared.gazetteer import Gazetteer, build_gazetteer, get_gazetteer, set_gazetteer, main
+from shared.geocoding import get_coordinates
+
+CSV_ROWS = """postcode,place,latitude,longitude
+10001,New York,40.7484,-73.9967
+90210,Beverly Hills,34.0901,-118.4065
+00501,Holtsville,40.8154,-73.0451
+10001,Duplicate,0,0
+ABCDE,Bad Postcode,1,1
+60601,Bad Latitude,not-a-number,-87.6181
+"""
+
+@pytest.fixture
+def gazetteer_path(tmp_path):
+    csv_path = tmp_path / 'zips.csv'
+    csv_path.write_text(CSV_ROWS)
+    output_path = tmp_path / 'zips.bin'
+    count = build_gazetteer(str(csv_path), str(output_path))
+    assert count == 3
+    return str(output_path)
+
+@pytest.fixture
+def gazetteer(gazetteer_path):
+    gazetteer = Gazetteer(gazetteer_path)
+    set_gazetteer(gazetteer)
+    yield gazetteer
+    set_gazetteer(None)
+    gazetteer.close()
+
+def test_lookup(gazetteer):
+    assert len(gazetteer) == 3
+    assert gazetteer.lookup('10001') == (40.7484, -73.9967)  # First row wins
+    assert gazetteer.lookup('90210') == (34.0901, -118.4065)
+    assert gazetteer.lookup('00501') == (40.8154, -73.0451)  # Leading zeros are kept
+
+    # Misses and malformed postcodes
+    assert gazetteer.lookup('99999') is None
+    assert gazetteer.lookup('00000') is None
+    assert gazetteer.lookup('1000') is None
+    assert gazetteer.lookup('ABCDE') is None
+    assert gazetteer.lookup(None) is None
+
+def test_invalid_file(tmp_path):
+    bad_path = tmp_path / 'bad.bin'
+    bad_path.write_bytes(b'not a gazetteer file')
+    with pytest.raises(ValueError):
+        Gazetteer(str(bad_path))
+
+def test_get_gazetteer_from_environment(gazetteer_path, monkeypatch):
+    set_gazetteer(None)
+    monkeypatch.setenv('GAZETTEER_PATH', gazetteer_path)
+    assert get_gazetteer().lookup('90210') == (34.0901, -118.4065)
+
+    # A missing file disables the gazetteer instead of failing requests
+    set_gazetteer(None)
+    monkeypatch.setenv('GAZETTEER_PATH', gazetteer_path + '.missing')
+    assert get_gazetteer() is None
+    set_gazetteer(None)
+
+@patch('shared.geocoding.requests.Session.get')
+def test_get_coordinates_uses_gazetteer(mock_get, gazetteer):
+    assert get_coordinates('90210') == (34.0901, -118.4065)
+    mock_get.assert_not_called()
+
+    # Misses fall back to the remote API
+    mock_get.return_value.status_code = 200
+    mock_get.return_value.json.return_value = {
+        'places': [{'latitude': '61.2181', 'longitude': '-149.9003'}]
+    }
+    assert get_coordinates('99501') == (61.2181, -149.9003)
+    mock_get.assert_called_once_with('https://api.zippopotam.us/us/99501', timeout=(3.05, 5.0))
+
+def test_main(tmp_path, capsys):
+    csv_path = tmp_path / 'zips.tsv'
+    csv_path.write_text("zip\tlat\tlng\n10001\t40.7484\t-73.9967\n")
+    output_path = tmp_path / 'zips.bin'
+
+    main([str(csv_path), str(output_path), '--postcode-column', 'zip',
+          '--latitude-column', 'lat', '--longitude-column', 'lng', '--delimiter', '\\t'])
+    assert 'Wrote 1 postcodes' in capsys.readouterr().out
+    assert Gazetteer(str(output_path)).lookup('10001') == (40.7484, -73.9967)
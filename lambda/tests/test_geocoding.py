@@ -2,11 +2,33 @@ import os
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+import json
+import time
+import threading
 import pytest
+from collections import Counter
+from datetime import datetime, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from unittest.mock import patch
-from shared.geocoding import get_coordinates, calculate_distance_from_ny, get_direction_from_ny
+from mongomock import MongoClient
+from shared.mongo_utils import set_geocache_collection
+import numpy as np
+from geopy.distance import geodesic
+from shared.geocoding import (
+    get_coordinates,
+    calculate_distance_from_ny,
+    get_direction_from_ny,
+    calculate_distances_from_ny,
+    get_directions_from_ny,
+    geodesic_miles,
+    get_coordinates_many,
+    get_cache_stats,
+    clear_cache,
+    GeocodingClient,
+    set_client
+)
 
-@patch('shared.geocoding.requests.get')
+@patch('shared.geocoding.requests.Session.get')
 def test_get_coordinates(mock_get):
     # Mock successful API response
     mock_get.return_value.status_code = 200
@@ -19,19 +41,22 @@ def test_get_coordinates(mock_get):
 
     coordinates = get_coordinates("10001")
     assert coordinates == (40.7128, -74.0060)
-    mock_get.assert_called_once_with('https://api.zippopotam.us/us/10001')
+    mock_get.assert_called_once_with('https://api.zippopotam.us/us/10001', timeout=(3.05, 5.0))
 
     # Test API error
+    clear_cache()
     mock_get.return_value.status_code = 404
     coordinates = get_coordinates("invalid_postcode")
     assert coordinates is None
 
     # Test network error
+    clear_cache()
     mock_get.side_effect = Exception("Network error")
     coordinates = get_coordinates("10001")
     assert coordinates is None
 
     # Test invalid JSON response
+    clear_cache()
     mock_get.side_effect = None
     mock_get.return_value.status_code = 200
     mock_get.return_value.json.side_effect = ValueError("Invalid JSON")
@@ -39,6 +64,7 @@ def test_get_coordinates(mock_get):
     assert coordinates is None
 
     # Test missing places in response
+    clear_cache()
     mock_get.return_value.json.side_effect = None
     mock_get.return_value.json.return_value = {}
     coordinates = get_coordinates("10001")
@@ -68,4 +94,226 @@ def test_get_direction_from_ny():
     assert get_direction_from_ny(40.7128, -75.0060) == "SW"  # Same latitude, west
     assert get_direction_from_ny(40.7128, -73.0060) == "SE"  # Same latitude, east
     assert get_direction_from_ny(41.7128, -74.0060) == "NW"  # Same longitude, north
-    assert get_direction_from_ny(39.7128, -74.0060) == "SW"  # Same longitude, south
\ No newline at end of file
+    assert get_direction_from_ny(39.7128, -74.0060) == "SW"  # Same longitude, south
+
+def test_geodesic_miles_matches_geopy():
+    rng = np.random.default_rng(0)
+    lats = np.concatenate([rng.uniform(-90, 90, 500), [40.7128, 90.0, -90.0, 0.0, -40.7128]])
+    lons = np.concatenate([rng.uniform(-180, 180, 500), [-74.0060, 0.0, 0.0, 0.0, 105.994]])
+
+    distances = geodesic_miles(40.7128, -74.0060, lats, lons)
+    expected = [geodesic((40.7128, -74.0060), (lat, lon)).miles for lat, lon in zip(lats, lons)]
+    np.testing.assert_allclose(distances, expected, rtol=0, atol=1e-6)
+
+def test_batch_distances_and_directions():
+    lats = np.array([40.7128, 42.7128, 38.7128, 42.7128])
+    lons = np.array([-74.0060, -73.0060, -75.0060, -75.0060])
+
+    distances = calculate_distances_from_ny(lats, lons)
+    assert distances.shape == (4,)
+    assert distances[0] == 0.0
+    assert list(distances) == [calculate_distance_from_ny(lat, lon) for lat, lon in zip(lats, lons)]
+
+    directions = get_directions_from_ny(lats, lons)
+    assert list(directions) == ["SW", "NE", "SW", "NW"]
+
+    # Scalar wrappers return plain Python types
+    assert type(calculate_distance_from_ny(42.7128, -74.0060)) is float
+    assert type(get_direction_from_ny(42.7128, -74.0060)) is str
+
+@pytest.fixture
+def geocache_collection(monkeypatch):
+    collection = MongoClient().items_db.geocache
+    set_geocache_collection(collection)
+    monkeypatch.setenv('GEOCACHE_SHARED_TIER', 'true')
+    yield collection
+    set_geocache_collection(None)
+
+@patch('shared.geocoding.requests.Session.get')
+def test_get_coordinates_memory_cache(mock_get):
+    mock_get.return_value.status_code = 200
+    mock_get.return_value.json.return_value = {
+        'places': [{'latitude': '40.7128', 'longitude': '-74.0060'}]
+    }
+
+    assert get_coordinates("10001") == (40.7128, -74.0060)
+    assert get_coordinates("10001") == (40.7128, -74.0060)
+    assert mock_get.call_count == 1
+
+    # Unknown postcodes are cached too
+    mock_get.return_value.status_code = 404
+    assert get_coordinates("00000") is None
+    assert get_coordinates("00000") is None
+    assert mock_get.call_count == 2
+
+    # Transient failures are not cached
+    mock_get.return_value.status_code = 503
+    set_client(GeocodingClient(max_retries=0))
+    try:
+        assert get_coordinates("10002") is None
+    finally:
+        set_client(None)
+    mock_get.return_value.status_code = 200
+    assert get_coordinates("10002") == (40.7128, -74.0060)
+    assert mock_get.call_count == 4
+
+    stats = get_cache_stats()
+    assert stats['memory']['hits'] == 2
+    assert stats['memory']['misses'] == 4
+    assert stats['memory']['size'] == 3
+
+@patch('shared.geocoding.requests.Session.get')
+def test_get_coordinates_negative_ttl(mock_get):
+    mock_get.return_value.status_code = 404
+    with patch('shared.geocoding.GEOCACHE_NEGATIVE_TTL_SECONDS', 0):
+        assert get_coordinates("00000") is None
+        assert get_coordinates("00000") is None
+    assert mock_get.call_count == 2
+
+@patch('shared.geocoding.requests.Session.get')
+def test_get_coordinates_shared_cache(mock_get, geocache_collection):
+    mock_get.return_value.status_code = 200
+    mock_get.return_value.json.return_value = {
+        'places': [{'latitude': '40.7128', 'longitude': '-74.0060'}]
+    }
+    assert get_coordinates("10001") == (40.7128, -74.0060)
+    doc = geocache_collection.find_one({'_id': '10001'})
+    assert doc['found'] is True
+    assert doc['latitude'] == 40.7128
+
+    mock_get.return_value.status_code = 404
+    assert get_coordinates("00000") is None
+    assert geocache_collection.find_one({'_id': '00000'})['found'] is False
+
+    # A new container starts with an empty memory tier but reuses the shared one
+    clear_cache()
+    assert get_coordinates("10001") == (40.7128, -74.0060)
+    assert get_coordinates("00000") is None
+    assert mock_get.call_count == 2
+    assert get_cache_stats()['shared'] == {'hits': 2, 'misses': 0}
+
+    # Expired entries are ignored even before the TTL monitor removes them
+    clear_cache()
+    geocache_collection.update_one(
+        {'_id': '10001'},
+        {'$set': {'expiresAt': datetime.utcnow() - timedelta(seconds=1)}}
+    )
+    mock_get.return_value.status_code = 200
+    assert get_coordinates("10001") == (40.7128, -74.0060)
+    assert mock_get.call_count == 3
+    assert get_cache_stats()['shared'] == {'hits': 0, 'misses': 1}
+
+class StubZippopotam(BaseHTTPRequestHandler):
+    """Local stand-in for api.zippopotam.us"""
+    requests = Counter()
+    lock = threading.Lock()
+
+    def do_GET(self):
+        postcode = self.path.rsplit('/', 1)[-1]
+        with self.lock:
+            self.requests[postcode] += 1
+            count = self.requests[postcode]
+
+        if postcode == '00000':
+            self.send_response(404)
+            self.end_headers()
+            return
+        if postcode == '50300' and count == 1:
+            self.send_response(503)
+            self.end_headers()
+            return
+        if postcode == '99999':
+            time.sleep(0.5)
+
+        time.sleep(0.05)
+        body = json.dumps({'places': [{'latitude': '40.0', 'longitude': f'-{postcode[:2]}.0'}]}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class StubServer(ThreadingHTTPServer):
+    # The default backlog of 5 drops concurrent connects and adds 1s SYN retries
+    request_queue_size = 64
+
+@pytest.fixture
+def stub_server():
+    StubZippopotam.requests.clear()
+    server = StubServer(('127.0.0.1', 0), StubZippopotam)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    client = GeocodingClient(
+        base_url=f'http://127.0.0.1:{server.server_port}/us',
+        read_timeout=0.2,
+        max_retries=1,
+        backoff=0.01
+    )
+    set_client(client)
+    yield StubZippopotam.requests
+    set_client(None)
+    client.close()
+    server.shutdown()
+    server.server_close()
+
+def test_client_against_stub_server(stub_server):
+    assert get_coordinates('10001') == (40.0, -10.0)
+    assert get_coordinates('00000') is None
+
+    # A retryable status is retried once
+    assert get_coordinates('50300') == (40.0, -50.0)
+    assert stub_server['50300'] == 2
+
+    # A slow upstream is cut off by the read timeout instead of hanging the caller
+    start = time.time()
+    assert get_coordinates('99999') is None
+    assert time.time() - start < 1.0
+    assert stub_server['99999'] == 2
+
+def test_get_coordinates_many(stub_server):
+    postcodes = ['10001', '20001', '10001', '30001', '00000', '20001'] + [f'{n}001' for n in range(40, 60)]
+
+    start = time.time()
+    results = get_coordinates_many(postcodes)
+    elapsed = time.time() - start
+
+    assert list(results) == list(dict.fromkeys(postcodes))
+    assert results['10001'] == (40.0, -10.0)
+    assert results['30001'] == (40.0, -30.0)
+    assert results['00000'] is None
+
+    # Each distinct postcode is requested once and the requests overlap
+    assert all(count == 1 for count in stub_server.values())
+    assert sum(stub_server.values()) == 24
+    assert elapsed < 24 * 0.05
+
+    assert get_coordinates_many([]) == {}
+
+def test_concurrent_lookups_are_coalesced():
+    release = threading.Event()
+    calls = Counter()
+
+    def slow_fetch(postcode):
+        calls[postcode] += 1
+        release.wait(timeout=5)
+        return (40.7128, -74.0060)
+
+    results = []
+    with patch('shared.geocoding.GeocodingClient.fetch', side_effect=slow_fetch):
+        threads = [threading.Thread(target=lambda: results.append(get_coordinates('10001'))) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        # Let every thread reach the in-flight lookup before the upstream answers
+        deadline = time.time() + 5
+        while get_cache_stats()['inflight']['saved'] < 19 and time.time() < deadline:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+    assert results == [(40.7128, -74.0060)] * 20
+    assert calls['10001'] == 1
+    assert get_cache_stats()['inflight'] == {'calls': 1, 'saved': 19, 'in_flight': 0}
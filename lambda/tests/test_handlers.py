@@ -12,7 +12,16 @@ from get_item import handler as get_handler
 from get_items import handler as get_items_handler
 from update_item import handler as update_handler
 from delete_item import handler as delete_handler
-from shared.validation import validate_item
+from get_items_near import handler as get_items_near_handler
+from get_items_stats import handler as get_items_stats_handler
+from search_items import handler as search_items_handler
+from create_items_batch import handler as create_items_batch_handler
+from update_items_batch import handler as update_items_batch_handler
+from delete_items_batch import handler as delete_items_batch_handler
+from backfill_items import handler as backfill_items_handler
+from shared.validation import validate_item, item_etag, encode_page_token
+from shared.mongo_utils import create_item, update_item, delete_item
+from shared import serializer
 
 @pytest.fixture
 def valid_item():
@@ -99,6 +108,82 @@ def test_get_item(mock_event, mongodb_collection):
         response = get_handler(mock_event, None)
         assert response['statusCode'] == 404
 
+def test_get_item_fields(mock_event, mongodb_collection):
+    mongodb_collection.insert_one({'id': '123', 'name': 'Test Item', 'users': ['John Doe']})
+
+    with patch('get_item.verify_auth', return_value=(True, "")):
+        mock_event['queryStringParameters'] = {'fields': 'name'}
+        response = get_handler(mock_event, None)
+        assert response['statusCode'] == 200
+        assert json.loads(response['body']) == {'id': '123', 'name': 'Test Item'}
+
+        mock_event['queryStringParameters'] = {'fields': 'name,$where'}
+        response = get_handler(mock_event, None)
+        assert response['statusCode'] == 400
+
+def test_get_item_conditional(mock_event, mongodb_collection):
+    mongodb_collection.insert_one({'id': '123', 'name': 'Test Item', 'version': 3})
+
+    with patch('get_item.verify_auth', return_value=(True, "")):
+        response = get_handler(mock_event, None)
+        etag = response['headers']['ETag']
+        assert etag == item_etag('123', (3, None))
+
+        # An unchanged item is revalidated with a version-only query and not sent again
+        mock_event['headers']['If-None-Match'] = etag
+        with patch('get_item.get_item_and_version') as mock_get_item_and_version:
+            response = get_handler(mock_event, None)
+            assert response['statusCode'] == 304
+            assert response['body'] == ''
+            assert response['headers']['ETag'] == etag
+            mock_get_item_and_version.assert_not_called()
+
+        # Other fieldsets are other representations
+        mock_event['queryStringParameters'] = {'fields': 'name'}
+        response = get_handler(mock_event, None)
+        assert response['statusCode'] == 200
+        assert json.loads(response['body']) == {'id': '123', 'name': 'Test Item'}
+        assert response['headers']['ETag'] == item_etag('123', (3, None), ['name'])
+        mock_event['queryStringParameters'] = None
+
+        update_item('123', {'name': 'Renamed'})
+        response = get_handler(mock_event, None)
+        assert response['statusCode'] == 200
+        stored = mongodb_collection.find_one({'id': '123'})
+        assert stored['version'] == 4
+        assert response['headers']['ETag'] == item_etag('123', (4, stored['updatedAt']))
+
+def test_get_item_reuses_encoded_body(mock_event, mongodb_collection):
+    mongodb_collection.insert_one({'id': '123', 'name': 'Test Item', 'version': 1})
+
+    with patch('get_item.verify_auth', return_value=(True, "")), \
+            patch('shared.serializer.dumps_bytes', wraps=serializer.dumps_bytes) as mock_dumps_bytes:
+        first = get_handler(mock_event, None)
+        second = get_handler(mock_event, None)
+        assert second['body'] == first['body']
+        assert mock_dumps_bytes.call_count == 1
+
+        # A new version has a new ETag and is encoded again
+        update_item('123', {'name': 'Renamed'})
+        response = get_handler(mock_event, None)
+        assert json.loads(response['body'])['name'] == 'Renamed'
+        assert mock_dumps_bytes.call_count == 2
+
+def test_get_item_body_after_delete_and_recreate(mock_event, mongodb_collection):
+    with patch('shared.mongo_utils._timestamp', side_effect=['2024-01-01T00:00:00.000001Z',
+                                                             '2024-01-01T00:00:00.000002Z']):
+        create_item({'id': '123', 'name': 'Test Item'})
+        with patch('get_item.verify_auth', return_value=(True, "")):
+            first = get_handler(mock_event, None)
+
+            # The same id comes back at version 1 with other content
+            delete_item('123')
+            create_item({'id': '123', 'name': 'Recreated'})
+            response = get_handler(mock_event, None)
+
+    assert json.loads(response['body'])['name'] == 'Recreated'
+    assert response['headers']['ETag'] != first['headers']['ETag']
+
 @patch('get_item.verify_auth')
 def test_get_item_errors(mock_verify_auth, mock_event, mongodb_collection):
     mock_verify_auth.return_value = (True, "")
@@ -130,6 +215,74 @@ def test_get_items(mongodb_collection):
     returned_items = json.loads(response['body'])['items']
     assert len(returned_items) == 2
 
+def test_get_items_without_page_params(mongodb_collection):
+    # The Lambda function never builds the whole collection into one response;
+    # clients that do not page get the first page and a token for the rest
+    mongodb_collection.insert_many([{'id': f'item-{i:03d}', 'postcode': '10001' if i % 2 else '90210'} for i in range(250)])
+
+    first = get_items_handler({'queryStringParameters': None}, None)
+    body = json.loads(first['body'])
+    assert [item['id'] for item in body['items']] == [f'item-{i:03d}' for i in range(100)]
+    assert body['next']
+    assert first['headers']['ETag'] == get_items_handler({'queryStringParameters': {'limit': '100'}}, None)['headers']['ETag']
+
+    body = json.loads(get_items_handler({'queryStringParameters': {'postcode': '10001', 'fields': 'postcode'}}, None)['body'])
+    assert len(body['items']) == 100 and body['next']
+    assert all(item == {'id': item['id'], 'postcode': '10001'} for item in body['items'])
+    body = json.loads(get_items_handler({'queryStringParameters': {'postcode': '10001', 'next': body['next']}}, None)['body'])
+    assert len(body['items']) == 25 and body['next'] is None
+
+def test_get_items_pagination(mongodb_collection):
+    for i in range(5):
+        mongodb_collection.insert_one({'id': f'item-{i}', 'name': f'Item {i}'})
+
+    ids = []
+    event = {'queryStringParameters': {'limit': '2'}}
+    while True:
+        response = get_items_handler(event, None)
+        assert response['statusCode'] == 200
+        body = json.loads(response['body'])
+        assert len(body['items']) <= 2
+        ids.extend(item['id'] for item in body['items'])
+        if body['next'] is None:
+            break
+        event = {'queryStringParameters': {'limit': '2', 'next': body['next']}}
+    assert ids == [f'item-{i}' for i in range(5)]
+
+    response = get_items_handler({'queryStringParameters': {'fields': 'name', 'limit': '1'}}, None)
+    assert json.loads(response['body'])['items'] == [{'id': 'item-0', 'name': 'Item 0'}]
+
+    # Filters are applied on the server and kept across pages
+    mongodb_collection.update_many({'id': {'$in': ['item-1', 'item-3', 'item-4']}}, {'$set': {'postcode': '90210'}})
+    response = get_items_handler({'queryStringParameters': {'postcode': '90210', 'limit': '2'}}, None)
+    body = json.loads(response['body'])
+    assert [item['id'] for item in body['items']] == ['item-1', 'item-3']
+    response = get_items_handler({'queryStringParameters': {'postcode': '90210', 'limit': '2', 'next': body['next']}}, None)
+    assert [item['id'] for item in json.loads(response['body'])['items']] == ['item-4']
+
+    # Invalid parameters
+    for params in ({'limit': '0'}, {'limit': 'many'}, {'next': 'not-a-token'}, {'directionFromNY': 'UP'}):
+        response = get_items_handler({'queryStringParameters': params}, None)
+        assert response['statusCode'] == 400
+
+def test_get_items_by_ids(mongodb_collection):
+    for i in range(5):
+        mongodb_collection.insert_one({'id': f'item-{i}', 'name': f'Item {i}', 'postcode': '10001'})
+
+    event = {'queryStringParameters': {'ids': 'item-3,missing,item-0,item-3', 'fields': 'name'}}
+    with patch('get_items.get_items_page') as mock_get_items_page:
+        response = get_items_handler(event, None)
+        mock_get_items_page.assert_not_called()
+    assert response['statusCode'] == 200
+    assert json.loads(response['body']) == {
+        'items': [{'id': 'item-3', 'name': 'Item 3'}, None, {'id': 'item-0', 'name': 'Item 0'}, {'id': 'item-3', 'name': 'Item 3'}],
+        'missing': ['missing']
+    }
+
+    for params in ({'ids': ''}, {'ids': 'item-1', 'next': 'token'}):
+        response = get_items_handler({'queryStringParameters': params}, None)
+        assert response['statusCode'] == 400
+
 @patch('shared.geocoding.get_coordinates')
 def test_update_item(mock_get_coordinates, mock_event, mock_coordinates, mongodb_collection):
     # Create test item
@@ -186,6 +339,35 @@ def test_update_item_errors(mock_get_coordinates, mock_verify_auth, mock_event,
     response = update_handler(mock_event, None)
     assert response['statusCode'] == 400
 
+    # A missing item is reported before its postcode is geocoded
+    with patch('update_item.get_coordinates') as mock_update_coordinates:
+        mock_event['pathParameters']['id'] = 'non-existent'
+        response = update_handler(mock_event, None)
+        assert response['statusCode'] == 404
+        mock_update_coordinates.assert_not_called()
+
+@patch('update_item.verify_auth')
+def test_update_item_without_reads(mock_verify_auth, mock_event, mongodb_collection):
+    mock_verify_auth.return_value = (True, "")
+    mongodb_collection.insert_one({'id': '123', 'name': 'Original Name'})
+    mock_event['body'] = json.dumps({'name': 'Updated Name'})
+
+    # The update returns the new document, so no separate reads are needed
+    with patch('shared.mongo_utils.get_item') as mock_get_item:
+        response = update_handler(mock_event, None)
+        assert response['statusCode'] == 200
+        body = json.loads(response['body'])
+        assert body['name'] == 'Updated Name'
+        assert body['version'] == 1
+        assert response['headers']['ETag'] == item_etag('123', (1, body['updatedAt']))
+        mock_get_item.assert_not_called()
+
+    # An update that matched nothing reads back to tell a missing item from a no-op
+    mock_event['pathParameters']['id'] = 'non-existent'
+    response = update_handler(mock_event, None)
+    assert response['statusCode'] == 404
+    assert mongodb_collection.count_documents({'id': 'non-existent'}) == 0
+
 def test_delete_item(mock_event, mongodb_collection):
     # Create test item
     mongodb_collection.insert_one({
@@ -215,9 +397,80 @@ def test_delete_item_errors(mock_verify_auth, mock_event, mongodb_collection):
     response = delete_handler(invalid_event, None)
     assert response['statusCode'] == 500
 
+def test_get_items_conditional(mongodb_collection):
+    for i in range(3):
+        mongodb_collection.insert_one({'id': f'item-{i}', 'version': 1, 'updatedAt': f'2024-01-0{i + 1}T00:00:00.000000Z'})
+
+    response = get_items_handler({'queryStringParameters': {'limit': '2'}}, None)
+    etag = response['headers']['ETag']
+    event = {'queryStringParameters': {'limit': '2'}, 'headers': {'if-none-match': etag}}
+
+    # Polling an unchanged collection does not read the page
+    with patch('get_items.get_items_page') as mock_get_items_page:
+        response = get_items_handler(event, None)
+        assert response['statusCode'] == 304
+        assert response['body'] == ''
+        mock_get_items_page.assert_not_called()
+
+    # Different query parameters, an update and a delete all change the ETag
+    assert get_items_handler({'queryStringParameters': {'limit': '3'}, 'headers': event['headers']}, None)['statusCode'] == 200
+    update_item('item-0', {'name': 'Renamed'})
+    assert get_items_handler(event, None)['statusCode'] == 200
+    event['headers']['if-none-match'] = get_items_handler(event, None)['headers']['ETag']
+    delete_item('item-2')
+    assert get_items_handler(event, None)['statusCode'] == 200
+
+def test_get_items_without_collection_version(mongodb_collection):
+    mongodb_collection.insert_one({'id': 'item-0', 'version': 1})
+    # Backends that cannot version the collection (DynamoDB) serve lists without an ETag
+    with patch('get_items.get_collection_version', return_value=None):
+        response = get_items_handler({'queryStringParameters': {}, 'headers': {'if-none-match': '*'}}, None)
+    assert response['statusCode'] == 200
+    assert 'ETag' not in response['headers']
+    assert json.loads(response['body'])['items'][0]['id'] == 'item-0'
+
+@patch('get_items_stats.verify_auth')
+def test_get_items_stats(mock_verify_auth, mongodb_collection):
+    mock_verify_auth.return_value = (True, "")
+    mongodb_collection.insert_many([
+        {'id': '1', 'postcode': '10001', 'users': ['Ann'], 'directionFromNY': 'NE', 'distanceFromNY': 3.2},
+        {'id': '2', 'postcode': '90210', 'users': ['Ann', 'Bob'], 'directionFromNY': 'W', 'distanceFromNY': 2451.25}
+    ])
+
+    response = get_items_stats_handler({'queryStringParameters': {'bucketMiles': '1000', 'top': '1'}}, None)
+    assert response['statusCode'] == 200
+    stats = json.loads(response['body'])
+    assert stats['count'] == 2
+    assert stats['distanceFromNY']['buckets'] == [
+        {'min': 0, 'max': 1000, 'count': 1},
+        {'min': 2000, 'max': 3000, 'count': 1}
+    ]
+    assert stats['topUsers'] == [{'user': 'Ann', 'count': 2}]
+
+    # An unchanged collection is not aggregated again
+    event = {'queryStringParameters': {'bucketMiles': '1000', 'top': '1'},
+             'headers': {'If-None-Match': response['headers']['ETag']}}
+    with patch('get_items_stats.get_item_stats') as mock_get_item_stats:
+        assert get_items_stats_handler(event, None)['statusCode'] == 304
+        mock_get_item_stats.assert_not_called()
+
+    response = get_items_stats_handler({'queryStringParameters': {'top': '0'}}, None)
+    assert response['statusCode'] == 400
+
+    mock_verify_auth.return_value = (False, "Invalid token")
+    assert get_items_stats_handler({}, None)['statusCode'] == 401
+
+def test_get_items_rejects_keys_the_list_did_not_return(mongodb_collection):
+    mongodb_collection.insert_one({'id': 'item-1', 'name': 'Item'})
+    # A DynamoDB bucket cursor or a non-string id is a 400, not a failed read
+    for key in ({'nextBucket': 1}, {'id': 1}, {'id': 'item-1', 'postcode': '10001'}):
+        response = get_items_handler({'queryStringParameters': {'next': encode_page_token(key)}}, None)
+        assert response['statusCode'] == 400
+        assert json.loads(response['body'])['error'] == "Invalid next token"
+
 def test_get_items_errors(mongodb_collection):
     # Test database error by mocking a failure
-    with patch('get_items.get_all_items', side_effect=Exception("Database error")):
+    with patch('get_items.get_items_page', side_effect=Exception("Database error")):
         response = get_items_handler({}, None)
         assert response['statusCode'] == 500
         error_message = json.loads(response['body'])['error']
@@ -231,4 +484,122 @@ def test_create_item_unauthorized(mock_verify_auth, mock_event, mongodb_collecti
     response = create_handler(mock_event, None)
     assert response['statusCode'] == 401
     error_response = json.loads(response['body'])
-    assert 'Authentication failed' in error_response['error']
\ No newline at end of file
+    assert 'Authentication failed' in error_response['error']
+
+@patch('get_items_near.verify_auth')
+@patch('get_items_near.find_items_near')
+def test_get_items_near(mock_find_items_near, mock_verify_auth, mock_event):
+    mock_verify_auth.return_value = (True, "")
+    mock_find_items_near.return_value = [{'id': '123', 'name': 'Item 1', 'distance': 1.5}]
+
+    mock_event['queryStringParameters'] = {'lat': '40.7128', 'lon': '-74.0060', 'radius': '10'}
+    response = get_items_near_handler(mock_event, None)
+    assert response['statusCode'] == 200
+    assert json.loads(response['body'])['items'][0]['distance'] == 1.5
+    mock_find_items_near.assert_called_once_with(latitude=40.7128, longitude=-74.0060, radius=10.0, limit=20)
+
+    # Invalid query parameters
+    mock_event['queryStringParameters'] = {'lat': '40.7128'}
+    response = get_items_near_handler(mock_event, None)
+    assert response['statusCode'] == 400
+
+    # Unauthorized
+    mock_verify_auth.return_value = (False, "Invalid token")
+    response = get_items_near_handler(mock_event, None)
+    assert response['statusCode'] == 401
+
+@patch('search_items.verify_auth')
+@patch('search_items.search_items')
+def test_search_items(mock_search_items, mock_verify_auth, mock_event):
+    mock_verify_auth.return_value = (True, "")
+    mock_search_items.return_value = ([{'id': '123', 'name': 'Red bike', 'score': 1.5}], {'id': '123', 'score': 1.5})
+
+    mock_event['queryStringParameters'] = {'q': 'red bike', 'limit': '1'}
+    response = search_items_handler(mock_event, None)
+    assert response['statusCode'] == 200
+    body = json.loads(response['body'])
+    assert body['items'][0]['score'] == 1.5
+    mock_search_items.assert_called_once_with(query='red bike', limit=1, after=None, fields=None)
+
+    # The next token resumes after the last item
+    mock_event['queryStringParameters'] = {'q': 'red bike', 'next': body['next']}
+    search_items_handler(mock_event, None)
+    assert mock_search_items.call_args.kwargs['after'] == {'id': '123', 'score': 1.5}
+
+    # Missing query
+    mock_event['queryStringParameters'] = {}
+    response = search_items_handler(mock_event, None)
+    assert response['statusCode'] == 400
+
+    # Unauthorized
+    mock_verify_auth.return_value = (False, "Invalid token")
+    response = search_items_handler(mock_event, None)
+    assert response['statusCode'] == 401
+
+@patch('create_items_batch.verify_auth')
+@patch('shared.batch.get_coordinates_many')
+def test_create_items_batch(mock_get_coordinates_many, mock_verify_auth, mock_event, mock_coordinates, mongodb_collection):
+    mock_verify_auth.return_value = (True, "")
+    mock_get_coordinates_many.return_value = {'10001': mock_coordinates}
+    start_date = (datetime.utcnow() + timedelta(weeks=2)).strftime('%Y-%m-%dT%H:%M:%SZ')
+    item = {'name': 'Batch Item', 'postcode': '10001', 'startDate': start_date, 'users': ['John Doe']}
+
+    mock_event['body'] = json.dumps({'items': [item, item]})
+    response = create_items_batch_handler(mock_event, None)
+    assert response['statusCode'] == 201
+    body = json.loads(response['body'])
+    assert body['created'] == 2
+    assert mongodb_collection.count_documents({}) == 2
+
+    # Partial failure
+    mock_event['body'] = json.dumps({'items': [item, {'name': 'No postcode'}]})
+    response = create_items_batch_handler(mock_event, None)
+    assert response['statusCode'] == 207
+    assert [r['status'] for r in json.loads(response['body'])['results']] == [201, 400]
+
+    # Malformed batch
+    mock_event['body'] = json.dumps({'items': []})
+    response = create_items_batch_handler(mock_event, None)
+    assert response['statusCode'] == 400
+
+    # Unauthorized
+    mock_verify_auth.return_value = (False, "Invalid token")
+    response = create_items_batch_handler(mock_event, None)
+    assert response['statusCode'] == 401
+
+@patch('update_items_batch.verify_auth')
+@patch('delete_items_batch.verify_auth')
+def test_update_and_delete_items_batch(mock_delete_verify_auth, mock_update_verify_auth, mock_event, mongodb_collection):
+    mock_update_verify_auth.return_value = (True, "")
+    mock_delete_verify_auth.return_value = (True, "")
+    mongodb_collection.insert_many([{'id': 'a', 'name': 'A'}, {'id': 'b', 'name': 'B'}])
+
+    mock_event['body'] = json.dumps({'items': [{'id': 'a', 'name': 'Renamed'}, {'id': 'b', 'name': 'Renamed'}]})
+    response = update_items_batch_handler(mock_event, None)
+    assert response['statusCode'] == 200
+    assert json.loads(response['body'])['modified'] == 2
+
+    mock_event['body'] = json.dumps({'ids': ['a', 'missing']})
+    response = delete_items_batch_handler(mock_event, None)
+    assert response['statusCode'] == 207
+    body = json.loads(response['body'])
+    assert body['deleted'] == 1
+    assert body['missing'] == 1
+
+    # Malformed batches
+    mock_event['body'] = json.dumps({'items': 'a'})
+    assert update_items_batch_handler(mock_event, None)['statusCode'] == 400
+    assert delete_items_batch_handler(mock_event, None)['statusCode'] == 400
+
+    # Unauthorized
+    mock_update_verify_auth.return_value = (False, "Invalid token")
+    mock_delete_verify_auth.return_value = (False, "Invalid token")
+    assert update_items_batch_handler(mock_event, None)['statusCode'] == 401
+    assert delete_items_batch_handler(mock_event, None)['statusCode'] == 401
+
+def test_backfill_items(moto_table):
+    # Run by the deploy-time trigger: items written before distance-index get their bucket
+    moto_table.put_item(Item={'id': 'old', 'distanceFromNY': 1200})
+    assert backfill_items_handler({}, None) == {'distanceBuckets': 1}
+    assert moto_table.get_item(Key={'id': 'old'})['Item']['distanceBucket'] == 2
+    assert backfill_items_handler({}, None) == {'distanceBuckets': 0}
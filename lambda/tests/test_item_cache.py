@@ -0,0 +1,189 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json
+import threading
+import fakeredis
+import pytest
+from unittest.mock import patch
+from shared.cache import TTLCache
+from shared import cloudwatch_logger, storage
+from shared.item_cache import ReadThroughCache, RedisCache, get_item_cache, set_item_cache
+from shared.mongo_utils import get_item, create_item, update_item, delete_item, update_items, delete_items, get_item_version
+from get_item import handler as get_handler
+
+ITEM = {'id': 'item-1', 'name': 'Test Item', 'users': ['John Doe']}
+
+def test_read_through():
+    cache = ReadThroughCache(TTLCache(max_entries=10, ttl=60))
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return dict(ITEM)
+
+    assert cache.get('item-1', loader) == ITEM
+    assert cache.get('item-1', loader) == ITEM
+    assert len(loads) == 1
+
+    # Results are copies
+    cache.get('item-1', loader)['name'] = 'Changed'
+    assert cache.get('item-1', loader)['name'] == 'Test Item'
+
+    # Misses are not cached
+    assert cache.get('missing', lambda: None) is None
+    assert cache.get('missing', loader) == ITEM
+
+    stats = cache.stats()
+    assert stats['hits'] == 3
+    assert stats['misses'] == 3
+    assert stats['hit_ratio'] == 0.5
+
+def test_read_racing_a_write_is_not_cached():
+    cache = ReadThroughCache(TTLCache(max_entries=10, ttl=60))
+
+    def stale_loader():
+        # A write lands after the database read but before the cache fill
+        cache.invalidate('item-1')
+        return {**ITEM, 'name': 'Stale'}
+
+    assert cache.get('item-1', stale_loader)['name'] == 'Stale'
+    assert cache.get('item-1', lambda: dict(ITEM))['name'] == 'Test Item'
+
+def test_redis_backend_is_shared():
+    client = fakeredis.FakeRedis()
+    first = ReadThroughCache(RedisCache(client, ttl=60))
+    second = ReadThroughCache(RedisCache(client, ttl=60))
+
+    first.put('item-1', ITEM)
+    assert second.get('item-1', lambda: pytest.fail("should be cached")) == ITEM
+    assert 0 < client.pttl('item:item-1') <= 60000
+    assert json.loads(client.get('item:item-1')) == ITEM
+
+    # An invalidation in one process is seen by the other
+    second.invalidate('item-1')
+    assert first.get('item-1', lambda: None) is None
+    assert first.stats()['misses'] == 1
+
+def test_redis_read_racing_a_write_in_another_process_is_not_cached():
+    client = fakeredis.FakeRedis()
+    first = ReadThroughCache(RedisCache(client, ttl=60))
+    second = ReadThroughCache(RedisCache(client, ttl=60))
+
+    def stale_loader():
+        # Another process writes after this database read but before the cache fill
+        second.put('item-1', {**ITEM, 'name': 'New'})
+        return {**ITEM, 'name': 'Stale'}
+
+    assert first.get('item-1', stale_loader)['name'] == 'Stale'
+    assert first.get('item-1', lambda: pytest.fail("should be cached"))['name'] == 'New'
+
+    second.invalidate('item-1')
+    assert first.get('item-1', lambda: dict(ITEM))['name'] == 'Test Item'
+    assert second.get('item-1', lambda: pytest.fail("should be cached")) == ITEM
+
+def test_backend_errors_fall_through_to_the_loader():
+    class BrokenBackend(TTLCache):
+        def get(self, key, default=None):
+            raise ConnectionError("cache is down")
+
+        def set(self, key, value, ttl=None):
+            raise ConnectionError("cache is down")
+
+    cache = ReadThroughCache(BrokenBackend())
+    assert cache.get('item-1', lambda: dict(ITEM)) == ITEM
+    cache.put('item-1', ITEM)
+
+def test_get_item_is_cached(mongodb_collection):
+    mongodb_collection.insert_one(dict(ITEM))
+
+    with patch.object(mongodb_collection, 'find_one', wraps=mongodb_collection.find_one) as find_one:
+        assert get_item('item-1') == ITEM
+        assert get_item('item-1') == ITEM
+        assert get_item('item-1', ['name']) == {'id': 'item-1', 'name': 'Test Item'}
+        assert find_one.call_count == 1
+
+def test_writes_keep_the_cache_current(mongodb_collection):
+    item = dict(ITEM)
+    create_item(item)
+    with patch.object(mongodb_collection, 'find_one', side_effect=AssertionError("should be cached")):
+        assert get_item('item-1') == item
+        assert get_item_version('item-1')[0] == 1
+
+    update_item('item-1', {'name': 'Updated'})
+    with patch.object(mongodb_collection, 'find_one', side_effect=AssertionError("should be cached")):
+        assert get_item('item-1')['name'] == 'Updated'
+
+    update_items({'item-1': {'name': 'Bulk Updated'}})
+    assert get_item('item-1')['name'] == 'Bulk Updated'
+
+    delete_item('item-1')
+    assert get_item('item-1') is None
+
+    create_item({'id': 'item-2'})
+    delete_items(['item-2'])
+    assert get_item('item-2') is None
+
+def test_concurrent_reads_and_writes(mongodb_collection):
+    create_item({'id': 'item-1', 'counter': 0})
+
+    def reader():
+        for _ in range(200):
+            get_item('item-1')
+
+    threads = [threading.Thread(target=reader) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for counter in range(1, 51):
+        update_item('item-1', {'counter': counter})
+    for thread in threads:
+        thread.join()
+
+    assert get_item('item-1')['counter'] == 50
+    assert get_item('item-1')['version'] == 51
+
+@patch('get_item.verify_auth')
+@patch('get_item.log_api_metrics')
+def test_handler_reports_hit_ratio(mock_log_api_metrics, mock_verify_auth, mongodb_collection):
+    mock_verify_auth.return_value = (True, "")
+    mongodb_collection.insert_one(dict(ITEM))
+    event = {'pathParameters': {'id': 'item-1'}, 'headers': {}}
+
+    get_handler(event, None)
+    get_handler(event, None)
+    cache_stats = mock_log_api_metrics.call_args[0][3]
+    assert cache_stats['hits'] == 1
+    assert cache_stats['misses'] == 1
+    assert cache_stats['hit_ratio'] == 0.5
+
+@patch('get_item.verify_auth', return_value=(True, ""))
+@patch('get_item.log_api_metrics')
+def test_handler_reports_no_cache_stats_without_a_cache(mock_log_api_metrics, mock_verify_auth):
+    # DynamoDB reads skip the item cache, so its (zero) counters are not reported
+    storage.set_backend(storage.load_backend('dynamodb'))
+    try:
+        with patch('shared.dynamo_utils.get_item_and_version', return_value=(dict(ITEM), (1, None))):
+            get_handler({'pathParameters': {'id': 'item-1'}, 'headers': {}}, None)
+    finally:
+        storage.set_backend(None)
+    assert mock_log_api_metrics.call_args[0][1] == 200
+    assert mock_log_api_metrics.call_args[0][3] is None
+
+@patch('shared.cloudwatch_logger.metrics')
+def test_metrics_report_each_request_once(mock_metrics, monkeypatch):
+    monkeypatch.setattr(cloudwatch_logger, '_reported_cache_stats', {'hits': 0, 'misses': 0})
+
+    def reported(stats):
+        mock_metrics.add_metric.reset_mock()
+        cloudwatch_logger.log_api_metrics("GetItem", 200, 1.0, stats)
+        return {call.kwargs['name']: call.kwargs['value'] for call in mock_metrics.add_metric.call_args_list}
+
+    assert reported({'hits': 0, 'misses': 1})['ItemCacheMisses'] == 1
+    metrics = reported({'hits': 3, 'misses': 1})
+    assert (metrics['ItemCacheHits'], metrics['ItemCacheMisses'], metrics['ItemCacheHitRatio']) == (3, 0, 100)
+    # No lookups: no ratio to report
+    assert 'ItemCacheHitRatio' not in reported({'hits': 3, 'misses': 1})
+    # The counters were cleared, so all of them are new
+    metrics = reported({'hits': 1, 'misses': 1})
+    assert (metrics['ItemCacheHits'], metrics['ItemCacheMisses'], metrics['ItemCacheHitRatio']) == (1, 1, 50)
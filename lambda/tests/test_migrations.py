@@ -0,0 +1,122 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from unittest.mock import patch
+from mongomock import MongoClient
+from shared import mongo_utils
+from shared.migrations import (
+    SCHEMA_VERSION, applied_versions, current_version, migrate, reconcile_indexes,
+    verify_schema, reset_schema_check, main
+)
+
+ITEM_INDEXES = [
+    'id_1', 'location_2dsphere', 'updatedAt_-1', 'postcode_1_id_1', 'directionFromNY_1_id_1',
+    'users_1_id_1', 'startDate_1', 'distanceFromNY_1', 'name_text_users_text'
+]
+
+@pytest.fixture
+def db(mongomock_bulk_updates):
+    reset_schema_check()
+    yield MongoClient().items_db
+    reset_schema_check()
+
+def test_migrate(db):
+    db.items.insert_many([
+        {'id': 'old', 'latitude': 40.7484, 'longitude': -73.9967},
+        {'id': 'no-coordinates'},
+        {'id': 'versioned', 'version': 4, 'updatedAt': '2024-01-01T00:00:00.000000Z'},
+        {'id': 'local-date', 'startDate': 'March 26 2030 9:00 -0500'},
+        {'id': 'bad-date', 'startDate': 'soon'}
+    ])
+
+    assert migrate(db) == list(range(1, SCHEMA_VERSION + 1))
+    assert applied_versions(db) == list(range(1, SCHEMA_VERSION + 1))
+    assert current_version(db) == SCHEMA_VERSION
+
+    items_indexes = db.items.index_information()
+    assert items_indexes['id_1']['unique'] is True
+    assert 'location_2dsphere' in items_indexes
+    assert db.geocache.index_information()['expiresAt_1']['expireAfterSeconds'] == 0
+
+    # Existing items were backfilled with a GeoJSON location
+    assert db.items.find_one({'id': 'old'})['location'] == {'type': 'Point', 'coordinates': [-73.9967, 40.7484]}
+    assert 'location' not in db.items.find_one({'id': 'no-coordinates'})
+
+    # and with the version and write time used for ETags
+    assert db.items.find_one({'id': 'old'})['version'] == 1
+    assert db.items.find_one({'id': 'no-coordinates'})['updatedAt'] > '2024-01-01'
+    assert db.items.find_one({'id': 'versioned'})['version'] == 4
+    assert db.items.find_one({'id': 'versioned'})['updatedAt'] == '2024-01-01T00:00:00.000000Z'
+
+    # and with startDate in the form the date filters compare
+    assert db.items.find_one({'id': 'local-date'})['startDate'] == '2030-03-26T14:00:00Z'
+    assert db.items.find_one({'id': 'bad-date'})['startDate'] == 'soon'
+
+    # Running again is a no-op
+    assert migrate(db) == []
+
+def test_migrate_to_target(db):
+    assert migrate(db, target=1) == [1]
+    assert current_version(db) == 1
+    assert migrate(db) == list(range(2, SCHEMA_VERSION + 1))
+
+def test_reconcile_indexes(db):
+    db.items.create_index([('name', 1)])
+    db.geocache.create_index([('expiresAt', 1)], expireAfterSeconds=60)
+
+    changes = reconcile_indexes(db, dry_run=True)
+    assert changes['items'] == {'created': ITEM_INDEXES, 'rebuilt': [], 'undeclared': ['name_1']}
+    assert changes['geocache']['rebuilt'] == ['expiresAt_1']
+    assert 'id_1' not in db.items.index_information()
+
+    reconcile_indexes(db)
+    assert 'id_1' in db.items.index_information()
+    assert 'name_1' in db.items.index_information()
+    assert db.geocache.index_information()['expiresAt_1']['expireAfterSeconds'] == 0
+
+    changes = reconcile_indexes(db, drop_undeclared=True)
+    assert changes['items'] == {'created': [], 'rebuilt': [], 'dropped': ['name_1']}
+    assert 'name_1' not in db.items.index_information()
+
+def test_verify_schema(db, caplog):
+    assert verify_schema(db) == 0
+    assert 'behind' in caplog.text
+
+    # The version is only read once per process
+    migrate(db)
+    assert verify_schema(db) == 0
+    reset_schema_check()
+    assert verify_schema(db) == SCHEMA_VERSION
+
+def test_get_mongo_collection_skips_schema_work(db, monkeypatch):
+    monkeypatch.setattr(mongo_utils, '_db', db)
+    mongo_utils.set_mongo_collection(None)
+
+    monkeypatch.delenv('SCHEMA_CHECK', raising=False)
+    with patch('shared.migrations.current_version') as mock_current_version:
+        assert mongo_utils.get_mongo_collection() is not None
+        mock_current_version.assert_not_called()
+    assert 'id_1' not in db.items.index_information()
+
+    mongo_utils.set_mongo_collection(None)
+    monkeypatch.setenv('SCHEMA_CHECK', 'true')
+    with patch('shared.migrations.current_version', return_value=SCHEMA_VERSION) as mock_current_version:
+        mongo_utils.get_mongo_collection()
+        mongo_utils.set_mongo_collection(None)
+        mongo_utils.get_mongo_collection()
+        mock_current_version.assert_called_once_with(db)
+    mongo_utils.set_mongo_collection(None)
+
+def test_main(db, capsys):
+    with patch('shared.migrations.get_mongo_db', return_value=db):
+        main(['status'])
+        out = capsys.readouterr().out
+        assert 'Schema version: 0' in out
+        assert f"items missing indexes: {', '.join(ITEM_INDEXES)}" in out
+
+        main(['migrate'])
+        out = capsys.readouterr().out
+        assert f'Schema version: {SCHEMA_VERSION}' in out
+        assert 'missing indexes' not in out
@@ -1,16 +1,31 @@
 import os
 import pytest
+from unittest.mock import MagicMock
 from mongomock import MongoClient
-from pymongo.errors import PyMongoError, InvalidDocument
+import pymongo
+from pymongo.errors import BulkWriteError, PyMongoError, InvalidDocument
 from shared.mongo_utils import (
     get_mongo_collection,
     get_all_items,
+    get_items_page,
+    iter_items,
     get_item,
     create_item,
+    create_items,
     update_item,
+    update_items,
     delete_item,
-    set_mongo_collection
+    delete_items,
+    get_item_version,
+    get_collection_version,
+    find_items_near,
+    search_items,
+    set_mongo_collection,
+    _filter_query
 )
+import shared.mongo_utils as mongo_utils
+from shared.migrations import reconcile_indexes
+from shared.text_index import TEXT_WEIGHTS
 
 # Test data
 TEST_ITEM = {
@@ -20,7 +35,7 @@ TEST_ITEM = {
 }
 
 @pytest.fixture
-def mock_mongo():
+def mock_mongo(mongomock_bulk_updates):
     """Create a mock MongoDB client and collection"""
     client = MongoClient()
     db = client.items_db
@@ -69,6 +84,60 @@ def test_get_all_items(mock_mongo):
     assert len(retrieved_items) == 3
     assert all(item['id'] in ['1', '2', '3'] for item in retrieved_items)
 
+def test_get_items_page(mock_mongo):
+    for item_id in ['3', '1', '2']:
+        create_item({'id': item_id, 'name': f'Item {item_id}'})
+
+    items, next_key = get_items_page(2)
+    assert [item['id'] for item in items] == ['1', '2']
+    assert next_key == {'id': '2'}
+    assert all('_id' not in item for item in items)
+
+    items, next_key = get_items_page(2, after=next_key)
+    assert [item['id'] for item in items] == ['3']
+    assert next_key is None
+
+    # A page that ends exactly on the last item has no next key
+    items, next_key = get_items_page(3)
+    assert len(items) == 3
+    assert next_key is None
+
+def test_sparse_fields(mock_mongo):
+    create_item({**TEST_ITEM, 'latitude': 40.7128, 'longitude': -74.0060})
+
+    assert get_item(TEST_ITEM['id'], ['name']) == {'id': TEST_ITEM['id'], 'name': TEST_ITEM['name']}
+    # Internal fields stay hidden even when asked for
+    assert get_item(TEST_ITEM['id'], ['location', 'latitude']) == {'id': TEST_ITEM['id'], 'latitude': 40.7128}
+
+    items, _ = get_items_page(10, fields=['description'])
+    assert items == [{'id': TEST_ITEM['id'], 'description': TEST_ITEM['description']}]
+    assert list(iter_items(fields=['name'])) == [{'id': TEST_ITEM['id'], 'name': TEST_ITEM['name']}]
+    assert get_all_items(['name']) == [{'id': TEST_ITEM['id'], 'name': TEST_ITEM['name']}]
+
+def test_iter_items(mock_mongo):
+    for item_id in ['1', '2', '3']:
+        create_item({'id': item_id})
+    items = iter_items(batch_size=2)
+    assert next(items)['id'] == '1'
+    assert [item['id'] for item in items] == ['2', '3']
+
+def test_create_items(mock_mongo):
+    create_item(TEST_ITEM)
+    items = [
+        {'id': 'first', 'name': 'First', 'latitude': 40.7484, 'longitude': -73.9967},
+        {'id': 'test-id', 'name': 'Duplicate'},
+        {'id': 'second', 'name': 'Second'}
+    ]
+
+    # Unordered inserts keep going past a failed item
+    assert create_items(items) == [None, "Duplicate Key Error", None]
+    assert get_item('first')['name'] == 'First'
+    assert get_item('second')['name'] == 'Second'
+    assert get_item('test-id')['name'] == TEST_ITEM['name']
+    assert mock_mongo.find_one({'id': 'first'})['location']['coordinates'] == [-73.9967, 40.7484]
+    assert '_id' not in items[0]
+    assert create_items([]) == []
+
 def test_update_item(mock_mongo):
     # Create initial item
     create_item(TEST_ITEM)
@@ -79,22 +148,104 @@ def test_update_item(mock_mongo):
         'description': 'Updated Description'
     }
 
-    update_item(TEST_ITEM['id'], updates)
+    # The updated item comes back from the same round trip
+    returned_item = update_item(TEST_ITEM['id'], updates)
+    assert returned_item == {'id': TEST_ITEM['id'], **updates, 'version': 2, 'updatedAt': returned_item['updatedAt']}
+    assert returned_item['updatedAt'] >= TEST_ITEM['updatedAt']
 
     # Verify update
     updated_item = get_item(TEST_ITEM['id'])
     assert updated_item['name'] == updates['name']
     assert updated_item['description'] == updates['description']
 
+    # A no-op update and a client-supplied version leave the version alone
+    assert update_item(TEST_ITEM['id'], {**updates, 'version': 99})['version'] == 2
+    assert get_item_version(TEST_ITEM['id'])[0] == 2
+
+    # Missing items are not created
+    assert update_item('missing-id', updates) is None
+    assert get_item_version('missing-id') is None
+    assert get_item('missing-id') is None
+
+def test_create_stamps_version(mock_mongo):
+    item = {'id': 'new'}
+    create_item(item)
+    assert item['version'] == 1
+    assert mock_mongo.find_one({'id': 'new'})['updatedAt'] == item['updatedAt']
+
+    items = [{'id': 'a', 'version': 7}, {'id': 'b'}]
+    create_items(items)
+    assert [item['version'] for item in items] == [1, 1]
+    assert get_item('a')['version'] == 1
+
+def test_get_collection_version(mock_mongo):
+    assert get_collection_version() == 0
+
+    create_items([{'id': 'a'}, {'id': 'b'}])
+    assert get_collection_version() == 1
+    update_item('a', {'name': 'Renamed'})
+    update_item('a', {'name': 'Renamed'})
+    assert get_collection_version() == 2
+    update_items({'a': {'name': 'Again'}, 'b': {'name': 'B'}})
+    delete_item('b')
+    delete_items(['a', 'b'])
+    assert get_collection_version() == 5
+    assert mock_mongo.database.counters.find_one() == {'_id': 'items', 'seq': 5}
+
+def test_writes_succeed_when_counting_fails(mock_mongo, monkeypatch):
+    counters = MagicMock()
+    counters.update_one.side_effect = PyMongoError("Write concern timeout")
+    monkeypatch.setattr(mongo_utils, 'get_counters_collection', lambda: counters)
+    create_items([{'id': 'a'}])
+    assert update_item('a', {'name': 'Renamed'})['version'] == 2
+    assert delete_item('a') is True
+    assert counters.update_one.call_count == 3
+
 def test_delete_item(mock_mongo):
     # Create item
     create_item(TEST_ITEM)
 
     # Delete item
-    delete_item(TEST_ITEM['id'])
+    assert delete_item(TEST_ITEM['id']) is True
 
     # Verify deletion
     assert get_item(TEST_ITEM['id']) is None
+    assert delete_item(TEST_ITEM['id']) is False
+
+def test_update_and_delete_items(mock_mongo):
+    create_items([{'id': 'a', 'name': 'A'}, {'id': 'b', 'name': 'B'}])
+
+    result = update_items({
+        'a': {'name': 'Renamed', 'latitude': 40.7484, 'longitude': -73.9967},
+        'b': {'name': 'B'},
+        'missing': {'name': 'Ghost'}
+    })
+    assert result == {'matched': 2, 'modified': 1, 'missing': ['missing'], 'failed': {}}
+    assert get_item('a')['name'] == 'Renamed'
+    assert mock_mongo.find_one({'id': 'a'})['location']['coordinates'] == [-73.9967, 40.7484]
+    assert get_item('missing') is None
+
+    assert delete_items(['a', 'missing']) == {'deleted': 1, 'missing': ['missing'], 'failed': {}}
+    assert get_item('a') is None
+    assert get_item('b') is not None
+    assert delete_items([]) == {'deleted': 0, 'missing': [], 'failed': {}}
+
+def test_update_items_partial_failure(mock_mongo, monkeypatch):
+    monkeypatch.setattr(mongo_utils, '_spatial_index', None)
+    create_items([{'id': 'a', 'name': 'A', 'latitude': 40.7, 'longitude': -74.0},
+                  {'id': 'b', 'name': 'B', 'latitude': 40.7, 'longitude': -74.0}])
+    index = mongo_utils.get_spatial_index()
+
+    # The write for 'a' fails; the counts come from what the server reports
+    error = BulkWriteError({'writeErrors': [{'index': 0, 'errmsg': 'boom'}], 'nMatched': 1, 'nModified': 1})
+    monkeypatch.setattr(mock_mongo, 'bulk_write', MagicMock(side_effect=error))
+    result = update_items({
+        'a': {'latitude': 34.0, 'longitude': -118.3},
+        'b': {'latitude': 34.1, 'longitude': -118.4}
+    })
+    assert result == {'matched': 1, 'modified': 1, 'missing': [], 'failed': {'a': 'boom'}}
+    assert [r['id'] for r in index.nearest(34.0, -118.3, k=1)] == ['b']
+    assert [r['id'] for r in index.nearest(40.7, -74.0, k=1)] == ['a']
 
 def test_error_handling(mock_mongo):
     # Create test item
@@ -113,4 +264,157 @@ def test_error_handling(mock_mongo):
     # Test invalid ID format
     with pytest.raises(Exception) as exc:
         get_item(None)
-    assert "Invalid ID" in str(exc.value)
\ No newline at end of file
+    assert "Invalid ID" in str(exc.value)
+
+def test_location(mock_mongo):
+    create_item({**TEST_ITEM, 'latitude': 40.7128, 'longitude': -74.0060})
+
+    # The GeoJSON point is stored for the 2dsphere index but not returned
+    stored = mock_mongo.find_one({'id': TEST_ITEM['id']})
+    assert stored['location'] == {'type': 'Point', 'coordinates': [-74.0060, 40.7128]}
+    assert 'location' not in get_item(TEST_ITEM['id'])
+
+    update_item(TEST_ITEM['id'], {'latitude': 34.0901, 'longitude': -118.4065})
+    stored = mock_mongo.find_one({'id': TEST_ITEM['id']})
+    assert stored['location'] == {'type': 'Point', 'coordinates': [-118.4065, 34.0901]}
+
+def test_find_items_near():
+    collection = MagicMock()
+    collection.aggregate.return_value = [{'id': '1', 'distance': 1.23456}]
+    set_mongo_collection(collection)
+
+    items = find_items_near(40.7128, -74.0060, radius=10, limit=5)
+    assert items == [{'id': '1', 'distance': 1.23}]
+
+    pipeline = collection.aggregate.call_args[0][0]
+    geo_near = pipeline[0]['$geoNear']
+    assert geo_near['near'] == {'type': 'Point', 'coordinates': [-74.0060, 40.7128]}
+    assert geo_near['key'] == 'location'
+    assert geo_near['maxDistance'] == pytest.approx(16093.44)
+    assert pipeline[1] == {'$limit': 5}
+
+    # Without a radius there is no distance cap
+    find_items_near(40.7128, -74.0060)
+    assert 'maxDistance' not in collection.aggregate.call_args[0][0][0]['$geoNear']
+    set_mongo_collection(None)
+
+FILTER_ITEMS = [
+    {'id': f'item-{i:02d}', 'postcode': ['10001', '90210'][i % 2], 'directionFromNY': ['NE', 'SW', 'NW'][i % 3],
+     'startDate': f'2025-0{1 + i % 9}-01T00:00:00Z', 'users': [f'user-{i % 4}', 'everyone'],
+     'distanceFromNY': i * 100.5}
+    for i in range(30)
+]
+FILTERS = [
+    {'postcode': '10001'},
+    {'directionFromNY': 'NE'},
+    {'user': 'user-2'},
+    {'startDateFrom': '2025-03-01', 'startDateTo': '2025-05-01T00:00:00Z'},
+    {'minDistance': 500.0, 'maxDistance': 1500.25},
+    {'postcode': '90210', 'directionFromNY': 'SW', 'user': 'user-1', 'minDistance': 100.0}
+]
+
+def test_filter_query():
+    assert _filter_query(None) == {}
+    assert _filter_query({'user': 'Ann', 'startDateFrom': '2025-01-01', 'maxDistance': 10.0}) == {
+        'users': 'Ann',
+        'startDate': {'$gte': '2025-01-01'},
+        'distanceFromNY': {'$lte': 10.0}
+    }
+
+@pytest.mark.parametrize('filters', FILTERS)
+def test_filters(mock_mongo, filters):
+    mock_mongo.insert_many([dict(item) for item in FILTER_ITEMS])
+
+    def matches(item):
+        return (
+            filters.get('postcode', item['postcode']) == item['postcode']
+            and filters.get('directionFromNY', item['directionFromNY']) == item['directionFromNY']
+            and filters.get('user', 'everyone') in item['users']
+            and filters.get('startDateFrom', '') <= item['startDate'] <= filters.get('startDateTo', '9999')
+            and filters.get('minDistance', 0) <= item['distanceFromNY'] <= filters.get('maxDistance', 10 ** 6)
+        )
+    expected = [item['id'] for item in FILTER_ITEMS if matches(item)]
+    assert expected
+
+    ids, next_key = [], None
+    while True:
+        items, next_key = get_items_page(3, after=next_key, filters=filters)
+        ids.extend(item['id'] for item in items)
+        if next_key is None:
+            break
+    assert ids == expected
+    assert [item['id'] for item in iter_items(filters=filters)] == expected
+
+@pytest.fixture(scope='module')
+def real_db():
+    """A scratch database on a real MongoDB, which explain() needs.
+
+    Skipped when there is none, unless REQUIRE_MONGODB is set, as it is in CI.
+    """
+    client = pymongo.MongoClient(os.environ.get('MONGODB_URI', 'mongodb://localhost:27017'), serverSelectionTimeoutMS=500)
+    try:
+        client.admin.command('ping')
+    except pymongo.errors.PyMongoError:
+        if os.environ.get('REQUIRE_MONGODB'):
+            raise
+        pytest.skip("MongoDB is not reachable")
+    db = client['items_db_explain_test']
+    reconcile_indexes(db)
+    db.items.insert_many([dict(item) for item in FILTER_ITEMS])
+    yield db
+    client.drop_database(db.name)
+    client.close()
+
+def _stages(plan):
+    yield plan['stage']
+    for child in [plan.get('inputStage')] + plan.get('inputStages', []):
+        if child:
+            yield from _stages(child)
+
+@pytest.mark.parametrize('filters', FILTERS)
+def test_filters_use_indexes(real_db, filters):
+    explain = real_db.items.find(_filter_query(filters)).sort('id', 1).limit(100).explain()
+    stages = list(_stages(explain['queryPlanner']['winningPlan'].get('queryPlan', explain['queryPlanner']['winningPlan'])))
+    assert 'IXSCAN' in stages
+    assert 'COLLSCAN' not in stages
+
+TEXT_ITEMS = [
+    {'id': 'text-1', 'name': 'Red bike', 'users': ['Ann Lee']},
+    {'id': 'text-2', 'name': 'Blue bike helmet', 'users': ['Bob']},
+    {'id': 'text-3', 'name': 'Red kettle', 'users': ['Red Smith']},
+    {'id': 'text-4', 'name': 'Lamp', 'users': ['Ann']}
+]
+
+@pytest.fixture
+def text_items(real_db):
+    real_db.items.insert_many([dict(item) for item in TEXT_ITEMS])
+    set_mongo_collection(real_db.items)
+    yield real_db.items
+    set_mongo_collection(None)
+    real_db.items.delete_many({'id': {'$in': [item['id'] for item in TEXT_ITEMS]}})
+
+def test_text_index_on_a_real_server(text_items):
+    index = text_items.index_information()['name_text_users_text']
+    assert dict(index['weights']) == TEXT_WEIGHTS
+
+def test_text_search_on_a_real_server(text_items):
+    items, next_key = search_items('red ann', limit=10, fields=['name'])
+    assert sorted(item['id'] for item in items) == ['text-1', 'text-3', 'text-4']
+    assert next_key is None
+    scores = [item['score'] for item in items]
+    assert scores == sorted(scores, reverse=True)
+    # The weighted name matches outrank a match on a user alone
+    assert items[-1]['id'] == 'text-4'
+    assert set(items[0]) == {'id', 'name', 'score'}
+
+    # Pages resume after the (score, id) key without overlapping
+    ids, after = [], None
+    while True:
+        page, after = search_items('red ann', limit=1, after=after)
+        ids += [item['id'] for item in page]
+        if after is None:
+            break
+    assert ids == [item['id'] for item in items]
+
+    assert [item['id'] for item in search_items('HELMETS')[0]] == ['text-2']
+    assert search_items('unicycle') == ([], None)
@@ -0,0 +1,91 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json
+import pytest
+from datetime import datetime, timezone
+from decimal import Decimal
+from bson import ObjectId
+from flask import Flask, jsonify
+from shared import serializer
+from shared.cache import TTLCache
+from shared.json_provider import SerializerJSONProvider
+from shared.validation import create_response
+
+ITEM = {
+    'id': 'item-1', 'name': 'Café ☕', 'users': ['Zoë'], 'version': Decimal('3'),
+    'distanceFromNY': Decimal('1234.5'), 'latitude': 40.7128, 'count': 7, 'active': True, 'note': None,
+    'ref': ObjectId('65f000000000000000000001'), 'seen': datetime(2025, 3, 26, 12, 30, tzinfo=timezone.utc),
+    'nested': {'scores': [Decimal('1'), Decimal('0.25')], 2: 'two'}
+}
+EXPECTED = {
+    'id': 'item-1', 'name': 'Café ☕', 'users': ['Zoë'], 'version': 3,
+    'distanceFromNY': 1234.5, 'latitude': 40.7128, 'count': 7, 'active': True, 'note': None,
+    'ref': '65f000000000000000000001', 'seen': '2025-03-26T12:30:00+00:00',
+    'nested': {'scores': [1, 0.25], '2': 'two'}
+}
+
+@pytest.fixture(params=['json', pytest.param('orjson', marks=pytest.mark.skipif(serializer.orjson is None, reason="orjson is not installed"))])
+def serializer_name(request):
+    serializer.set_serializer(request.param)
+    yield request.param
+    serializer.set_serializer(None)
+
+def test_encodes_store_types(serializer_name):
+    body = serializer.dumps_bytes(ITEM)
+    assert json.loads(body) == EXPECTED
+    decoded = json.loads(body)
+    assert isinstance(decoded['version'], int) and isinstance(decoded['distanceFromNY'], float)
+    assert serializer.dumps(ITEM) == body.decode()
+    with pytest.raises(TypeError):
+        serializer.dumps({'value': {1, 2}})
+
+def test_serializers_agree():
+    if serializer.orjson is None:
+        pytest.skip("orjson is not installed")
+    assert serializer.load_serializer('orjson')(ITEM) == serializer.load_serializer('json')(ITEM)
+
+def test_serializer_selection(monkeypatch):
+    with pytest.raises(ValueError):
+        serializer.load_serializer('simplejson')
+    monkeypatch.setenv('JSON_SERIALIZER', 'json')
+    serializer.set_serializer(None)
+    assert serializer.get_serializer() is serializer.SERIALIZERS['json']
+
+    # Without orjson, the stdlib is the default and orjson cannot be chosen
+    monkeypatch.delenv('JSON_SERIALIZER')
+    monkeypatch.setattr(serializer, 'orjson', None)
+    serializer.set_serializer(None)
+    assert serializer.get_serializer() is serializer.SERIALIZERS['json']
+    with pytest.raises(ValueError):
+        serializer.load_serializer('orjson')
+    serializer.set_serializer(None)
+
+def test_pre_serialized_bodies():
+    cache = TTLCache()
+    body = serializer.dumps_cached(cache, 'etag-1', ITEM)
+    assert serializer.dumps_cached(cache, 'etag-1', {'other': 'value'}) is body
+    assert serializer.dumps_cached(cache, 'etag-2', {'other': 'value'}) == b'{"other":"value"}'
+
+    response = create_response(200, body)
+    assert json.loads(response['body']) == EXPECTED
+    assert create_response(200, {'version': Decimal('2')})['body'] == '{"version":2}'
+    assert create_response(304, None)['body'] == ''
+
+def test_json_provider():
+    app = Flask(__name__)
+    app.json = SerializerJSONProvider(app)
+    with app.app_context():
+        response = jsonify(ITEM)
+    assert response.mimetype == 'application/json'
+    assert json.loads(response.get_data()) == EXPECTED
+    assert app.json.loads('{"a": 1}') == {'a': 1}
+
+def test_json_benchmark_runs():
+    from benchmarks.bench_json import run
+    results = run(items=50, repeats=2)
+    assert set(results) == {'mongo', 'dynamodb'}
+    for encoders in results.values():
+        assert {'DecimalEncoder', 'json', 'pre-serialized'} <= set(encoders)
+        assert all(result['mb_per_s'] > 0 for result in encoders.values())
@@ -0,0 +1,136 @@
+import numpy as np
+import pytest
+from unittest.mock import patch
+from mongomock import MongoClient
+import shared.dynamo_utils as dynamo_utils
+import shared.mongo_utils as mongo_utils
+from shared.spatial_index import SpatialIndex, haversine_miles
+
+def random_items(count, seed=0):
+    rng = np.random.default_rng(seed)
+    lats = rng.uniform(-89, 89, count)
+    lons = rng.uniform(-180, 180, count)
+    return [
+        {'id': str(i), 'name': f'Item {i}', 'latitude': float(lat), 'longitude': float(lon)}
+        for i, (lat, lon) in enumerate(zip(lats, lons))
+    ]
+
+def brute_force(items, lat, lon):
+    distances = haversine_miles(lat, lon, [i['latitude'] for i in items], [i['longitude'] for i in items])
+    return sorted(zip(np.round(distances, 2), [i['id'] for i in items]))
+
+@pytest.fixture
+def items():
+    return random_items(2000)
+
+@pytest.fixture
+def index(items):
+    index = SpatialIndex(cell_size=2)
+    index.build(items)
+    return index
+
+QUERY_POINTS = [(40.7128, -74.0060), (0, 179.9), (-33.9, 151.2), (88.5, 10), (-89, -170)]
+
+def test_nearest_matches_brute_force(index, items):
+    for lat, lon in QUERY_POINTS:
+        expected = brute_force(items, lat, lon)[:10]
+        results = index.nearest(lat, lon, k=10)
+        assert [r['distance'] for r in results] == [d for d, _ in expected]
+        assert results[0]['name'].startswith('Item')
+
+    # Asking for more than there is returns everything
+    assert len(index.nearest(0, 0, k=5000)) == len(items)
+
+def test_within_radius_matches_brute_force(index, items):
+    for lat, lon in QUERY_POINTS:
+        for radius in (50, 500, 3000):
+            expected = {i for d, i in brute_force(items, lat, lon) if d <= radius}
+            results = index.within_radius(lat, lon, radius)
+            assert {r['id'] for r in results} == expected
+            assert [r['distance'] for r in results] == sorted(r['distance'] for r in results)
+
+def test_within_bbox(index, items):
+    results = index.within_bbox(30, -100, 45, -70)
+    assert {r['id'] for r in results} == {
+        i['id'] for i in items if 30 <= i['latitude'] <= 45 and -100 <= i['longitude'] <= -70
+    }
+
+    # Boxes can cross the antimeridian
+    results = index.within_bbox(-20, 170, 20, -170)
+    assert {r['id'] for r in results} == {
+        i['id'] for i in items
+        if -20 <= i['latitude'] <= 20 and (i['longitude'] >= 170 or i['longitude'] <= -170)
+    }
+
+def test_incremental_updates():
+    index = SpatialIndex()
+    index.upsert({'id': 'a', 'latitude': 40.7, 'longitude': -74.0})
+    index.upsert({'id': 'b', 'latitude': 34.1, 'longitude': -118.4})
+    index.upsert({'id': 'c', 'name': 'No coordinates'})
+    assert len(index) == 2
+    assert [r['id'] for r in index.nearest(40.7, -74.0, k=1)] == ['a']
+
+    index.update('a', {'latitude': 34.0, 'longitude': -118.3, 'name': 'Moved'})
+    assert index.within_radius(40.7, -74.0, 100) == []
+    nearest = index.nearest(34.0, -118.3, k=1)[0]
+    assert nearest['id'] == 'a' and nearest['name'] == 'Moved'
+
+    index.remove('a')
+    index.remove('missing')
+    assert [r['id'] for r in index.nearest(34.0, -118.3, k=5)] == ['b']
+
+    with pytest.raises(ValueError):
+        SpatialIndex(cell_size=0.7)
+
+def test_queries_examine_nearby_cells_only():
+    index = SpatialIndex()
+    index.build(random_items(50000, seed=1))
+    examined = []
+    with_distances = index._with_distances
+
+    def counting(latitude, longitude, ids):
+        examined.append(len(ids))
+        return with_distances(latitude, longitude, ids)
+
+    # Distances are only computed for items in the cells around the query point,
+    # a small multiple of the results rather than all 50,000 items
+    with patch.object(index, '_with_distances', side_effect=counting):
+        assert len(index.nearest(40.7128, -74.0060, k=10)) == 10
+        assert sum(examined) <= 10 * 10
+        examined.clear()
+        found = index.within_radius(40.7128, -74.0060, 300)
+        assert found and sum(examined) <= 2 * len(found)
+
+def test_mongo_utils_maintains_index():
+    collection = MongoClient().items_db.items
+    mongo_utils.set_mongo_collection(collection)
+    mongo_utils.create_item({'id': 'a', 'latitude': 40.7, 'longitude': -74.0})
+
+    index = mongo_utils.get_spatial_index()
+    assert len(index) == 1
+
+    mongo_utils.create_item({'id': 'b', 'latitude': 34.1, 'longitude': -118.4})
+    mongo_utils.update_item('a', {'latitude': 34.0, 'longitude': -118.3})
+    mongo_utils.delete_item('b')
+    assert [r['id'] for r in index.nearest(34.0, -118.3, k=5)] == ['a']
+    assert 'location' not in index.nearest(34.0, -118.3, k=1)[0]
+
+    mongo_utils.set_mongo_collection(None)
+
+@patch('shared.dynamo_utils.get_table')
+def test_dynamo_utils_find_items_near(mock_table, monkeypatch):
+    monkeypatch.setattr(dynamo_utils, '_indexes', {})
+    mock_table.return_value.scan.return_value = {'Items': [
+        {'id': 'a', 'latitude': 40.7, 'longitude': -74.0},
+        {'id': 'b', 'latitude': 34.1, 'longitude': -118.4}
+    ]}
+
+    assert [r['id'] for r in dynamo_utils.find_items_near(40.7, -74.0)] == ['a', 'b']
+    assert [r['id'] for r in dynamo_utils.find_items_near(40.7, -74.0, radius=100)] == ['a']
+
+    # Writes keep the index current without another scan
+    dynamo_utils.create_item({'id': 'c', 'latitude': 40.8, 'longitude': -74.1})
+    mock_table.return_value.delete_item.return_value = {'Attributes': {'id': 'a'}}
+    dynamo_utils.delete_item('a')
+    assert [r['id'] for r in dynamo_utils.find_items_near(40.7, -74.0, limit=1)] == ['c']
+    mock_table.return_value.scan.assert_called_once()
@@ -0,0 +1,68 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from decimal import Decimal
+from unittest.mock import patch
+from shared.stats import summarize, bucket_boundaries, MAX_DISTANCE_MILES
+from shared.mongo_utils import get_item_stats
+from shared import dynamo_utils
+
+ITEMS = [
+    {'id': '1', 'postcode': '10001', 'users': ['Ann', 'Bob'], 'directionFromNY': 'NE', 'distanceFromNY': 3.2},
+    {'id': '2', 'postcode': '10001', 'users': ['Ann'], 'directionFromNY': 'NE', 'distanceFromNY': 499.99},
+    {'id': '3', 'postcode': '90210', 'users': ['Cat'], 'directionFromNY': 'W', 'distanceFromNY': 2451.25},
+    {'id': '4', 'postcode': '60601', 'users': ['Bob', 'Ann'], 'directionFromNY': 'W', 'distanceFromNY': 500},
+    {'id': '5', 'name': 'No location'}
+]
+
+def test_bucket_boundaries():
+    boundaries = bucket_boundaries(500)
+    assert boundaries[:3] == [0, 500, 1000]
+    assert boundaries[-1] >= MAX_DISTANCE_MILES
+    assert bucket_boundaries(5000) == [0, 5000, 10000, 15000]
+
+def test_summarize():
+    stats = summarize(ITEMS, bucket_size=500, top=2)
+    assert stats['count'] == 5
+    assert stats['byDirection'] == [
+        {'direction': 'NE', 'count': 2},
+        {'direction': 'W', 'count': 2},
+        {'direction': None, 'count': 1}
+    ]
+    assert stats['distanceFromNY'] == {
+        'min': 3.2,
+        'max': 2451.25,
+        'average': 863.61,
+        'bucketSize': 500,
+        'buckets': [
+            {'min': 0, 'max': 500, 'count': 2},
+            {'min': 500, 'max': 1000, 'count': 1},
+            {'min': 2000, 'max': 2500, 'count': 1}
+        ]
+    }
+    assert stats['topPostcodes'] == [{'postcode': '10001', 'count': 2}, {'postcode': '60601', 'count': 1}]
+    assert stats['topUsers'] == [{'user': 'Ann', 'count': 3}, {'user': 'Bob', 'count': 2}]
+
+def test_summarize_empty_and_decimal():
+    stats = summarize([])
+    assert stats['count'] == 0
+    assert stats['distanceFromNY']['min'] is None
+    assert stats['distanceFromNY']['buckets'] == []
+
+    # DynamoDB returns numbers as Decimal
+    stats = summarize([{'distanceFromNY': Decimal('12.5')}], bucket_size=10)
+    assert stats['distanceFromNY']['buckets'] == [{'min': 10, 'max': 20, 'count': 1}]
+
+def test_mongo_stats_match_summarize(mongodb_collection):
+    mongodb_collection.insert_many([dict(item) for item in ITEMS])
+    for bucket_size, top in ((500, 2), (100, 10), (5000, 1)):
+        assert get_item_stats(bucket_size, top) == summarize(ITEMS, bucket_size, top)
+
+    mongodb_collection.delete_many({})
+    assert get_item_stats() == summarize([])
+
+def test_dynamo_stats_read_only_needed_fields():
+    with patch('shared.dynamo_utils.iter_items', return_value=iter(ITEMS)) as mock_iter_items:
+        assert dynamo_utils.get_item_stats(500, 2) == summarize(ITEMS, 500, 2)
+        mock_iter_items.assert_called_once_with(fields=['directionFromNY', 'distanceFromNY', 'postcode', 'users'])
@@ -0,0 +1,206 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json
+import pytest
+import shared.dynamo_utils as dynamo_utils
+import shared.mongo_utils as mongo_utils
+from shared import storage
+from shared.migrations import reconcile_indexes
+from shared.stats import summarize
+from shared.validation import DecimalEncoder, encode_page_token, decode_page_token
+
+ITEMS = [
+    {'id': f'item-{i:02d}', 'name': f'Item {i}', 'postcode': ['10001', '90210'][i % 2],
+     'users': [f'user-{i % 3}'], 'directionFromNY': ['NE', 'SW'][i % 2], 'startDate': f'2025-0{1 + i % 9}-01',
+     'latitude': 40.7 + i / 10, 'longitude': -74.0 - i / 10, 'distanceFromNY': round(i * 6.9, 2)}
+    for i in range(25)
+]
+
+def plain(value):
+    """value with DynamoDB's Decimals as the JSON numbers clients receive"""
+    return json.loads(json.dumps(value, cls=DecimalEncoder))
+
+def matches(item, filters):
+    filters = filters or {}
+    return (
+        filters.get('postcode', item['postcode']) == item['postcode']
+        and filters.get('directionFromNY', item['directionFromNY']) == item['directionFromNY']
+        and filters.get('user', item['users'][0]) in item['users']
+        and filters.get('startDateFrom', '') <= item['startDate']
+        and item['distanceFromNY'] <= filters.get('maxDistance', 10 ** 6)
+    )
+
+@pytest.fixture(params=['mongo', 'dynamodb'])
+def backend(request):
+    """Each backend on its in-memory double: mongomock for MongoDB, moto for DynamoDB"""
+    store = request.getfixturevalue('mongodb_collection' if request.param == 'mongo' else 'moto_table')
+    if request.param == 'mongo':
+        # The indexes shared.migrations deploys, such as the unique id index
+        reconcile_indexes(store.database)
+    backend = storage.load_backend(request.param)
+    storage.set_backend(backend)
+    yield backend
+    storage.set_backend(None)
+
+@pytest.fixture
+def items(backend):
+    items = [dict(item) for item in ITEMS]
+    assert storage.create_items(items) == [None] * len(items)
+    return items
+
+def test_backend_selection(monkeypatch):
+    storage.set_backend(None)
+    monkeypatch.setenv('STORAGE_BACKEND', 'DynamoDB')
+    assert storage.get_backend() is dynamo_utils
+    storage.set_backend(None)
+    monkeypatch.delenv('STORAGE_BACKEND')
+    assert storage.get_backend() is mongo_utils
+    storage.set_backend(None)
+    with pytest.raises(ValueError):
+        storage.load_backend('sqlite')
+
+def test_implements_protocol(backend):
+    assert isinstance(backend, storage.StorageBackend)
+
+def test_create_and_get(backend):
+    item = dict(ITEMS[0], version=7)
+    storage.create_item(item)
+    assert item['version'] == 1 and item['updatedAt']
+
+    stored = storage.get_item('item-00')
+    assert plain(stored) == plain(item)
+    assert plain(storage.get_item('item-00', ['name', 'latitude'])) == {'id': 'item-00', 'name': 'Item 0', 'latitude': 40.7}
+    assert storage.get_item_and_version('item-00', ['name']) == ({'id': 'item-00', 'name': 'Item 0'}, (1, item['updatedAt']))
+    assert storage.get_item_version('item-00') == (1, item['updatedAt'])
+
+    assert storage.get_item('missing') is None
+    assert storage.get_item_and_version('missing') == (None, None)
+    assert storage.get_item_version('missing') is None
+
+def test_get_items_by_ids(backend, items):
+    found = storage.get_items_by_ids(['item-09', 'missing', 'item-01', 'item-09'], ['name'])
+    assert plain(found) == [{'id': 'item-09', 'name': 'Item 9'}, None, {'id': 'item-01', 'name': 'Item 1'},
+                            {'id': 'item-09', 'name': 'Item 9'}]
+    assert plain(storage.get_items_by_ids(['item-02'])) == [plain(items[2])]
+
+def test_update(backend, items):
+    updated = storage.update_item('item-01', {'name': 'Renamed', 'latitude': 51.5, 'version': 99})
+    assert updated['name'] == 'Renamed' and updated['latitude'] == 51.5
+    assert updated['version'] == 2
+    assert plain(storage.get_item('item-01')) == plain(updated)
+
+    # A no-op returns the item and keeps its version
+    assert storage.update_item('item-01', {'name': 'Renamed'})['version'] == 2
+    assert storage.get_item_version('item-01')[0] == 2
+    assert storage.update_item('missing', {'name': 'Nobody'}) is None
+
+def test_delete(backend, items):
+    assert storage.delete_item('item-02') is True
+    assert storage.delete_item('item-02') is False
+    assert storage.get_item('item-02') is None
+
+def test_batches(backend, items):
+    assert storage.update_items({
+        'item-03': {'name': 'Three'},
+        'item-04': {'name': 'Item 4'},
+        'missing': {'name': 'Nobody'}
+    }) == {'matched': 2, 'modified': 1, 'missing': ['missing'], 'failed': {}}
+    assert storage.get_item_version('item-03')[0] == 2
+    assert storage.get_item_version('item-04')[0] == 1
+
+    assert storage.delete_items(['item-05', 'item-06', 'missing']) == {'deleted': 2, 'missing': ['missing'], 'failed': {}}
+    assert storage.get_item('item-05') is None
+
+def test_creates_never_overwrite(backend, items):
+    # An existing id and one repeated in the batch are rejected; the first occurrence is written
+    results = storage.create_items([
+        {'id': 'new-1', 'name': 'First'},
+        {'id': 'item-02', 'name': 'Overwrite'},
+        {'id': 'new-1', 'name': 'Second'}
+    ])
+    assert results == [None, "Duplicate Key Error", "Duplicate Key Error"]
+    assert storage.get_item('new-1')['name'] == 'First'
+    assert storage.get_item('item-02')['name'] == ITEMS[2]['name']
+    assert storage.get_item_version('item-02')[0] == 1
+
+    with pytest.raises(Exception, match="Duplicate Key Error"):
+        storage.create_item({'id': 'item-03', 'name': 'Overwrite'})
+    assert storage.get_item('item-03')['name'] == ITEMS[3]['name']
+
+@pytest.mark.parametrize('filters', [None, {'postcode': '90210'}, {'directionFromNY': 'NE', 'startDateFrom': '2025-03-01'},
+                                     {'user': 'user-1', 'maxDistance': 100.0}])
+def test_pages_cover_every_item_once(backend, items, filters):
+    expected = sorted(item['id'] for item in ITEMS if matches(item, filters))
+    assert expected
+    assert sorted(item['id'] for item in storage.iter_items(filters=filters)) == expected
+
+    seen, after = [], None
+    while True:
+        page, after = storage.get_items_page(7, after, ['name'], filters)
+        assert len(page) <= 7
+        assert all(set(item) == {'id', 'name'} for item in page)
+        seen += [item['id'] for item in page]
+        if after is None:
+            break
+        # Keys go to clients and back as tokens, and are checked on the way in
+        after = decode_page_token(encode_page_token(after))
+        storage.check_page_key(after, filters)
+    assert sorted(seen) == expected
+
+@pytest.mark.parametrize('after, filters', [
+    ({'nextBucket': 1}, None),
+    ({'nextBucket': 1}, {'postcode': '90210'}),
+    ({'id': 'item-01', 'postcode': '10001'}, None),
+    ({'id': 'item-01', 'postcode': '10001'}, {'postcode': '90210'}),
+    ({'id': 'item-01', 'directionFromNY': 'NE', 'startDate': '2025-01-01T00:00:00Z'},
+     {'directionFromNY': 'NE', 'startDateFrom': '2025-03-01T00:00:00Z'}),
+    ({'id': 'item-01', 'distanceBucket': 3, 'distanceFromNY': 1600.0}, {'maxDistance': 100.0}),
+    ({'nextBucket': 9}, {'maxDistance': 100.0}),
+])
+def test_page_keys_a_list_did_not_return_are_rejected(backend, after, filters):
+    with pytest.raises(ValueError, match="Invalid next token"):
+        storage.check_page_key(after, filters)
+
+def test_stats(backend, items):
+    assert storage.get_item_stats(100, 2) == summarize(ITEMS, 100, 2)
+
+def test_collection_version(backend, items):
+    version = storage.get_collection_version()
+    # Backends without a collection version return None
+    if version is None:
+        return
+    storage.update_item('item-07', {'name': 'Seven'})
+    assert storage.get_collection_version() > version
+    # A no-op changes nothing
+    version = storage.get_collection_version()
+    storage.update_item('item-07', {'name': 'Seven'})
+    assert storage.delete_item('missing') is False
+    assert storage.get_collection_version() == version
+    # Counted even when the item count and the latest write time come back the same
+    storage.delete_item('item-07')
+    storage.create_item(dict(ITEMS[7]))
+    assert storage.get_collection_version() == version + 2
+
+def test_find_items_near(backend, items):
+    if backend is mongo_utils:
+        pytest.skip("mongomock does not implement $geoNear")
+    nearest = storage.find_items_near(40.7, -74.0, radius=50, limit=3)
+    assert [item['id'] for item in nearest] == ['item-00', 'item-01', 'item-02']
+    assert nearest[0]['distance'] == 0
+
+def test_search_items(backend, items):
+    if backend is mongo_utils:
+        pytest.skip("mongomock does not implement $text")
+    found, after = storage.search_items('item 12', limit=1, fields=['name'])
+    assert [(item['id'], item['name']) for item in found] == [('item-12', 'Item 12')]
+    assert after is not None
+
+def test_storage_benchmark_runs():
+    from benchmarks.bench_storage import run, WORKLOADS
+    results = run(items=10)
+    assert set(results) == set(storage.BACKENDS)
+    for backend_results in results.values():
+        assert set(backend_results) == set(WORKLOADS)
+        assert all(result['per_s'] > 0 for result in backend_results.values())
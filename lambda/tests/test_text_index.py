@@ -0,0 +1,131 @@
+from unittest.mock import patch, MagicMock
+from pymongo import TEXT
+import shared.dynamo_utils as dynamo_utils
+import shared.mongo_utils as mongo_utils
+from shared.text_index import TextIndex, TEXT_WEIGHTS, tokenize
+
+ITEMS = [
+    {'id': '1', 'name': 'Red bike', 'users': ['Ann Lee']},
+    {'id': '2', 'name': 'Blue bike helmet', 'users': ['Bob']},
+    {'id': '3', 'name': 'Red kettle', 'users': ['Red Smith']},
+    {'id': '4', 'name': 'Lamp', 'users': ['Ann']},
+    {'id': '5', 'postcode': '10001'}
+]
+
+def brute_force(items, query, weights):
+    terms = set(tokenize(query))
+    scores = {}
+    for item in items:
+        score = sum(
+            weight * sum(1 for token in tokenize(item.get(field)) if token in terms)
+            for field, weight in weights.items()
+        )
+        if score:
+            scores[item['id']] = score
+    return sorted(scores.items(), key=lambda pair: (-pair[1], pair[0]))
+
+def test_tokenize():
+    assert tokenize('Red-Bike, 2nd!') == ['red', 'bike', '2nd']
+    assert tokenize(['Ann Lee', 'Bob']) == ['ann', 'lee', 'bob']
+    assert tokenize(None) == []
+
+def test_search_ranks_by_weighted_matches():
+    index = TextIndex()
+    index.build(ITEMS)
+    items, next_key = index.search('red ann')
+    # A name match outweighs a user match; equal scores are ordered by id
+    assert [(item['id'], item['score']) for item in items] == [('1', 3), ('3', 3), ('4', 1)]
+    assert [(item['id'], item['score']) for item in items] == brute_force(ITEMS, 'red ann', index.weights)
+    assert next_key is None
+    assert index.search('HELMET')[0][0]['name'] == 'Blue bike helmet'
+    assert index.search('unicycle') == ([], None)
+
+def test_search_pages_do_not_overlap():
+    items = [{'id': f'{i:03d}', 'name': 'bike ' * (i % 4), 'users': ['bike rider'] * (i % 3)} for i in range(200)]
+    index = TextIndex()
+    index.build(items)
+
+    seen, after = [], None
+    while True:
+        page, after = index.search('bike', limit=7, after=after)
+        seen += [(item['id'], item['score']) for item in page]
+        if after is None:
+            break
+    assert seen == brute_force(items, 'bike', index.weights)
+
+def test_incremental_updates():
+    index = TextIndex()
+    index.build(ITEMS)
+    index.upsert({'id': '6', 'name': 'Kettle'})
+    index.update('3', {'name': 'Teapot'})
+    index.remove('1')
+    assert [item['id'] for item in index.search('kettle')[0]] == ['6']
+    assert [item['id'] for item in index.search('red')[0]] == ['3']
+    assert index.search('teapot')[0][0]['users'] == ['Red Smith']
+    assert len(index) == 5
+
+class RecordingPostings(dict):
+    """Posting lists that record which terms were read"""
+    def __init__(self, postings):
+        super().__init__(postings)
+        self.read = []
+
+    def get(self, term, default=None):
+        self.read.append(term)
+        return super().get(term, default)
+
+def test_search_reads_only_its_terms_posting_lists():
+    words = [f'word{i}' for i in range(5000)]
+    items = [{'id': str(i), 'name': f'{words[i % 5000]} {words[(i * 7) % 5000]}'} for i in range(50000)]
+    index = TextIndex()
+    index.build(items)
+    index._postings = RecordingPostings(index._postings)
+
+    page, _ = index.search('word3 WORD4 word3', limit=20)
+    # The cost of a search is the size of its terms' posting lists, not of the index
+    assert sorted(index._postings.read) == ['word3', 'word4']
+    assert [(item['id'], item['score']) for item in page] == brute_force(items, 'word3 word4', index.weights)[:20]
+
+def test_mongo_search_pipeline():
+    collection = MagicMock()
+    collection.aggregate.return_value = [{'id': 'a', 'score': 2.0}, {'id': 'b', 'score': 1.5}, {'id': 'c', 'score': 1.5}]
+    mongo_utils.set_mongo_collection(collection)
+
+    items, next_key = mongo_utils.search_items('red bike', limit=2, after={'id': 'x', 'score': 3.0}, fields=['name'])
+    assert items == [{'id': 'a', 'score': 2.0}, {'id': 'b', 'score': 1.5}]
+    assert next_key == {'id': 'b', 'score': 1.5}
+
+    pipeline = collection.aggregate.call_args[0][0]
+    assert pipeline[0] == {'$match': {'$text': {'$search': 'red bike'}}}
+    assert pipeline[1] == {'$addFields': {'score': {'$meta': 'textScore'}}}
+    assert pipeline[2] == {'$match': {'$or': [{'score': {'$lt': 3.0}}, {'score': 3.0, 'id': {'$gt': 'x'}}]}}
+    assert pipeline[3:5] == [{'$sort': {'score': -1, 'id': 1}}, {'$limit': 3}]
+    assert pipeline[5]['$project']['score'] == 1
+
+    # The last page has no next key
+    collection.aggregate.return_value = [{'id': 'a', 'score': 2.0}]
+    assert mongo_utils.search_items('red bike', limit=2) == ([{'id': 'a', 'score': 2.0}], None)
+    mongo_utils.set_mongo_collection(None)
+
+def test_mongo_text_index_matches_the_text_weights():
+    # $text scores use the same fields and weights as the in-process index
+    text_indexes = [(keys, options) for keys, options in mongo_utils.INDEXES['items']
+                    if any(direction == TEXT for _, direction in keys)]
+    assert text_indexes == [([(field, TEXT) for field in TEXT_WEIGHTS], {'weights': TEXT_WEIGHTS})]
+
+@patch('shared.dynamo_utils.get_table')
+def test_dynamo_utils_search_items(mock_table, monkeypatch):
+    monkeypatch.setattr(dynamo_utils, '_indexes', {})
+    mock_table.return_value.scan.return_value = {'Items': [dict(item) for item in ITEMS]}
+
+    items, next_key = dynamo_utils.search_items('red', limit=1, fields=['name'])
+    assert items == [{'id': '3', 'name': 'Red kettle', 'score': 3}]
+    items, next_key = dynamo_utils.search_items('red', limit=1, after=next_key)
+    assert [item['id'] for item in items] == ['1'] and next_key is None
+
+    # Writes keep the index current without another scan
+    dynamo_utils.create_item({'id': '6', 'name': 'Red lamp'})
+    mock_table.return_value.delete_item.return_value = {'Attributes': {'id': '3'}}
+    dynamo_utils.delete_item('3')
+    assert [item['id'] for item in dynamo_utils.search_items('red')[0]] == ['1', '6']
+    mock_table.return_value.scan.assert_called_once()
@@ -11,10 +11,28 @@ from shared.validation import (
     validate_name_length,
     validate_users,
     validate_item,
+    validate_updates,
     create_response,
     DecimalEncoder,
     verify_auth,
-    get_token_from_event
+    get_token_from_event,
+    parse_near_params,
+    parse_page_params,
+    encode_page_token,
+    decode_page_token,
+    parse_fields,
+    parse_stats_params,
+    parse_item_filters,
+    parse_search_params,
+    parse_ids_params,
+    parse_list_params,
+    multi_get_body,
+    make_etag,
+    item_etag,
+    item_version,
+    list_etag,
+    etag_matches,
+    get_header
 )
 
 def test_decimal_encoder():
@@ -118,6 +136,19 @@ def test_validate_item():
     assert is_valid == False
     assert "Invalid date format" in error
 
+def test_validate_item_normalizes_start_date():
+    item = {'name': 'Test Item', 'postcode': '10001', 'startDate': 'March 26 2099 9:00 -0500', 'users': ['John Doe']}
+    assert validate_item(item) == (True, "")
+    assert item['startDate'] == '2099-03-26T14:00:00Z'
+
+def test_validate_updates():
+    updates = {'name': 'Renamed', 'startDate': '2099-03-26'}
+    assert validate_updates(updates) == (True, "")
+    assert updates == {'name': 'Renamed', 'startDate': '2099-03-26T00:00:00Z'}
+    assert validate_updates({'name': 'Renamed'}) == (True, "")
+    assert validate_updates({'startDate': 'not a date'}) == (False, "Invalid date format")
+    assert validate_updates({'startDate': 20990326}) == (False, "Invalid date format")
+
 def test_create_response():
     # Test successful response
     response = create_response(200, {'message': 'Success'})
@@ -130,6 +161,41 @@ def test_create_response():
     assert response['statusCode'] == 400
     assert 'error' in json.loads(response['body'])
 
+    # Not Modified responses have an empty body and carry extra headers
+    response = create_response(304, None, {'ETag': '"abc"'})
+    assert response['body'] == ''
+    assert response['headers']['ETag'] == '"abc"'
+    assert response['headers']['Access-Control-Allow-Origin'] == '*'
+
+def test_etags():
+    etag = item_etag('item-1', (2, '2025-01-01T00:00:00.000000Z'))
+    assert etag.startswith('"') and etag.endswith('"')
+    assert etag == item_etag('item-1', (Decimal(2), '2025-01-01T00:00:00.000000Z'))
+    assert etag != item_etag('item-1', (3, '2025-01-01T00:00:00.000000Z'))
+    assert etag != item_etag('item-1', (2, '2025-01-01T00:00:00.000000Z'), ['name'])
+    # The same version of an item deleted and created again
+    assert etag != item_etag('item-1', (2, '2025-01-02T00:00:00.000000Z'))
+    assert item_version({'version': Decimal(2), 'updatedAt': 'T'}) == (2, 'T')
+    assert item_version({}) == (0, None)
+    assert make_etag(Decimal('1.5')) == make_etag(1.5)
+
+    params = {'limit': 100, 'after': None, 'fields': None}
+    assert list_etag(3, params) != list_etag(2, params)
+    assert list_etag(3, params) != list_etag(3, {**params, 'limit': 5})
+    assert list_etag(None, params) is None
+
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"other", W/{etag}', etag)
+    assert etag_matches('*', etag)
+    assert not etag_matches('"other"', etag)
+    assert not etag_matches(None, etag)
+
+def test_get_header():
+    event = {'headers': {'If-None-Match': '"abc"'}}
+    assert get_header(event, 'if-none-match') == '"abc"'
+    assert get_header(event, 'ETag') is None
+    assert get_header({'headers': None}, 'If-None-Match') is None
+
 def test_get_token_from_event():
     # Valid token
     event = {
@@ -167,4 +233,127 @@ def test_verify_auth():
     event = {'headers': {'Authorization': 'Bearer invalid-token'}}
     is_valid, error = verify_auth(event)
     assert not is_valid
-    assert "Invalid token" in error
\ No newline at end of file
+    assert "Invalid token" in error
+
+def test_parse_near_params():
+    assert parse_near_params({'lat': '40.7', 'lon': '-74'}) == {
+        'latitude': 40.7, 'longitude': -74.0, 'radius': None, 'limit': 20
+    }
+    assert parse_near_params({'lat': '40.7', 'lon': '-74', 'radius': '2.5', 'limit': '5'}) == {
+        'latitude': 40.7, 'longitude': -74.0, 'radius': 2.5, 'limit': 5
+    }
+
+    invalid = [
+        (None, "Missing required parameter: lat"),
+        ({'lat': '40.7'}, "Missing required parameter: lon"),
+        ({'lat': 'north', 'lon': '-74'}, "lat and lon must be numbers"),
+        ({'lat': '91', 'lon': '-74'}, "lat must be between -90 and 90"),
+        ({'lat': '40.7', 'lon': '-181'}, "lon must be between -180 and 180"),
+        ({'lat': '40.7', 'lon': '-74', 'radius': '0'}, "radius must be greater than 0"),
+        ({'lat': '40.7', 'lon': '-74', 'radius': 'far'}, "radius must be a number"),
+        ({'lat': '40.7', 'lon': '-74', 'limit': '101'}, "limit must be between 1 and 100"),
+        ({'lat': '40.7', 'lon': '-74', 'limit': 'all'}, "limit must be an integer"),
+    ]
+    for params, message in invalid:
+        with pytest.raises(ValueError) as exc:
+            parse_near_params(params)
+        assert message in str(exc.value)
+
+def test_page_tokens():
+    token = encode_page_token({'id': 'abc'})
+    assert decode_page_token(token) == {'id': 'abc'}
+    assert encode_page_token(None) is None
+
+    # Decimal keys from DynamoDB can be encoded
+    assert decode_page_token(encode_page_token({'id': 'a', 'n': Decimal('1.5')})) == {'id': 'a', 'n': 1.5}
+
+    # Keys without an id, such as DynamoDB bucket cursors, are left to storage.check_page_key
+    assert decode_page_token(encode_page_token({'nextBucket': 3})) == {'nextBucket': 3}
+
+    for token in ('not a token', 'WzFd', encode_page_token({'id': 3}), encode_page_token({'id': None}),
+                  encode_page_token({'id': ['a']})):
+        with pytest.raises(ValueError) as exc:
+            decode_page_token(token)
+        assert "Invalid next token" in str(exc.value)
+
+def test_parse_page_params():
+    assert parse_page_params(None) == {'limit': None, 'after': None, 'fields': None}
+    assert parse_page_params({'fields': 'name'}) == {'limit': None, 'after': None, 'fields': ['name']}
+    assert parse_page_params({'next': encode_page_token({'id': 'x'})}) == {'limit': 100, 'after': {'id': 'x'}, 'fields': None}
+    assert parse_page_params({'limit': '5', 'next': encode_page_token({'id': 'x'}), 'fields': 'name'}) == {
+        'limit': 5, 'after': {'id': 'x'}, 'fields': ['name']
+    }
+    with pytest.raises(ValueError):
+        parse_page_params({'limit': '1001'})
+    with pytest.raises(ValueError):
+        parse_page_params({'limit': 'ten'})
+
+def test_parse_stats_params():
+    assert parse_stats_params(None) == {'bucket_size': 500, 'top': 10}
+    assert parse_stats_params({'bucketMiles': '250', 'top': '5'}) == {'bucket_size': 250, 'top': 5}
+    assert parse_stats_params({'bucketMiles': '2.5'}) == {'bucket_size': 2.5, 'top': 10}
+    for params in ({'bucketMiles': '0.5'}, {'bucketMiles': 'wide'}, {'bucketMiles': '20000'},
+                   {'top': '0'}, {'top': '101'}, {'top': 'all'}):
+        with pytest.raises(ValueError):
+            parse_stats_params(params)
+
+def test_parse_item_filters():
+    assert parse_item_filters(None) == {}
+    assert parse_item_filters({'limit': '5', 'postcode': ' 10001 ', 'directionFromNY': 'sw', 'user': 'Ann'}) == {
+        'postcode': '10001', 'directionFromNY': 'SW', 'user': 'Ann'
+    }
+    assert parse_item_filters({'startDateFrom': '2025-01-01', 'startDateTo': '2025-02-01T00:00:00Z',
+                               'minDistance': '0', 'maxDistance': '12.5'}) == {
+        'startDateFrom': '2025-01-01T00:00:00Z', 'startDateTo': '2025-02-01T00:00:00Z', 'minDistance': 0.0, 'maxDistance': 12.5
+    }
+    # Bounds in another time zone compare with the stored UTC dates
+    assert parse_item_filters({'startDateFrom': '2025-01-01T09:30:00+05:30'}) == {'startDateFrom': '2025-01-01T04:00:00Z'}
+    for params in ({'postcode': ' '}, {'directionFromNY': 'N'}, {'startDateFrom': 'next week'},
+                   {'minDistance': 'far'}, {'maxDistance': '-1'}, {'minDistance': '5', 'maxDistance': '1'},
+                   {'startDateFrom': '2025-02-01', 'startDateTo': '2025-01-01'}):
+        with pytest.raises(ValueError):
+            parse_item_filters(params)
+
+def test_parse_fields():
+    assert parse_fields(None) is None
+    assert parse_fields('name, postcode,name,distanceFromNY') == ['name', 'postcode', 'distanceFromNY']
+
+    for value in ('', ' , ', 'name,$where', 'users.0', '_id', ','.join(f'f{i}' for i in range(51))):
+        with pytest.raises(ValueError):
+            parse_fields(value)
+
+def test_parse_ids_params():
+    assert parse_ids_params({'limit': '5'}) is None
+    assert parse_ids_params({'ids': ' b, a ,b', 'fields': 'name'}) == {'ids': ['b', 'a', 'b'], 'fields': ['name']}
+    for params in ({'ids': ''}, {'ids': 'a,,b'}, {'ids': ','.join(map(str, range(201)))},
+                   {'ids': 'a', 'limit': '5'}, {'ids': 'a', 'postcode': '10001'}, {'ids': 'a', 'fields': ''}):
+        with pytest.raises(ValueError):
+            parse_ids_params(params)
+
+def test_parse_list_params():
+    assert parse_list_params({'ids': 'a,b'}) == ({'ids': ['a', 'b'], 'fields': None}, None)
+    assert parse_list_params(None) == (None, {'limit': None, 'after': None, 'fields': None, 'filters': {}})
+    multi_get, page_params = parse_list_params({'limit': '5', 'postcode': '10001'})
+    assert multi_get is None
+    assert (page_params['limit'], page_params['filters']) == (5, {'postcode': '10001'})
+    with pytest.raises(ValueError):
+        parse_list_params({'limit': '5', 'minDistance': 'far'})
+
+def test_multi_get_body():
+    assert multi_get_body(['a', 'x', 'b', 'x'], [{'id': 'a'}, None, {'id': 'b'}, None]) == {
+        'items': [{'id': 'a'}, None, {'id': 'b'}, None],
+        'missing': ['x']
+    }
+
+def test_parse_search_params():
+    assert parse_search_params({'q': ' red bike '}) == {'query': 'red bike', 'limit': 20, 'after': None, 'fields': None}
+    token = encode_page_token({'id': 'abc', 'score': 1.5})
+    assert parse_search_params({'q': 'bike', 'limit': '5', 'next': token, 'fields': 'name'}) == {
+        'query': 'bike', 'limit': 5, 'after': {'id': 'abc', 'score': 1.5}, 'fields': ['name']
+    }
+    for params in (None, {'q': ' '}, {'q': 'x' * 201}, {'q': 'bike', 'limit': '0'}, {'q': 'bike', 'limit': '101'},
+                   {'q': 'bike', 'next': encode_page_token({'id': 'abc'})},
+                   {'q': 'bike', 'next': encode_page_token({'id': 'abc', 'score': 'high'})},
+                   {'q': 'bike', 'next': encode_page_token({'score': 1.5})}):
+        with pytest.raises(ValueError):
+            parse_search_params(params)
@@ -1,7 +1,7 @@
 import json
-from shared.validation import create_response, verify_auth
-from shared.geocoding import get_coordinates, calculate_distance_from_ny, get_direction_from_ny
-from shared.mongo_utils import get_item, update_item
+from shared.validation import validate_updates, create_response, verify_auth, item_etag, item_version
+from shared.geocoding import get_coordinates, location_fields
+from shared.storage import update_item, get_item_version
 from shared.cloudwatch_logger import setup_logging, logger, log_event, log_api_metrics, metrics
 import time
 
@@ -27,17 +27,24 @@ def handler(event, context):
         item_id = event['pathParameters']['id']
         updates = json.loads(event['body'])
 
-        # Check if item exists
-        existing_item = get_item(item_id)
-        if not existing_item:
-            logger.info(f"Item not found: {item_id}")
-            status_code = 404
-            response = create_response(status_code, {'error': 'Item not found'})
+        is_valid, error_message = validate_updates(updates)
+        if not is_valid:
+            logger.error(f"Validation error: {error_message}")
+            status_code = 400
+            response = create_response(status_code, {'error': error_message})
             log_api_metrics("UpdateItem", status_code, (time.time() - start_time) * 1000)
             return response
 
         # If postcode is being updated, recalculate coordinates and directions
         if 'postcode' in updates:
+            # Geocoding is only worth doing, and a bad postcode only worth reporting, for an item that exists
+            if get_item_version(item_id) is None:
+                logger.info(f"Item not found: {item_id}")
+                status_code = 404
+                response = create_response(status_code, {'error': 'Item not found'})
+                log_api_metrics("UpdateItem", status_code, (time.time() - start_time) * 1000)
+                return response
+
             coordinates = get_coordinates(updates['postcode'])
             if not coordinates:
                 logger.error("Invalid postcode")
@@ -46,20 +53,21 @@ def handler(event, context):
                 log_api_metrics("UpdateItem", status_code, (time.time() - start_time) * 1000)
                 return response
 
-            lat, lon = coordinates
-            updates['latitude'] = float(lat)
-            updates['longitude'] = float(lon)
-            updates['distanceFromNY'] = float(calculate_distance_from_ny(lat, lon))
-            updates['directionFromNY'] = get_direction_from_ny(lat, lon)
+            updates.update(location_fields(*coordinates))
 
-        # Update item
+        # Update item and read it back in one round trip
         logger.info(f"Updating item {item_id}", extra={"updates": updates})
-        update_item(item_id, updates)
+        updated_item = update_item(item_id, updates)
+        if not updated_item:
+            logger.info(f"Item not found: {item_id}")
+            status_code = 404
+            response = create_response(status_code, {'error': 'Item not found'})
+            log_api_metrics("UpdateItem", status_code, (time.time() - start_time) * 1000)
+            return response
 
-        # Get updated item
-        updated_item = get_item(item_id)
         status_code = 200
-        response = create_response(status_code, updated_item)
+        etag = item_etag(item_id, item_version(updated_item))
+        response = create_response(status_code, updated_item, {'ETag': etag})
         log_api_metrics("UpdateItem", status_code, (time.time() - start_time) * 1000)
         return response
 
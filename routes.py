@@ -1,8 +1,14 @@
-from flask import request, jsonify
+from flask import request, jsonify, Response, stream_with_context
 from app import app
-from shared.validation import validate_item, verify_auth
-from shared.mongo_utils import create_item, get_item, get_all_items, update_item, delete_item
-from shared.geocoding import get_coordinates, calculate_distance_from_ny, get_direction_from_ny
+from shared.validation import validate_item, validate_updates, verify_auth, parse_near_params, parse_list_params, parse_fields, encode_page_token
+from shared.validation import item_etag, item_version, list_etag, stats_etag, etag_matches, parse_stats_params
+from shared.validation import parse_search_params, multi_get_body
+from shared.storage import create_item, get_items_page, check_page_key, iter_items, update_item, delete_item, find_items_near
+from shared.storage import get_items_by_ids, get_item_and_version, get_item_version, get_collection_version, get_item_stats, search_items
+from shared.geocoding import get_coordinates, location_fields
+from shared.batch import parse_batch, create_items_batch, update_items_batch, delete_items_batch
+from shared.item_cache import get_body_cache
+from shared.serializer import dumps, dumps_cached
 import uuid
 
 @app.route('/items', methods=['POST'])
@@ -25,41 +31,186 @@ def create_item_route():
         if not coordinates:
             return jsonify({'error': 'Invalid postcode'}), 400
 
-        lat, lon = coordinates
-        distance_from_ny = calculate_distance_from_ny(lat, lon)
-        direction_from_ny = get_direction_from_ny(lat, lon)
-
         # Create item with additional data
-        item = {
-            'id': str(uuid.uuid4()),
-            **data,
-            'latitude': float(lat),
-            'longitude': float(lon),
-            'distanceFromNY': float(distance_from_ny),
-            'directionFromNY': direction_from_ny
-        }
+        item = {'id': str(uuid.uuid4()), **data, **location_fields(*coordinates)}
 
         create_item(item)
-        return jsonify(item), 201
+        return jsonify(item), 201, {'ETag': item_etag(item['id'], item_version(item))}
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/items:batch', methods=['POST'])
+def create_items_batch_route():
+    try:
+        # Verify authentication
+        is_auth_valid, auth_error = verify_auth(request)
+        if not is_auth_valid:
+            return jsonify({'error': f'Authentication failed: {auth_error}'}), 401
+
+        try:
+            bodies = parse_batch(request.get_json())
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        status_code, body = create_items_batch(bodies)
+        return jsonify(body), status_code
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/items:batch', methods=['PATCH'])
+def update_items_batch_route():
+    try:
+        # Verify authentication
+        is_auth_valid, auth_error = verify_auth(request)
+        if not is_auth_valid:
+            return jsonify({'error': f'Authentication failed: {auth_error}'}), 401
+
+        try:
+            elements = parse_batch(request.get_json())
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        status_code, body = update_items_batch(elements)
+        return jsonify(body), status_code
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/items:batch', methods=['DELETE'])
+def delete_items_batch_route():
+    try:
+        # Verify authentication
+        is_auth_valid, auth_error = verify_auth(request)
+        if not is_auth_valid:
+            return jsonify({'error': f'Authentication failed: {auth_error}'}), 401
+
+        try:
+            ids = parse_batch(request.get_json(), key='ids')
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        status_code, body = delete_items_batch(ids)
+        return jsonify(body), status_code
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def stream_items(fields=None, filters=None):
+    """Yield the whole collection as a JSON document, one item at a time"""
+    yield '{"items": ['
+    for index, item in enumerate(iter_items(fields=fields, filters=filters)):
+        yield (',' if index else '') + dumps(item)
+    yield ']}'
+
 @app.route('/items', methods=['GET'])
 def get_items_route():
     try:
-        items = get_all_items()
+        try:
+            multi_get, page_params = parse_list_params(request.args.to_dict())
+            if page_params and page_params['after']:
+                check_page_key(page_params['after'], page_params['filters'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        # ?ids=a,b,c reads every listed item in one query instead of one request per item
+        if multi_get is not None:
+            items = get_items_by_ids(**multi_get)
+            return jsonify(multi_get_body(multi_get['ids'], items)), 200
+
+        if request.args.get('stream', '').lower() == 'true':
+            return Response(stream_with_context(stream_items(page_params['fields'], page_params['filters'])), mimetype='application/json')
+
+        # Polling clients whose copy is current get a 304 without the page being read
+        etag = list_etag(get_collection_version(), page_params)
+        if etag_matches(request.headers.get('If-None-Match'), etag):
+            return '', 304, {'ETag': etag}
+
+        # Clients that do not page get every item, streamed from the cursor as before pagination existed
+        if page_params['limit'] is None:
+            stream = stream_with_context(stream_items(page_params['fields'], page_params['filters']))
+            return Response(stream, mimetype='application/json'), 200, {'ETag': etag} if etag else {}
+
+        items, next_key = get_items_page(**page_params)
+        return jsonify({'items': items, 'next': encode_page_token(next_key)}), 200, {'ETag': etag} if etag else {}
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/items/near', methods=['GET'])
+def get_items_near_route():
+    try:
+        try:
+            params = parse_near_params(request.args.to_dict())
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        items = find_items_near(**params)
         return jsonify({'items': items}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/items/stats', methods=['GET'])
+def get_items_stats_route():
+    try:
+        # Verify authentication
+        is_auth_valid, auth_error = verify_auth(request)
+        if not is_auth_valid:
+            return jsonify({'error': f'Authentication failed: {auth_error}'}), 401
+
+        try:
+            params = parse_stats_params(request.args.to_dict())
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        # The aggregation reads every item, so skip it when the collection has not changed
+        etag = stats_etag(get_collection_version(), params)
+        if etag_matches(request.headers.get('If-None-Match'), etag):
+            return '', 304, {'ETag': etag}
+
+        return jsonify(get_item_stats(**params)), 200, {'ETag': etag} if etag else {}
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/items/search', methods=['GET'])
+def search_items_route():
+    try:
+        # Verify authentication
+        is_auth_valid, auth_error = verify_auth(request)
+        if not is_auth_valid:
+            return jsonify({'error': f'Authentication failed: {auth_error}'}), 401
+
+        try:
+            params = parse_search_params(request.args.to_dict())
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        items, next_key = search_items(**params)
+        return jsonify({'items': items, 'next': encode_page_token(next_key)}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/items/<item_id>', methods=['GET'])
 def get_item_route(item_id):
     try:
-        item = get_item(item_id)
+        try:
+            fields = parse_fields(request.args.get('fields'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        # A revalidation only needs the version, so an unchanged item is never fetched
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match:
+            version = get_item_version(item_id)
+            if version is not None and etag_matches(if_none_match, item_etag(item_id, version, fields)):
+                return '', 304, {'ETag': item_etag(item_id, version, fields)}
+
+        item, version = get_item_and_version(item_id, fields)
         if not item:
             return jsonify({'error': 'Item not found'}), 404
-        return jsonify(item), 200
+        # Repeated reads of an unchanged item reuse its encoded body
+        etag = item_etag(item_id, version, fields)
+        return Response(dumps_cached(get_body_cache(), etag, item), mimetype='application/json'), 200, {'ETag': etag}
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -72,27 +223,26 @@ def update_item_route(item_id):
             return jsonify({'error': f'Authentication failed: {auth_error}'}), 401
 
         updates = request.get_json()
-        
-        # Check if item exists
-        existing_item = get_item(item_id)
-        if not existing_item:
-            return jsonify({'error': 'Item not found'}), 404
+        is_valid, error_message = validate_updates(updates)
+        if not is_valid:
+            return jsonify({'error': error_message}), 400
 
         # If postcode is being updated, recalculate coordinates
         if 'postcode' in updates:
+            # Geocoding is only worth doing, and a bad postcode only worth reporting, for an item that exists
+            if get_item_version(item_id) is None:
+                return jsonify({'error': 'Item not found'}), 404
+
             coordinates = get_coordinates(updates['postcode'])
             if not coordinates:
                 return jsonify({'error': 'Invalid postcode'}), 400
 
-            lat, lon = coordinates
-            updates['latitude'] = float(lat)
-            updates['longitude'] = float(lon)
-            updates['distanceFromNY'] = float(calculate_distance_from_ny(lat, lon))
-            updates['directionFromNY'] = get_direction_from_ny(lat, lon)
+            updates.update(location_fields(*coordinates))
 
-        update_item(item_id, updates)
-        updated_item = get_item(item_id)
-        return jsonify(updated_item), 200
+        updated_item = update_item(item_id, updates)
+        if not updated_item:
+            return jsonify({'error': 'Item not found'}), 404
+        return jsonify(updated_item), 200, {'ETag': item_etag(item_id, item_version(updated_item))}
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -105,12 +255,8 @@ def delete_item_route(item_id):
         if not is_auth_valid:
             return jsonify({'error': f'Authentication failed: {auth_error}'}), 401
 
-        # Check if item exists
-        existing_item = get_item(item_id)
-        if not existing_item:
+        if not delete_item(item_id):
             return jsonify({'error': 'Item not found'}), 404
-
-        delete_item(item_id)
         return '', 204
 
     except Exception as e: